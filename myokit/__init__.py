@@ -235,6 +235,9 @@ else:                           # pragma: no cover
 # Example mmt file
 EXAMPLE = os.path.join(DIR_DATA, 'example.mmt')
 
+# On-disk caches, e.g. of compiled simulation modules
+DIR_CACHE = os.path.join(DIR_USER, 'cache')
+
 # Don't expose standard libraries as part of Myokit
 del(os, inspect)
 
@@ -315,6 +318,17 @@ OPENCL_LIB = []
 # Location of the OpenCL header files (.h)
 OPENCL_INC = []
 
+#
+# Caching of compiled modules
+#
+
+# Store compiled simulation modules in an on-disk cache in ``DIR_CACHE``, so
+# that they can be reused by new simulations (in this or other processes).
+CACHE_COMPILED = True
+
+# Maximum size of the cache of compiled modules, in bytes
+CACHE_COMPILED_SIZE = 512 * 1024 * 1024
+
 
 #
 # Imports
@@ -526,6 +540,7 @@ from ._progress import (    # noqa
 # Data logging
 from ._datalog import (     # noqa
     DataLog,
+    DataLogWriter,
     _dimco,
     LoggedVariableInfo,
     prepare_log,
@@ -560,11 +575,13 @@ from ._sim.cvodessim import Simulation      # noqa
 from ._sim.cvodesim import Simulation as LegacySimulation  # noqa
 from ._sim.cable import Simulation1d        # noqa
 from ._sim.rhs import RhsBenchmarker        # noqa
+from ._sim.rhseval import RhsEvaluator     # noqa
 from ._sim.icsim import ICSimulation        # noqa
 from ._sim.psim import PSimulation          # noqa
 from ._sim.jacobian import JacobianTracer, JacobianCalculator   # noqa
 from ._sim.openclsim import SimulationOpenCL                    # noqa
 from ._sim.fiber_tissue import FiberTissueSimulation            # noqa
+from ._sim.pool import SimulationPool                           # noqa
 
 
 #
@@ -156,6 +156,21 @@ def _create(path):
             paths.append('/System/Library/Frameworks')
         config.set('opencl', 'inc', ';'.join(paths))
 
+    # Cache for compiled modules
+    config.add_section('cache')
+    config.set('cache', '# Compiled simulation modules are stored in an')
+    config.set('cache', '# on-disk cache, so that they can be reused by new')
+    config.set('cache', '# simulations.')
+    config.set('cache', '# Set to false to disable caching.')
+    config.set('cache', 'compiled', 'true')
+    config.set('cache', '# Maximum size of the cache of compiled modules, in'
+               ' megabytes.')
+    config.set('cache', 'compiled_size', str(
+        myokit.CACHE_COMPILED_SIZE // (1024 * 1024)))
+    config.set('cache', '# Location of the cache directory.')
+    config.set('cache', '# Leave unset to use the default location.')
+    config.set('cache', '#path = ' + myokit.DIR_CACHE)
+
     # Write ini file
     try:
         with open(path, 'w') as configfile:
@@ -258,6 +273,24 @@ def _load():
     if config.has_option('opencl', 'inc'):
         myokit.OPENCL_INC.extend(_path_list(config.get('opencl', 'inc')))
 
+    # Cache settings
+    if config.has_option('cache', 'compiled'):
+        try:
+            myokit.CACHE_COMPILED = config.getboolean('cache', 'compiled')
+        except ValueError:
+            # If invalid, don't adjust the settings
+            pass
+    if config.has_option('cache', 'compiled_size'):
+        try:
+            x = float(config.get('cache', 'compiled_size'))
+            myokit.CACHE_COMPILED_SIZE = int(x * 1024 * 1024)
+        except ValueError:
+            pass
+    if config.has_option('cache', 'path'):
+        x = config.get('cache', 'path').strip()
+        if x:
+            myokit.DIR_CACHE = os.path.expandvars(os.path.expanduser(x))
+
 
 def _dynamically_add_embedded_sundials_win():   # pragma: no linux cover
     """
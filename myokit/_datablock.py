@@ -13,6 +13,11 @@ import array
 import numpy as np
 import myokit
 
+try:
+    import concurrent.futures as futures
+except ImportError:     # pragma: no python 3 cover
+    futures = None
+
 
 # Readme file for DataBlock1d binary files
 README_SAVE_1D = """
@@ -84,6 +89,9 @@ header, and little-endian:
 # Encoding used for text portions of zip files
 ENC = 'utf-8'
 
+# Default number of matrix entries to process per call in eigenvalue methods
+EIGENVALUE_CHUNK = 2**20
+
 
 class DataBlock1d(object):
     """
@@ -1037,7 +1045,8 @@ class DataBlock2d(object):
         # Return new block
         return block
 
-    def dominant_eigenvalues(self, name):
+    def dominant_eigenvalues(
+            self, name, chunk_size=None, threads=1, out=None):
         """
         Takes the 2d data specified by ``name`` and computes the dominant
         eigenvalue for each point in time (this only works for datablocks with
@@ -1047,18 +1056,15 @@ class DataBlock2d(object):
         magnitude (``sqrt(a + bi)``).
 
         The returned data is a 1d numpy array.
+
+        For the optional arguments ``chunk_size``, ``threads``, and ``out``,
+        see :meth:`eigenvalues()`.
         """
-        if self._nx != self._ny:
-            raise Exception(
-                'Eigenvalues can only be determined for square data blocks.')
-        data = self._2d[name]
-        dominants = []
-        for t in range(self._nt):
-            e = np.linalg.eigvals(data[t])
-            dominants.append(e[np.argmax(np.absolute(e))])
-        return np.array(dominants)
+        def select(e):
+            return np.argmax(np.absolute(e), axis=1)
+        return self._eigenvalues(name, select, chunk_size, threads, out)
 
-    def eigenvalues(self, name):
+    def eigenvalues(self, name, chunk_size=None, threads=1, out=None):
         """
         Takes the 2d data specified as ``name`` and computes the eigenvalues of
         its data matrix at every point in time (this only works for datablocks
@@ -1066,15 +1072,72 @@ class DataBlock2d(object):
 
         The returned data is a 2d numpy array where the first axis is time and
         the second axis is the index of each eigenvalue.
+
+        The eigenvalues are calculated for ``chunk_size`` points in time at
+        once, which reduces overhead but requires temporary memory
+        proportional to the chunk size. By default, chunks are chosen to
+        contain around a million matrix entries. Chunks can be processed in
+        parallel by setting ``threads`` to a number greater than 1.
+
+        For very large blocks, e.g. blocks whose data is stored in a
+        ``numpy.memmap``, the results can be written directly to a
+        preallocated array ``out`` (which can be a ``numpy.memmap`` too),
+        which is then returned. Unless all eigenvalues are known to be real,
+        this array should have a complex data type.
+        """
+        return self._eigenvalues(name, None, chunk_size, threads, out)
+
+    def _eigenvalues(self, name, select, chunk_size, threads, out):
+        """
+        Calculates the eigenvalues of the 2d series ``name``, in chunks of
+        ``chunk_size`` points in time. If a function ``select`` is given, this
+        is used to select a single eigenvalue per point in time: it will be
+        called with a 2d array of eigenvalues, and should return the index of
+        the selected eigenvalue in each row.
         """
         if self._nx != self._ny:
             raise Exception(
                 'Eigenvalues can only be determined for square data blocks.')
         data = self._2d[name]
-        eigenvalues = []
-        for t in range(self._nt):
-            eigenvalues.append(np.linalg.eigvals(data[t]))
-        return np.array(eigenvalues)
+
+        # Check chunk size
+        if chunk_size is None:
+            chunk_size = max(1, EIGENVALUE_CHUNK // (self._nx * self._ny))
+        else:
+            chunk_size = int(chunk_size)
+            if chunk_size < 1:
+                raise ValueError('Chunk size must be at least 1.')
+
+        # Check output array
+        shape = (self._nt, self._nx) if select is None else (self._nt,)
+        if out is not None and out.shape != shape:
+            raise ValueError(
+                'Output array must have shape ' + str(shape) + '.')
+
+        def calculate(lo):
+            hi = min(lo + chunk_size, self._nt)
+            e = np.linalg.eigvals(data[lo:hi])
+            if select is not None:
+                e = e[np.arange(hi - lo), select(e)]
+            if out is None:
+                return e
+            np.copyto(out[lo:hi], e, casting='same_kind')
+
+        # Calculate, in parallel or in series
+        chunks = range(0, self._nt, chunk_size)
+        threads = int(threads)
+        if threads > 1 and len(chunks) > 1 and futures is not None:
+            with futures.ThreadPoolExecutor(max_workers=threads) as pool:
+                results = list(pool.map(calculate, chunks))
+        else:
+            results = [calculate(lo) for lo in chunks]
+
+        # Return
+        if out is not None:
+            return out
+        if not results:
+            return np.zeros(shape)
+        return np.concatenate(results)
 
     @staticmethod
     def from_DataLog(log):
@@ -1216,7 +1279,8 @@ class DataBlock2d(object):
         """
         return iter(self._2d)
 
-    def largest_eigenvalues(self, name):
+    def largest_eigenvalues(
+            self, name, chunk_size=None, threads=1, out=None):
         """
         Takes the 2d data specified by ``name`` and computes the largest
         eigenvalue for each point in time (this only works for datablocks with
@@ -1226,16 +1290,13 @@ class DataBlock2d(object):
         positive real part. Note that the returned values may be complex.
 
         The returned data is a 1d numpy array.
+
+        For the optional arguments ``chunk_size``, ``threads``, and ``out``,
+        see :meth:`eigenvalues()`.
         """
-        if self._nx != self._ny:
-            raise Exception(
-                'Eigenvalues can only be determined for square data blocks.')
-        data = self._2d[name]
-        largest = []
-        for t in range(self._nt):
-            e = np.linalg.eigvals(data[t])
-            largest.append(e[np.argmax(np.real(e))])
-        return np.array(largest)
+        def select(e):
+            return np.argmax(np.real(e), axis=1)
+        return self._eigenvalues(name, select, chunk_size, threads, out)
 
     def len0d(self):
         """
@@ -11,10 +11,18 @@ import os
 import re
 import sys
 import array
+import bisect
+import struct
+import multiprocessing
 import numpy as np
 from collections import OrderedDict
 import myokit
 
+try:
+    import concurrent.futures as futures
+except ImportError:     # pragma: no python 3 cover
+    futures = None
+
 # Strings in Python 2 and 3
 try:
     basestring
@@ -38,11 +46,67 @@ corresponds to a time variable, or is blank if no time variable was explicitly
 specified. Each following line contains the name of a data field, in the order
 its data occurs in the binary data file "data.bin". All data is stored
 little-endian.
+
+If the file contains an entry "data-shuffled.bin" instead of "data.bin", the
+bytes of each field's data have been shuffled to improve compression: for a
+field with n values of b bytes each, the first n bytes contain the first byte
+of every value, the next n bytes contain the second byte of every value, and
+so on.
 """.strip()
 
 # Encoding used for text portions of zip files
 ENC = 'utf-8'
 
+# Magic bytes at the start of chunked DataLog files
+CHUNKED_MAGIC = b'MYOKITDL'
+
+# Marker at the start of each chunk in a chunked DataLog file
+CHUNKED_CHUNK = b'CHNK'
+
+# Marker at the start and end of the index in a chunked DataLog file
+CHUNKED_INDEX = b'INDX'
+
+# Description of the chunked DataLog format
+README_SAVE_CHUNKED = """
+Myokit Chunked DataLog File
+---------------------------
+This file contains binary time series data for one or multiple variables,
+stored as a sequence of chunks so that it can be written incrementally. All
+numbers are stored little-endian.
+
+The file starts with the 8 bytes "MYOKITDL", followed by a 4 byte unsigned
+integer giving the size of a utf-8 encoded text header. The first line of the
+header gives the format version (1). The second line gives the number of
+fields. The third line specifies the data type, either single ("f") or double
+("d") precision. The fourth line indicates which entry corresponds to a time
+variable, or is blank if no time variable was explicitly specified. The fifth
+line names the compression used for data blocks: "stored" for uncompressed
+data, "deflate" for blocks compressed with zlib, or "lzma" for blocks
+compressed in the xz format. This may be followed by "+shuffle" to indicate
+that the bytes in each block were shuffled before compression: for a block
+with n values of b bytes each, the first n bytes then contain the first byte
+of every value, the next n bytes contain the second byte of every value, and
+so on. Each following line contains the name of a data field.
+
+The header is followed by any number of chunks. Each chunk starts with the 4
+bytes "CHNK", followed by an 8 byte unsigned integer giving the number of data
+points in the chunk, two 8 byte doubles giving the first and last time in the
+chunk (or NaN if there is no time variable), and one 8 byte unsigned integer
+per field giving the size (in bytes) of that field's data block. The data
+blocks follow, in the order the fields are listed in the header. Each block is
+compressed separately, so that single fields can be read without reading the
+rest of the chunk. An incomplete chunk at the end of the file (for example
+after a crash) is ignored.
+
+When a file is closed, an index is written after the last chunk. The index
+starts with the 4 bytes "INDX", followed by an 8 byte unsigned integer giving
+the number of chunks. For each chunk, it then contains the 8 byte unsigned
+position of the chunk in the file, followed by a copy of the chunk header
+without the "CHNK" marker. The file ends with an 8 byte unsigned integer
+giving the position of the index, followed by the bytes "INDX". Files without
+an index can still be read by scanning the chunk headers.
+""".strip()
+
 
 class DataLog(OrderedDict):
     """
@@ -114,6 +178,16 @@ class DataLog(OrderedDict):
         if time is not None:
             self.set_time_key(time)
 
+    def _adjust_time(self, offset):
+        """
+        Replaces this log's time entry with a copy lowered by ``offset``.
+        """
+        time = self[self._time]
+        if isinstance(time, np.ndarray):
+            self[self._time] = time - offset
+        else:
+            self[self._time] = [x - offset for x in time]
+
     def apd(self, v='membrane.V', threshold=-70):
         """
         Calculates one or more Action Potential Durations (APDs) in a single
@@ -134,58 +208,57 @@ class DataLog(OrderedDict):
         certain, fixed, threshold. It does *not* calculate dynamic thresholds
         like "90% of max(V) - min(V)".
 
-        The returned value is a list of tuples (AP_start, APD).
+        The returned value is a :class:`DataLog` with entries ``start`` and
+        ``duration``. If the membrane potential is stored as a NumPy array,
+        these entries will be NumPy arrays too, otherwise they are lists.
         """
         def crossings(x, y, t):
             """
             Calculates the ``x``-values where ``y`` crosses threshold ``t``.
-            Returns a list of tuples ``(xc, sc)`` where ``xc`` is the ``x``
-            coordinate of the crossing and ``sc`` is the slope at this point.
+            Returns a tuple of arrays ``(xc, sc)`` where ``xc`` contains the
+            ``x`` coordinates of the crossings and ``sc`` contains the slopes
+            at these points.
             """
-            x = np.asarray(x)
-            y = np.asarray(y)
-
-            # Get array of places where v exceeds the threshold (1s and 0s)
-            h = (y > t) * 1
+            # Get array of places where v exceeds the threshold
+            h = y > t
 
             # Get array of indices just before a crossing
-            c = np.argwhere(h[1:] - h[:-1])
-
-            # Gather crossing times
-            crossings = []
-            for i in c:
-                i = i[0]
-                sc = (y[i + 1] - y[i]) / (x[i + 1] - x[i])
-                if y[i] == t:
-                    xc = x[i]
-                else:
-                    xc = x[i] + (t - y[i]) / sc
-                crossings.append((xc, sc))
-            return crossings
+            i = np.nonzero(h[1:] != h[:-1])[0]
+
+            # Calculate crossing times
+            y0, y1 = y[i], y[i + 1]
+            x0 = x[i]
+            sc = (y1 - y0) / (x[i + 1] - x0)
+            xc = np.where(y0 == t, x0, x0 + (t - y0) / sc)
+            return xc, sc
 
         # Check time variable
         t = np.asarray(self.time())
 
         # Check voltage variable
+        numpy = isinstance(self[v], np.ndarray)
         v = np.asarray(self[v])
 
         # Check threshold
         threshold = float(threshold)
 
-        # Initial status: check if already in AP
+        # Evaluate crossings: each AP ends at a crossing with a negative
+        # slope, and starts at the crossing before it. APs started before t[0]
+        # are not included.
+        time, slope = crossings(t, v, threshold)
+        last = np.concatenate((t[:1], time[:-1]))
+        ends = (slope < 0) & (last != t[0])
+        start = last[ends]
+        duration = time[ends] - start
+
+        # Create log
         apds = myokit.DataLog()
-        apds['start'] = []
-        apds['duration'] = []
-        last = t[0]
-
-        # Evaluate crossings
-        for time, slope in crossings(t, v, threshold):
-            if slope < 0:
-                # End of AP
-                if last != t[0]:    # Don't inlcude AP started before t[0]
-                    apds['start'].append(last)
-                    apds['duration'].append(time - last)
-            last = time
+        if numpy:
+            apds['start'] = start
+            apds['duration'] = duration
+        else:
+            apds['start'] = start.tolist()
+            apds['duration'] = duration.tolist()
         return apds
 
     def block1d(self):
@@ -287,17 +360,9 @@ class DataLog(OrderedDict):
             return n
 
         # Find t
-        def find(lo, hi):
-            # lo = first indice, hi = last indice + 1
-            if (lo + 1 == hi):
-                return lo + 1
-            m = int((lo + hi) / 2)
-            if time > times[m]:
-                return find(m, hi)
-            else:
-                return find(lo, m)
-
-        return find(0, n)
+        if isinstance(times, np.ndarray):
+            return int(np.searchsorted(times, time, side='left'))
+        return bisect.bisect_left(times, time)
 
     def fold(self, period, discard_remainder=True):
         """
@@ -312,7 +377,9 @@ class DataLog(OrderedDict):
         """
         # Note: Using closed intervals can lead to logs of unequal length, so
         # it should be disabled here to ensure a valid log
-        logs = self.split_periodic(period, adjust=True, closed_intervals=False)
+        # Note: The split logs are not returned, so can be views on this log
+        logs = self.split_periodic(
+            period, adjust=True, closed_intervals=False, copy=False)
         # Discard remainder if present
         if discard_remainder:
             if len(logs) > 1:
@@ -326,7 +393,7 @@ class DataLog(OrderedDict):
         for i, log in enumerate(logs):
             for k, v in log.items():
                 if k != self._time:
-                    out[k, i] = v
+                    out[k, i] = np.array(v) if isinstance(v, np.ndarray) else v
         return out
 
     def __getitem__(self, key):
@@ -365,7 +432,7 @@ class DataLog(OrderedDict):
         key = [str(x) for x in cell]
         key.append(str(name))
         key = '.'.join(key)
-        data = np.array(self[key], copy=True)
+        data = np.asarray(self[key])
         time = np.asarray(self.time())
 
         # Integration using the midpoint Riemann sum:
@@ -377,9 +444,12 @@ class DataLog(OrderedDict):
         # For discontinuities (esp. with CVODES), it makes more sense to treat
         # the signal as a zero-order hold, IE use the left-point integration
         # rule:
-        data[1:] = data[:-1] * (time[1:] - time[:-1])
-        data[0] = 0
-        return data.cumsum()
+        out = np.empty(data.shape, dtype=np.result_type(data, time, float))
+        if len(out):
+            out[0] = 0
+            np.multiply(data[:-1], np.diff(time), out=out[1:])
+            np.cumsum(out, out=out)
+        return out
 
     def interpolate_at(self, name, time):
         """
@@ -425,48 +495,35 @@ class DataLog(OrderedDict):
                 log2[k] = v[i:]
         return log1, log2
 
-    def itrim(self, a, b):
+    def itrim(self, a, b, copy=True):
         """
         Returns a copy of this log, with all entries trimmed to the region
         between indices ``a`` and ``b`` (similar to performing ``x = x[a:b]``
         on a list).
+
+        If this log contains NumPy arrays, the data is copied unless ``copy``
+        is set to ``False``, in which case the returned log contains views of
+        this log's arrays.
         """
-        log = DataLog()
-        log._time = self._time
-        for k, v in self.items():
-            if isinstance(v, np.ndarray):
-                log[k] = np.array(v[a:b], copy=True, dtype=float)
-            else:
-                log[k] = v[a:b]
-        return log
+        return self._slice(a, b, copy)
 
-    def itrim_left(self, i):
+    def itrim_left(self, i, copy=True):
         """
         Returns a copy of this log, with all entries before indice ``i``
         removed (similar to performing ``x = x[i:]`` on a list).
+
+        For the meaning of ``copy``, see :meth:`itrim`.
         """
-        log = DataLog()
-        log._time = self._time
-        for k, v in self.items():
-            if isinstance(v, np.ndarray):
-                log[k] = np.array(v[i:], copy=True, dtype=float)
-            else:
-                log[k] = v[i:]
-        return log
+        return self._slice(i, None, copy)
 
-    def itrim_right(self, i):
+    def itrim_right(self, i, copy=True):
         """
         Returns a copy of this log, with all entries starting from indice ``i``
         removed (similar to performing ``x = x[:i]`` on a list).
+
+        For the meaning of ``copy``, see :meth:`itrim`.
         """
-        log = DataLog()
-        log._time = self._time
-        for k, v in self.items():
-            if isinstance(v, np.ndarray):
-                log[k] = np.array(v[:i], copy=True, dtype=float)
-            else:
-                log[k] = v[:i]
-        return log
+        return self._slice(None, i, copy)
 
     def keys_like(self, query):
         """
@@ -491,15 +548,37 @@ class DataLog(OrderedDict):
         return len(next(iter(self.values())))
 
     @staticmethod
-    def load(filename, progress=None, msg='Loading DataLog'):
+    def load(filename, progress=None, msg='Loading DataLog', mmap=False,
+             keys=None, tmin=None, tmax=None):
         """
         Loads a :class:`DataLog` from the binary format used by myokit.
 
+        Both the format created by :meth:`save` and the chunked format written
+        by a :class:`DataLogWriter` (or by ``save`` with a ``chunk_size``) are
+        supported.
+
+        To load only some of the variables in a file, a list of ``keys`` can
+        be given. If the file has a time variable, this is always loaded, and
+        will be the first entry in the log if it was not among the ``keys``.
+        Similarly, only the data in a time window can be loaded by
+        setting ``tmin`` and/or ``tmax``. As with :meth:`trim`, this loads all
+        points with ``tmin <= t < tmax``. For chunked files, only the parts of
+        the file containing the selected variables and times are read from
+        disk, so that small selections from very large logs can be loaded
+        quickly.
+
         The values in the log will be stored in an :class:`array.array`. The
         data type used by the array will be the one specified in the binary
         file. Notice that an `array.array` storing single precision floats will
         make conversions to ``Float`` objects when items are accessed.
 
+        For files created with ``save(filename, compression='stored')``, the
+        data can also be memory-mapped instead of read, by setting
+        ``mmap=True``. In this case, each value in the log will be a read-only
+        NumPy array that is backed by the file, so that loading takes almost no
+        time or memory, and data is only read from disk when it is accessed.
+        The file should not be modified while the log is in use.
+
         To obtain feedback on the simulation progress, an object implementing
         the :class:`myokit.ProgressReporter` interface can be passed in.
         passed in as ``progress``. An optional description of the current
@@ -508,6 +587,20 @@ class DataLog(OrderedDict):
         # Check filename
         filename = os.path.expanduser(filename)
 
+        # Check selection
+        if keys is not None:
+            keys = [DataLog()._parse_key(key) for key in keys]
+        window = tmin is not None or tmax is not None
+
+        # Check for chunked format
+        with open(filename, 'rb') as f:
+            chunked = f.read(len(CHUNKED_MAGIC)) == CHUNKED_MAGIC
+        if chunked:
+            if mmap:
+                raise myokit.DataLogReadError(
+                    'Chunked log files cannot be memory-mapped.')
+            return _load_chunked(filename, progress, msg, keys, tmin, tmax)
+
         # Load compression modules
         import zipfile
         try:
@@ -536,8 +629,10 @@ class DataLog(OrderedDict):
             f = None
             f = zipfile.ZipFile(filename, 'r')
             # Get ZipInfo objects
+            shuffled = 'data-shuffled.bin' in f.namelist()
             try:
-                body = f.getinfo('data.bin')
+                body = f.getinfo(
+                    'data-shuffled.bin' if shuffled else 'data.bin')
             except KeyError:
                 raise myokit.DataLogReadError('Invalid log file format.')
             try:
@@ -546,7 +641,14 @@ class DataLog(OrderedDict):
                 raise myokit.DataLogReadError('Invalid log file format.')
             # Read file contents
             head = f.read(head).decode(ENC)
-            body = f.read(body)
+            if mmap:
+                if body.compress_type != zipfile.ZIP_STORED or shuffled:
+                    raise myokit.DataLogReadError(
+                        'Only logs stored without compression or shuffling'
+                        ' can be memory-mapped.')
+                body = (_zip_data_offset(filename, body), body.file_size)
+            else:
+                body = f.read(body)
         except zipfile.BadZipfile:
             raise myokit.DataLogReadError('Unable to read log: bad zip file.')
         except zipfile.LargeZipFile:    # pragma: no cover
@@ -575,6 +677,14 @@ class DataLog(OrderedDict):
             raise myokit.DataLogReadError(
                 'Invalid number of fields specified.')
 
+        # Check selection, and get set of fields to read
+        wanted = None
+        if keys is not None:
+            keys = _check_keys(keys, time, fields)
+            wanted = set(keys)
+        if window:
+            _check_window(time, fields)
+
         # Get size of each entry on disk
         if data_size < 0:
             raise myokit.DataLogReadError(
@@ -585,6 +695,25 @@ class DataLog(OrderedDict):
             raise myokit.DataLogReadError(
                 'Invalid data type: "' + data_type + '".')
 
+        # Create memory-mapped arrays
+        if mmap:
+            offset, nbody = body
+            if nbody < data_size * n:
+                raise myokit.DataLogReadError(
+                    'Header indicates larger data size than found in body.')
+            if n == 0 or data_size == 0:
+                for field in fields:
+                    log[field] = np.zeros(0, dtype=data_type)
+                return _select(log, keys, tmin, tmax)
+            dtype = np.dtype(data_type).newbyteorder('<')
+            shape = (n, data_size // dsize[data_type])
+            data = np.memmap(
+                filename, dtype=dtype, mode='r', offset=offset, shape=shape)
+            for k, field in enumerate(fields):
+                if wanted is None or field in wanted:
+                    log[field] = data[k]
+            return _select(log, keys, tmin, tmax)
+
         # Parse read data
         fraction = 1.0 / len(fields)
         start, end = 0, 0
@@ -603,20 +732,25 @@ class DataLog(OrderedDict):
                     raise myokit.DataLogReadError(
                         'Header indicates larger data size than found in body.'
                     )
+                if wanted is not None and field not in wanted:
+                    continue
 
                 # Read data
+                data = body[start:end]
+                if shuffled:
+                    data = _unshuffle(data, dsize[data_type])
                 ar = array.array(data_type)
                 try:
-                    ar.frombytes(body[start:end])
+                    ar.frombytes(data)
                 except AttributeError:  # pragma: no python 3 cover
-                    ar.fromstring(body[start:end])
+                    ar.fromstring(data)
                 if sys.byteorder == 'big':  # pragma: no cover
                     ar.byteswap()
                 log[field] = ar
         finally:
             if progress:
                 progress.exit()
-        return log
+        return _select(log, keys, tmin, tmax)
 
     @staticmethod
     def load_csv(filename, precision=myokit.DOUBLE_PRECISION):
@@ -844,60 +978,50 @@ class DataLog(OrderedDict):
         ``tmax``. If no value for ``tmax`` is given the final value in the log
         is used.
 
-        This method works by
-
-          1. Finding the indices corresponding to ``tmin`` and ``tmax``.
-          2. Creating a spline interpolant with all the data from ``tmin`` to
-             ``tmax``. If possible, two points to the left and right of
-             ``tmin`` and ``tmax`` will be included in the interpolated data
-             set (so *only* if there are at least two values before ``tmin`` or
-             two values after ``tmax`` in the data respectively).
-          3. Evaluating the interpolant at the regularly spaced points.
-
-        As a result of the cubic spline interpolation, the function may perform
-        poorly on large data sets.
-
-        This method requires ``SciPy`` to be installed.
+        Values at the new time points are obtained using linear interpolation
+        between the nearest logged points. Points before the first or after
+        the last logged time are found by linear extrapolation from the first
+        or last two points.
         """
         self.validate()
-        from scipy.interpolate import UnivariateSpline as Spline
 
         # Check time variable
-        time = self.time()
-        n = len(time)
-
-        # Get left indice for splines
-        imin = 0
+        time = np.asarray(self.time())
         if tmin is None:
             tmin = time[0]
-        elif tmin > time[0]:
-            # Find position of tmin in time list, then add two points to the
-            # left so that the spline has 4 points
-            imin = max(0, np.searchsorted(time, tmin) - 2)
-
-        # Get right indice for splines
-        imax = n
         if tmax is None:
             tmax = time[-1]
-        elif tmax < time[-1]:
-            imax = min(n, np.searchsorted(time, tmax) + 2)
 
         # Get time steps
         steps = 1 + np.floor((tmax - tmin) / dt)
         rtime = tmin + dt * np.arange(0, steps)
 
+        # Points requiring extrapolation
+        left = rtime < time[0]
+        right = rtime > time[-1]
+        if len(time) < 2:
+            left[:] = right[:] = False
+
         # Create output and return
         out = DataLog()
         out._time = self._time
         out[self._time] = rtime
-        time_part = time[imin:imax]
         for key, data in self.items():
             if key != self._time:
-                s = Spline(time_part, data[imin:imax], k=1, s=0)
-                out[key] = s(rtime)
+                data = np.asarray(data)
+                values = np.interp(rtime, time, data)
+                if np.any(left):
+                    values[left] = data[0] + (rtime[left] - time[0]) * (
+                        (data[1] - data[0]) / (time[1] - time[0]))
+                if np.any(right):
+                    values[right] = data[-1] + (rtime[right] - time[-1]) * (
+                        (data[-1] - data[-2]) / (time[-1] - time[-2]))
+                out[key] = values
         return out
 
-    def save(self, filename, precision=myokit.DOUBLE_PRECISION):
+    def save(self, filename, precision=myokit.DOUBLE_PRECISION,
+             compression='deflate', chunk_size=None, shuffle=False,
+             threads=None):
         """
         Writes this ``DataLog`` to a binary file.
 
@@ -912,12 +1036,45 @@ class DataLog(OrderedDict):
 
         The optional argument ``precision`` allows logs to be stored in single
         precision format, which saves space.
+
+        By default, the data is compressed using ``compression='deflate'``.
+        Faster but less effective compression can be used by setting
+        ``compression='deflate-fast'``, while ``compression='lzma'`` gives
+        smaller files but is much slower. Large logs can be stored without
+        compression by setting ``compression='stored'``, which results in
+        larger files but allows them to be loaded with ``mmap=True`` (see
+        :meth:`load`).
+
+        Setting ``shuffle=True`` reorders the bytes of each variable's data
+        before compression, so that the first bytes of all values are stored
+        together, followed by all second bytes, etc. For smoothly varying
+        floating point data this often improves compression considerably.
+
+        If a ``chunk_size`` is given, the log is stored in the chunked format
+        used by :class:`DataLogWriter` instead, with every ``chunk_size``
+        points stored as a separate chunk and every variable in a chunk
+        compressed separately. This allows selected variables and time ranges
+        to be loaded without reading the full file (see :meth:`load`). In this
+        format, the variables are compressed in parallel threads. The maximum
+        number of threads can be set with ``threads`` (by default, one thread
+        per CPU core is used).
         """
         self.validate()
 
         # Check filename
         filename = os.path.expanduser(filename)
 
+        # Store in chunked format
+        if chunk_size is not None:
+            with DataLogWriter(filename, self.keys(), self._time, chunk_size,
+                               precision, compression, shuffle,
+                               threads) as w:
+                chunk_size = w._chunk_size
+                for i in range(0, self.length(), chunk_size):
+                    for k, v in self.items():
+                        w[k].extend(v[i:i + chunk_size])
+            return
+
         # Load compression modules
         import zipfile
         try:
@@ -928,6 +1085,22 @@ class DataLog(OrderedDict):
             raise Exception(
                 'This method requires the `zlib` module to be installed.')
 
+        # Compression
+        level = None
+        if compression == 'deflate':
+            compression = zipfile.ZIP_DEFLATED
+        elif compression == 'deflate-fast':
+            compression = zipfile.ZIP_DEFLATED
+            level = 1
+        elif compression == 'lzma':
+            _import_lzma()
+            compression = zipfile.ZIP_LZMA
+        elif compression == 'stored':
+            compression = zipfile.ZIP_STORED
+        else:
+            raise ValueError(
+                'Unknown compression method: ' + repr(compression) + '.')
+
         # Data type
         # dtype must be str for Python 2.7.10 (see #225)
         dtype = str('d' if precision == myokit.DOUBLE_PRECISION else 'f')
@@ -949,13 +1122,20 @@ class DataLog(OrderedDict):
         for k, v in self.items():
             head_str.append(k)
             # Create array, ensure it's litte-endian
-            ar = array.array(dtype, v)
-            if sys.byteorder == 'big':  # pragma: no cover
-                ar.byteswap()
-            try:
-                body_str.append(ar.tobytes())
-            except AttributeError:   # pragma: no python 3 cover
-                body_str.append(ar.tostring())
+            if isinstance(v, np.ndarray):
+                ar = np.asarray(
+                    v, dtype=np.dtype(dtype).newbyteorder('<')).tobytes()
+            else:
+                ar = array.array(dtype, v)
+                if sys.byteorder == 'big':  # pragma: no cover
+                    ar.byteswap()
+                try:
+                    ar = ar.tobytes()
+                except AttributeError:   # pragma: no python 3 cover
+                    ar = ar.tostring()
+            if shuffle:
+                ar = _shuffle(ar, array.array(dtype).itemsize)
+            body_str.append(ar)
         head_str = '\n'.join(head_str)
         body_str = b''.join(body_str)
 
@@ -964,12 +1144,21 @@ class DataLog(OrderedDict):
         # Write
         head = zipfile.ZipInfo('structure.txt')
         head.compress_type = zipfile.ZIP_DEFLATED
-        body = zipfile.ZipInfo('data.bin')
-        body.compress_type = zipfile.ZIP_DEFLATED
+        body = zipfile.ZipInfo('data-shuffled.bin' if shuffle else 'data.bin')
+        body.compress_type = compression
+        if compression == zipfile.ZIP_STORED:
+            _zip_align(body, len(body_str))
         read = zipfile.ZipInfo('readme.txt')
         read.compress_type = zipfile.ZIP_DEFLATED
         with zipfile.ZipFile(filename, 'w') as f:
-            f.writestr(body, body_str)
+            if level is None:
+                f.writestr(body, body_str)
+            else:
+                try:
+                    f.writestr(body, body_str, compresslevel=level)
+                except TypeError:   # pragma: no cover
+                    # Compression levels require Python 3.7+
+                    f.writestr(body, body_str)
             f.writestr(head, head_str.encode(enc))
             f.writestr(read, README_SAVE_BIN.encode(enc))
 
@@ -1103,6 +1292,21 @@ class DataLog(OrderedDict):
         return super(DataLog, self).__setitem__(
             self._parse_key(key), value)
 
+    def _slice(self, a, b, copy):
+        """
+        Returns a log with all entries sliced as ``x[a:b]``. NumPy arrays are
+        copied (and converted to float) if ``copy`` is ``True``, and returned
+        as views otherwise.
+        """
+        log = DataLog()
+        log._time = self._time
+        for k, v in self.items():
+            if isinstance(v, np.ndarray) and copy:
+                log[k] = np.array(v[a:b], copy=True, dtype=float)
+            else:
+                log[k] = v[a:b]
+        return log
+
     def split(self, value):
         """
         Splits the log into a part before and after the time ``value``::
@@ -1116,7 +1320,8 @@ class DataLog(OrderedDict):
         """
         return self.isplit(self.find_after(value))
 
-    def split_periodic(self, period, adjust=False, closed_intervals=True):
+    def split_periodic(self, period, adjust=False, closed_intervals=True,
+                       copy=True):
         """
         Splits this log into multiple logs, each covering an equal period of
         time. For example a log covering the time span ``[0, 10000]`` can be
@@ -1132,6 +1337,11 @@ class DataLog(OrderedDict):
         the duplication of some data points. To disable this behaviour and
         return half-closed endpoints (containing only the left point), set
         ``closed_intervals`` to ``False``.
+
+        If this log contains NumPy arrays, the data is copied unless ``copy``
+        is set to ``False``, in which case the returned logs contain views of
+        this log's arrays (except for adjusted time arrays, which are always
+        new arrays).
         """
         # Validate log before starting
         self.validate()
@@ -1157,67 +1367,29 @@ class DataLog(OrderedDict):
 
         # Find split points
         tstarts = tmin + np.arange(nlogs) * period
-        istarts = [0] * nlogs
-        k = 0
-        for i, t in enumerate(time):
-            while k < nlogs and t >= tstarts[k]:
-                istarts[k] = i
-                k += 1
-
-        # Create logs
-        logs = []
-        for i in range(0, nlogs - 1):
-            log = DataLog()
-            log._time = self._time
-
-            # Get indices
-            imin = istarts[i]
-            imax = istarts[i + 1]
+        istarts = np.searchsorted(time, tstarts, side='left')
 
-            # Include right point endpoint if needed
-            if closed_intervals and time[imax] == tstarts[i + 1]:
-                imax += 1
+        # Find end points
+        iends = np.empty(istarts.shape, dtype=istarts.dtype)
+        iends[:-1] = istarts[1:]
+        iends[-1] = len(time)
 
-            # Select sections of log and append
-            for k, v in self.items():
-                d = self[k][imin:imax]
-                # NumPy? Then copy data
-                if isinstance(d, np.ndarray):
-                    d = np.array(d, copy=True, dtype=float)
-                log[k] = d
-            logs.append(log)
-
-        # Last log
-        log = DataLog()
-        log._time = self._time
-        imin = istarts[-1]
-        imax = len(time)
+        # Include right point endpoint if needed
+        if closed_intervals:
+            iends[:-1] += np.asarray(time)[istarts[1:]] == tstarts[1:]
 
         # Not including right endpoints? Then may be required to omit last pt
-        if not closed_intervals and time[-1] >= tmin + nlogs * period:
-            imax -= 1
+        elif time[-1] >= tmin + nlogs * period:
+            iends[-1] -= 1
 
-        # Select sections of log and append
-        for k, v in self.items():
-            d = self[k][imin:imax]
-            # NumPy? Then copy data
-            if isinstance(d, np.ndarray):
-                d = np.array(d, copy=True, dtype=float)
-            log[k] = d
-        logs.append(log)
+        # Create logs
+        logs = [self._slice(int(a), int(b), copy)
+                for a, b in zip(istarts, iends)]
 
         # Adjust
         if adjust:
-            if isinstance(time, np.ndarray):
-                # Fast method for numpy arrays
-                for k, log in enumerate(logs):
-                    log[self._time] -= k * period
-            else:
-                for k, log in enumerate(logs):
-                    tlist = log[self._time]
-                    tdiff = k * period
-                    for i in range(len(tlist)):
-                        tlist[i] -= tdiff
+            for k, log in enumerate(logs):
+                log._adjust_time(k * period)
 
         # Return
         return logs
@@ -1247,46 +1419,49 @@ class DataLog(OrderedDict):
         """
         return self._time
 
-    def trim(self, a, b, adjust=False):
+    def trim(self, a, b, adjust=False, copy=True):
         """
         Returns a copy of this log, with all data before time ``a`` and after
         (and including) time ``b`` removed.
 
         If ``adjust`` is set to ``True``, all logged times will be lowered by
         ``a``.
+
+        If this log contains NumPy arrays, the data is copied unless ``copy``
+        is set to ``False``, in which case the returned log contains views of
+        this log's arrays (except for an adjusted time array, which is always
+        a new array).
         """
         self.validate()
-        log = self.itrim(self.find_after(a), self.find_after(b))
+        log = self.itrim(self.find_after(a), self.find_after(b), copy)
         if adjust and self._time in log:
-            if isinstance(log[self._time], np.ndarray):
-                log[self._time] -= a
-            else:
-                log[self._time] = [x - a for x in log[self._time]]
+            log._adjust_time(a)
         return log
 
-    def trim_left(self, value, adjust=False):
+    def trim_left(self, value, adjust=False, copy=True):
         """
         Returns a copy of this log, with all data before time ``value``
         removed.
 
         If ``adjust`` is set to ``True``, all logged times will be lowered by
         ``value``.
+
+        For the meaning of ``copy``, see :meth:`trim`.
         """
         self.validate()
-        log = self.itrim_left(self.find_after(value))
+        log = self.itrim_left(self.find_after(value), copy)
         if adjust and self._time in log:
-            if isinstance(log[self._time], np.ndarray):
-                log[self._time] -= value
-            else:
-                log[self._time] = [x - value for x in log[self._time]]
+            log._adjust_time(value)
         return log
 
-    def trim_right(self, value):
+    def trim_right(self, value, copy=True):
         """
         Returns a copy of this log, with all data at times after and including
         ``value`` removed.
+
+        For the meaning of ``copy``, see :meth:`trim`.
         """
-        return self.itrim_right(self.find_after(value))
+        return self.itrim_right(self.find_after(value), copy)
 
     def validate(self):
         """
@@ -1415,6 +1590,310 @@ class DataLog(OrderedDict):
         return infos
 
 
+class DataLogWriter(DataLog):
+    """
+    A :class:`DataLog` that writes its data to disk while it is being logged,
+    so that the memory used during long simulations stays bounded.
+
+    A ``DataLogWriter`` can be passed to a simulation's ``run`` method as the
+    ``log`` argument. Each logged value is added to an in-memory buffer, and
+    every time ``chunk_size`` points have been logged, the buffered data is
+    appended to the file at ``filename`` and removed from memory. Remaining
+    data is written when :meth:`close` is called, for example::
+
+        with myokit.DataLogWriter('log.bin', ['engine.time', 'membrane.V'],
+                                  time='engine.time') as log:
+            s = myokit.Simulation(m, p)
+            s.run(3600000, log=log, log_interval=1)
+
+        d = myokit.DataLog.load('log.bin')
+
+    The file uses a chunked binary format that can be read with
+    :meth:`DataLog.load`. Because data is appended to the file, everything
+    written before a crash can still be read from an unfinished file.
+
+    As the data is not kept in memory, most ``DataLog`` methods cannot be used
+    on a ``DataLogWriter``: the data should be loaded from disk after the
+    writer has been closed instead. The length of each entry, as returned by
+    ``len(log[key])`` or :meth:`length`, includes the data already written to
+    disk.
+
+    Arguments:
+
+    ``filename``
+        The file to write to. Any existing file will be overwritten.
+    ``keys``
+        The keys to log. Keys cannot be added or removed after the writer has
+        been created.
+    ``time``
+        The key to use for the time variable (if any).
+    ``chunk_size``
+        The number of points to buffer before writing to disk.
+    ``precision``
+        The precision to store data in, either ``myokit.DOUBLE_PRECISION`` or
+        ``myokit.SINGLE_PRECISION``.
+    ``compression``
+        The compression to use for each variable's data in each chunk, one of
+        ``'deflate'``, ``'deflate-fast'``, ``'lzma'``, or ``'stored'`` (no
+        compression). See :meth:`DataLog.save` for details.
+    ``shuffle``
+        Set to ``True`` to shuffle the bytes in each block of data before
+        compression (see :meth:`DataLog.save`).
+    ``threads``
+        The maximum number of threads to use to compress the data in a chunk.
+        By default, one thread per CPU core is used.
+
+    """
+    def __init__(self, filename, keys, time=None, chunk_size=10000,
+                 precision=myokit.DOUBLE_PRECISION, compression='deflate',
+                 shuffle=False, threads=None):
+        super(DataLogWriter, self).__init__(time=time)
+
+        # Chunk size
+        chunk_size = int(chunk_size)
+        if chunk_size < 1:
+            raise ValueError('The chunk size must be at least 1.')
+        self._chunk_size = chunk_size
+
+        # Compression
+        self._codec, self._compress = _chunked_compressor(compression)
+        self._shuffle = bool(shuffle)
+        if self._shuffle:
+            self._codec += '+shuffle'
+
+        # Data type
+        self._dtype = str('d' if precision == myokit.DOUBLE_PRECISION else 'f')
+
+        # Create columns
+        for key in keys:
+            super(DataLogWriter, self).__setitem__(
+                self._parse_key(key), _DataLogWriterColumn(self))
+        self._columns = list(self.values())
+        if len(self._columns) == 0:
+            raise ValueError('At least one key must be given.')
+
+        # Create thread pool for compression
+        self._pool = None
+        if threads is None:
+            threads = multiprocessing.cpu_count()
+        threads = min(int(threads), len(self._columns))
+        if threads > 1 and self._compress is not None and futures is not None:
+            self._pool = futures.ThreadPoolExecutor(max_workers=threads)
+
+        # Number of columns with a full buffer
+        self._nfull = 0
+
+        # Number of points written to disk
+        self._nwritten = 0
+
+        # Index entries for chunks written to disk
+        self._index = []
+
+        # Open file
+        self._filename = os.path.abspath(os.path.expanduser(filename))
+        self._file = open(self._filename, 'wb')
+        self._header = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+    def _chunk_full(self):
+        """
+        Called by a column when its buffer holds at least ``chunk_size``
+        points. Writes chunks for as long as every column holds a full chunk.
+        """
+        # Note: _nfull can overestimate the number of full columns (columns
+        # that are already full report again when appended to), but never
+        # underestimates it.
+        self._nfull += 1
+        if self._nfull >= len(self._columns):
+            n = self._chunk_size
+            while min([len(c._b) for c in self._columns]) >= n:
+                self._write_chunk(n)
+            self._nfull = len([c for c in self._columns if len(c._b) >= n])
+
+    def clone(self, numpy=False):
+        """ Writers cannot be cloned: raises a ``NotImplementedError``. """
+        raise NotImplementedError('DataLogWriter objects cannot be cloned.')
+
+    def close(self):
+        """
+        Writes any remaining data to disk, and closes the file.
+
+        Raises a :class:`myokit.InvalidDataLogError` if not all entries contain
+        the same number of points. In this case, as much data as possible will
+        still be written.
+        """
+        if self._file is None:
+            return
+        try:
+            n = min([len(c._b) for c in self._columns])
+            m = max([len(c._b) for c in self._columns])
+            if n or not self._header:
+                self._write_chunk(n)
+            self._write_index()
+            if n != m:
+                raise myokit.InvalidDataLogError(
+                    'All entries in a data log must have the same length.')
+        finally:
+            self._file.close()
+            self._file = None
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+    def closed(self):
+        """ Returns ``True`` if this writer has been closed. """
+        return self._file is None
+
+    def filename(self):
+        """ Returns the path to the file this writer writes to. """
+        return self._filename
+
+    def length(self):
+        """
+        Returns the number of points logged so far, including points already
+        written to disk.
+        """
+        return len(self._columns[0])
+
+    def __setitem__(self, key, value):
+        raise TypeError('Entries cannot be replaced in a DataLogWriter.')
+
+    def set_time_key(self, key):
+        """
+        Sets the key under which the time data is stored. This can only be
+        done before any data has been written.
+        """
+        if getattr(self, '_header', False):
+            raise RuntimeError(
+                'The time key cannot be changed after writing has started.')
+        super(DataLogWriter, self).set_time_key(key)
+
+    def validate(self):
+        """
+        Validates this ``DataLogWriter``. Raises a
+        :class:`myokit.InvalidDataLogError` if the log has inconsistencies.
+        """
+        if self._time and self._time not in self:
+            raise myokit.InvalidDataLogError(
+                'Time variable <' + str(self._time)
+                + '> specified but not found in log.')
+        n = set([len(v) for v in self.values()])
+        if len(n) > 1:
+            raise myokit.InvalidDataLogError(
+                'All entries in a data log must have the same length.')
+
+    def _write_chunk(self, n):
+        """ Writes the first ``n`` buffered points of each column to disk. """
+        if self._file is None:
+            raise ValueError('I/O operation on closed DataLogWriter.')
+
+        # Write header
+        if not self._header:
+            head = [
+                '1', str(len(self)), self._dtype, self._time or '',
+                self._codec]
+            head.extend(self.keys())
+            head = '\n'.join(head).encode(ENC)
+            self._file.write(CHUNKED_MAGIC)
+            self._file.write(struct.pack('<I', len(head)))
+            self._file.write(head)
+            self._header = True
+        if n == 0:
+            self._file.flush()
+            return
+
+        # Time range
+        t0 = t1 = float('nan')
+        if self._time:
+            t = self[self._time]._b
+            t0, t1 = t[0], t[n - 1]
+
+        # Get data blocks
+        blocks = []
+        for c in self._columns:
+            ar = c._b[:n]
+            del(c._b[:n])
+            if sys.byteorder == 'big':  # pragma: no cover
+                ar.byteswap()
+            try:
+                blocks.append(ar.tobytes())
+            except AttributeError:   # pragma: no python 3 cover
+                blocks.append(ar.tostring())
+
+        # Shuffle and compress blocks, in parallel if possible
+        if self._shuffle or self._compress is not None:
+            if self._pool is None:
+                blocks = [self._encode(b) for b in blocks]
+            else:
+                blocks = list(self._pool.map(self._encode, blocks))
+
+        # Write chunk
+        head = struct.pack('<Qdd', n, t0, t1) + struct.pack(
+            '<' + str(len(blocks)) + 'Q', *[len(b) for b in blocks])
+        self._index.append(struct.pack('<Q', self._file.tell()) + head)
+        self._file.write(CHUNKED_CHUNK)
+        self._file.write(head)
+        for block in blocks:
+            self._file.write(block)
+        self._file.flush()
+        self._nwritten += n
+
+    def _encode(self, block):
+        """ Shuffles and/or compresses a single block of data. """
+        if self._shuffle:
+            block = _shuffle(block, array.array(self._dtype).itemsize)
+        if self._compress is not None:
+            block = self._compress(block)
+        return block
+
+    def _write_index(self):
+        """ Writes the chunk index to disk. """
+        offset = self._file.tell()
+        self._file.write(CHUNKED_INDEX)
+        self._file.write(struct.pack('<Q', len(self._index)))
+        for entry in self._index:
+            self._file.write(entry)
+        self._file.write(struct.pack('<Q', offset))
+        self._file.write(CHUNKED_INDEX)
+        self._file.flush()
+
+
+class _DataLogWriterColumn(object):
+    """
+    A column in a :class:`DataLogWriter`, providing the ``append`` and
+    ``extend`` methods used by simulations.
+    """
+    def __init__(self, writer):
+        self._w = writer
+        self._b = array.array(writer._dtype)
+
+    def append(self, value):
+        self._b.append(value)
+        if len(self._b) >= self._w._chunk_size:
+            self._w._chunk_full()
+
+    def extend(self, values):
+        if isinstance(values, np.ndarray):
+            values = np.asarray(values, dtype=self._b.typecode)
+            try:
+                self._b.frombytes(values.tobytes())
+            except AttributeError:  # pragma: no python 3 cover
+                self._b.fromstring(values.tostring())
+        else:
+            self._b.extend(values)
+        if len(self._b) >= self._w._chunk_size:
+            self._w._chunk_full()
+
+    def __len__(self):
+        return self._w._nwritten + len(self._b)
+
+
 class LoggedVariableInfo(object):
     """
     Contains information about the log entries for each variable. These objects
@@ -1953,6 +2432,326 @@ def prepare_log(
     return log
 
 
+def _zip_align(info, size):
+    """
+    Adds padding to the extra field of a ``ZipInfo`` for the first entry in a
+    zip file, so that its (uncompressed) data starts at an 8-byte boundary.
+    This lets memory-mapped arrays be aligned.
+    """
+    import zipfile
+
+    # Size of local header, including a zip64 extra field if zipfile will add
+    # one (see ZipFile._open_to_write).
+    offset = 30 + len(info.filename.encode(ENC))
+    if size * 1.05 > zipfile.ZIP64_LIMIT:
+        offset += 20
+
+    # Add padding in an extra field with id 0xd935 (as used by zipalign)
+    pad = (8 - (offset + 4) % 8) % 8
+    info.extra = struct.pack('<HH', 0xd935, pad) + b'\x00' * pad
+
+
+def _zip_data_offset(filename, info):
+    """
+    Returns the position of the data for the zip entry with the given
+    ``ZipInfo`` in the file at ``filename``.
+    """
+    import zipfile
+    with open(filename, 'rb') as f:
+        f.seek(info.header_offset)
+        head = f.read(zipfile.sizeFileHeader)
+    if len(head) != zipfile.sizeFileHeader or head[:4] != b'PK\x03\x04':
+        raise myokit.DataLogReadError('Invalid log file format.')
+    head = struct.unpack(zipfile.structFileHeader, head)
+    return info.header_offset + zipfile.sizeFileHeader + head[10] + head[11]
+
+
+def _read_chunked_header(f):
+    """
+    Reads the header of a chunked DataLog file (after the magic bytes), and
+    returns a tuple ``(data_type, time, codec, fields)``.
+    """
+    try:
+        n = struct.unpack('<I', f.read(4))[0]
+        head = f.read(n).decode(ENC)
+    except (struct.error, UnicodeDecodeError):
+        raise myokit.DataLogReadError('Invalid log file header.')
+    head = head.split('\n')
+    if len(head) < 5:
+        raise myokit.DataLogReadError('Invalid log file header.')
+    if head[0] != '1':
+        raise myokit.DataLogReadError(
+            'Unsupported chunked log format version: ' + head[0] + '.')
+    try:
+        n = int(head[1])
+    except ValueError:
+        raise myokit.DataLogReadError('Invalid number of fields specified.')
+    data_type = str(head[2])    # Cast to str for Python 2.7.10 (see #225)
+    if data_type not in ('d', 'f'):
+        raise myokit.DataLogReadError(
+            'Invalid data type: "' + data_type + '".')
+    fields = head[5:]
+    if len(fields) != n:
+        raise myokit.DataLogReadError('Invalid number of fields specified.')
+    return data_type, head[3], head[4], fields
+
+
+def _load_chunked(filename, progress, msg, keys=None, tmin=None, tmax=None):
+    """
+    Loads a :class:`DataLog` stored in the chunked format, reading only the
+    blocks needed for the given ``keys`` and time window.
+    """
+    log = DataLog()
+    with open(filename, 'rb') as f:
+        f.read(len(CHUNKED_MAGIC))
+        data_type, time, codec, fields = _read_chunked_header(f)
+        decompress, shuffled = _chunked_decompressor(codec)
+        if time:
+            log._time = time
+
+        # Get selected fields and time window
+        if keys is None:
+            keys = fields
+        else:
+            keys = _check_keys(keys, time, fields)
+        columns = [fields.index(key) for key in keys]
+        arrays = [array.array(data_type) for key in keys]
+        itime = None
+        if tmin is not None or tmax is not None:
+            _check_window(time, fields)
+            itime = fields.index(time)
+        isize = array.array(data_type).itemsize
+
+        # Get chunk positions
+        index = _read_chunked_index(f, len(fields))
+
+        def read(offset, size):
+            f.seek(offset)
+            block = f.read(size)
+            if decompress is not None:
+                block = decompress(block)
+            if shuffled:
+                block = _unshuffle(block, isize)
+            return block
+
+        # Read chunks
+        try:
+            if progress:
+                progress.enter(msg)
+            for k, chunk in enumerate(index):
+                if progress and not progress.update(k / len(index)):
+                    return
+                offset, n, t0, t1, sizes = chunk
+
+                # Select points in time window
+                a, b = 0, n
+                if itime is not None:
+                    if tmin is not None and t1 < tmin:
+                        continue
+                    if tmax is not None and t0 >= tmax:
+                        continue
+                    if (tmin is not None and t0 < tmin) or (
+                            tmax is not None and t1 >= tmax):
+                        t = np.frombuffer(read(
+                            offset + sum(sizes[:itime]), sizes[itime]),
+                            dtype=np.dtype(data_type).newbyteorder('<'))
+                        if tmin is not None:
+                            a = int(np.searchsorted(t, tmin, side='left'))
+                        if tmax is not None:
+                            b = int(np.searchsorted(t, tmax, side='left'))
+                        if a >= b:
+                            continue
+
+                # Read selected blocks
+                for ar, i in zip(arrays, columns):
+                    block = read(offset + sum(sizes[:i]), sizes[i])
+                    if (a, b) != (0, n):
+                        block = block[a * isize:b * isize]
+                    try:
+                        ar.frombytes(block)
+                    except AttributeError:  # pragma: no python 3 cover
+                        ar.fromstring(block)
+        finally:
+            if progress:
+                progress.exit()
+
+    for key, ar in zip(keys, arrays):
+        if sys.byteorder == 'big':  # pragma: no cover
+            ar.byteswap()
+        log[key] = ar
+    return log
+
+
+def _read_chunked_index(f, nfields):
+    """
+    Returns a list of tuples ``(offset, n, tmin, tmax, sizes)`` for every
+    complete chunk in an open chunked DataLog file, where ``offset`` is the
+    position of the chunk's first data block. The file must be positioned at
+    the start of the first chunk.
+
+    If the file ends with an index this is used, otherwise the chunk headers
+    are scanned.
+    """
+    start = f.tell()
+    f.seek(0, os.SEEK_END)
+    end = f.tell()
+    head_size = 24 + 8 * nfields
+    head_format = '<Qdd' + str(nfields) + 'Q'
+
+    def entry(offset, head):
+        head = struct.unpack(head_format, head)
+        return (offset + 4 + head_size, head[0], head[1], head[2], head[3:])
+
+    # Read index at end of file
+    if end - start >= 24:
+        f.seek(end - 12)
+        tail = f.read(12)
+        if tail[8:] == CHUNKED_INDEX:
+            offset = struct.unpack('<Q', tail[:8])[0]
+            if start <= offset <= end - 24:
+                f.seek(offset)
+                head = f.read(12)
+                n = struct.unpack('<Q', head[4:])[0]
+                if head[:4] == CHUNKED_INDEX and (
+                        n * (8 + head_size) == end - offset - 24):
+                    data = f.read(n * (8 + head_size))
+                    index = []
+                    for i in range(0, len(data), 8 + head_size):
+                        index.append(entry(
+                            struct.unpack('<Q', data[i:i + 8])[0],
+                            data[i + 8:i + 8 + head_size]))
+                    return index
+
+    # Scan chunk headers
+    index = []
+    offset = start
+    while True:
+        f.seek(offset)
+        head = f.read(4 + head_size)
+        if head[:4] == CHUNKED_INDEX or len(head) < 4 + head_size:
+            break
+        if head[:4] != CHUNKED_CHUNK:
+            raise myokit.DataLogReadError('Invalid chunk header.')
+        chunk = entry(offset, head[4:])
+        offset = chunk[0] + sum(chunk[4])
+        if offset > end:
+            break
+        index.append(chunk)
+    return index
+
+
+def _chunked_compressor(compression):
+    """
+    Returns a tuple ``(codec, compress)`` for the given chunked DataLog
+    compression method, where ``codec`` is the name stored in the file and
+    ``compress`` is a function that compresses a block of bytes (or ``None``
+    for uncompressed data).
+    """
+    if compression == 'stored':
+        return 'stored', None
+    elif compression in ('deflate', 'deflate-fast'):
+        import zlib
+        level = 1 if compression == 'deflate-fast' else -1
+        return 'deflate', lambda block: zlib.compress(block, level)
+    elif compression == 'lzma':
+        return 'lzma', _import_lzma().compress
+    raise ValueError('Unknown compression method: ' + repr(compression) + '.')
+
+
+def _chunked_decompressor(codec):
+    """
+    Returns a tuple ``(decompress, shuffled)`` for the codec named in a
+    chunked DataLog file, where ``decompress`` is a function that decompresses
+    a block of bytes (or ``None`` for uncompressed data), and ``shuffled`` is
+    ``True`` if the bytes in each block were shuffled before compression.
+    """
+    shuffled = codec.endswith('+shuffle')
+    if shuffled:
+        codec = codec[:-8]
+    if codec == 'stored':
+        return None, shuffled
+    elif codec == 'deflate':
+        import zlib
+        return zlib.decompress, shuffled
+    elif codec == 'lzma':
+        return _import_lzma().decompress, shuffled
+    raise myokit.DataLogReadError('Unsupported compression: "' + codec + '".')
+
+
+def _import_lzma():
+    """ Imports and returns the ``lzma`` module. """
+    try:
+        import lzma
+    except ImportError:     # pragma: no python 3 cover
+        raise Exception(
+            'This method requires the ``lzma`` module to be installed.')
+    return lzma
+
+
+def _shuffle(data, itemsize):
+    """
+    Shuffles the bytes in a block of ``data`` with values of ``itemsize``
+    bytes, so that all first bytes are stored first, then all second bytes,
+    etc.
+    """
+    data = np.frombuffer(data, dtype=np.uint8)
+    return data.reshape((-1, itemsize)).T.tobytes()
+
+
+def _unshuffle(data, itemsize):
+    """ Reverses the operation performed by :meth:`_shuffle`. """
+    data = np.frombuffer(data, dtype=np.uint8)
+    return data.reshape((itemsize, -1)).T.tobytes()
+
+
+def _check_keys(keys, time, fields):
+    """
+    Checks that all ``keys`` selected for loading are among the ``fields``
+    found in a file, and returns the list of keys to load.
+
+    If the file has a time variable that is not among the ``keys``, its key is
+    added at the start of the returned list.
+    """
+    for key in keys:
+        if key not in fields:
+            raise KeyError('Key not found in log file: ' + str(key))
+    if time and time in fields and time not in keys:
+        keys = [time] + list(keys)
+    return keys
+
+
+def _check_window(time, fields):
+    """
+    Checks that a time window can be selected when loading a file with the
+    given time key and ``fields``.
+    """
+    if not time or time not in fields:
+        raise ValueError(
+            'A time window can only be selected in logs with a time'
+            ' variable.')
+
+
+def _select(log, keys, tmin, tmax):
+    """
+    Returns a log containing the given ``keys`` (in the given order) and the
+    points with ``tmin <= t < tmax`` from a loaded ``log``. Slices of NumPy
+    arrays are returned as views.
+    """
+    if tmin is not None or tmax is not None:
+        a = 0 if tmin is None else log.find_after(tmin)
+        b = log.length() if tmax is None else log.find_after(tmax)
+        if (a, b) != (0, log.length()):
+            for k, v in log.items():
+                log[k] = v[a:b]
+    if keys is not None:
+        selected = DataLog()
+        selected._time = log._time
+        for key in keys:
+            selected[key] = log[key]
+        log = selected
+    return log
+
+
 def _dimco(*dims):
     """
     Generates all the combinations of a certain set of integer dimensions. For
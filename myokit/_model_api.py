@@ -823,6 +823,10 @@ class Model(ObjectWithMeta, VarProvider):
         # Validation status: True, False or None (not tested)
         self._valid = None
 
+        # Cached compiled right-hand side, reset along with the validation
+        # status
+        self._compiled_rhs = None
+
         # Name meta property
         if name:
             self.meta['name'] = str(name)
@@ -842,7 +846,7 @@ class Model(ObjectWithMeta, VarProvider):
         try:
             self._components[name] = comp = Component(self, name)
         finally:
-            self._valid = None
+            self._reset_validation()
         return comp
 
     def add_component_allow_renaming(self, name):
@@ -1150,6 +1154,27 @@ class Model(ObjectWithMeta, VarProvider):
         for c in self.components(sort=True):
             c._code(b, t)
 
+    def compile_rhs(self):
+        """
+        Returns a :class:`myokit.RhsEvaluator` that uses compiled C code to
+        evaluate this model's state derivatives (and, optionally, its
+        intermediary variables) for one or more states.
+
+        Unlike :meth:`evaluate_derivatives()`, the returned object does not
+        walk the expression tree on every call, which makes it suitable for use
+        inside optimisers or root finders. For example::
+
+            f = model.compile_rhs()
+            dy = f(model.state())
+            dys = f(np.array([x1, x2, x3]))
+
+        The compiled evaluator is cached, and repeated calls to
+        ``compile_rhs()`` return the same object until the model is changed.
+        """
+        if self._compiled_rhs is None:
+            self._compiled_rhs = myokit.RhsEvaluator(self)
+        return self._compiled_rhs
+
     def components(self, sort=False):
         """
         Returns an iterator over this model's component objects.
@@ -2558,6 +2583,99 @@ class Model(ObjectWithMeta, VarProvider):
             var.set_binding(None)
         return variables
 
+    def pyfunc(self):
+        """
+        Returns a python function that uses NumPy to evaluate all state
+        derivatives for a whole array of states at once.
+
+        The returned function has the signature ``f(state, inputs=None,
+        out=None)``, where ``state`` is either a single state (a sequence of
+        length ``n``, where ``n`` is the number of states), or an array of
+        shape ``(..., n)``, e.g. an ``(N, n)`` array containing the states of
+        ``N`` cells in a population or tissue. The derivatives are returned in
+        an array of the same shape as ``state``, or written to and returned in
+        ``out`` if given.
+
+        Values for external inputs can be passed in as ``inputs``, a
+        dictionary mapping binding labels (e.g. ``time`` or ``pace``) to
+        either single values or arrays that broadcast against ``state[..., 0]``
+        (e.g. a different pacing value for each cell). If no value is given,
+        the right-hand side of the bound variable is used (as in
+        :meth:`evaluate_derivatives()`).
+
+        The function is generated from the equations in
+        :meth:`solvable_order()`: constants are evaluated once, when the
+        function is created, while all other equations are evaluated
+        element-wise (see
+        :class:`myokit.formats.python.NumPyArrayExpressionWriter`). This allows
+        large numbers of cells to be evaluated (and stepped, e.g. with a
+        forward Euler method) without a C compiler. Changes made to the model
+        after calling ``pyfunc()`` do not affect the returned function.
+        """
+        import numpy
+        from myokit.formats.python import NumPyArrayExpressionWriter
+        from myokit.formats.python import keywords
+
+        # Create a clone with valid python names for all variables
+        model = self.clone()
+        if not model.is_valid():
+            model.validate()
+        model.reserve_unique_names('numpy', *keywords)
+        model.create_unique_names()
+
+        # Get expression writer
+        w = NumPyArrayExpressionWriter()
+        w.set_lhs_function(
+            lambda x: ('_d_' if x.is_derivative() else '') + x.var().uname())
+
+        # Get equations in solvable order
+        order = model.solvable_order()
+        states = list(model.states())
+
+        # Calculate constants once
+        tab = '    '
+        func = []
+        for eqs in order.values():
+            for eq in eqs.equations(const=True):
+                func.append(w.eq(eq))
+
+        # Create function text
+        func.append('def model_pyfunc_generated(_state, _inputs=None, '
+                    '_out=None):')
+        func.append(tab + '_state = numpy.asarray(_state, dtype=float)')
+        func.append(tab + 'if _state.ndim < 1 or _state.shape[-1] != '
+                    + str(len(states)) + ':')
+        func.append(tab + tab + 'raise ValueError(\'State must have length '
+                    + str(len(states)) + ' (in the last dimension).\')')
+        func.append(tab + 'if _inputs is None:')
+        func.append(tab + tab + '_inputs = {}')
+        func.append(tab + 'if _out is None:')
+        func.append(tab + tab + '_out = numpy.empty(_state.shape)')
+        func.append(tab + 'with numpy.errstate(all=\'ignore\'):')
+        tab += tab
+        for i, var in enumerate(states):
+            func.append(tab + var.uname() + ' = _state[..., ' + str(i) + ']')
+        for label, eqs in order.items():
+            for eq in eqs.equations(const=False):
+                var = eq.lhs.var()
+                if var.is_bound():
+                    func.append(
+                        tab + w.ex(eq.lhs) + ' = _inputs.get('
+                        + repr(str(var.binding())) + ', ' + w.ex(eq.rhs)
+                        + ')')
+                else:
+                    func.append(tab + w.eq(eq))
+        for i, var in enumerate(states):
+            func.append(tab + '_out[..., ' + str(i) + '] = '
+                        + w.ex(var.lhs()))
+        func.append(tab[:4] + 'return _out')
+        func = '\n'.join(func) + '\n'
+
+        # Create function
+        local = {'numpy': numpy}
+        myokit._exec(func, local, local)
+        return local['model_pyfunc_generated']
+
     def __reduce__(self):
         """
         Pickles the model.
@@ -2651,6 +2769,7 @@ class Model(ObjectWithMeta, VarProvider):
         self._current_state = current
         for k, v in enumerate(state):
             v._indice = k
+        self._compiled_rhs = None
 
     def remove_component(self, component):
         """
@@ -2667,7 +2786,7 @@ class Model(ObjectWithMeta, VarProvider):
             # Delete component from list
             del(self._components[component.qname()])
         finally:
-            self._valid = None
+            self._reset_validation()
 
     def remove_derivative_references(self):
         """
@@ -2774,9 +2893,11 @@ class Model(ObjectWithMeta, VarProvider):
 
     def _reset_validation(self):
         """
-        Will reset the model's validation status to not validated.
+        Will reset the model's validation status to not validated, and clear
+        any cached compiled right-hand side.
         """
         self._valid = None
+        self._compiled_rhs = None
 
     def _resolve(self, name):
         """ See :meth:`VarProvider._resolve(). """
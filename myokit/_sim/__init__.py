@@ -9,8 +9,10 @@ from __future__ import absolute_import, division
 from __future__ import print_function, unicode_literals
 
 # Library imports
+import hashlib
 import os
 import platform
+import shutil
 import sys
 import tempfile
 import threading
@@ -56,6 +58,8 @@ if sys.hexversion >= 0x03050000:
         module = importlib.util.module_from_spec(spec)
         return module
 
+    EXTENSION_SUFFIXES = importlib.machinery.EXTENSION_SUFFIXES
+
 else:  # pragma: no python 3 cover
     import imp
 
@@ -64,6 +68,89 @@ else:  # pragma: no python 3 cover
         f.close()
         return imp.load_dynamic(name, pathname)
 
+    EXTENSION_SUFFIXES = [
+        x[0] for x in imp.get_suffixes() if x[2] == imp.C_EXTENSION]
+
+
+# Fingerprints of header files, used in cache keys
+_header_fingerprints = {}
+
+
+def _cache_key(source, libs, libd, incd, carg, larg):
+    """
+    Returns a key for the on-disk cache of compiled modules.
+    """
+    return myokit.tools.DiskCache.key(
+        myokit.__version__,
+        sys.version_info[:2],
+        sys.platform,
+        platform.machine(),
+        EXTENSION_SUFFIXES[0],
+        os.environ.get('CC'),
+        os.environ.get('CFLAGS'),
+        os.environ.get('LDFLAGS'),
+        source,
+        libs,
+        libd,
+        incd,
+        carg,
+        larg,
+        _header_fingerprint(incd),
+    )
+
+
+def _header_fingerprint(incd):
+    """
+    Returns a hash of Myokit's C header files and the Sundials configuration
+    header (which contains the Sundials version) found in the include
+    directories ``incd``.
+    """
+    incd = tuple(incd)
+    try:
+        return _header_fingerprints[incd]
+    except KeyError:
+        pass
+
+    h = hashlib.sha256()
+    paths = [os.path.join(x, 'sundials', 'sundials_config.h') for x in incd]
+    for fname in sorted(os.listdir(myokit.DIR_CFUNC)):
+        if os.path.splitext(fname)[1] in ('.h', '.hpp'):
+            paths.append(os.path.join(myokit.DIR_CFUNC, fname))
+    for path in paths:
+        if os.path.isfile(path):
+            h.update(path.encode('utf-8'))
+            with open(path, 'rb') as f:
+                h.update(f.read())
+    _header_fingerprints[incd] = h = h.hexdigest()
+    return h
+
+
+def _load_cached(cache, key, name):
+    """
+    Loads and returns a compiled module ``name`` from a
+    :class:`myokit.tools.DiskCache`, or returns ``None`` if not found.
+
+    The cached file is copied to a new temporary directory before loading, so
+    that each call returns a module with its own copy of any global variables.
+    """
+    path = cache.get(key)
+    if path is None:
+        return None
+    d_cache = tempfile.mkdtemp('myokit')
+    try:
+        try:
+            shutil.copyfile(
+                path, os.path.join(d_cache, name + EXTENSION_SUFFIXES[0]))
+            return load_module(name, d_cache)
+        except Exception:
+            # Removed by another process, or unloadable: recompile
+            return None
+    finally:
+        try:
+            myokit.tools.rmtree(d_cache)
+        except Exception:   # pragma: no cover
+            pass
+
 
 class CModule(object):
     """
@@ -85,6 +172,15 @@ class CModule(object):
         ``libd`` and ``incd``. Extra compiler arguments can be given in the
         list ``carg``, and linker args in ``larg``.
 
+        If ``myokit.CACHE_COMPILED`` is set, compiled modules are stored in an
+        on-disk cache in ``myokit.DIR_CACHE``, indexed by the generated source
+        code, the compiler and linker arguments, the Sundials version, and the
+        Python version. If a matching module is found in the cache, it is
+        imported without recompiling. Each call returns a separately loaded
+        copy of the module, so that no (C) global variables are shared between
+        the returned objects. When a module is loaded from the cache, its
+        ``__name__`` will differ from ``name``.
+
         If ``myokit.DEBUG_SG`` or ``myokit.DEBUG_WG`` are set, the method will
         print the generated code to screen and/or write it to disk. Following
         this, it will terminate with exit code 1 unless
@@ -99,6 +195,87 @@ class CModule(object):
             if not continue_in_debug_mode:
                 sys.exit(1)
 
+        # Ensure headers can be read from myokit/_sim
+        if incd is None:
+            incd = []
+        incd.append(myokit.DIR_CFUNC)
+
+        # Inputs must all be strings
+        name = str(name)
+        incd = [str(x) for x in incd]
+        libd = None if libd is None else [str(x) for x in libd]
+        libs = None if libs is None else [str(x) for x in libs]
+        carg = None if carg is None else [str(x) for x in carg]
+        larg = None if larg is None else [str(x) for x in larg]
+
+        # Show warnings
+        if myokit.DEBUG_SC:
+            if carg is None:
+                carg = []
+            carg.append('-Wall')
+            if platform.system() == 'Linux':
+                carg.extend([
+                    '-Wextra',
+                    '-Wstrict-prototypes',
+                    '-Wold-style-definition',
+                    '-Wmissing-prototypes',
+                    '-Wmissing-declarations',
+                    '-Wdeclaration-after-statement',
+                ])
+
+        # Add runtime_library_dirs to prevent LD_LIBRARY_PATH errors on
+        # unconventional linux sundials installations, but not on windows
+        # as this can lead to a weird error in setuptools
+        runtime = libd
+        if platform.system() == 'Windows':  # pragma: no linux cover
+            if libd is not None:
+                runtime = None
+
+                # Make windows search the libd directories
+                path = os.environ.get('path', '')
+                if path is None:
+                    path = ''
+                to_add = [x for x in libd if x not in path]
+                os.environ['path'] = os.pathsep.join([path] + to_add)
+
+                # In Python 3.8+, they need to be registered with
+                # add_dll_directory too. This does not seem to be 100%
+                # consistent. AppVeyor tests pass when using
+                # add_dll_directory *without* adding the directories to the
+                # path, while installations via miniconda seem to need the
+                # path method too.
+                try:
+                    # Fail if add_dll_directory not present
+                    os.add_dll_directory
+
+                    # Add DLL paths
+                    for path in libd:
+                        if os.path.isdir(path):
+                            os.add_dll_directory(path)
+                except AttributeError:
+                    pass
+
+        # Generate source code
+        source = self._export_inner(template, variables)
+
+        # Check the cache for a previously compiled module. The module name is
+        # unique for every call, so it is left out of the cache key and
+        # replaced by a name derived from the key.
+        cache = key = None
+        if myokit.CACHE_COMPILED and not myokit.DEBUG_SC:
+            cache = myokit.tools.DiskCache(
+                os.path.join(myokit.DIR_CACHE, 'modules'),
+                myokit.CACHE_COMPILED_SIZE)
+            key = _cache_key(
+                source.replace(name, ''), libs, libd, incd, carg, larg)
+            cached_name = 'myokit_cached_' + key[:32]
+            source = source.replace(name, cached_name)
+            name = cached_name
+
+            module = _load_cached(cache, key, name)
+            if module is not None:
+                return module
+
         # Write to temp dir and compile
         src_file = self._source_file()
         working_dir = os.getcwd()
@@ -109,69 +286,9 @@ class CModule(object):
             os.makedirs(d_build)
 
             # Export c file
-            src_file = os.path.join(d_cache, src_file)
-            self._export_inner(template, variables, src_file)
-
-            # Ensure headers can be read from myokit/_sim
-            if incd is None:
-                incd = []
-            incd.append(myokit.DIR_CFUNC)
-
-            # Inputs must all be strings
-            name = str(name)
-            src_file = str(src_file)
-            incd = [str(x) for x in incd]
-            libd = None if libd is None else [str(x) for x in libd]
-            libs = None if libs is None else [str(x) for x in libs]
-            carg = None if carg is None else [str(x) for x in carg]
-            larg = None if larg is None else [str(x) for x in larg]
-
-            # Show warnings
-            if myokit.DEBUG_SC:
-                if carg is None:
-                    carg = []
-                carg.append('-Wall')
-                if platform.system() == 'Linux':
-                    carg.extend([
-                        '-Wextra',
-                        '-Wstrict-prototypes',
-                        '-Wold-style-definition',
-                        '-Wmissing-prototypes',
-                        '-Wmissing-declarations',
-                        '-Wdeclaration-after-statement',
-                    ])
-
-            # Add runtime_library_dirs to prevent LD_LIBRARY_PATH errors on
-            # unconventional linux sundials installations, but not on windows
-            # as this can lead to a weird error in setuptools
-            runtime = libd
-            if platform.system() == 'Windows':  # pragma: no linux cover
-                if libd is not None:
-                    runtime = None
-
-                    # Make windows search the libd directories
-                    path = os.environ.get('path', '')
-                    if path is None:
-                        path = ''
-                    to_add = [x for x in libd if x not in path]
-                    os.environ['path'] = os.pathsep.join([path] + to_add)
-
-                    # In Python 3.8+, they need to be registered with
-                    # add_dll_directory too. This does not seem to be 100%
-                    # consistent. AppVeyor tests pass when using
-                    # add_dll_directory *without* adding the directories to the
-                    # path, while installations via miniconda seem to need the
-                    # path method too.
-                    try:
-                        # Fail if add_dll_directory not present
-                        os.add_dll_directory
-
-                        # Add DLL paths
-                        for path in libd:
-                            if os.path.isdir(path):
-                                os.add_dll_directory(path)
-                    except AttributeError:
-                        pass
+            src_file = str(os.path.join(d_cache, src_file))
+            with open(src_file, 'w') as f:
+                f.write(source)
 
             # Create extension
             ext = Extension(
@@ -211,6 +328,17 @@ class CModule(object):
                 t.extend(['    ' + x for x in captured.splitlines()])
                 raise myokit.CompilationError('\n'.join(t))
 
+            # Store in cache. Failing to do so is not an error.
+            if cache is not None:
+                for fname in os.listdir(d_build):
+                    if fname.startswith(name) and any(
+                            fname.endswith(x) for x in EXTENSION_SUFFIXES):
+                        try:
+                            cache.put_file(key, os.path.join(d_build, fname))
+                        except Exception:   # pragma: no cover
+                            pass
+                        break
+
             # Include module (and refresh in case 2nd model is loaded)
             return load_module(name, d_build)
 
@@ -167,6 +167,29 @@ Model_DeInitialiseLogging(model)
     De-initialises logging. This only needs to be called if logging needs to be
     set up differently, i.e. before a new call to Model_InitialiseLogging.
 
+Buffered logging
+================
+Creating a Python float for every logged value can be avoided by using
+buffered logging. In this mode, the values in the log dict must be (empty)
+Python bytearray objects, which are used as contiguous buffers of raw doubles
+that can be viewed as NumPy arrays from Python.
+
+Model_InitialiseBufferedLogging(model, log_dict, capacity)
+    Sets up logging like Model_InitialiseLogging, but writes to bytearrays
+    instead of appending to sequences. Space for ``capacity`` logged points is
+    allocated in advance, and the buffers are grown geometrically if more
+    points are logged.
+
+Model_FinaliseBufferedLogging(model)
+    Trims the bytearrays so that their size matches the number of logged
+    points. Must be called before the buffers are used from Python. Calling
+    this method has no effect if buffered logging was not initialised.
+
+Model_SetBufferedLogPosition(model, position)
+    Sets the index in the buffers that the next logged point will be written
+    to, and sets the number of logged points to ``position``. This can be used
+    to write several runs to consecutive blocks in the same buffers.
+
 Logging sensitivities
 =====================
 Logging of sensitivity outputs is slightly more primitive than variable
@@ -211,6 +234,8 @@ typedef int Model_Flag;
 #define Model_LOGGING_NOT_INITIALISED       -201
 #define Model_UNKNOWN_VARIABLES_IN_LOG      -202
 #define Model_LOG_APPEND_FAILED             -203
+#define Model_INVALID_LOG_BUFFER            -204
+#define Model_INVALID_LOG_POSITION          -205
 /* Logging sensitivities */
 #define Model_NO_SENSITIVITIES_TO_LOG       -300
 #define Model_SENSITIVITY_LOG_APPEND_FAILED -303
@@ -252,6 +277,12 @@ Model_SetPyErr(Model_Flag flag)
     case Model_LOG_APPEND_FAILED:
         PyErr_SetString(PyExc_Exception, "CModel error: Call to append() failed on logging list.");
         break;
+    case Model_INVALID_LOG_BUFFER:
+        PyErr_SetString(PyExc_Exception, "CModel error: Buffered logging requires a dict of bytearray objects.");
+        break;
+    case Model_INVALID_LOG_POSITION:
+        PyErr_SetString(PyExc_Exception, "CModel error: Log position outside of buffers.");
+        break;
     /* Logging sensitivities */
     case Model_NO_SENSITIVITIES_TO_LOG:
         PyErr_SetString(PyExc_Exception, "CModel error: Sensivity logging called, but sensitivity calculations were not enabled.");
@@ -351,6 +382,13 @@ struct Model_Memory {
     /* Array of pointers to realtype, each a variable to log */
     realtype** _log_vars;
 
+    /* Buffered logging: if set, _log_lists contains bytearrays */
+    int _log_buffered;
+
+    /* Number of points logged, and number of points that fit in the buffers */
+    Py_ssize_t _log_count;
+    Py_ssize_t _log_capacity;
+
     /* Caching */
     #ifdef Model_CACHING
     int valid_cache_derivatives;
@@ -1000,7 +1038,113 @@ Model_DeInitialiseLogging(Model model)
     model->logging_derivatives = 0;
     model->logging_intermediary = 0;
     model->logging_bound = 0;
+    model->_log_buffered = 0;
+    model->_log_count = 0;
+    model->_log_capacity = 0;
+
+    return Model_OK;
+}
+
+/*
+ * Private method: Resizes all buffers used in buffered logging, so that they
+ * can contain ``capacity`` points.
+ *
+ * Arguments
+ *  model : The model whose log buffers to resize.
+ *  capacity : The new number of points.
+ *
+ * Returns a model flag.
+ */
+Model_Flag
+Model__ResizeLogBuffers(Model model, Py_ssize_t capacity)
+{
+    int i;
+    for (i=0; i<model->n_logged_variables; i++) {
+        if (PyByteArray_Resize(model->_log_lists[i], capacity * sizeof(realtype))) {
+            return Model_OUT_OF_MEMORY;
+        }
+    }
+    model->_log_capacity = capacity;
+    return Model_OK;
+}
+
+/*
+ * Initialises buffered logging, using the given dict. An error is returned if
+ * logging is already initialised, or if the dict values are not bytearrays.
+ *
+ * Arguments
+ *  model : The model whose logging system to initialise.
+ *  log_dict : A Python dict mapping fully qualified variable names to empty
+ *             bytearray objects to log in.
+ *  capacity : The number of points to allocate space for in advance.
+ *
+ * Returns a model flag
+ */
+Model_Flag
+Model_InitialiseBufferedLogging(Model model, PyObject* log_dict, Py_ssize_t capacity)
+{
+    int i;
+    Model_Flag flag;
+
+    flag = Model_InitialiseLogging(model, log_dict);
+    if (flag != Model_OK) return flag;
 
+    /* Check buffer types */
+    for (i=0; i<model->n_logged_variables; i++) {
+        if (!PyByteArray_Check(model->_log_lists[i])) {
+            Model_DeInitialiseLogging(model);
+            return Model_INVALID_LOG_BUFFER;
+        }
+    }
+
+    /* Allocate space */
+    model->_log_buffered = 1;
+    model->_log_count = 0;
+    flag = Model__ResizeLogBuffers(model, capacity > 0 ? capacity : 0);
+    if (flag != Model_OK) {
+        Model_DeInitialiseLogging(model);
+        return flag;
+    }
+
+    return Model_OK;
+}
+
+/*
+ * Trims the buffers used in buffered logging to the number of logged points.
+ * Does nothing if buffered logging was not initialised.
+ *
+ * Arguments
+ *  model : The model whose log buffers to trim.
+ *
+ * Returns a model flag.
+ */
+Model_Flag
+Model_FinaliseBufferedLogging(Model model)
+{
+    if (model == NULL) return Model_INVALID_MODEL;
+    if (!(model->logging_initialised && model->_log_buffered)) return Model_OK;
+    return Model__ResizeLogBuffers(model, model->_log_count);
+}
+
+/*
+ * Sets the position in the buffers used in buffered logging that the next
+ * point will be logged to. All points before this position are counted as
+ * logged.
+ *
+ * Arguments
+ *  model : The model whose log position to set.
+ *  position : The index of the next point to log, in the range
+ *             ``[0, capacity]``.
+ *
+ * Returns a model flag.
+ */
+Model_Flag
+Model_SetBufferedLogPosition(Model model, Py_ssize_t position)
+{
+    if (model == NULL) return Model_INVALID_MODEL;
+    if (!(model->logging_initialised && model->_log_buffered)) return Model_LOGGING_NOT_INITIALISED;
+    if (position < 0 || position > model->_log_capacity) return Model_INVALID_LOG_POSITION;
+    model->_log_count = position;
     return Model_OK;
 }
 
@@ -1020,11 +1164,26 @@ Model_Flag
 Model_Log(Model model)
 {
     int i;
+    Model_Flag flag;
     PyObject *val, *ret;
 
     if (model == NULL) return Model_INVALID_MODEL;
     if (!model->logging_initialised) return Model_LOGGING_NOT_INITIALISED;
 
+    /* Buffered logging: write doubles, growing the buffers if needed */
+    if (model->_log_buffered) {
+        if (model->_log_count >= model->_log_capacity) {
+            flag = Model__ResizeLogBuffers(model,
+                model->_log_capacity < 512 ? 1024 : 2 * model->_log_capacity);
+            if (flag != Model_OK) return flag;
+        }
+        for (i=0; i<model->n_logged_variables; i++) {
+            ((realtype*)PyByteArray_AS_STRING(model->_log_lists[i]))[model->_log_count] = *(model->_log_vars[i]);
+        }
+        model->_log_count++;
+        return Model_OK;
+    }
+
     for (i=0; i<model->n_logged_variables; i++) {
         val = PyFloat_FromDouble(*(model->_log_vars[i]));
         ret = PyObject_CallMethodObjArgs(model->_log_lists[i], model->_list_update_string, val, NULL);
@@ -1196,6 +1355,11 @@ for i, expr in enumerate(s_independents):
     model->_log_lists = NULL;
     model->_log_vars = NULL;
 
+    /* Buffered logging */
+    model->_log_buffered = 0;
+    model->_log_count = 0;
+    model->_log_capacity = 0;
+
     /*
      * Default values
      */
@@ -176,15 +176,21 @@ check_cvode_flag(void *flagvalue, char *funcname, int opt)
  * suppresses error messages.
  * Warnings are passed to Python's warning system, where they can be
  * caught or suppressed using the warnings module.
+ *
+ * This method can be called from inside CVode(), which runs without holding
+ * the GIL, so the GIL is (re)acquired before calling any Python code.
  */
 void
 ErrorHandler(int error_code, const char *module, const char *function,
              char *msg, void *eh_data)
 {
     char errstr[1024];
+    PyGILState_STATE gstate;
     if (error_code > 0) {
         sprintf(errstr, "CVODES: %s", msg);
+        gstate = PyGILState_Ensure();
         PyErr_WarnEx(PyExc_RuntimeWarning, errstr, 1);
+        PyGILState_Release(gstate);
     }
 }
 
@@ -287,6 +293,17 @@ int dynamic_logging;    /* True if logging every point. */
 PyObject* log_dict;     /* The log dict (DataLog) */
 PyObject* sens_list;    /* Sensitivity logging list */
 
+/* Buffered logging */
+PyObject* log_buffers;      /* A dict of bytearrays to log to, or None */
+Py_ssize_t log_capacity;    /* Number of points to allocate in advance */
+
+/* Jacobian logging */
+PyObject* jac_buffer;       /* A bytearray to log Jacobians to, or None */
+Py_ssize_t jac_count;       /* Number of Jacobians logged */
+Py_ssize_t jac_capacity;    /* Number of Jacobians that fit in the buffer */
+realtype* jac_x;            /* State vector used in finite differences */
+realtype* jac_f;            /* Derivatives used in finite differences */
+
 /* Periodic and point-list logging */
 double tlog;            /* Next time to log */
 double log_interval;    /* The periodic logging interval */
@@ -355,13 +372,17 @@ rhs(realtype t, N_Vector y, N_Vector ydot, void *user_data)
 {
     FSys_Flag flag_fpacing;
     UserData fdata;
+    PyGILState_STATE gstate;
     int i;
 
     /* Fixed-form pacing? Then look-up correct value of pacing variable! */
     if (fpacing != NULL) {
         pace = FSys_GetLevel(fpacing, t, &flag_fpacing);
         if (flag_fpacing != FSys_OK) { /* This should never happen */
+            /* Called from CVode(), so must acquire the GIL to set an error */
+            gstate = PyGILState_Ensure();
             FSys_SetPyErr(flag_fpacing);
+            PyGILState_Release(gstate);
             return -1;  /* Negative value signals irrecoverable error to CVODE */
         }
     }
@@ -427,6 +448,73 @@ rf_function(realtype t, N_Vector y, realtype *gout, void *user_data)
     return 0;
 }
 
+/*
+ * Approximates the Jacobian of the model's right-hand side function at the
+ * current point using central finite differences, and appends it to the
+ * Jacobian log buffer as an n-by-n matrix of doubles (in row-major order, so
+ * that entry (i, j) is the derivative of dot(x_i) with respect to x_j).
+ *
+ * Assumes the RHS has been evaluated at the current point. Bound variables are
+ * not changed, and on exit the model is returned to the current point.
+ *
+ * Returns 0 on success, or -1 if the buffer could not be resized (in which
+ * case a Python exception is set).
+ */
+int
+jac_log(void)
+{
+    int i, j, n;
+    realtype xj, h, d;
+    realtype* jac;
+
+    n = model->n_states;
+
+    /* Grow buffer if needed */
+    if (jac_count >= jac_capacity) {
+        jac_capacity = (jac_capacity < 16) ? 16 : 2 * jac_capacity;
+        if (PyByteArray_Resize(jac_buffer, jac_capacity * n * n * sizeof(realtype))) {
+            return -1;
+        }
+    }
+    jac = (realtype*)PyByteArray_AS_STRING(jac_buffer) + jac_count * n * n;
+
+    /* Store current point */
+    for (i=0; i<n; i++) {
+        jac_x[i] = model->states[i];
+    }
+
+    /* Perturb each state in turn */
+    for (j=0; j<n; j++) {
+        xj = jac_x[j];
+        h = 6.0554544523933395e-06 * (fabs(xj) + abs_tol); /* cbrt(eps) */
+
+        jac_x[j] = xj + h;
+        Model_SetStates(model, jac_x);
+        Model_EvaluateDerivatives(model);
+        for (i=0; i<n; i++) {
+            jac_f[i] = model->derivatives[i];
+        }
+
+        jac_x[j] = xj - h;
+        Model_SetStates(model, jac_x);
+        Model_EvaluateDerivatives(model);
+
+        /* Use the step that was actually taken */
+        d = (xj + h) - (xj - h);
+        for (i=0; i<n; i++) {
+            jac[i * n + j] = (jac_f[i] - model->derivatives[i]) / d;
+        }
+        jac_x[j] = xj;
+    }
+
+    /* Restore current point */
+    Model_SetStates(model, jac_x);
+    Model_EvaluateDerivatives(model);
+
+    jac_count++;
+    return 0;
+}
+
 /*
  * Cleans up after a simulation
  */
@@ -473,6 +561,14 @@ sim_clean()
         ESys_Destroy(epacing); epacing = NULL;
         FSys_Destroy(fpacing); fpacing = NULL;
 
+        /* Trim log buffers to the logged size */
+        Model_FinaliseBufferedLogging(model);
+        if (jac_buffer != NULL && jac_buffer != Py_None && model != NULL) {
+            PyByteArray_Resize(jac_buffer, jac_count * model->n_states * model->n_states * sizeof(realtype));
+        }
+        free(jac_x); jac_x = NULL;
+        free(jac_f); jac_f = NULL;
+
         /* CModel */
         Model_Destroy(model); model = NULL;
 
@@ -577,6 +673,9 @@ sim_init(PyObject *self, PyObject *args)
     ylast = NULL;
     /* Logging */
     log_times = NULL;
+    jac_buffer = NULL;
+    jac_x = NULL;
+    jac_f = NULL;
     /* Benchmarking and profiling */
     benchmarker_time_str = NULL;
     #ifdef MYOKIT_DEBUG_PROFILING
@@ -593,8 +692,8 @@ sim_init(PyObject *self, PyObject *args)
     sundials_context = NULL;
     #endif
 
-    /* Check input arguments     0123456789012345678 */
-    if (!PyArg_ParseTuple(args, "ddOOOOOOOOdOOidOOi",
+    /* Check input arguments     0123456789012345678901 */
+    if (!PyArg_ParseTuple(args, "ddOOOOOOOOdOOidOOiOnO",
             &tmin,              /*  0. Float: initial time */
             &tmax,              /*  1. Float: final time */
             &state_py,          /*  2. List: initial and final state */
@@ -612,7 +711,10 @@ sim_init(PyObject *self, PyObject *args)
             &rf_threshold,      /* 14. Float: root-finding threshold */
             &rf_list,           /* 15. List to store roots in or None */
             &benchmarker,       /* 16. myokit.tools.Benchmarker object */
-            &log_realtime       /* 17. Int: 1 if logging real time */
+            &log_realtime,      /* 17. Int: 1 if logging real time */
+            &log_buffers,       /* 18. Dict of bytearrays to log to, or None */
+            &log_capacity,      /* 19. Int: number of points to preallocate */
+            &jac_buffer         /* 20. Bytearray to log Jacobians to, or None */
     )) {
         PyErr_SetString(PyExc_Exception, "Incorrect input arguments.");
         return 0;
@@ -1079,13 +1181,35 @@ sim_init(PyObject *self, PyObject *args)
         }
     }
 
-    /* Set up logging */
-    flag_model = Model_InitialiseLogging(model, log_dict);
+    /* Set up logging, writing either to the DataLog or to raw buffers */
+    if (log_buffers == Py_None) {
+        flag_model = Model_InitialiseLogging(model, log_dict);
+    } else {
+        flag_model = Model_InitialiseBufferedLogging(model, log_buffers, log_capacity);
+    }
     if (flag_model != Model_OK) { Model_SetPyErr(flag_model); return sim_clean(); }
     #ifdef MYOKIT_DEBUG_PROFILING
     benchmarker_print("CP Logging initialised.");
     #endif
 
+    /* Set up Jacobian logging */
+    jac_count = 0;
+    jac_capacity = 0;
+    if (jac_buffer != Py_None) {
+        if (!PyByteArray_Check(jac_buffer)) {
+            return sim_cleanx(PyExc_TypeError, "'jac_buffer' must be a bytearray or None.");
+        }
+        jac_x = (realtype*)malloc(sizeof(realtype) * model->n_states);
+        jac_f = (realtype*)malloc(sizeof(realtype) * model->n_states);
+        if (jac_x == NULL || jac_f == NULL) {
+            return sim_cleanx(PyExc_MemoryError, "Unable to allocate space for Jacobian calculation.");
+        }
+        jac_capacity = (log_capacity > 0) ? log_capacity : 0;
+        if (PyByteArray_Resize(jac_buffer, jac_capacity * model->n_states * model->n_states * sizeof(realtype))) {
+            return sim_clean();
+        }
+    }
+
     /* Check logging list for sensitivities */
     if (model->has_sensitivities) {
         if (!PyList_Check(sens_list)) {
@@ -1173,6 +1297,11 @@ sim_init(PyObject *self, PyObject *args)
                 flag_model = Model_LogSensitivityMatrix(model, sens_list);
                 if (flag_model != Model_OK) { Model_SetPyErr(flag_model); return sim_clean(); }
             }
+
+            /* Write Jacobian to buffer */
+            if (jac_buffer != Py_None) {
+                if (jac_log()) return sim_clean();
+            }
         }
     }
 
@@ -1243,7 +1372,14 @@ sim_step(PyObject *self, PyObject *args)
             #ifdef MYOKIT_DEBUG_MESSAGES
             printf("\nCM Taking CVODE step from time %f to %f\n", t, tnext);
             #endif
+            /* Release the GIL while integrating, so that simulations in
+               other threads can run at the same time. This is safe because
+               each simulation has its own copy of this module's globals,
+               and the callbacks used by CVode() re-acquire the GIL before
+               calling any Python code. */
+            Py_BEGIN_ALLOW_THREADS
             flag_cvode = CVode(cvode_mem, tnext, y, &t, CV_ONE_STEP);
+            Py_END_ALLOW_THREADS
 
             /* Check for errors */
             if (check_cvode_flag(&flag_cvode, "CVode", 1)) {
@@ -1385,6 +1521,11 @@ sim_step(PyObject *self, PyObject *args)
                         if (flag_model != Model_OK) { Model_SetPyErr(flag_model); return sim_clean(); }
                     }
 
+                    /* Write Jacobian to buffer */
+                    if (jac_buffer != Py_None) {
+                        if (jac_log()) return sim_clean();
+                    }
+
                     /* Get next logging point */
                     if (log_interval > 0) {
                         /* Periodic logging */
@@ -1451,10 +1592,10 @@ sim_step(PyObject *self, PyObject *args)
                 }
 
                 /* Ensure the logged values are correct for the new time t */
-                if (model->logging_derivatives || model->logging_intermediary || model->has_sensitivities) {
+                if (model->logging_derivatives || model->logging_intermediary || model->has_sensitivities || jac_buffer != Py_None) {
                     /* If logging derivatives or intermediaries, calculate the
                        values for the current time. Similarly, if calculating
-                       sensitivities this is needed. */
+                       sensitivities or Jacobians this is needed. */
                     #ifdef MYOKIT_DEBUG_MESSAGES
                     printf("CM Calling RHS to log derivs/inter/sens at time %f\n", t);
                     #endif
@@ -1477,6 +1618,11 @@ sim_step(PyObject *self, PyObject *args)
                     flag_model = Model_LogSensitivityMatrix(model, sens_list);
                     if (flag_model != Model_OK) { Model_SetPyErr(flag_model); return sim_clean(); }
                 }
+
+                /* Write Jacobian to buffer */
+                if (jac_buffer != Py_None) {
+                    if (jac_log()) return sim_clean();
+                }
             }
 
             /*
@@ -1557,6 +1703,247 @@ sim_step(PyObject *self, PyObject *args)
     return PyFloat_FromDouble(t);
 }
 
+/*
+ * Runs a batch of simulations, one for each row in a 2d array of values for
+ * selected constants, using the memory set up by sim_init().
+ *
+ * Each simulation starts at tmin from the initial state passed to sim_init,
+ * with the same protocol, and runs until tmax. Only the constants are
+ * changed between simulations, after which the CVODES memory block is
+ * re-initialised with CVodeReInit. Results are logged at the given times, into
+ * the buffers passed to sim_init as ``log_buffers``, which must have space for
+ * ``n_times`` points for every row. The points logged for row ``i`` start at
+ * index ``i * n_times``.
+ *
+ * Simulations that fail with a CVODES error (or that get stuck taking
+ * zero-length steps) are marked in ``failed``, instead of raising an
+ * exception. Sensitivities and root finding are not used.
+ *
+ * This method can be called several times after a single call to sim_init,
+ * e.g. to report progress between calls, but the caller is responsible for
+ * calling sim_clean() when done.
+ */
+PyObject*
+sim_run_batch(PyObject *self, PyObject *args)
+{
+    /* Error flags */
+    Model_Flag flag_model;
+    ESys_Flag flag_epacing;
+    int flag_cvode;
+    int flag_failed;
+
+    /* Input arguments */
+    PyObject* values_py;    /* Bytearray: (N, P) values, row-major */
+    PyObject* columns_py;   /* List: P indices of constants to set */
+    PyObject* times_py;     /* Bytearray: Times to log at */
+    PyObject* failed_py;    /* Bytearray: N flags, set to 1 for failed rows */
+    Py_ssize_t first_row;   /* First row to simulate */
+    Py_ssize_t n_rows;      /* Number of rows to simulate */
+
+    /* Pointers to data in the input arguments */
+    realtype* values;
+    realtype* times;
+    char* failed;
+
+    /* Sizes */
+    Py_ssize_t n_columns, n_times;
+
+    /* Iteration */
+    Py_ssize_t row, ilog;
+    int i, j;
+    long k;
+
+    /* Multi-purpose Python object */
+    PyObject *val;
+
+    /* Check input arguments */
+    if (!PyArg_ParseTuple(args, "OOnnOO",
+            &values_py,         /* 0. Bytearray: (N, P) values */
+            &columns_py,        /* 1. List: P indices of constants */
+            &first_row,         /* 2. Int: first row to simulate */
+            &n_rows,            /* 3. Int: number of rows to simulate */
+            &times_py,          /* 4. Bytearray: times to log at */
+            &failed_py          /* 5. Bytearray: N failed flags */
+    )) {
+        PyErr_SetString(PyExc_Exception, "Incorrect input arguments in sim_run_batch.");
+        return 0;
+    }
+
+    /* Check initialisation and argument types */
+    if (!initialised) {
+        PyErr_SetString(PyExc_Exception, "Simulation not initialised.");
+        return 0;
+    }
+    if (!(PyByteArray_Check(values_py) && PyByteArray_Check(times_py) && PyByteArray_Check(failed_py))) {
+        return sim_cleanx(PyExc_TypeError, "Batch values, times, and flags must be bytearrays.");
+    }
+    if (!PyList_Check(columns_py)) {
+        return sim_cleanx(PyExc_TypeError, "'columns' must be a list.");
+    }
+    n_columns = PyList_Size(columns_py);
+    n_times = PyByteArray_Size(times_py) / sizeof(realtype);
+    if (first_row < 0 || n_rows < 0
+            || (first_row + n_rows) * n_columns * (Py_ssize_t)sizeof(realtype) > PyByteArray_Size(values_py)
+            || first_row + n_rows > PyByteArray_Size(failed_py)) {
+        return sim_cleanx(PyExc_ValueError, "Rows to simulate out of bounds.");
+    }
+    for (j=0; j<n_columns; j++) {
+        k = PyLong_AsLong(PyList_GetItem(columns_py, j));   /* Borrowed */
+        if (k < 0 || k >= model->n_literals + model->n_parameters) {
+            return sim_cleanx(PyExc_ValueError, "Column index out of bounds.");
+        }
+    }
+    values = (realtype*)PyByteArray_AS_STRING(values_py);
+    times = (realtype*)PyByteArray_AS_STRING(times_py);
+    failed = PyByteArray_AS_STRING(failed_py);
+
+    /* Sensitivities are not calculated in batch runs */
+    if (model->is_ode && model->has_sensitivities) {
+        flag_cvode = CVodeSensToggleOff(cvode_mem);
+        if (check_cvode_flag(&flag_cvode, "CVodeSensToggleOff", 1)) return sim_clean();
+    }
+
+    for (row=first_row; row<first_row + n_rows; row++) {
+
+        /* Set constants, ordered as literals followed by parameters */
+        for (j=0; j<n_columns; j++) {
+            k = PyLong_AsLong(PyList_GetItem(columns_py, j));   /* Borrowed */
+            if (k < model->n_literals) {
+                model->literals[k] = values[row * n_columns + j];
+            } else {
+                model->parameters[k - model->n_literals] = values[row * n_columns + j];
+            }
+        }
+        Model_EvaluateLiteralDerivedVariables(model);
+        if (model->has_sensitivities) {
+            Model_EvaluateParameterDerivedVariables(model);
+        }
+
+        /* Set initial state */
+        for (i=0; i<model->n_states; i++) {
+            model->states[i] = PyFloat_AsDouble(PyList_GetItem(state_py, i));  /* Borrowed */
+            NV_Ith_S(y, i) = model->states[i];
+        }
+
+        /* Update parameters used by rhs() */
+        if (model->has_sensitivities) {
+            for (i=0; i<model->ns_independents; i++) {
+                udata->p[i] = *model->s_independents[i];
+            }
+        }
+
+        /* Reset time, pacing, and solver */
+        t = tmin;
+        zero_step_count = 0;
+        if (epacing != NULL) {
+            flag_epacing = ESys_Reset(epacing);
+            if (flag_epacing != ESys_OK) { ESys_SetPyErr(flag_epacing); return sim_clean(); }
+            flag_epacing = ESys_AdvanceTime(epacing, tmin);
+            if (flag_epacing != ESys_OK) { ESys_SetPyErr(flag_epacing); return sim_clean(); }
+            tnext = ESys_GetNextTime(epacing, NULL);
+            tnext = (tnext < tmax) ? tnext : tmax;
+            pace = ESys_GetLevel(epacing, NULL);
+        } else {
+            tnext = tmax;
+        }
+        if (model->is_ode) {
+            flag_cvode = CVodeReInit(cvode_mem, t, y);
+            if (check_cvode_flag(&flag_cvode, "CVodeReInit", 1)) return sim_clean();
+        }
+
+        /* Log to this row's part of the buffers */
+        flag_model = Model_SetBufferedLogPosition(model, row * n_times);
+        if (flag_model != Model_OK) { Model_SetPyErr(flag_model); return sim_clean(); }
+        ilog = 0;
+
+        /* Simulate */
+        flag_failed = 0;
+        while (1) {
+            tlast = t;
+            if (model->is_ode) {
+                /* Take a single ODE step, without holding the GIL */
+                Py_BEGIN_ALLOW_THREADS
+                flag_cvode = CVode(cvode_mem, tnext, y, &t, CV_ONE_STEP);
+                Py_END_ALLOW_THREADS
+                if (flag_cvode < 0) {
+                    flag_failed = 1;
+                    break;
+                }
+            } else {
+                t = (tmax > tnext) ? tnext : tmax;
+            }
+
+            /* Check if progress is being made */
+            if (t == tlast) {
+                if (++zero_step_count >= max_zero_step_count) {
+                    flag_failed = 1;
+                    break;
+                }
+            } else {
+                zero_step_count = 0;
+            }
+            steps++;
+
+            /* Next event time exceeded? Then go back to time=tnext */
+            flag_cvode = 0;
+            if (model->is_ode && t > tnext) {
+                if (CVodeGetDky(cvode_mem, tnext, 0, y) < 0) {
+                    flag_failed = 1;
+                    break;
+                }
+                t = tnext;
+                flag_cvode = 1;  /* Require reinit (after logging) */
+            }
+
+            /* Log interpolated points */
+            while (ilog < n_times && t > times[ilog]) {
+                if (model->is_ode) {
+                    if (CVodeGetDky(cvode_mem, times[ilog], 0, z) < 0) {
+                        flag_failed = 1;
+                        break;
+                    }
+                }
+                rhs(times[ilog], z, NULL, udata);
+                flag_model = Model_Log(model);
+                if (flag_model != Model_OK) { Model_SetPyErr(flag_model); return sim_clean(); }
+                ilog++;
+            }
+            if (flag_failed) break;
+
+            /* Update event-based pacing */
+            if (epacing != NULL) {
+                flag_epacing = ESys_AdvanceTime(epacing, t);
+                if (flag_epacing != ESys_OK) { ESys_SetPyErr(flag_epacing); return sim_clean(); }
+                tnext = ESys_GetNextTime(epacing, NULL);
+                tnext = (tnext < tmax) ? tnext : tmax;
+                pace = ESys_GetLevel(epacing, NULL);
+            }
+
+            /* Reinitialise CVODE if needed */
+            if (flag_cvode) {
+                flag_cvode = CVodeReInit(cvode_mem, t, y);
+                if (check_cvode_flag(&flag_cvode, "CVodeReInit", 1)) return sim_clean();
+            }
+
+            /* Check if we're finished */
+            if (ESys_eq(t, tmax)) t = tmax;
+            if (t >= tmax) break;
+
+            /* Perform any Python signal handling */
+            if (PyErr_CheckSignals() != 0) return sim_clean();
+        }
+
+        /* Mark failed simulations, and skip to the next row */
+        failed[row] = (char)flag_failed;
+        flag_model = Model_SetBufferedLogPosition(model, (row + 1) * n_times);
+        if (flag_model != Model_OK) { Model_SetPyErr(flag_model); return sim_clean(); }
+    }
+
+    /* Not finished, so not cleaning up! */
+    val = PyLong_FromSsize_t(first_row + n_rows);
+    return val;
+}
+
 /*
  * Evaluates the state derivatives at the given state
  */
@@ -1771,6 +2158,7 @@ PyMethodDef SimMethods[] = {
     {"sim_init", sim_init, METH_VARARGS, "Initialize the simulation."},
     {"sim_step", sim_step, METH_VARARGS, "Perform the next step in the simulation."},
     {"sim_clean", py_sim_clean, METH_VARARGS, "Clean up after an aborted simulation."},
+    {"sim_run_batch", sim_run_batch, METH_VARARGS, "Run a batch of simulations with different constants."},
     {"eval_derivatives", sim_eval_derivatives, METH_VARARGS, "Evaluate the state derivatives."},
     {"set_tolerance", sim_set_tolerance, METH_VARARGS, "Set the absolute and relative solver tolerance."},
     {"set_max_step_size", sim_set_max_step_size, METH_VARARGS, "Set the maximum solver step size (0 for none)."},
@@ -13,6 +13,8 @@ import platform
 
 from collections import OrderedDict
 
+import numpy as np
+
 import myokit
 
 # Location of C template
@@ -383,7 +385,7 @@ class Simulation(myokit.CModule):
 
     def run(self, duration, log=None, log_interval=None, log_times=None,
             sensitivities=None, apd_variable=None, apd_threshold=None,
-            progress=None, msg='Running simulation'):
+            progress=None, msg='Running simulation', log_numpy=False):
         """
         Runs a simulation and returns the logged results. Running a simulation
         has the following effects:
@@ -429,6 +431,18 @@ class Simulation(myokit.CModule):
         threshold, and so differs from the often used dynamical thresholds such
         as "90% of max(V) - min(V)".*
 
+        For long simulations with many logged points, creating a Python
+        ``float`` for every logged value can take up a significant part of the
+        run time. This can be avoided by setting ``log_numpy=True``, in which
+        case the values are written into contiguous buffers (preallocated if
+        the number of points is known in advance, and grown geometrically if
+        not), and the returned :class:`myokit.DataLog` contains NumPy arrays
+        instead of lists. The logged values are the same in both modes. If an
+        existing log is passed in, its data is concatenated with the newly
+        logged data (this requires a copy, so for very long runs it is faster
+        to create a new log for every call to ``run`` and merge them
+        afterwards).
+
         To obtain feedback on the simulation progress, an object implementing
         the :class:`myokit.ProgressReporter` interface can be passed in.
         passed in as ``progress``. An optional description of the current
@@ -462,6 +476,8 @@ class Simulation(myokit.CModule):
             feedback about simulation progress.
         ``msg``
             An optional message to pass to any progress reporter.
+        ``log_numpy``
+            Set to ``True`` to log into NumPy arrays instead of lists.
 
         By default, this method returns a :class:`myokit.DataLog` containing
         the logged variables.
@@ -480,12 +496,13 @@ class Simulation(myokit.CModule):
         duration = float(duration)
         output = self._run(
             duration, log, log_interval, log_times, sensitivities,
-            apd_variable, apd_threshold, progress, msg)
+            apd_variable, apd_threshold, progress, msg, log_numpy)
         self._time += duration
         return output
 
     def _run(self, duration, log, log_interval, log_times, sensitivities,
-             apd_variable, apd_threshold, progress, msg):
+             apd_variable, apd_threshold, progress, msg, log_numpy=False,
+             jacobians=None):
 
         # Create benchmarker for profiling and realtime logging
         # Note: When adding profiling messages, write them in past tense so
@@ -574,6 +591,16 @@ class Simulation(myokit.CModule):
         if myokit.DEBUG_SP:
             b.print('PP Called prepare_log.')
 
+        # Create buffers for logging to NumPy arrays, and guess their size
+        log_buffers = None
+        log_capacity = 0
+        if log_numpy:
+            log_buffers = OrderedDict([(k, bytearray()) for k in log.keys()])
+            if log_interval > 0:
+                log_capacity = 1 + int(duration / log_interval)
+            elif log_times is not None:
+                log_capacity = len(log_times)
+
         # Run simulation
         # The simulation is run only if (tmin + duration > tmin). This is a
         # stronger check than (duration == 0), which will return true even for
@@ -633,6 +660,12 @@ class Simulation(myokit.CModule):
                 b,
                 # 17. Boolean/int: 1 if we are logging realtime
                 int(self._model.binding('realtime') is not None),
+                # 18. A dict of bytearrays to log to, or None
+                log_buffers,
+                # 19. The number of points to allocate space for in advance
+                log_capacity,
+                # 20. A bytearray to log Jacobians to, or None
+                jacobians,
             )
             t = tmin
 
@@ -699,11 +732,20 @@ class Simulation(myokit.CModule):
                 # Clean even after KeyboardInterrupt or other Exception
                 self._sim.sim_clean()
 
+                # Add buffered data to log
+                if log_buffers is not None:
+                    self._merge_buffers(log, log_buffers)
+                    log_buffers = None
+
             # Update internal state
             # Both lists were newly created, so this is OK.
             self._state = state
             self._s_state = s_state
 
+        # Ensure NumPy logs are returned even if no simulation was run
+        if log_buffers is not None:
+            self._merge_buffers(log, log_buffers)
+
         # Simulation complete
         if myokit.DEBUG_SP:
             b.print('PP Simulation complete.')
@@ -740,6 +782,293 @@ class Simulation(myokit.CModule):
             return log, apds
         return log
 
+    def _merge_buffers(self, log, buffers):
+        """
+        Adds the data in a dict of ``bytearray`` buffers, as filled by the C
+        code when logging to NumPy arrays, to a :class:`myokit.DataLog`.
+        """
+        for key, buf in buffers.items():
+            # Create a view on the buffer, without copying
+            data = np.frombuffer(buf, dtype=float)
+            if isinstance(log, myokit.DataLogWriter):
+                log[key].extend(data)
+                continue
+            if len(log[key]) > 0:
+                data = np.concatenate(
+                    (np.asarray(log[key], dtype=float), data))
+            log[key] = data
+
+    def run_batch(self, parameters, duration, constants, log=None,
+                  log_interval=None, log_times=None, progress=None,
+                  msg='Running batch simulation'):
+        """
+        Runs a simulation for every row in a 2d array of parameter values, and
+        returns the logged results as stacked NumPy arrays.
+
+        All simulations are run by the compiled C module, using a single
+        CVODES memory block that is re-initialised for every row. The values
+        of the selected constants are updated in C, and results are written
+        straight into preallocated arrays, so that no Python code is run
+        between simulations. The GIL is released while integrating.
+
+        Simulations in a batch are run one after the other, on a single core.
+        To use several cores, the rows can be split up and passed to separate
+        :class:`Simulation` objects running in separate threads or processes,
+        for example using a :class:`myokit.SimulationPool`.
+
+        Each simulation starts from the current simulation time and state, and
+        runs for ``duration`` time units. Unlike :meth:`run`, the
+        simulation's time, state, and constants are not changed by this
+        method.
+
+        Because results are stacked, dynamic logging is not supported, and
+        either a ``log_interval`` or a list of ``log_times`` must be given.
+        Sensitivities are not calculated, and variables bound to ``realtime``
+        are not updated.
+
+        Arguments:
+
+        ``parameters``
+            An ``(N, P)`` array, where each row contains the values for ``P``
+            constants.
+        ``duration``
+            The time to simulate, for each row.
+        ``constants``
+            A sequence of ``P`` literal constants, given as
+            :class:`myokit.Variable` objects or fully qualified names,
+            corresponding to the columns in ``parameters``.
+        ``log``
+            The variables to log, see :meth:`run`. Existing
+            :class:`myokit.DataLog` objects cannot be used.
+        ``log_interval``
+            A fixed log interval. Must be ``None`` if ``log_times`` is used.
+        ``log_times``
+            A non-decreasing sequence of pre-determined logging times. Must be
+            ``None`` if ``log_interval`` is used.
+        ``progress``
+            An optional :class:`myokit.ProgressReporter` used to obtain
+            feedback about simulation progress.
+        ``msg``
+            An optional message to pass to any progress reporter.
+
+        Returns an ``OrderedDict`` mapping the logged variable names to arrays
+        of shape ``(N, T)``, where ``T`` is the number of logged points. If a
+        simulation fails, for example because of a CVODES error, its row in
+        each array is filled with ``NaN``.
+        """
+        # Check parameters
+        duration = float(duration)
+        if duration < 0:
+            raise ValueError('Simulation time can\'t be negative.')
+        parameters = np.array(parameters, dtype=float, ndmin=2)
+        if parameters.ndim != 2:
+            raise ValueError('The argument `parameters` must be a 2d array.')
+        if parameters.shape[1] != len(constants):
+            raise ValueError(
+                'The number of columns in `parameters` must equal the number'
+                ' of constants.')
+
+        # Check constants, and get their indices in the list of literals
+        # followed by parameters, as used in the C code
+        literals = list(self._literals.keys())
+        params = list(self._parameters.keys())
+        columns = []
+        for var in constants:
+            if isinstance(var, myokit.Variable):
+                var = var.qname()
+            var = self._model.get(var)
+            if var in self._literals:
+                columns.append(literals.index(var))
+            elif var in self._parameters:
+                columns.append(len(literals) + params.index(var))
+            else:
+                raise ValueError(
+                    'The given variable <' + var.qname() + '> is not a'
+                    ' literal.')
+
+        # Check logging
+        if log_interval is None and log_times is None:
+            raise ValueError(
+                'Either `log_interval` or `log_times` must be set.')
+        if log_interval is not None and log_times is not None:
+            raise ValueError(
+                'The arguments `log_times` and `log_interval` cannot be used'
+                ' simultaneously.')
+        if isinstance(log, myokit.DataLog):
+            raise ValueError(
+                'Existing DataLog objects cannot be used in batch'
+                ' simulations.')
+        log = myokit.prepare_log(log, self._model, if_empty=myokit.LOG_ALL)
+
+        # Get logging times, matching the half-open interval used by run()
+        tmin = self._time
+        tmax = tmin + duration
+        if log_interval is not None:
+            log_interval = float(log_interval)
+            if log_interval <= 0:
+                raise ValueError('The `log_interval` must be greater than 0.')
+            times = np.arange(2 + int(duration / log_interval))
+            times = tmin + times * log_interval
+        else:
+            times = np.array(log_times, dtype=float, ndmin=1)
+            if np.any(np.diff(times) < 0):
+                raise ValueError(
+                    'Values in `log_times` must be non-decreasing.')
+        times = times[(times >= tmin) & (times < tmax)]
+
+        # Get progress indication function (if any)
+        if progress is None:
+            progress = myokit._Simulation_progress
+        if progress:
+            if not isinstance(progress, myokit.ProgressReporter):
+                raise ValueError(
+                    'The argument `progress` must be either a'
+                    ' subclass of myokit.ProgressReporter or None.')
+
+        # Nothing to log? Then return without simulating
+        n = len(parameters)
+        nt = len(times)
+        if n == 0 or nt == 0:
+            return OrderedDict([(k, np.zeros((n, nt))) for k in log])
+
+        # Create buffers, and space for failure flags
+        log_buffers = OrderedDict([(k, bytearray()) for k in log.keys()])
+        values = bytearray(np.ascontiguousarray(parameters).tobytes())
+        failed = bytearray(n)
+
+        # Run
+        b = myokit.tools.Benchmarker() if myokit.DEBUG_SP else None
+        self._sim.sim_init(
+            tmin,
+            tmax,
+            list(self._state),
+            [list(x) for x in self._s_state] if self._sensitivities else None,
+            [0, 0, 0, 0],
+            list(self._literals.values()),
+            list(self._parameters.values()),
+            self._protocol,
+            self._fixed_form_protocol,
+            log,
+            0,
+            list(times),
+            [] if self._sensitivities else None,
+            0,
+            0,
+            None,
+            b,
+            0,
+            log_buffers,
+            n * nt,
+            None,
+        )
+        times = bytearray(times.tobytes())
+        try:
+            if progress:
+                # Run in chunks, with feedback
+                with progress.job(msg):
+                    i = 0
+                    chunk = max(1, n // 100)
+                    while i < n:
+                        i = self._sim.sim_run_batch(
+                            values, columns, i, min(chunk, n - i), times,
+                            failed)
+                        if not progress.update(i / n):
+                            raise myokit.SimulationCancelledError()
+            else:
+                # Run all rows in a single call
+                self._sim.sim_run_batch(values, columns, 0, n, times, failed)
+        finally:
+            # Clean even after KeyboardInterrupt or other Exception
+            self._sim.sim_clean()
+
+        # Create (N, T) arrays, and mark failed simulations
+        failed = np.frombuffer(failed, dtype=np.uint8).astype(bool)
+        results = OrderedDict()
+        for k, buf in log_buffers.items():
+            results[k] = np.frombuffer(buf, dtype=float).reshape((n, nt))
+            results[k][failed] = np.nan
+        return results
+
+    def run_jacobians(self, duration, log=None, log_interval=None,
+                      log_times=None, progress=None,
+                      msg='Running simulation'):
+        """
+        Runs a simulation, and returns a :class:`myokit.DataBlock2d` containing
+        the logged variables and the Jacobian of the model's right-hand side
+        function (the matrix of partial derivatives of each state derivative
+        with respect to each state) at every logged point.
+
+        This gives the same information as running a simulation and passing
+        the result to :meth:`myokit.JacobianTracer.jacobians`, but without
+        compiling a second module and replaying the logged data: the Jacobians
+        are calculated during the simulation, and written into a single
+        preallocated array. Like in :meth:`run`, the simulation's time and
+        state are updated.
+
+        The Jacobians are approximated using central finite differences on the
+        compiled right-hand side function, at the logged time and pacing
+        value. As with :class:`myokit.JacobianTracer`, discontinuities in
+        conditional expressions are not taken into account.
+
+        Arguments:
+
+        ``duration``
+            The time to simulate.
+        ``log``
+            The variables to log, see :meth:`run`. By default, all states and
+            bound variables are logged. The time variable is always logged.
+            Existing :class:`myokit.DataLog` objects cannot be used.
+        ``log_interval``
+            An optional fixed size log interval. Must be ``None`` if
+            ``log_times`` is used. If both are ``None`` every step is logged.
+        ``log_times``
+            An optional set of pre-determined logging times. Must be ``None``
+            if ``log_interval`` is used. If both are ``None`` every step is
+            logged.
+        ``progress``
+            An optional :class:`myokit.ProgressReporter` used to obtain
+            feedback about simulation progress.
+        ``msg``
+            An optional message to pass to any progress reporter.
+
+        The returned block contains the logged variables as 0d series (stored
+        as NumPy arrays), and the Jacobians as a 2d series ``jacobians`` of
+        shape ``(T, n, n)``. Its eigenvalues can then be obtained with e.g.
+        :meth:`DataBlock2d.dominant_eigenvalues('jacobians')`.
+
+        If sensitivities are enabled, these are calculated but not returned.
+        """
+        # Check log
+        if isinstance(log, myokit.DataLog):
+            raise ValueError(
+                'Existing DataLog objects cannot be used when logging'
+                ' Jacobians.')
+        log = myokit.prepare_log(
+            log, self._model, if_empty=myokit.LOG_STATE + myokit.LOG_BOUND)
+        tvar = self._model.time().qname()
+        if tvar not in log:
+            log[tvar] = []
+
+        # Run, logging Jacobians to a buffer
+        duration = float(duration)
+        jacobians = bytearray()
+        d = self._run(
+            duration, log, log_interval, log_times, None, None, None,
+            progress, msg, True, jacobians)
+        self._time += duration
+        if self._sensitivities:
+            d = d[0]
+
+        # Create data block
+        n = self._model.count_states()
+        jacobians = np.frombuffer(jacobians, dtype=float).reshape((-1, n, n))
+        block = myokit.DataBlock2d(n, n, d[tvar], copy=False)
+        for k, v in d.items():
+            if k != tvar:
+                block.set0d(k, v, copy=False)
+        block.set2d('jacobians', jacobians, copy=False)
+        return block
+
     def set_constant(self, var, value):
         """
         Changes a model constant. Only literal constants (constants not
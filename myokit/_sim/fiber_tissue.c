@@ -135,6 +135,7 @@ PyObject *log_dict_t;   // A logging dict for the tissue
 double log_interval;    // The time between log writes
 PyObject *inter_log_f;  // A list of intermediary fiber variables to log
 PyObject *inter_log_t;  // A list of intermediary tissue variables to log
+PyObject *program_cache;// A cache of program binaries, or None
 
 // OpenCL objects
 cl_context context = NULL;
@@ -200,6 +201,9 @@ Real arg_gtx;
 Real arg_gty;
 Real arg_gft;
 
+/* Index of the first cell in each vector, passed to the kernels */
+unsigned long arg_offset = 0;
+
 /* Logging */
 PyObject** logs_f;       // An array of pointers to a PyObject (fiber)
 PyObject** logs_t;       // An array of pointers to a PyObject (tissue)
@@ -373,7 +377,7 @@ sim_init(PyObject* self, PyObject* args)
     vars_t = NULL;
 
     // Check input arguments
-    if(!PyArg_ParseTuple(args, "OOsskkkkiidddddkkkdddOOOOOOOdOO",
+    if(!PyArg_ParseTuple(args, "OOsskkkkiidddddkkkdddOOOOOOOdOOO",
             &platform_name,
             &device_name,
             &kernel_source_f,
@@ -404,7 +408,8 @@ sim_init(PyObject* self, PyObject* args)
             &log_dict_t,
             &log_interval,
             &inter_log_f,
-            &inter_log_t
+            &inter_log_t,
+            &program_cache
             )) {
         PyErr_SetString(PyExc_Exception, "Wrong number of arguments.");
         // Nothing allocated yet, no pyobjects _created_, return directly
@@ -687,9 +692,7 @@ sim_init(PyObject* self, PyObject* args)
     #ifdef MYOKIT_DEBUG_MESSAGES
     printf("Building fiber program on device...");
     #endif
-    program_f = clCreateProgramWithSource(context, 1, (const char**)&kernel_source_f, NULL, &flag);
-    if(mcl_flag(flag)) return sim_clean();
-    flag = clBuildProgram(program_f, 1, &device_id, NULL, NULL, NULL);
+    flag = mcl_build_program(context, 1, &device_id, kernel_source_f, "", program_cache, &program_f);
     if(flag == CL_BUILD_PROGRAM_FAILURE) {
         /* Build failed, extract log */
         clGetProgramBuildInfo(program_f, device_id, CL_PROGRAM_BUILD_LOG, 0, NULL, &blog_size);
@@ -712,9 +715,7 @@ sim_init(PyObject* self, PyObject* args)
     #ifdef MYOKIT_DEBUG_MESSAGES
     printf("Building tissue program on device...");
     #endif
-    program_t = clCreateProgramWithSource(context, 1, (const char**)&kernel_source_t, NULL, &flag);
-    if(mcl_flag(flag)) return sim_clean();
-    flag = clBuildProgram(program_t, 1, &device_id, NULL, NULL, NULL);
+    flag = mcl_build_program(context, 1, &device_id, kernel_source_t, "", program_cache, &program_t);
     if(flag == CL_BUILD_PROGRAM_FAILURE) {
         /* Build failed, extract log */
         clGetProgramBuildInfo(program_t, device_id, CL_PROGRAM_BUILD_LOG, 0, NULL, &blog_size);
@@ -759,6 +760,7 @@ sim_init(PyObject* self, PyObject* args)
     if(mcl_flag(clSetKernelArg(kernel_cell_f, i++, sizeof(mbuf_idiff_f), &mbuf_idiff_f))) return sim_clean();
     if(mcl_flag(clSetKernelArg(kernel_cell_f, i++, sizeof(mbuf_inter_log_f), &mbuf_inter_log_f))) return sim_clean();
     if(mcl_flag(clSetKernelArg(kernel_cell_f, i++, sizeof(mbuf_field_data), &mbuf_field_data))) return sim_clean();
+    if(mcl_flag(clSetKernelArg(kernel_cell_f, i++, sizeof(arg_offset), &arg_offset))) return sim_clean();
     #ifdef MYOKIT_DEBUG_MESSAGES
     printf("Set up cell kernel for fiber model.\n");
     #endif
@@ -770,6 +772,7 @@ sim_init(PyObject* self, PyObject* args)
     if(mcl_flag(clSetKernelArg(kernel_diff_f, i++, sizeof(arg_gfy), &arg_gfy))) return sim_clean();
     if(mcl_flag(clSetKernelArg(kernel_diff_f, i++, sizeof(mbuf_state_f), &mbuf_state_f))) return sim_clean();
     if(mcl_flag(clSetKernelArg(kernel_diff_f, i++, sizeof(mbuf_idiff_f), &mbuf_idiff_f))) return sim_clean();
+    if(mcl_flag(clSetKernelArg(kernel_diff_f, i++, sizeof(arg_offset), &arg_offset))) return sim_clean();
     #ifdef MYOKIT_DEBUG_MESSAGES
     printf("Set up diffusion kernel for fiber model.\n");
     #endif
@@ -784,6 +787,7 @@ sim_init(PyObject* self, PyObject* args)
     if(mcl_flag(clSetKernelArg(kernel_cell_t, i++, sizeof(mbuf_idiff_t), &mbuf_idiff_t))) return sim_clean();
     if(mcl_flag(clSetKernelArg(kernel_cell_t, i++, sizeof(mbuf_inter_log_t), &mbuf_inter_log_t))) return sim_clean();
     if(mcl_flag(clSetKernelArg(kernel_cell_t, i++, sizeof(mbuf_field_data), &mbuf_field_data))) return sim_clean();
+    if(mcl_flag(clSetKernelArg(kernel_cell_t, i++, sizeof(arg_offset), &arg_offset))) return sim_clean();
     #ifdef MYOKIT_DEBUG_MESSAGES
     printf("Set up cell kernel for tissue model.\n");
     #endif
@@ -795,6 +799,7 @@ sim_init(PyObject* self, PyObject* args)
     if(mcl_flag(clSetKernelArg(kernel_diff_t, i++, sizeof(arg_gty), &arg_gty))) return sim_clean();
     if(mcl_flag(clSetKernelArg(kernel_diff_t, i++, sizeof(mbuf_state_t), &mbuf_state_t))) return sim_clean();
     if(mcl_flag(clSetKernelArg(kernel_diff_t, i++, sizeof(mbuf_idiff_t), &mbuf_idiff_t))) return sim_clean();
+    if(mcl_flag(clSetKernelArg(kernel_diff_t, i++, sizeof(arg_offset), &arg_offset))) return sim_clean();
     #ifdef MYOKIT_DEBUG_MESSAGES
     printf("Set up diffusion kernel for tissue model.\n");
     #endif
@@ -11,6 +11,8 @@ import os
 import myokit
 import platform
 
+from myokit._sim.opencl import ProgramCache
+
 # Location of C and OpenCL sources
 SOURCE_FILE = 'fiber_tissue.c'
 KERNEL_FILE = 'openclsim.cl'
@@ -230,6 +232,9 @@ class FiberTissueSimulation(myokit.CModule):
             raise ValueError('The step size must be greater than zero.')
         self._step_size = dt
 
+        # No multi-rate stepping
+        self._multi_rate = None
+
         # Set precision
         if precision not in (myokit.SINGLE_PRECISION, myokit.DOUBLE_PRECISION):
             raise ValueError('Only single and double precision are supported.')
@@ -849,6 +854,8 @@ class FiberTissueSimulation(myokit.CModule):
             'rl_states': {},
             'connections': False,
             'heterogeneous': False,
+            'apd': False,
+            'multi_rate': self._multi_rate,
         }
         args['model'] = self._modelf
         args['vmvar'] = self._vmf
@@ -919,6 +926,7 @@ class FiberTissueSimulation(myokit.CModule):
                 log_interval,
                 [x.qname().encode('ascii') for x in inter_logf],
                 [x.qname().encode('ascii') for x in inter_logt],
+                ProgramCache.create(),
             )
             try:
                 t = tmin
@@ -1138,6 +1146,25 @@ class FiberTissueSimulation(myokit.CModule):
             raise ValueError('Step size must be greater than zero.')
         self._step_size = step_size
 
+    def set_multi_rate(self, levels=0, abs_tol=1e-3, rel_tol=1e-3):
+        """
+        Enables or disables multi-rate time stepping, so that each fiber or
+        tissue cell can divide every step into up to ``2**levels`` substeps,
+        based on an estimate of the local error.
+
+        See :meth:`SimulationOpenCL.set_multi_rate()` for details.
+        """
+        levels = int(levels)
+        if levels < 0 or levels > 16:
+            raise ValueError('The number of levels must be in the range 0-16.')
+        abs_tol = float(abs_tol)
+        rel_tol = float(rel_tol)
+        if abs_tol <= 0:
+            raise ValueError('The absolute tolerance must be positive.')
+        if rel_tol < 0:
+            raise ValueError('The relative tolerance cannot be negative.')
+        self._multi_rate = (levels, abs_tol, rel_tol) if levels else None
+
     def set_protocol(self, protocol=None):
         """ Changes the pacing protocol used by this simulation. """
         if protocol is None:
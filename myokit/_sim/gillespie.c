@@ -0,0 +1,445 @@
+<?
+# gillespie.c
+#
+# A pype template for a compiled stochastic simulation back-end, used by
+# myokit.lib.markov.DiscreteSimulation.
+#
+# The module is independent of the model being simulated: transition rates,
+# states, and random number generator states are passed in for every call.
+#
+# Required variables
+# -----------------------------------------------------------------------------
+# module_name A module name
+# -----------------------------------------------------------------------------
+#
+# This file is part of Myokit.
+# See http://myokit.org for copyright, sharing, and licensing details.
+#
+?>
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include <math.h>
+#include <stdint.h>
+#include <stdlib.h>
+#include <string.h>
+
+/*
+ * Number of bytes in a random number generator state.
+ */
+#define RNG_STATE_SIZE (4 * sizeof(uint64_t))
+
+/*
+ * Random number generation, using the xoshiro256** generator by Blackman and
+ * Vigna (http://prng.di.unimi.it/).
+ */
+static uint64_t
+rng_rotl(const uint64_t x, int k)
+{
+    return (x << k) | (x >> (64 - k));
+}
+
+/*
+ * Returns the next 64 bit integer from the generator with state ``s``.
+ */
+static uint64_t
+rng_next(uint64_t* s)
+{
+    const uint64_t result = rng_rotl(s[1] * 5, 7) * 9;
+    const uint64_t t = s[1] << 17;
+    s[2] ^= s[0];
+    s[3] ^= s[1];
+    s[1] ^= s[2];
+    s[0] ^= s[3];
+    s[2] ^= t;
+    s[3] = rng_rotl(s[3], 45);
+    return result;
+}
+
+/*
+ * Advances the generator with state ``s`` by 2^128 steps. This can be used to
+ * create non-overlapping streams of random numbers from a single state.
+ */
+static void
+rng_jump(uint64_t* s)
+{
+    static const uint64_t jump[] = {
+        0x180ec6d33cfd0abaULL, 0xd5a61266f0c9392cULL,
+        0xa9582618e03fc9aaULL, 0x39abdc4529b1661cULL };
+    uint64_t s0, s1, s2, s3;
+    int i, b;
+
+    s0 = s1 = s2 = s3 = 0;
+    for (i = 0; i < 4; i++) {
+        for (b = 0; b < 64; b++) {
+            if (jump[i] & ((uint64_t)1 << b)) {
+                s0 ^= s[0];
+                s1 ^= s[1];
+                s2 ^= s[2];
+                s3 ^= s[3];
+            }
+            rng_next(s);
+        }
+    }
+    s[0] = s0;
+    s[1] = s1;
+    s[2] = s2;
+    s[3] = s3;
+}
+
+/*
+ * Returns a uniformly distributed random number in the interval (0, 1].
+ */
+static double
+rng_uniform(uint64_t* s)
+{
+    return ((rng_next(s) >> 11) + 1) * (1.0 / 9007199254740992.0);
+}
+
+/*
+ * Returns a Poisson distributed random number with the given mean.
+ *
+ * For small means, Knuth's multiplication method is used. For larger means
+ * (where the cost of this method becomes prohibitive) a normal approximation
+ * is used instead.
+ */
+static int64_t
+rng_poisson(uint64_t* s, double mean)
+{
+    double p, limit, z;
+    int64_t k;
+
+    if (mean <= 0) {
+        return 0;
+    } else if (mean < 30) {
+        limit = exp(-mean);
+        k = 0;
+        p = rng_uniform(s);
+        while (p > limit) {
+            k++;
+            p *= rng_uniform(s);
+        }
+        return k;
+    }
+    z = sqrt(-2 * log(rng_uniform(s))) * cos(6.283185307179586 * rng_uniform(s));
+    k = (int64_t)floor(mean + sqrt(mean) * z + 0.5);
+    return k < 0 ? 0 : k;
+}
+
+/*
+ * Growable buffers for logged times and states.
+ */
+typedef struct {
+    Py_ssize_t count;       /* Number of logged points */
+    Py_ssize_t capacity;    /* Number of points that fit in the buffers */
+    Py_ssize_t nstates;     /* Number of states per point */
+    double* times;
+    int64_t* states;
+} Log;
+
+/*
+ * Adds a point to a log, returns 0 if successful or -1 if memory allocation
+ * failed.
+ */
+static int
+log_append(Log* log, double t, const int64_t* state)
+{
+    double* times;
+    int64_t* states;
+    Py_ssize_t capacity;
+
+    if (log->count == log->capacity) {
+        capacity = log->capacity < 64 ? 64 : 2 * log->capacity;
+        times = (double*)realloc(log->times, capacity * sizeof(double));
+        if (times == NULL) return -1;
+        log->times = times;
+        states = (int64_t*)realloc(
+            log->states, capacity * log->nstates * sizeof(int64_t));
+        if (states == NULL) return -1;
+        log->states = states;
+        log->capacity = capacity;
+    }
+    log->times[log->count] = t;
+    memcpy(log->states + log->count * log->nstates, state,
+           log->nstates * sizeof(int64_t));
+    log->count++;
+    return 0;
+}
+
+/*
+ * Appends ``size`` bytes from ``data`` to a bytearray ``array``. Returns 0 if
+ * successful, or -1 if an error occurred.
+ */
+static int
+bytearray_extend(PyObject* array, const void* data, Py_ssize_t size)
+{
+    Py_ssize_t offset = PyByteArray_Size(array);
+    if (PyByteArray_Resize(array, offset + size)) return -1;
+    memcpy(PyByteArray_AS_STRING(array) + offset, data, size);
+    return 0;
+}
+
+/*
+ * Simulates a linear model with a finite number of channels, at a fixed
+ * membrane potential.
+ *
+ * Arguments:
+ *  rates      A sequence of transition rates (floats)
+ *  si         A sequence of "from" state indices, one for each rate
+ *  sj         A sequence of "to" state indices, one for each rate
+ *  state      A bytearray containing the number of channels in each state,
+ *             stored as 64-bit integers. Updated to the final state.
+ *  rng        A bytearray containing a random number generator state.
+ *             Updated after the simulation.
+ *  t          The starting time
+ *  duration   The time to simulate for
+ *  leap       The time step for tau-leaping, or 0 to use Gillespie's direct
+ *             method.
+ *  log_time   A bytearray to append logged times to, as doubles.
+ *  log_state  A bytearray to append logged states to, as 64-bit integers.
+ *
+ * With the direct method, the state is logged at the start of the simulation
+ * and after every transition. With tau-leaping, it is logged at the start of
+ * every leap. Returns the number of logged points.
+ */
+static PyObject*
+simulate(PyObject *self, PyObject *args)
+{
+    PyObject *rates_in, *si_in, *sj_in, *state_in, *rng_in;
+    PyObject *log_time, *log_state;
+    PyObject *item;
+    double t, duration, leap, tstart, tstop, tnext, lsum, target, rsum, dt;
+    double *rates, *lambdas;
+    long *si, *sj;
+    int64_t *state, *avail, *delta, k;
+    uint64_t rng[4];
+    Py_ssize_t i, j, m, n, nsteps;
+    Log buffer;
+    int flag;
+
+    if (!PyArg_ParseTuple(args, "OOOOOdddOO",
+            &rates_in, &si_in, &sj_in, &state_in, &rng_in,
+            &t, &duration, &leap, &log_time, &log_state)) {
+        return 0;
+    }
+    if (!(PyByteArray_Check(state_in) && PyByteArray_Check(rng_in)
+            && PyByteArray_Check(log_time) && PyByteArray_Check(log_state))) {
+        PyErr_SetString(PyExc_TypeError, "States, random number generator states and logs must be given as bytearrays.");
+        return 0;
+    }
+    if (PyByteArray_Size(rng_in) != RNG_STATE_SIZE) {
+        PyErr_SetString(PyExc_ValueError, "Invalid random number generator state.");
+        return 0;
+    }
+    if (!(PySequence_Check(rates_in) && PySequence_Check(si_in) && PySequence_Check(sj_in))) {
+        PyErr_SetString(PyExc_TypeError, "Rates and state indices must be given as sequences.");
+        return 0;
+    }
+    m = PySequence_Size(rates_in);
+    n = PyByteArray_Size(state_in) / sizeof(int64_t);
+    if (PySequence_Size(si_in) != m || PySequence_Size(sj_in) != m) {
+        PyErr_SetString(PyExc_ValueError, "Rates and state indices must have the same length.");
+        return 0;
+    }
+
+    /* Allocate memory */
+    buffer.count = buffer.capacity = 0;
+    buffer.nstates = n;
+    buffer.times = NULL;
+    buffer.states = NULL;
+    rates = (double*)malloc((m + 1) * sizeof(double));
+    lambdas = (double*)malloc((m + 1) * sizeof(double));
+    si = (long*)malloc((m + 1) * sizeof(long));
+    sj = (long*)malloc((m + 1) * sizeof(long));
+    state = (int64_t*)malloc((n + 1) * sizeof(int64_t));
+    avail = (int64_t*)malloc((n + 1) * sizeof(int64_t));
+    delta = (int64_t*)malloc((n + 1) * sizeof(int64_t));
+    if (rates == NULL || lambdas == NULL || si == NULL || sj == NULL
+            || state == NULL || avail == NULL || delta == NULL) {
+        PyErr_SetString(PyExc_MemoryError, "Unable to allocate memory for simulation.");
+        goto error;
+    }
+
+    /* Read rates and transitions */
+    for (i = 0; i < m; i++) {
+        item = PySequence_GetItem(rates_in, i);   /* New reference */
+        rates[i] = PyFloat_AsDouble(item);
+        Py_XDECREF(item);
+        item = PySequence_GetItem(si_in, i);
+        si[i] = PyLong_AsLong(item);
+        Py_XDECREF(item);
+        item = PySequence_GetItem(sj_in, i);
+        sj[i] = PyLong_AsLong(item);
+        Py_XDECREF(item);
+        if (PyErr_Occurred()) goto error;
+        if (si[i] < 0 || si[i] >= n || sj[i] < 0 || sj[i] >= n) {
+            PyErr_SetString(PyExc_ValueError, "State index out of range.");
+            goto error;
+        }
+        if (!(rates[i] >= 0)) {
+            PyErr_SetString(PyExc_ValueError, "Transition rates must be non-negative.");
+            goto error;
+        }
+    }
+    memcpy(state, PyByteArray_AS_STRING(state_in), n * sizeof(int64_t));
+    memcpy(rng, PyByteArray_AS_STRING(rng_in), RNG_STATE_SIZE);
+
+    /* Simulate, without holding the GIL */
+    flag = 0;
+    tstart = t;
+    tstop = t + duration;
+    Py_BEGIN_ALLOW_THREADS
+    if (leap <= 0) {
+
+        /* Gillespie's direct method */
+        while (t < tstop) {
+            if (log_append(&buffer, t, state)) { flag = -1; break; }
+
+            /* Get propensities */
+            lsum = 0;
+            for (i = 0; i < m; i++) {
+                lambdas[i] = rates[i] * (double)state[si[i]];
+                lsum += lambdas[i];
+            }
+            if (lsum <= 0) break;
+
+            /* Sample time until next transition, don't step beyond tstop.
+               Because the exponential distribution is memoryless, no
+               transition needs to be made in the remaining time. */
+            tnext = t - log(rng_uniform(rng)) / lsum;
+            if (tnext > tstop) break;
+
+            /* Select and perform transition */
+            target = rng_uniform(rng) * lsum;
+            rsum = 0;
+            j = -1;
+            for (i = 0; i < m; i++) {
+                if (lambdas[i] > 0) {
+                    j = i;
+                    rsum += lambdas[i];
+                    if (rsum >= target) break;
+                }
+            }
+            state[si[j]]--;
+            state[sj[j]]++;
+            t = tnext;
+        }
+
+    } else {
+
+        /* Tau-leaping */
+        nsteps = 0;
+        while (t < tstop) {
+            if (log_append(&buffer, t, state)) { flag = -1; break; }
+
+            /* Get size of this leap, without accumulating rounding errors */
+            nsteps++;
+            tnext = tstart + nsteps * leap;
+            if (tnext > tstop) tnext = tstop;
+            dt = tnext - t;
+
+            /* Sample number of transitions of each type, never removing more
+               channels from a state than it contained at the start of the
+               leap. */
+            for (i = 0; i < n; i++) {
+                avail[i] = state[i];
+                delta[i] = 0;
+            }
+            for (i = 0; i < m; i++) {
+                k = rng_poisson(rng, rates[i] * (double)state[si[i]] * dt);
+                if (k > avail[si[i]]) k = avail[si[i]];
+                avail[si[i]] -= k;
+                delta[si[i]] -= k;
+                delta[sj[i]] += k;
+            }
+            for (i = 0; i < n; i++) {
+                state[i] += delta[i];
+            }
+            t = tnext;
+        }
+
+    }
+    Py_END_ALLOW_THREADS
+    if (flag) {
+        PyErr_SetString(PyExc_MemoryError, "Unable to allocate memory for simulation log.");
+        goto error;
+    }
+
+    /* Store results */
+    memcpy(PyByteArray_AS_STRING(state_in), state, n * sizeof(int64_t));
+    memcpy(PyByteArray_AS_STRING(rng_in), rng, RNG_STATE_SIZE);
+    if (bytearray_extend(log_time, buffer.times, buffer.count * sizeof(double))) goto error;
+    if (bytearray_extend(log_state, buffer.states, buffer.count * n * sizeof(int64_t))) goto error;
+
+    free(rates); free(lambdas); free(si); free(sj);
+    free(state); free(avail); free(delta);
+    free(buffer.times); free(buffer.states);
+    return PyLong_FromSsize_t(buffer.count);
+
+error:
+    free(rates); free(lambdas); free(si); free(sj);
+    free(state); free(avail); free(delta);
+    free(buffer.times); free(buffer.states);
+    return 0;
+}
+
+/*
+ * Advances a random number generator state (given as a bytearray) by 2^128
+ * steps, in place.
+ */
+static PyObject*
+jump(PyObject *self, PyObject *args)
+{
+    PyObject *rng_in;
+    uint64_t rng[4];
+
+    if (!PyArg_ParseTuple(args, "O", &rng_in)) {
+        return 0;
+    }
+    if (!PyByteArray_Check(rng_in) || PyByteArray_Size(rng_in) != RNG_STATE_SIZE) {
+        PyErr_SetString(PyExc_ValueError, "Invalid random number generator state.");
+        return 0;
+    }
+    memcpy(rng, PyByteArray_AS_STRING(rng_in), RNG_STATE_SIZE);
+    rng_jump(rng);
+    memcpy(PyByteArray_AS_STRING(rng_in), rng, RNG_STATE_SIZE);
+    Py_RETURN_NONE;
+}
+
+/*
+ * Methods in this module
+ */
+static PyMethodDef SimMethods[] = {
+    {"simulate", simulate, METH_VARARGS, "Run a stochastic simulation."},
+    {"jump", jump, METH_VARARGS, "Advance a random number generator state."},
+    {NULL},
+};
+
+/*
+ * Module definition
+ */
+#if PY_MAJOR_VERSION >= 3
+
+    static struct PyModuleDef moduledef = {
+        PyModuleDef_HEAD_INIT,
+        "<?= module_name ?>",       /* m_name */
+        "Generated Gillespie module",   /* m_doc */
+        -1,                         /* m_size */
+        SimMethods,                 /* m_methods */
+        NULL,                       /* m_reload */
+        NULL,                       /* m_traverse */
+        NULL,                       /* m_clear */
+        NULL,                       /* m_free */
+    };
+
+    PyMODINIT_FUNC PyInit_<?=module_name?>(void) {
+        return PyModule_Create(&moduledef);
+    }
+
+#else
+
+    PyMODINIT_FUNC
+    init<?=module_name?>(void) {
+        (void) Py_InitModule("<?= module_name ?>", SimMethods);
+    }
+
+#endif
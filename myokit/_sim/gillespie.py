@@ -0,0 +1,72 @@
+#
+# Compiled back-end for discrete stochastic simulations.
+#
+# This file is part of Myokit.
+# See http://myokit.org for copyright, sharing, and licensing details.
+#
+from __future__ import absolute_import, division
+from __future__ import print_function, unicode_literals
+
+import os
+
+import myokit
+
+# Path to C Source for Gillespie module
+SOURCE_FILE = 'gillespie.c'
+
+
+class Gillespie(myokit.CModule):
+    """
+    Compiles and caches the model-independent back-end used for compiled
+    stochastic simulations in :class:`myokit.lib.markov.DiscreteSimulation`.
+    """
+    # Unique id for this object
+    _index = 0
+
+    # Cached back-end object if compiled, False if compilation failed
+    _instance = None
+
+    # Cached compilation error messages
+    _message = None
+
+    def __init__(self):
+        super(Gillespie, self).__init__()
+        # Create and cache back-end
+        Gillespie._index += 1
+
+        # Define libraries
+        libd = list()
+        incd = list()
+        incd.append(myokit.DIR_CFUNC)
+        libs = []
+        if os.name != 'nt':  # pragma: no windows cover
+            libs.append('m')
+
+        # Create back-end
+        mname = 'myokit_gillespie_' + str(Gillespie._index)
+        mname += '_' + str(myokit.pid_hash())
+        fname = os.path.join(myokit.DIR_CFUNC, SOURCE_FILE)
+        args = {'module_name': mname}
+        try:
+            Gillespie._instance = self._compile(
+                mname, fname, args, libs, libd, incd)
+        except myokit.CompilationError as e:  # pragma: no cover
+            Gillespie._instance = False
+            Gillespie._message = str(e)
+
+    @staticmethod
+    def _get_instance():
+        """
+        Returns a cached back-end, creates and returns a new back-end or raises
+        a :class:`myokit.CompilationError`.
+        """
+        # No instance? Create it
+        if Gillespie._instance is None:
+            Gillespie()
+
+        # Instance creation failed, raise exception
+        if Gillespie._instance is False:  # pragma: no cover
+            raise myokit.CompilationError(Gillespie._message)
+
+        # Return instance
+        return Gillespie._instance
@@ -221,9 +221,85 @@ extern "C" {
         Py_RETURN_NONE;
     }
 
+    // Calculates the derivatives and partial derivatives for a batch of K
+    // points, reading and writing contiguous arrays of doubles through the
+    // buffer protocol (e.g. NumPy arrays).
+    //
+    // Arguments: states (K x N_STATE), inputs (K x N_INPUT), derivatives
+    // (K x N_STATE, output), partial derivatives (K x N_STATE x N_STATE,
+    // output), and K.
+    static PyObject*
+    calculate_batch(PyObject* self, PyObject* args)
+    {
+        int i, j;
+        Py_ssize_t k, nk;
+        Py_buffer b_state, b_input, b_deriv, b_partial;
+        Real *x, *u, *f, *p;
+
+        // Check input arguments
+        if (!PyArg_ParseTuple(args, "y*y*w*w*n",
+                &b_state,
+                &b_input,
+                &b_deriv,
+                &b_partial,
+                &nk
+                )) {
+            // Any buffers obtained are released by PyArg_ParseTuple
+            return 0;
+        }
+
+        // Check buffer sizes
+        if (nk < 0
+                || b_state.len != (Py_ssize_t)(nk * N_STATE * sizeof(Real))
+                || b_input.len != (Py_ssize_t)(nk * N_INPUT * sizeof(Real))
+                || b_deriv.len != (Py_ssize_t)(nk * N_STATE * sizeof(Real))
+                || b_partial.len != (Py_ssize_t)(nk * N_STATE2 * sizeof(Real))) {
+            PyBuffer_Release(&b_state);
+            PyBuffer_Release(&b_input);
+            PyBuffer_Release(&b_deriv);
+            PyBuffer_Release(&b_partial);
+            return e("Incorrect buffer sizes.");
+        }
+        x = (Real*)b_state.buf;
+        u = (Real*)b_input.buf;
+        f = (Real*)b_deriv.buf;
+        p = (Real*)b_partial.buf;
+
+        // Create state vector, derivatives vector & input vector
+        state = (Diff*)malloc(sizeof(Diff) * N_STATE);
+        deriv = (Diff*)malloc(sizeof(Diff) * N_STATE);
+        input = (Real*)malloc(sizeof(Real) * N_INPUT);
+
+        // Run!
+        for(k=0; k<nk; k++) {
+            for(i=0; i<N_STATE; i++) {
+                state[i] = Diff(x[k*N_STATE+i], i);
+            }
+            for(i=0; i<N_INPUT; i++) {
+                input[i] = u[k*N_INPUT+i];
+            }
+            rhs(state, deriv, input);
+            for(i=0; i<N_STATE; i++) {
+                f[k*N_STATE+i] = deriv[i].value();
+                for(j=0; j<N_STATE; j++) {
+                    p[k*N_STATE2+i*N_STATE+j] = deriv[i][j];
+                }
+            }
+        }
+
+        // Finished succesfully, clean up and return
+        PyBuffer_Release(&b_state);
+        PyBuffer_Release(&b_input);
+        PyBuffer_Release(&b_deriv);
+        PyBuffer_Release(&b_partial);
+        clean();
+        Py_RETURN_NONE;
+    }
+
     // Methods in this module
     static PyMethodDef SimMethods[] = {
         {"calculate", calculate, METH_VARARGS, "Calculates the derivatives and partial derivatives."},
+        {"calculate_batch", calculate_batch, METH_VARARGS, "Calculates the derivatives and partial derivatives for a batch of points."},
         {NULL},
     };
 
@@ -149,28 +149,18 @@ class JacobianTracer(myokit.CppModule):
             if k != tvar:
                 block.set0d(k, v)
 
-        # Create iterators over lists of state and input values
-        istates = [iter(x) for x in states]
-        iinputs = [iter(x) for x in inputs]
-
-        # Length of derivs and partials lists
+        # Create (n, ns) arrays of state and input values
         ns = self._model.count_states()
-        ns2 = ns * ns
-
-        # Pass every state into the generator, store the output
-        partials = []
-        for i in range(n):
-            state = [next(x) for x in istates]
-            bound = [next(x) for x in iinputs]
-            deriv = [0] * ns
-            partial = [0] * ns2
-            self._ext.calculate(state, bound, deriv, partial)
-            # Discard derivatives
-            # Convert partial derivatives to numpy array and store
-            partial = np.array(partial, copy=False)
-            partial = partial.reshape((ns, ns))
-            partials.append(partial)
-        partials = np.array(partials)
+        states = np.array(np.stack(states, axis=1), dtype=float, order='C')
+        inputs = np.array(
+            np.stack(inputs, axis=1) if inputs else np.zeros((n, 0)),
+            dtype=float, order='C')
+
+        # Calculate all partial derivatives in a single call, discard the
+        # derivatives
+        derivs = np.empty((n, ns))
+        partials = np.empty((n, ns, ns))
+        self._ext.calculate_batch(states, inputs, derivs, partials, n)
 
         # Create a simulation
         block.set2d('jacobians', partials, copy=False)
@@ -251,37 +241,63 @@ class JacobianCalculator(myokit.CppModule):
         incd = [myokit.DIR_CFUNC]
         self._ext = self._compile(module_name, fname, args, libs, libd, incd)
 
-    def calculate(self, state):
+    def calculate(self, state, derivatives=None, jacobians=None):
         """
         Calculates both the derivatives ``f`` and the Jacobian ``J`` at the
         given state ``x`` and returns a tuple ``(f(x), J(x))``.
 
         The order of state variables must be that specified by the model (i.e.
         the one obtained from calling :meth:`Model.states()`).
+
+        To evaluate many points at once, ``state`` can be given as a 2d array
+        of shape ``(K, n)``, where ``n`` is the number of states. In this case
+        the returned derivatives and Jacobians have shapes ``(K, n)`` and
+        ``(K, n, n)`` respectively, and all ``K`` points are evaluated in a
+        single call to the compiled back-end.
+
+        To avoid allocating new arrays on every call, preallocated arrays of
+        the correct shape can be passed in as ``derivatives`` and
+        ``jacobians``. These must be C-contiguous arrays of doubles, and will
+        be filled and returned.
         """
         # Check state vector
         n = self._model.count_states()
-        if len(state) != n:
-            raise ValueError('State vector must have length ' + str(n) + '.')
         try:
-            state = [float(x) for x in state]
-        except ValueError:
+            state = np.array(state, dtype=float, order='C', ndmin=1)
+        except (TypeError, ValueError):
             raise ValueError('State vector must contain floats.')
+        if state.ndim > 2 or state.shape[-1] != n:
+            raise ValueError('State vector must have length ' + str(n) + '.')
+        shape = state.shape
+        k = 1 if state.ndim == 1 else shape[0]
 
-        # Create input vector
-        inputs = []
-
-        # Create output vectors
-        deriv = [0] * n
-        partial = [0] * n * n
+        # Create or check output arrays
+        derivatives = self._output(derivatives, shape, 'derivatives')
+        jacobians = self._output(jacobians, shape + (n,), 'jacobians')
 
-        # Run!
-        self._ext.calculate(state, inputs, deriv, partial)
+        # Run! (No inputs are used)
+        self._ext.calculate_batch(
+            state, np.empty((k, 0)), derivatives, jacobians, k)
+        return derivatives, jacobians
 
-        # Create numpy versions and return
-        deriv = np.array(deriv, copy=False)
-        partial = np.array(partial, copy=False).reshape((n, n))
-        return deriv, partial
+    def _output(self, array, shape, name):
+        """
+        Creates an output array of the given ``shape``, or checks that a
+        user-supplied ``array`` can be used.
+        """
+        if array is None:
+            return np.empty(shape)
+        if not (isinstance(array, np.ndarray) and array.dtype == float
+                and array.flags['C_CONTIGUOUS']
+                and array.flags['WRITEABLE']):
+            raise ValueError(
+                'The argument `' + name + '` must be a writable C-contiguous'
+                ' NumPy array of floats.')
+        if array.shape != shape:
+            raise ValueError(
+                'The argument `' + name + '` must have shape ' + str(shape)
+                + '.')
+        return array
 
     def newton_root(self, x=None, accuracy=0, max_iter=50, damping=1):
         """
@@ -484,6 +484,101 @@ int mcl_select_device(
     }
 }
 
+/*
+ * Searches for the preferred platform, and selects one or more devices on it.
+ *
+ * The first device is selected as in mcl_select_device(). If more than one
+ * device is requested, the remaining devices are either the other devices on
+ * the same platform (in the order they are reported by the platform), or, if
+ * ``fission`` is set, sub-devices created by dividing the first device into
+ * ``count`` parts with an equal number of compute units. Sub-devices must be
+ * released with clReleaseDevice() when no longer needed.
+ *
+ * Arguments:
+ *  PyObject* platform  A string representing the platform, or None
+ *  PyObject* device    A string representing the device, or None
+ *  cl_uint count       The number of devices to select
+ *  int fission         Set to 1 to divide the selected device into sub-devices
+ *  cl_platform_id* pid The returned cl_platform_id
+ *  cl_device_id* dids  An array of size count, used to return the devices
+ * The returned value is 0 if no error occurred, 1 if an error did occur. In
+ *  this case a python error message will also be set.
+ */
+int mcl_select_devices(
+    PyObject* platform,     // Must be bytes
+    PyObject* device,       // Must be bytes
+    cl_uint count,
+    int fission,
+    cl_platform_id* pid,
+    cl_device_id* dids)
+{
+    // OpenCL return
+    cl_int flag;
+
+    // Array of device ids
+    cl_device_id device_ids[MCL_MAX_DEVICES];
+    cl_uint n_devices;
+
+    // Device fission
+    cl_uint n_units;
+    cl_device_partition_property properties[3];
+
+    // OpenCL ints for iterating
+    cl_uint i, j;
+
+    // Select first device
+    if (mcl_select_device(platform, device, pid, dids)) return 1;
+    if (count < 2) return 0;
+
+    if (fission) {
+        // Divide first device into sub-devices
+        flag = clGetDeviceInfo(dids[0], CL_DEVICE_MAX_COMPUTE_UNITS, sizeof(n_units), &n_units, NULL);
+        if (mcl_flag(flag)) return 1;
+        if (n_units < count) {
+            PyErr_SetString(PyExc_Exception, "The selected OpenCL device has fewer compute units than the requested number of sub-devices.");
+            return 1;
+        }
+        properties[0] = CL_DEVICE_PARTITION_EQUALLY;
+        properties[1] = (cl_device_partition_property)(n_units / count);
+        properties[2] = 0;
+        n_devices = 0;
+        flag = clCreateSubDevices(dids[0], properties, 0, NULL, &n_devices);
+        if (mcl_flag(flag)) return 1;
+        if (n_devices < count || n_devices > MCL_MAX_DEVICES) {
+            PyErr_SetString(PyExc_Exception, "Unable to divide the selected OpenCL device into the requested number of sub-devices.");
+            return 1;
+        }
+        flag = clCreateSubDevices(dids[0], properties, n_devices, device_ids, NULL);
+        if (mcl_flag(flag)) return 1;
+
+        // Use the first count sub-devices, release the rest
+        for (i=0; i<n_devices; i++) {
+            if (i < count) {
+                dids[i] = device_ids[i];
+            } else {
+                clReleaseDevice(device_ids[i]);
+            }
+        }
+        return 0;
+    }
+
+    // Add other devices on the same platform
+    n_devices = 0;
+    flag = clGetDeviceIDs(*pid, CL_DEVICE_TYPE_ALL, MCL_MAX_DEVICES, device_ids, &n_devices);
+    if (mcl_flag(flag)) return 1;
+    j = 1;
+    for (i=0; i<n_devices && j<count; i++) {
+        if (device_ids[i] != dids[0]) {
+            dids[j++] = device_ids[i];
+        }
+    }
+    if (j < count) {
+        PyErr_SetString(PyExc_Exception, "Not enough OpenCL devices found on the selected platform.");
+        return 1;
+    }
+    return 0;
+}
+
 /*
  * Rounds up to the nearest multiple of ws_size.
  */
@@ -521,6 +616,178 @@ int mcl_platform_supports_extension(cl_platform_id platform_id, const char* exte
     return (strstr(buffer, extension) != NULL);
 }
 
+/*
+ * Returns a tuple of strings identifying a device and its driver, for use as
+ * part of a key in a cache of program binaries.
+ *
+ * Arguments:
+ *  cl_device_id device_id  The id of the device to query
+ *
+ * Returns NULL if the information could not be obtained.
+ */
+PyObject* mcl_device_key(cl_device_id device_id)
+{
+    // Platform id
+    cl_platform_id platform_id;
+
+    // String buffers
+    char platform_name[1024];
+    char platform_version[1024];
+    char device_name[1024];
+    char device_version[1024];
+    char driver_version[1024];
+
+    if(clGetDeviceInfo(device_id, CL_DEVICE_PLATFORM, sizeof(platform_id), &platform_id, NULL) != CL_SUCCESS) return NULL;
+    if(clGetPlatformInfo(platform_id, CL_PLATFORM_NAME, sizeof(platform_name), platform_name, NULL) != CL_SUCCESS) return NULL;
+    if(clGetPlatformInfo(platform_id, CL_PLATFORM_VERSION, sizeof(platform_version), platform_version, NULL) != CL_SUCCESS) return NULL;
+    if(clGetDeviceInfo(device_id, CL_DEVICE_NAME, sizeof(device_name), device_name, NULL) != CL_SUCCESS) return NULL;
+    if(clGetDeviceInfo(device_id, CL_DEVICE_VERSION, sizeof(device_version), device_version, NULL) != CL_SUCCESS) return NULL;
+    if(clGetDeviceInfo(device_id, CL_DRIVER_VERSION, sizeof(driver_version), driver_version, NULL) != CL_SUCCESS) return NULL;
+    return Py_BuildValue("(sssss)", platform_name, platform_version, device_name, device_version, driver_version);
+}
+
+/*
+ * Creates and builds an OpenCL program for one or more devices.
+ *
+ * If a program cache is given, its method ``load(source, device, options)`` is
+ * called first for each device, where ``device`` is a tuple created by
+ * mcl_device_key(). If this returns a (non-empty) bytes object for every
+ * device, the program is created from these binaries. Otherwise, or if the
+ * binaries can't be used, the program is built from source and the cache's
+ * method ``store(source, device, options, binary)`` is called to store the
+ * resulting binary for each device. Any errors raised by the cache are
+ * ignored.
+ *
+ * Arguments:
+ *  cl_context context      The context to create the program in
+ *  cl_uint n_devices       The number of devices to build the program for
+ *  cl_device_id* device_ids  The devices to build the program for
+ *  const char* source      The program source code
+ *  const char* options     The build options
+ *  PyObject* cache         A program cache, or Py_None
+ *  cl_program* program     The created program
+ *
+ * Returns the flag from creating or building the program from source, or
+ * CL_SUCCESS if cached binaries were used.
+ */
+cl_int mcl_build_program(
+    cl_context context,
+    cl_uint n_devices,
+    const cl_device_id* device_ids,
+    const char* source,
+    const char* options,
+    PyObject* cache,
+    cl_program* program)
+{
+    // Return from OpenCL
+    cl_int flag, status;
+
+    // Iteration, number of binaries found in the cache
+    cl_uint i, n_found;
+
+    // Device keys, and return values from cache (decref when done)
+    PyObject** devices = NULL;
+    PyObject** rets = NULL;
+    PyObject* ret = NULL;
+    PyObject* data = NULL;
+
+    // Program binaries
+    const unsigned char** binaries = NULL;
+    unsigned char** built = NULL;
+    size_t* binary_sizes = NULL;
+
+    *program = NULL;
+
+    // Try creating from cached binaries
+    n_found = 0;
+    if(cache != Py_None) {
+        devices = (PyObject**)calloc(n_devices, sizeof(PyObject*));
+        rets = (PyObject**)calloc(n_devices, sizeof(PyObject*));
+        binaries = (const unsigned char**)calloc(n_devices, sizeof(unsigned char*));
+        binary_sizes = (size_t*)calloc(n_devices, sizeof(size_t));
+        for(i=0; i<n_devices; i++) {
+            devices[i] = mcl_device_key(device_ids[i]);
+            if(devices[i] == NULL) {
+                PyErr_Clear();
+                break;
+            }
+            rets[i] = PyObject_CallMethod(cache, "load", "sOs", source, devices[i], options);
+            if(rets[i] == NULL) {
+                PyErr_Clear();
+            } else if(PyBytes_Check(rets[i]) && PyBytes_Size(rets[i]) > 0) {
+                binaries[i] = (const unsigned char*)PyBytes_AsString(rets[i]);
+                binary_sizes[i] = (size_t)PyBytes_Size(rets[i]);
+                n_found++;
+            }
+        }
+        if(n_found == n_devices) {
+            *program = clCreateProgramWithBinary(context, n_devices, device_ids, binary_sizes, binaries, NULL, &flag);
+            if(flag == CL_SUCCESS) {
+                // Binaries must still be built, but this is fast
+                flag = clBuildProgram(*program, n_devices, device_ids, options, NULL, NULL);
+                if(flag != CL_SUCCESS) {
+                    clReleaseProgram(*program);
+                    *program = NULL;
+                }
+            } else {
+                *program = NULL;
+            }
+        }
+        for(i=0; i<n_devices; i++) {
+            Py_XDECREF(rets[i]);
+        }
+        free(rets); rets = NULL;
+        free(binaries); binaries = NULL;
+        if(*program != NULL) {
+            for(i=0; i<n_devices; i++) {
+                Py_XDECREF(devices[i]);
+            }
+            free(devices);
+            free(binary_sizes);
+            return CL_SUCCESS;
+        }
+    }
+
+    // Build from source
+    *program = clCreateProgramWithSource(context, 1, &source, NULL, &flag);
+    if(flag == CL_SUCCESS) {
+        flag = clBuildProgram(*program, n_devices, device_ids, options, NULL, NULL);
+    }
+
+    // Store binaries
+    if(flag == CL_SUCCESS && devices != NULL) {
+        status = clGetProgramInfo(*program, CL_PROGRAM_BINARY_SIZES, n_devices * sizeof(size_t), binary_sizes, NULL);
+        if(status == CL_SUCCESS) {
+            built = (unsigned char**)calloc(n_devices, sizeof(unsigned char*));
+            for(i=0; i<n_devices; i++) {
+                built[i] = (unsigned char*)malloc(binary_sizes[i] > 0 ? binary_sizes[i] : 1);
+            }
+            status = clGetProgramInfo(*program, CL_PROGRAM_BINARIES, n_devices * sizeof(unsigned char*), built, NULL);
+            for(i=0; i<n_devices; i++) {
+                if(status == CL_SUCCESS && devices[i] != NULL && binary_sizes[i] > 0) {
+                    data = PyBytes_FromStringAndSize((const char*)built[i], (Py_ssize_t)binary_sizes[i]);
+                    if(data != NULL) {
+                        ret = PyObject_CallMethod(cache, "store", "sOsO", source, devices[i], options, data);
+                        Py_XDECREF(ret);
+                        Py_DECREF(data);
+                    }
+                    PyErr_Clear();
+                }
+                free(built[i]);
+            }
+            free(built);
+        }
+    }
+    if(devices != NULL) {
+        for(i=0; i<n_devices; i++) {
+            Py_XDECREF(devices[i]);
+        }
+        free(devices);
+    }
+    free(binary_sizes);
+    return flag;
+}
+
 /*
  * Creates and returns a platform information dict, not including a devices
  * entry.
@@ -271,6 +271,66 @@ class OpenCL(myokit.CModule):
     '''
 
 
+class ProgramCache(object):
+    """
+    Stores and retrieves built OpenCL program binaries in an on-disk cache
+    in ``myokit.DIR_CACHE``, so that simulations of the same model don't need
+    to build their kernels from source.
+
+    Entries are keyed on the program source code, the platform, device, and
+    driver version, and the build options.
+
+    Instances of this class are passed to the C back-ends of OpenCL
+    simulations, which call :meth:`load()` before building a program, and
+    :meth:`store()` after building it from source.
+    """
+    def __init__(self):
+        self._cache = myokit.tools.DiskCache(
+            os.path.join(myokit.DIR_CACHE, 'opencl-programs'),
+            myokit.CACHE_COMPILED_SIZE)
+
+    @staticmethod
+    def create():
+        """
+        Returns a new :class:`ProgramCache`, or ``None`` if caching is disabled
+        (see ``myokit.CACHE_COMPILED``).
+        """
+        if myokit.CACHE_COMPILED and not myokit.DEBUG_SC:
+            return ProgramCache()
+        return None
+
+    def _key(self, source, device, options):
+        """ Returns the key for a program. """
+        return self._cache.key(source, tuple(device), options)
+
+    def load(self, source, device, options):
+        """
+        Returns the cached binary for the program with the given ``source``,
+        built for the given ``device`` (a tuple of strings identifying the
+        platform, device, and driver) with the given build ``options``, or
+        ``None`` if not found.
+        """
+        path = self._cache.get(self._key(source, device, options))
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except (IOError, OSError):  # pragma: no cover
+            # Removed by another process
+            return None
+
+    def store(self, source, device, options, binary):
+        """
+        Stores a ``binary`` built from ``source`` for the given ``device`` and
+        ``options``.
+        """
+        try:
+            self._cache.put(self._key(source, device, options), binary)
+        except Exception:   # pragma: no cover
+            pass
+
+
 class OpenCLInfo(object):
     """
     Represents information about the available OpenCL platforms and devices.
@@ -44,6 +44,13 @@ if myokit.DEBUG_SM:
 
 #define n_state <?= str(model.count_states()) ?>
 
+<?
+vm = model.label('membrane_potential')
+if vm is not None:
+    print('/* Indice of membrane potential in state vector */')
+    print('#define i_vm ' + str(vm.indice()))
+?>
+
 typedef <?= ('double' if precision == myokit.DOUBLE_PRECISION else 'float') ?> Real;
 <?
 if precision == myokit.DOUBLE_PRECISION:
@@ -75,6 +82,93 @@ static int log_add(PyObject* log_dict, PyObject** logs, Real** vars, unsigned lo
     return added;
 }
 
+/*
+ * Domain decomposition
+ * The cells can be divided over several devices. Each device simulates a
+ * block of cells (its "domain"), with global indices lo <= i < hi, and stores
+ * the state of these cells plus a "halo" of neighbouring cells that are
+ * simulated on other devices. Before each diffusion step, the membrane
+ * potentials of the halo cells are copied from the devices that simulate
+ * them. With a single device, there is a single domain containing all cells.
+ *
+ * Each cell i simulated on a device is stored at local index i - offset. For
+ * rectangular grids the stored cells (including the halo) form a single
+ * block, so that the same holds for the halo cells. For arbitrary geometries
+ * the halo cells are stored after the simulated cells.
+ */
+typedef struct Domain {
+    unsigned long lo;           // The first cell simulated on this device
+    unsigned long hi;           // One past the last cell simulated on this device
+    unsigned long offset;       // The global index of local cell 0
+    unsigned long n_local;      // The number of cells stored on this device
+    unsigned long n_halo;       // The number of halo cells
+    unsigned long n_export;     // The number of cells needed by other devices
+    unsigned long n_connections;// The number of connections (arbitrary geometry)
+    unsigned long n_log_state;  // The number of gathered state values
+    unsigned long n_log_idiff;  // The number of gathered diffusion currents
+    unsigned long n_log_inter;  // The number of gathered intermediary variables
+    unsigned long log_start;    // The position of the first gathered value
+    cl_uint apd_capacity;       // The maximum number of stored APs
+
+    // Work items
+    size_t work_offset[2];      // The global index of the first simulated cell
+    size_t work_size[2];        // The number of simulated cells
+    size_t work_size_local[1];  // The number of stored cells
+    size_t work_size_conn[1];   // The number of connections
+    size_t work_size_halo[1];   // The number of halo cells
+    size_t work_size_export[1]; // The number of exported cells
+    size_t work_size_log[1];    // The number of gathered logged values
+
+    // OpenCL objects
+    cl_command_queue queue;
+    cl_kernel kernel_cell;
+    cl_kernel kernel_diff;
+    cl_kernel kernel_cond;
+    cl_kernel kernel_arb_reset;
+    cl_kernel kernel_arb_step;
+    cl_kernel kernel_log;
+    cl_kernel kernel_apd;
+    cl_kernel kernel_export;    // Gathers values needed by other devices
+    cl_kernel kernel_halo;      // Scatters values from other devices
+    cl_mem mbuf_state;
+    cl_mem mbuf_idiff;
+    cl_mem mbuf_inter_log;
+    cl_mem mbuf_field_data;
+    cl_mem mbuf_gx;             // Conductance field
+    cl_mem mbuf_gy;             // Conductance field
+    cl_mem mbuf_conn1;          // Connections: Cell 1
+    cl_mem mbuf_conn2;          // Connections: Cell 2
+    cl_mem mbuf_conn3;          // Connections: Conductance between 1 and 2
+    cl_mem mbuf_log;            // Logged values, gathered on the device
+    cl_mem mbuf_log_index;      // Indices of logged values in their source
+    cl_mem mbuf_apd_vm;         // APD detection: last membrane potential
+    cl_mem mbuf_apd_active;     // APD detection: 1 if above threshold
+    cl_mem mbuf_apd_start;      // APD detection: start of current AP
+    cl_mem mbuf_apd_count;      // APD detection: number of detected APs
+    cl_mem mbuf_apd_cell;       // APD detection: cell index for each AP
+    cl_mem mbuf_apd_time;       // APD detection: start and duration of each AP
+    cl_mem mbuf_export;         // Halo exchange: values needed by other devices
+    cl_mem mbuf_export_index;   // Halo exchange: indices of exported values
+    cl_mem mbuf_halo;           // Halo exchange: values from other devices
+    cl_mem mbuf_halo_index;     // Halo exchange: indices of halo values
+    cl_event export_event;      // Event for the last export
+    int exporting;              // True if export_event must be released
+} Domain;
+
+/*
+ * A copy of membrane potentials from the export buffer of one device to the
+ * halo buffer of another.
+ */
+typedef struct HaloCopy {
+    unsigned long src;          // The domain to copy from
+    unsigned long dst;          // The domain to copy to
+    unsigned long src_offset;   // The first value to copy from the export buffer
+    unsigned long dst_offset;   // The first value to copy to in the halo buffer
+    unsigned long count;        // The number of values to copy
+    cl_event event;             // Event for the last copy
+    int pending;                // True if event must be released
+} HaloCopy;
+
 /*
  * Simulation variables
  *
@@ -104,45 +198,38 @@ PyObject *log_dict;     // A logging dict
 double log_interval;    // The time between log writes
 PyObject *inter_log;    // A list of intermediary variables to log
 PyObject *field_data;   // A list containing all field data
+PyObject *apd_threshold;// The threshold for APD detection, or None
+PyObject *apd_data;     // A list to append detected APs to
+PyObject *program_cache;// A cache of program binaries, or None
+int fission;            // True if the devices are sub-devices of a single device
+PyObject *domain_list;  // A list of tuples describing each domain
+PyObject *copy_list;    // A list of tuples describing the halo exchange
 
 // OpenCL objects
 cl_context context = NULL;
-cl_command_queue command_queue = NULL;
 cl_program program = NULL;
-cl_kernel kernel_cell;
-cl_kernel kernel_diff;
-cl_kernel kernel_cond;
-cl_kernel kernel_arb_reset;
-cl_kernel kernel_arb_step;
-cl_mem mbuf_state = NULL;
-cl_mem mbuf_idiff = NULL;
-cl_mem mbuf_inter_log = NULL;
-cl_mem mbuf_field_data = NULL;
-cl_mem mbuf_gx = NULL;      // Conductance field
-cl_mem mbuf_gy = NULL;      // Conductance field
-cl_mem mbuf_conn1 = NULL;   // Connections: Cell 1
-cl_mem mbuf_conn2 = NULL;   // Connections: Cell 2
-cl_mem mbuf_conn3 = NULL;   // Connections: Conductance between 1 and 2
+cl_device_id *device_ids = NULL;
+cl_mem mbuf_log_host[2] = {NULL, NULL};     // Pinned host memory for logging
+
+// Domains, and copies between them
+Domain *domains = NULL;
+unsigned long n_domains = 0;
+HaloCopy *copies = NULL;
+unsigned long n_copies = 0;
+cl_event *copy_wait = NULL; // Events to wait for before exporting
 
 // Input vectors to kernels
 Real *rvec_state = NULL;
-Real *rvec_idiff = NULL;
-Real *rvec_inter_log = NULL;
 Real *rvec_field_data = NULL;
 Real *rvec_gx = NULL;
 Real *rvec_gy = NULL;
-unsigned long *rvec_conn1 = NULL;
-unsigned long *rvec_conn2 = NULL;
-Real *rvec_conn3 = NULL;
+Real *rvec_log[2] = {NULL, NULL};   // Mapped pointers to pinned memory
+unsigned long *rvec_log_index = NULL;
+unsigned long *rvec_log_local = NULL;
+cl_uint *rvec_apd_cell = NULL;
+Real *rvec_apd_time = NULL;
 size_t dsize_state;
-size_t dsize_idiff;
-size_t dsize_inter_log;
-size_t dsize_field_data;
-size_t dsize_gx = 0;
-size_t dsize_gy = 0;
-size_t dsize_conn1 = 0;
-size_t dsize_conn2 = 0;
-size_t dsize_conn3 = 0;
+size_t dsize_log = 0;
 
 /* Timing */
 double engine_time;     /* The current simulation time */
@@ -168,12 +255,6 @@ PyObject* gy_field;
 
 // Arbitrary geometry diffusion
 PyObject* connections;  // List of connection tuples
-unsigned long n_connections;
-
-// OpenCL work group sizes
-size_t global_work_size[2];
-// Work items for arbitrary geometry diffusion step
-size_t global_work_size_conn[1];
 
 // Kernel arguments copied into "Real" type
 Real arg_time;
@@ -181,10 +262,11 @@ Real arg_pace;
 Real arg_dt;
 Real arg_gx;
 Real arg_gy;
+Real arg_apd_threshold;
 
 /* Logging */
 PyObject** logs = NULL;     /* An array of pointers to a PyObject */
-Real** vars = NULL;         /* An array of pointers to values to log */
+Real** vars = NULL;         /* An array of pointers to values to log, for each logging slot */
 unsigned long n_vars;       /* Number of logging variables */
 double tnext_log;           /* The next logging point */
 unsigned long inext_log;    /* The number of logged steps */
@@ -198,12 +280,378 @@ unsigned long n_inter;      /* The number of intermediary variables to log */
 /* simulation variable (1.2.membrane.V) is listed in the given log. */
 unsigned long n_field_data; /* The number of floats in the field data */
 
+/* On-device log reduction
+ * Only the logged values are sent to the host. At each logging point, they
+ * are gathered from the state, diffusion current, and intermediary variable
+ * buffers into a single compact buffer on the device. The values from each
+ * device are stored contiguously, starting with the state entries. The first
+ * entry of the first device is the first state of the first cell, which is
+ * used to check for NaNs.
+ */
+unsigned long n_log_state;  /* The total number of gathered state values */
+unsigned long n_log_idiff;  /* The total number of gathered diffusion currents */
+unsigned long n_log_inter;  /* The total number of gathered intermediary variables */
+
+/* APD detection
+ * Threshold crossings of the membrane potential are detected on the device.
+ * Each completed AP is stored in a buffer, which is downloaded and emptied
+ * every time control returns to Python.
+ */
+int apd_enabled;            /* True if APD detection is enabled */
+
+/* Asynchronous logging
+ * Logged data is downloaded from the device using non-blocking reads into one
+ * of two "slots" of pinned host memory. While the device works on the next
+ * steps, the host waits for the reads into the other slot (made at the
+ * previous logging point) to finish and writes their results to the log.
+ */
+int log_slot;               /* The slot to use for the next logging point */
+int log_pending[2];         /* True if a slot contains data not yet logged */
+unsigned long log_reading[2];   /* The number of reads made into each slot */
+cl_event *log_events = NULL;    /* Events for the reads made into each slot, n_domains per slot */
+Real log_time[2];           /* The time at the logging point in each slot */
+Real log_pace[2];           /* The pacing level at the logging point in each slot */
+
 /* Temporary objects: decref before re-using for another var */
 /* (Unless you got it through PyList_GetItem or PyTuble_GetItem) */
 PyObject* flt = NULL;               /* PyObject, various uses */
 PyObject* ret = NULL;               /* PyObject, used as return value */
 PyObject* list_update_str = NULL;   /* PyUnicode, used to call "append" method */
 
+/*
+ * Releases an OpenCL kernel, if set.
+ */
+static void
+release_kernel(cl_kernel* kernel)
+{
+    if (*kernel != NULL) {
+        clReleaseKernel(*kernel);
+        *kernel = NULL;
+    }
+}
+
+/*
+ * Releases an OpenCL memory object, if set.
+ */
+static void
+release_buffer(cl_mem* buffer)
+{
+    if (*buffer != NULL) {
+        clReleaseMemObject(*buffer);
+        *buffer = NULL;
+    }
+}
+
+/*
+ * Submits all enqueued commands to the devices.
+ */
+static void
+flush_all(void)
+{
+    unsigned long i;
+    for (i=0; i<n_domains; i++) {
+        if (domains[i].queue != NULL) clFlush(domains[i].queue);
+    }
+}
+
+/*
+ * Waits for all enqueued commands to finish.
+ */
+static void
+finish_all(void)
+{
+    unsigned long i;
+    flush_all();
+    for (i=0; i<n_domains; i++) {
+        if (domains[i].queue != NULL) clFinish(domains[i].queue);
+    }
+}
+
+/*
+ * Returns the index of the domain that simulates the given cell.
+ */
+static unsigned long
+domain_of(unsigned long cell)
+{
+    unsigned long i;
+    for (i=1; i<n_domains; i++) {
+        if (cell < domains[i].lo) return i - 1;
+    }
+    return n_domains - 1;
+}
+
+/*
+ * Translates a pointer to a logged value in slot 0 to a pointer to the same
+ * value in the given slot.
+ */
+static Real*
+log_slot_pointer(Real* p, int slot)
+{
+    if (p == &log_time[0]) return &log_time[slot];
+    if (p == &log_pace[0]) return &log_pace[slot];
+    return rvec_log[slot] + (p - rvec_log[0]);
+}
+
+/*
+ * Waits for any reads into the given logging slot to complete, and releases
+ * the corresponding events. Returns the OpenCL flag from the wait.
+ */
+static cl_int
+log_wait_slot(int slot)
+{
+    cl_int flag = CL_SUCCESS;
+    unsigned long i;
+    if (log_reading[slot]) {
+        flag = clWaitForEvents((cl_uint)log_reading[slot], log_events + slot * n_domains);
+        for (i=0; i<log_reading[slot]; i++) {
+            clReleaseEvent(log_events[slot * n_domains + i]);
+        }
+        log_reading[slot] = 0;
+    }
+    return flag;
+}
+
+/*
+ * Writes the data in the given logging slot (if any) to the log, after
+ * waiting for it to be downloaded. Sets halt_sim if a NaN is found in the
+ * state.
+ *
+ * Returns 0 if successful, or 1 if an error occurred (in which case a Python
+ * exception will have been set).
+ */
+static int
+log_write_slot(int slot)
+{
+    unsigned long i;
+    Real** slot_vars;
+
+    if (!log_pending[slot]) return 0;
+    log_pending[slot] = 0;
+    if (mcl_flag(log_wait_slot(slot))) return 1;
+
+    /* Check for NaNs in the state */
+    if (logging_states && isnan(rvec_log[slot][0])) {
+        halt_sim = 1;
+    }
+
+    /* Write everything to the log */
+    slot_vars = vars + slot * n_vars;
+    for(i=0; i<n_vars; i++) {
+        flt = PyFloat_FromDouble(*slot_vars[i]);
+        ret = PyObject_CallMethodObjArgs(logs[i], list_update_str, flt, NULL);
+        Py_CLEAR(flt);
+        Py_XDECREF(ret);
+        if(ret == NULL) {
+            PyErr_SetString(PyExc_Exception, "Call to append() failed on logging list.");
+            return 1;
+        }
+    }
+    ret = NULL;
+    return 0;
+}
+
+/*
+ * Enqueues a kernel that gathers n logged values from the given source buffer
+ * on a device into its compact logging buffer, starting at the given offset.
+ */
+static cl_int
+log_gather(Domain* dom, unsigned long n, unsigned long offset, cl_mem* source)
+{
+    cl_int flag;
+    dom->work_size_log[0] = n;
+    flag = clSetKernelArg(dom->kernel_log, 0, sizeof(n), &n);
+    if (flag != CL_SUCCESS) return flag;
+    flag = clSetKernelArg(dom->kernel_log, 1, sizeof(offset), &offset);
+    if (flag != CL_SUCCESS) return flag;
+    flag = clSetKernelArg(dom->kernel_log, 3, sizeof(cl_mem), source);
+    if (flag != CL_SUCCESS) return flag;
+    return clEnqueueNDRangeKernel(dom->queue, dom->kernel_log, 1, NULL, dom->work_size_log, NULL, 0, NULL, NULL);
+}
+
+/*
+ * Divides the gathered logged values over the domains, so that the values
+ * gathered on each device are stored contiguously and can be sent to the host
+ * in a single read. Within each domain, the states come first, followed by the
+ * diffusion currents and the intermediary variables, each in the order used
+ * in rvec_log_index. Updates the pointers to the logged values, and stores the
+ * local index of each value in rvec_log_local.
+ */
+static void
+log_divide(void)
+{
+    unsigned long i, k, c, n, count;
+    unsigned long ranges[4];
+    unsigned long strides[3];
+    unsigned long *next;        // Next position for each domain and category
+    unsigned long *position;    // New position of each gathered value
+
+    n = n_log_state + n_log_idiff + n_log_inter;
+    ranges[0] = 0;
+    ranges[1] = n_log_state;
+    ranges[2] = n_log_state + n_log_idiff;
+    ranges[3] = n;
+    strides[0] = n_state;
+    strides[1] = 1;
+    strides[2] = n_inter;
+    next = (unsigned long*)calloc(3 * n_domains, sizeof(unsigned long));
+    position = (unsigned long*)malloc((n + 1) * sizeof(unsigned long));
+
+    /* Count values in each domain and category */
+    for (c=0; c<3; c++) {
+        for (k=ranges[c]; k<ranges[c + 1]; k++) {
+            next[3 * domain_of(rvec_log_index[k] / strides[c]) + c]++;
+        }
+    }
+
+    /* Set counts and first position for each domain and category */
+    k = 0;
+    for (i=0; i<n_domains; i++) {
+        domains[i].log_start = k;
+        domains[i].n_log_state = next[3 * i];
+        domains[i].n_log_idiff = next[3 * i + 1];
+        domains[i].n_log_inter = next[3 * i + 2];
+        for (c=0; c<3; c++) {
+            count = next[3 * i + c];
+            next[3 * i + c] = k;
+            k += count;
+        }
+    }
+
+    /* Assign new positions, and convert to local indices */
+    for (c=0; c<3; c++) {
+        for (k=ranges[c]; k<ranges[c + 1]; k++) {
+            i = domain_of(rvec_log_index[k] / strides[c]);
+            position[k] = next[3 * i + c]++;
+            rvec_log_local[position[k]] = rvec_log_index[k] - domains[i].offset * strides[c];
+        }
+    }
+
+    /* Update pointers to logged values */
+    for (i=0; i<n_vars; i++) {
+        if (vars[i] != &log_time[0] && vars[i] != &log_pace[0]) {
+            vars[i] = rvec_log[0] + position[vars[i] - rvec_log[0]];
+        }
+    }
+
+    free(next);
+    free(position);
+}
+
+/*
+ * Copies the membrane potentials of all halo cells from the devices that
+ * simulate them. Each device first gathers the values needed by other devices
+ * into an export buffer. These are then copied into the halo buffers of the
+ * receiving devices, and scattered into their state vectors. Events are used
+ * to order these operations, so that the host does not need to wait.
+ */
+static cl_int
+halo_exchange(void)
+{
+    cl_int flag;
+    unsigned long i, k;
+    cl_uint n_wait;
+    Domain* dom;
+    HaloCopy* copy;
+
+    /* Gather exported values, once the copies made in the previous exchange
+       have finished reading the export buffer */
+    for (i=0; i<n_domains; i++) {
+        dom = domains + i;
+        if (dom->n_export == 0) continue;
+        n_wait = 0;
+        for (k=0; k<n_copies; k++) {
+            if (copies[k].src == i && copies[k].pending) {
+                copy_wait[n_wait++] = copies[k].event;
+            }
+        }
+        flag = clEnqueueNDRangeKernel(dom->queue, dom->kernel_export, 1, NULL, dom->work_size_export, NULL, n_wait, (n_wait ? copy_wait : NULL), &dom->export_event);
+        for (k=0; k<n_copies; k++) {
+            if (copies[k].src == i && copies[k].pending) {
+                clReleaseEvent(copies[k].event);
+                copies[k].pending = 0;
+            }
+        }
+        if (flag != CL_SUCCESS) return flag;
+        dom->exporting = 1;
+        clFlush(dom->queue);
+    }
+
+    /* Copy into the halo buffers of the receiving devices */
+    for (k=0; k<n_copies; k++) {
+        copy = copies + k;
+        flag = clEnqueueCopyBuffer(domains[copy->dst].queue, domains[copy->src].mbuf_export, domains[copy->dst].mbuf_halo, copy->src_offset * sizeof(Real), copy->dst_offset * sizeof(Real), copy->count * sizeof(Real), 1, &domains[copy->src].export_event, &copy->event);
+        if (flag != CL_SUCCESS) return flag;
+        copy->pending = 1;
+    }
+    for (i=0; i<n_domains; i++) {
+        if (domains[i].exporting) {
+            clReleaseEvent(domains[i].export_event);
+            domains[i].exporting = 0;
+        }
+    }
+
+    /* Scatter into the state vectors */
+    for (i=0; i<n_domains; i++) {
+        dom = domains + i;
+        if (dom->n_halo == 0) continue;
+        flag = clEnqueueNDRangeKernel(dom->queue, dom->kernel_halo, 1, NULL, dom->work_size_halo, NULL, 0, NULL, NULL);
+        if (flag != CL_SUCCESS) return flag;
+    }
+    return CL_SUCCESS;
+}
+
+/*
+ * Downloads any APs detected on the devices, appends them to the APD list as
+ * tuples (cell, start, duration), and resets the devices' AP counts.
+ *
+ * Returns 0 if successful, or 1 if an error occurred (in which case a Python
+ * exception will have been set).
+ */
+static int
+apd_drain(void)
+{
+    cl_int flag;
+    cl_uint count, i;
+    unsigned long j;
+    Domain* dom;
+
+    if (!apd_enabled) return 0;
+
+    for (j=0; j<n_domains; j++) {
+        dom = domains + j;
+
+        /* Blocking read: waits for all steps enqueued so far */
+        flag = clEnqueueReadBuffer(dom->queue, dom->mbuf_apd_count, CL_TRUE, 0, sizeof(cl_uint), &count, 0, NULL, NULL);
+        if (mcl_flag(flag)) return 1;
+        if (count == 0) continue;
+        if (count > dom->apd_capacity) {
+            PyErr_SetString(PyExc_Exception, "Too many action potentials detected between updates: please check the APD threshold.");
+            return 1;
+        }
+        flag = clEnqueueReadBuffer(dom->queue, dom->mbuf_apd_cell, CL_TRUE, 0, count * sizeof(cl_uint), rvec_apd_cell, 0, NULL, NULL);
+        if (mcl_flag(flag)) return 1;
+        flag = clEnqueueReadBuffer(dom->queue, dom->mbuf_apd_time, CL_TRUE, 0, 2 * count * sizeof(Real), rvec_apd_time, 0, NULL, NULL);
+        if (mcl_flag(flag)) return 1;
+
+        /* Add to list */
+        for (i=0; i<count; i++) {
+            flt = Py_BuildValue("(kdd)", (unsigned long)rvec_apd_cell[i], (double)rvec_apd_time[2 * i], (double)rvec_apd_time[2 * i + 1]);
+            if (flt == NULL) return 1;
+            if (PyList_Append(apd_data, flt)) {
+                Py_CLEAR(flt);
+                return 1;
+            }
+            Py_CLEAR(flt);
+        }
+
+        /* Reset count */
+        count = 0;
+        flag = clEnqueueWriteBuffer(dom->queue, dom->mbuf_apd_count, CL_TRUE, 0, sizeof(cl_uint), &count, 0, NULL, NULL);
+        if (mcl_flag(flag)) return 1;
+    }
+    return 0;
+}
+
 /*
  * Cleans up after a simulation
  *
@@ -211,6 +659,10 @@ PyObject* list_update_str = NULL;   /* PyUnicode, used to call "append" method *
 static PyObject*
 sim_clean()
 {
+    int i;
+    unsigned long j;
+    Domain* dom;
+
     #ifdef MYOKIT_DEBUG_MESSAGES
     printf("Clean called.\n");
     #endif
@@ -220,49 +672,101 @@ sim_clean()
         printf("Cleaning.\n");
         #endif
 
-        // Wait for any remaining commands to finish
-        clFlush(command_queue);
-        clFinish(command_queue);
-
-        // Decref opencl objects
-        clReleaseKernel(kernel_cell); kernel_cell = NULL;
-        if (connections != Py_None) {
-            clReleaseKernel(kernel_arb_reset); kernel_arb_reset = NULL;
-            clReleaseKernel(kernel_arb_step); kernel_arb_step = NULL;
-        } else if (gx_field != Py_None) {
-            clReleaseKernel(kernel_cond); kernel_cond = NULL;
-        } else if (diffusion) {
-            clReleaseKernel(kernel_diff); kernel_diff = NULL;
+        if (domains != NULL) {
+            // Wait for any remaining commands to finish
+            finish_all();
+
+            // Discard any data not yet logged, unmap pinned memory
+            for (i=0; i<2; i++) {
+                if (log_events != NULL) log_wait_slot(i);
+                log_pending[i] = 0;
+                if (rvec_log[i] != NULL) {
+                    clEnqueueUnmapMemObject(domains[0].queue, mbuf_log_host[i], rvec_log[i], 0, NULL, NULL);
+                    rvec_log[i] = NULL;
+                }
+            }
+            if (domains[0].queue != NULL) clFinish(domains[0].queue);
+
+            // Release events
+            if (copies != NULL) {
+                for (j=0; j<n_copies; j++) {
+                    if (copies[j].pending) clReleaseEvent(copies[j].event);
+                }
+            }
+
+            // Decref opencl objects
+            for (j=0; j<n_domains; j++) {
+                dom = domains + j;
+                if (dom->exporting) clReleaseEvent(dom->export_event);
+                release_kernel(&dom->kernel_cell);
+                release_kernel(&dom->kernel_diff);
+                release_kernel(&dom->kernel_cond);
+                release_kernel(&dom->kernel_arb_reset);
+                release_kernel(&dom->kernel_arb_step);
+                release_kernel(&dom->kernel_log);
+                release_kernel(&dom->kernel_apd);
+                release_kernel(&dom->kernel_export);
+                release_kernel(&dom->kernel_halo);
+                release_buffer(&dom->mbuf_state);
+                release_buffer(&dom->mbuf_idiff);
+                release_buffer(&dom->mbuf_inter_log);
+                release_buffer(&dom->mbuf_field_data);
+                release_buffer(&dom->mbuf_gx);
+                release_buffer(&dom->mbuf_gy);
+                release_buffer(&dom->mbuf_conn1);
+                release_buffer(&dom->mbuf_conn2);
+                release_buffer(&dom->mbuf_conn3);
+                release_buffer(&dom->mbuf_log);
+                release_buffer(&dom->mbuf_log_index);
+                release_buffer(&dom->mbuf_apd_vm);
+                release_buffer(&dom->mbuf_apd_active);
+                release_buffer(&dom->mbuf_apd_start);
+                release_buffer(&dom->mbuf_apd_count);
+                release_buffer(&dom->mbuf_apd_cell);
+                release_buffer(&dom->mbuf_apd_time);
+                release_buffer(&dom->mbuf_export);
+                release_buffer(&dom->mbuf_export_index);
+                release_buffer(&dom->mbuf_halo);
+                release_buffer(&dom->mbuf_halo_index);
+                if (dom->queue != NULL) {
+                    clReleaseCommandQueue(dom->queue); dom->queue = NULL;
+                }
+            }
         }
-        clReleaseProgram(program); program = NULL;
-        clReleaseMemObject(mbuf_state); mbuf_state = NULL;
-        clReleaseMemObject(mbuf_idiff); mbuf_idiff = NULL;
-        clReleaseMemObject(mbuf_inter_log); mbuf_inter_log = NULL;
-        clReleaseMemObject(mbuf_field_data); mbuf_field_data = NULL;
-        if (gx_field != Py_None) {
-            clReleaseMemObject(mbuf_gx); mbuf_gx = NULL;
-            clReleaseMemObject(mbuf_gy); mbuf_gy = NULL;
-        } else if (connections != Py_None) {
-            clReleaseMemObject(mbuf_conn1); mbuf_conn1 = NULL;
-            clReleaseMemObject(mbuf_conn2); mbuf_conn2 = NULL;
-            clReleaseMemObject(mbuf_conn3); mbuf_conn3 = NULL;
+        for (i=0; i<2; i++) {
+            release_buffer(&mbuf_log_host[i]);
+        }
+        if (program != NULL) {
+            clReleaseProgram(program); program = NULL;
+        }
+        if (context != NULL) {
+            clReleaseContext(context); context = NULL;
+        }
+        if (fission && device_ids != NULL) {
+            for (j=0; j<n_domains; j++) {
+                if (device_ids[j] != NULL) clReleaseDevice(device_ids[j]);
+            }
         }
-        clReleaseCommandQueue(command_queue); command_queue = NULL;
-        clReleaseContext(context); context = NULL;
 
         // Free pacing system memory
         ESys_Destroy(pacing); pacing = NULL;
 
         // Free dynamically allocated arrays
+        free(domains); domains = NULL;
+        free(copies); copies = NULL;
+        free(copy_wait); copy_wait = NULL;
+        free(device_ids); device_ids = NULL;
+        free(log_events); log_events = NULL;
+        n_domains = 0;
+        n_copies = 0;
         free(rvec_state); rvec_state = NULL;
-        free(rvec_idiff); rvec_idiff = NULL;
-        free(rvec_inter_log); rvec_inter_log = NULL;
         free(rvec_field_data); rvec_field_data = NULL;
         free(rvec_gx); rvec_gx = NULL;
         free(rvec_gy); rvec_gy = NULL;
-        free(rvec_conn1); rvec_conn1 = NULL;
-        free(rvec_conn2); rvec_conn2 = NULL;
-        free(rvec_conn3); rvec_conn3 = NULL;
+        free(rvec_log_index); rvec_log_index = NULL;
+        free(rvec_log_local); rvec_log_local = NULL;
+        free(rvec_apd_cell); rvec_apd_cell = NULL;
+        free(rvec_apd_time); rvec_apd_time = NULL;
         free(logs); logs = NULL;
         free(vars); vars = NULL;
 
@@ -296,6 +800,397 @@ py_sim_clean(PyObject *self, PyObject *args)
     Py_RETURN_NONE;
 }
 
+/*
+ * Reads a list of local cell indices, and converts them to the positions of
+ * the corresponding membrane potentials in a local state vector.
+ *
+ * Returns a newly allocated array (or NULL if an error occurred, in which case
+ * a Python exception will have been set).
+ */
+static unsigned long*
+domain_vm_index(PyObject* list, unsigned long n_local)
+{
+    Py_ssize_t i, n;
+    unsigned long* index;
+    unsigned long cell;
+
+    n = PyList_Size(list);
+    index = (unsigned long*)malloc((n + 1) * sizeof(unsigned long));
+    for (i=0; i<n; i++) {
+        cell = (unsigned long)PyLong_AsUnsignedLong(PyList_GetItem(list, i));
+        if (PyErr_Occurred() || cell >= n_local) {
+            PyErr_Clear();
+            PyErr_SetString(PyExc_Exception, "Invalid cell index in halo or export list.");
+            free(index);
+            return NULL;
+        }
+        #ifdef i_vm
+        index[i] = cell * n_state + i_vm;
+        #else
+        index[i] = cell * n_state;
+        #endif
+    }
+    return index;
+}
+
+/*
+ * Creates the command queue, buffers, and kernels for a single domain.
+ *
+ * Arguments
+ *  dom       : The domain, with lo, hi, offset, and n_local set
+ *  device_id : The device to use
+ *  halo      : A list of the local indices of the halo cells
+ *  export    : A list of the local indices of cells needed by other devices
+ *  conns     : A list of connection tuples, using local indices, or None
+ *
+ * Returns 0 if successful, or 1 if an error occurred (in which case a Python
+ * exception will have been set).
+ */
+static int
+domain_init(Domain* dom, cl_device_id device_id, PyObject* halo, PyObject* export, PyObject* conns)
+{
+    // OpenCL flag
+    cl_int flag;
+
+    // Iteration and sizes
+    cl_uint a;
+    unsigned long i, j, n, start;
+
+    // Temporary host vectors, freed after creating buffers
+    Real* rvec = NULL;
+    unsigned long* uvec = NULL;
+    unsigned long* uvec2 = NULL;
+    cl_uint* ivec = NULL;
+
+    // Used for buffers that would otherwise be empty
+    Real zero = 0;
+    unsigned long zero_index = 0;
+
+    // Work sizes
+    if (ny > 1) {
+        dom->work_offset[0] = 0;
+        dom->work_offset[1] = dom->lo / nx;
+        dom->work_size[0] = nx;
+        dom->work_size[1] = (dom->hi - dom->lo) / nx;
+    } else {
+        dom->work_offset[0] = dom->lo;
+        dom->work_offset[1] = 0;
+        dom->work_size[0] = dom->hi - dom->lo;
+        dom->work_size[1] = 1;
+    }
+    dom->work_size_local[0] = dom->n_local;
+
+    // Create command queue
+    dom->queue = clCreateCommandQueue(context, device_id, 0, &flag);
+    if(mcl_flag2("queue", flag)) return 1;
+
+    // Create state buffer. The simulated cells are copied from the global
+    // state, while the halo cells are set before each diffusion step.
+    rvec = (Real*)calloc(dom->n_local * n_state, sizeof(Real));
+    for(i=dom->lo * n_state, j=(dom->lo - dom->offset) * n_state; i<dom->hi * n_state; i++, j++) {
+        rvec[j] = rvec_state[i];
+    }
+    dom->mbuf_state = clCreateBuffer(context, CL_MEM_READ_WRITE | CL_MEM_COPY_HOST_PTR, dom->n_local * n_state * sizeof(Real), rvec, &flag);
+    free(rvec); rvec = NULL;
+    if(mcl_flag2("dsize_state", flag)) return 1;
+
+    // Create diffusion current buffer
+    n = diffusion ? dom->n_local : 1;
+    rvec = (Real*)calloc(n, sizeof(Real));
+    dom->mbuf_idiff = clCreateBuffer(context, CL_MEM_READ_WRITE | CL_MEM_COPY_HOST_PTR, n * sizeof(Real), rvec, &flag);
+    free(rvec); rvec = NULL;
+    if(mcl_flag2("dsize_diff", flag)) return 1;
+
+    // Create buffer for intermediary variables to log
+    n = n_inter ? dom->n_local * n_inter : 1;
+    rvec = (Real*)calloc(n, sizeof(Real));
+    dom->mbuf_inter_log = clCreateBuffer(context, CL_MEM_READ_WRITE | CL_MEM_COPY_HOST_PTR, n * sizeof(Real), rvec, &flag);
+    free(rvec); rvec = NULL;
+    if(mcl_flag2("dsize_inter_log", flag)) return 1;
+
+    // Create field data buffer, containing the data for the simulated cells
+    if(n_field_data) {
+        n = n_field_data / (nx * ny);
+        dom->mbuf_field_data = clCreateBuffer(context, CL_MEM_READ_ONLY | CL_MEM_COPY_HOST_PTR, (dom->hi - dom->offset) * n * sizeof(Real), rvec_field_data + dom->offset * n, &flag);
+    } else {
+        dom->mbuf_field_data = clCreateBuffer(context, CL_MEM_READ_ONLY | CL_MEM_COPY_HOST_PTR, sizeof(Real), &zero, &flag);
+    }
+    if(mcl_flag2("dsize_field_data", flag)) return 1;
+
+    // Create conductance field buffers, starting at the first stored cell
+    if(gx_field != Py_None) {
+        start = dom->offset - dom->offset / nx;
+        n = (ny > 1) ? (dom->n_local / nx) * (nx - 1) : dom->n_local - 1;
+        if(n) {
+            dom->mbuf_gx = clCreateBuffer(context, CL_MEM_READ_ONLY | CL_MEM_COPY_HOST_PTR, n * sizeof(Real), rvec_gx + start, &flag);
+        } else {
+            dom->mbuf_gx = clCreateBuffer(context, CL_MEM_READ_ONLY | CL_MEM_COPY_HOST_PTR, sizeof(Real), &zero, &flag);
+        }
+        if(mcl_flag(flag)) return 1;
+        n = 0;
+        if(ny > 1) {
+            start = dom->offset / nx;
+            n = dom->n_local / nx;
+            if(start + n > ny - 1) n = ny - 1 - start;
+            n *= nx;
+        }
+        if(n) {
+            dom->mbuf_gy = clCreateBuffer(context, CL_MEM_READ_ONLY | CL_MEM_COPY_HOST_PTR, n * sizeof(Real), rvec_gy + dom->offset, &flag);
+        } else {
+            dom->mbuf_gy = clCreateBuffer(context, CL_MEM_READ_ONLY | CL_MEM_COPY_HOST_PTR, sizeof(Real), &zero, &flag);
+        }
+        if(mcl_flag(flag)) return 1;
+    }
+
+    // Create connection buffers
+    if(connections != Py_None) {
+        // Check connections list
+        if(!PyList_Check(conns)) {
+            PyErr_SetString(PyExc_Exception, "Connections should be None or a list");
+            return 1;
+        }
+        dom->n_connections = PyList_Size(conns);
+        n = dom->n_connections ? dom->n_connections : 1;
+        uvec = (unsigned long*)calloc(n, sizeof(unsigned long));
+        uvec2 = (unsigned long*)calloc(n, sizeof(unsigned long));
+        rvec = (Real*)calloc(n, sizeof(Real));
+
+        for(i=0; i<dom->n_connections; i++) {
+            flt = PyList_GetItem(conns, i);   // Borrowed reference
+            if(!PyTuple_Check(flt)) {
+                PyErr_SetString(PyExc_Exception, "Connections list must contain all tuples");
+                break;
+            }
+            if(PyTuple_Size(flt) != 3) {
+                PyErr_SetString(PyExc_Exception, "Connections list must contain only 3-tuples");
+                break;
+            }
+
+            ret = PyTuple_GetItem(flt, 0);  // Borrowed reference
+            if(PyLong_Check(ret)) {
+                uvec[i] = (unsigned long)PyLong_AsLong(ret);
+            #if PY_MAJOR_VERSION < 3
+            } else if (PyInt_Check(ret)) {
+                uvec[i] = (unsigned long)PyInt_AsLong(ret);
+            #endif
+            } else {
+                PyErr_SetString(PyExc_Exception, "First item in each connection tuple must be int");
+                break;
+            }
+
+            ret = PyTuple_GetItem(flt, 1);  // Borrowed reference
+            if(PyLong_Check(ret)) {
+                uvec2[i] = (unsigned long)PyLong_AsLong(ret);
+            #if PY_MAJOR_VERSION < 3
+            } else if(PyInt_Check(ret)) {
+                uvec2[i] = (unsigned long)PyInt_AsLong(ret);
+            #endif
+            } else {
+                PyErr_SetString(PyExc_Exception, "Second item in each connection tuple must be int");
+                break;
+            }
+
+            ret = PyTuple_GetItem(flt, 2);  // Borrowed reference
+            if(!PyFloat_Check(ret)) {
+                PyErr_SetString(PyExc_Exception, "Third item in each connection tuple must be float");
+                break;
+            }
+            rvec[i] = (Real)PyFloat_AsDouble(ret);
+
+            if(uvec[i] >= dom->n_local || uvec2[i] >= dom->n_local) {
+                PyErr_SetString(PyExc_Exception, "Cell index in connection out of range");
+                break;
+            }
+        }
+        ret = NULL;
+        if(i == dom->n_connections) {
+            dom->mbuf_conn1 = clCreateBuffer(context, CL_MEM_READ_ONLY | CL_MEM_COPY_HOST_PTR, n * sizeof(unsigned long), uvec, &flag);
+            if(flag == CL_SUCCESS) {
+                dom->mbuf_conn2 = clCreateBuffer(context, CL_MEM_READ_ONLY | CL_MEM_COPY_HOST_PTR, n * sizeof(unsigned long), uvec2, &flag);
+            }
+            if(flag == CL_SUCCESS) {
+                dom->mbuf_conn3 = clCreateBuffer(context, CL_MEM_READ_ONLY | CL_MEM_COPY_HOST_PTR, n * sizeof(Real), rvec, &flag);
+            }
+        }
+        free(uvec); uvec = NULL;
+        free(uvec2); uvec2 = NULL;
+        free(rvec); rvec = NULL;
+        if(i < dom->n_connections) return 1;
+        if(mcl_flag(flag)) return 1;
+        dom->work_size_conn[0] = dom->n_connections;
+    }
+
+    // Create buffers for APD detection. The buffer for detected APs can hold
+    // several APs per cell, and is emptied whenever control returns to Python
+    if(apd_enabled) {
+        dom->apd_capacity = (cl_uint)(4 * (dom->hi - dom->lo));
+        rvec = (Real*)calloc(dom->n_local, sizeof(Real));
+        #ifdef i_vm
+        for(i=dom->lo; i<dom->hi; i++) rvec[i - dom->offset] = rvec_state[i * n_state + i_vm];
+        #endif
+        ivec = (cl_uint*)calloc(dom->n_local, sizeof(cl_uint));
+        dom->mbuf_apd_vm = clCreateBuffer(context, CL_MEM_READ_WRITE | CL_MEM_COPY_HOST_PTR, dom->n_local * sizeof(Real), rvec, &flag);
+        free(rvec); rvec = NULL;
+        if(flag == CL_SUCCESS) {
+            dom->mbuf_apd_active = clCreateBuffer(context, CL_MEM_READ_WRITE | CL_MEM_COPY_HOST_PTR, dom->n_local * sizeof(cl_uint), ivec, &flag);
+        }
+        if(flag == CL_SUCCESS) {
+            dom->mbuf_apd_count = clCreateBuffer(context, CL_MEM_READ_WRITE | CL_MEM_COPY_HOST_PTR, sizeof(cl_uint), ivec, &flag);
+        }
+        free(ivec); ivec = NULL;
+        if(mcl_flag2("apd_vm", flag)) return 1;
+        dom->mbuf_apd_start = clCreateBuffer(context, CL_MEM_READ_WRITE, dom->n_local * sizeof(Real), NULL, &flag);
+        if(mcl_flag2("apd_start", flag)) return 1;
+        dom->mbuf_apd_cell = clCreateBuffer(context, CL_MEM_READ_WRITE, dom->apd_capacity * sizeof(cl_uint), NULL, &flag);
+        if(mcl_flag2("apd_cell", flag)) return 1;
+        dom->mbuf_apd_time = clCreateBuffer(context, CL_MEM_READ_WRITE, 2 * dom->apd_capacity * sizeof(Real), NULL, &flag);
+        if(mcl_flag2("apd_time", flag)) return 1;
+    }
+
+    // Create buffers for halo exchange
+    dom->n_halo = PyList_Size(halo);
+    dom->n_export = PyList_Size(export);
+    dom->work_size_halo[0] = dom->n_halo;
+    dom->work_size_export[0] = dom->n_export;
+    if(dom->n_halo) {
+        uvec = domain_vm_index(halo, dom->n_local);
+        if(uvec == NULL) return 1;
+        dom->mbuf_halo_index = clCreateBuffer(context, CL_MEM_READ_ONLY | CL_MEM_COPY_HOST_PTR, dom->n_halo * sizeof(unsigned long), uvec, &flag);
+        free(uvec); uvec = NULL;
+        if(mcl_flag2("halo_index", flag)) return 1;
+        dom->mbuf_halo = clCreateBuffer(context, CL_MEM_READ_WRITE, dom->n_halo * sizeof(Real), NULL, &flag);
+        if(mcl_flag2("halo", flag)) return 1;
+    }
+    if(dom->n_export) {
+        uvec = domain_vm_index(export, dom->n_local);
+        if(uvec == NULL) return 1;
+        dom->mbuf_export_index = clCreateBuffer(context, CL_MEM_READ_ONLY | CL_MEM_COPY_HOST_PTR, dom->n_export * sizeof(unsigned long), uvec, &flag);
+        free(uvec); uvec = NULL;
+        if(mcl_flag2("export_index", flag)) return 1;
+        dom->mbuf_export = clCreateBuffer(context, CL_MEM_READ_WRITE, dom->n_export * sizeof(Real), NULL, &flag);
+        if(mcl_flag2("export", flag)) return 1;
+    }
+
+    // Create the kernels
+    dom->kernel_cell = clCreateKernel(program, "cell_step", &flag);
+    if(mcl_flag(flag)) return 1;
+    dom->kernel_log = clCreateKernel(program, "log_gather", &flag);
+    if(mcl_flag(flag)) return 1;
+    if(apd_enabled) {
+        dom->kernel_apd = clCreateKernel(program, "apd_step", &flag);
+        if(mcl_flag(flag)) return 1;
+    }
+    if(connections != Py_None) {
+        // Arbitrary geometry
+        dom->kernel_arb_reset = clCreateKernel(program, "diff_arb_reset", &flag);
+        if(mcl_flag(flag)) return 1;
+        dom->kernel_arb_step = clCreateKernel(program, "diff_arb_step", &flag);
+        if(mcl_flag(flag)) return 1;
+    } else if (gx_field != Py_None) {
+        // Rectangular grid, heterogeneous conduction
+        dom->kernel_cond = clCreateKernel(program, "diff_hetero", &flag);
+        if(mcl_flag(flag)) return 1;
+    } else if (diffusion) {
+        // Rectangular grid, homogeneous conduction
+        dom->kernel_diff = clCreateKernel(program, "diff_step", &flag);
+        if(mcl_flag(flag)) return 1;
+    }
+    if(dom->n_export) {
+        dom->kernel_export = clCreateKernel(program, "log_gather", &flag);
+        if(mcl_flag(flag)) return 1;
+    }
+    if(dom->n_halo) {
+        dom->kernel_halo = clCreateKernel(program, "halo_scatter", &flag);
+        if(mcl_flag(flag)) return 1;
+    }
+
+    // Pass arguments into kernels
+    a = 0;
+    if(mcl_flag(clSetKernelArg(dom->kernel_cell, a++, sizeof(nx), &nx))) return 1;
+    if(mcl_flag(clSetKernelArg(dom->kernel_cell, a++, sizeof(ny), &ny))) return 1;
+    if(mcl_flag(clSetKernelArg(dom->kernel_cell, a++, sizeof(arg_time), &arg_time))) return 1;
+    if(mcl_flag(clSetKernelArg(dom->kernel_cell, a++, sizeof(arg_dt), &arg_dt))) return 1;
+    if(mcl_flag(clSetKernelArg(dom->kernel_cell, a++, sizeof(arg_pace), &arg_pace))) return 1;
+    if(mcl_flag(clSetKernelArg(dom->kernel_cell, a++, sizeof(dom->mbuf_state), &dom->mbuf_state))) return 1;
+    if(mcl_flag(clSetKernelArg(dom->kernel_cell, a++, sizeof(dom->mbuf_idiff), &dom->mbuf_idiff))) return 1;
+    if(mcl_flag(clSetKernelArg(dom->kernel_cell, a++, sizeof(dom->mbuf_inter_log), &dom->mbuf_inter_log))) return 1;
+    if(mcl_flag(clSetKernelArg(dom->kernel_cell, a++, sizeof(dom->mbuf_field_data), &dom->mbuf_field_data))) return 1;
+    if(mcl_flag(clSetKernelArg(dom->kernel_cell, a++, sizeof(dom->offset), &dom->offset))) return 1;
+
+    // APD detection
+    if(apd_enabled) {
+        a = 0;
+        if(mcl_flag(clSetKernelArg(dom->kernel_apd, a++, sizeof(nx), &nx))) return 1;
+        if(mcl_flag(clSetKernelArg(dom->kernel_apd, a++, sizeof(ny), &ny))) return 1;
+        if(mcl_flag(clSetKernelArg(dom->kernel_apd, a++, sizeof(arg_time), &arg_time))) return 1;
+        if(mcl_flag(clSetKernelArg(dom->kernel_apd, a++, sizeof(arg_dt), &arg_dt))) return 1;
+        if(mcl_flag(clSetKernelArg(dom->kernel_apd, a++, sizeof(arg_apd_threshold), &arg_apd_threshold))) return 1;
+        if(mcl_flag(clSetKernelArg(dom->kernel_apd, a++, sizeof(dom->apd_capacity), &dom->apd_capacity))) return 1;
+        if(mcl_flag(clSetKernelArg(dom->kernel_apd, a++, sizeof(dom->mbuf_state), &dom->mbuf_state))) return 1;
+        if(mcl_flag(clSetKernelArg(dom->kernel_apd, a++, sizeof(dom->mbuf_apd_vm), &dom->mbuf_apd_vm))) return 1;
+        if(mcl_flag(clSetKernelArg(dom->kernel_apd, a++, sizeof(dom->mbuf_apd_active), &dom->mbuf_apd_active))) return 1;
+        if(mcl_flag(clSetKernelArg(dom->kernel_apd, a++, sizeof(dom->mbuf_apd_start), &dom->mbuf_apd_start))) return 1;
+        if(mcl_flag(clSetKernelArg(dom->kernel_apd, a++, sizeof(dom->mbuf_apd_count), &dom->mbuf_apd_count))) return 1;
+        if(mcl_flag(clSetKernelArg(dom->kernel_apd, a++, sizeof(dom->mbuf_apd_cell), &dom->mbuf_apd_cell))) return 1;
+        if(mcl_flag(clSetKernelArg(dom->kernel_apd, a++, sizeof(dom->mbuf_apd_time), &dom->mbuf_apd_time))) return 1;
+        if(mcl_flag(clSetKernelArg(dom->kernel_apd, a++, sizeof(dom->offset), &dom->offset))) return 1;
+    }
+
+    // Diffusion current
+    if(connections != Py_None) {
+        // Arbitrary geometry
+        a = 0;
+        if(mcl_flag(clSetKernelArg(dom->kernel_arb_reset, a++, sizeof(dom->n_local), &dom->n_local))) return 1;
+        if(mcl_flag(clSetKernelArg(dom->kernel_arb_reset, a++, sizeof(dom->mbuf_idiff), &dom->mbuf_idiff))) return 1;
+        a = 0;
+        if(mcl_flag(clSetKernelArg(dom->kernel_arb_step, a++, sizeof(dom->n_connections), &dom->n_connections))) return 1;
+        if(mcl_flag(clSetKernelArg(dom->kernel_arb_step, a++, sizeof(dom->mbuf_conn1), &dom->mbuf_conn1))) return 1;
+        if(mcl_flag(clSetKernelArg(dom->kernel_arb_step, a++, sizeof(dom->mbuf_conn2), &dom->mbuf_conn2))) return 1;
+        if(mcl_flag(clSetKernelArg(dom->kernel_arb_step, a++, sizeof(dom->mbuf_conn3), &dom->mbuf_conn3))) return 1;
+        if(mcl_flag(clSetKernelArg(dom->kernel_arb_step, a++, sizeof(dom->mbuf_state), &dom->mbuf_state))) return 1;
+        if(mcl_flag(clSetKernelArg(dom->kernel_arb_step, a++, sizeof(dom->mbuf_idiff), &dom->mbuf_idiff))) return 1;
+    } else if (gx_field != Py_None) {
+        // Heteogeneous, rectangular diffusion
+        a = 0;
+        if(mcl_flag(clSetKernelArg(dom->kernel_cond, a++, sizeof(nx), &nx))) return 1;
+        if(mcl_flag(clSetKernelArg(dom->kernel_cond, a++, sizeof(ny), &ny))) return 1;
+        if(mcl_flag(clSetKernelArg(dom->kernel_cond, a++, sizeof(dom->mbuf_gx), &dom->mbuf_gx))) return 1;
+        if(mcl_flag(clSetKernelArg(dom->kernel_cond, a++, sizeof(dom->mbuf_gy), &dom->mbuf_gy))) return 1;
+        if(mcl_flag(clSetKernelArg(dom->kernel_cond, a++, sizeof(dom->mbuf_state), &dom->mbuf_state))) return 1;
+        if(mcl_flag(clSetKernelArg(dom->kernel_cond, a++, sizeof(dom->mbuf_idiff), &dom->mbuf_idiff))) return 1;
+        if(mcl_flag(clSetKernelArg(dom->kernel_cond, a++, sizeof(dom->offset), &dom->offset))) return 1;
+    } else if (diffusion) {
+        // Homogeneous, rectangular diffusion
+        a = 0;
+        if(mcl_flag(clSetKernelArg(dom->kernel_diff, a++, sizeof(nx), &nx))) return 1;
+        if(mcl_flag(clSetKernelArg(dom->kernel_diff, a++, sizeof(ny), &ny))) return 1;
+        if(mcl_flag(clSetKernelArg(dom->kernel_diff, a++, sizeof(arg_gx), &arg_gx))) return 1;
+        if(mcl_flag(clSetKernelArg(dom->kernel_diff, a++, sizeof(arg_gy), &arg_gy))) return 1;
+        if(mcl_flag(clSetKernelArg(dom->kernel_diff, a++, sizeof(dom->mbuf_state), &dom->mbuf_state))) return 1;
+        if(mcl_flag(clSetKernelArg(dom->kernel_diff, a++, sizeof(dom->mbuf_idiff), &dom->mbuf_idiff))) return 1;
+        if(mcl_flag(clSetKernelArg(dom->kernel_diff, a++, sizeof(dom->offset), &dom->offset))) return 1;
+    }
+
+    // Halo exchange
+    if(dom->n_export) {
+        a = 0;
+        if(mcl_flag(clSetKernelArg(dom->kernel_export, a++, sizeof(dom->n_export), &dom->n_export))) return 1;
+        if(mcl_flag(clSetKernelArg(dom->kernel_export, a++, sizeof(zero_index), &zero_index))) return 1;
+        if(mcl_flag(clSetKernelArg(dom->kernel_export, a++, sizeof(dom->mbuf_export_index), &dom->mbuf_export_index))) return 1;
+        if(mcl_flag(clSetKernelArg(dom->kernel_export, a++, sizeof(dom->mbuf_state), &dom->mbuf_state))) return 1;
+        if(mcl_flag(clSetKernelArg(dom->kernel_export, a++, sizeof(dom->mbuf_export), &dom->mbuf_export))) return 1;
+    }
+    if(dom->n_halo) {
+        a = 0;
+        if(mcl_flag(clSetKernelArg(dom->kernel_halo, a++, sizeof(dom->n_halo), &dom->n_halo))) return 1;
+        if(mcl_flag(clSetKernelArg(dom->kernel_halo, a++, sizeof(dom->mbuf_halo_index), &dom->mbuf_halo_index))) return 1;
+        if(mcl_flag(clSetKernelArg(dom->kernel_halo, a++, sizeof(dom->mbuf_halo), &dom->mbuf_halo))) return 1;
+        if(mcl_flag(clSetKernelArg(dom->kernel_halo, a++, sizeof(dom->mbuf_state), &dom->mbuf_state))) return 1;
+    }
+
+    return 0;
+}
+
 /*
  * Sets up a simulation
  *
@@ -313,9 +1208,15 @@ sim_init(PyObject* self, PyObject* args)
     // Iteration
     unsigned long i, j, k;
 
-    // Platform and device id
+    // Platform id
     cl_platform_id platform_id;
-    cl_device_id device_id;
+
+    // Domains
+    Domain* dom;
+    PyObject* halo;
+    PyObject* export;
+    PyObject* conns;
+    cl_uint apd_capacity;
 
     // Compilation options
     char options[1024];
@@ -324,6 +1225,9 @@ sim_init(PyObject* self, PyObject* args)
     char log_var_name[1023];
     unsigned long k_vars;
 
+    // Position in compact logging buffer
+    unsigned long k_log;
+
     // Compilation error message
     size_t blog_size;
     char *blog;
@@ -341,40 +1245,35 @@ sim_init(PyObject* self, PyObject* args)
     }
 
     // Set all pointers used in sim_clean to null
-    command_queue = NULL;
-    kernel_cell = NULL;
-    kernel_diff = NULL;
-    kernel_cond = NULL;
-    kernel_arb_reset = NULL;
-    kernel_arb_step = NULL;
     program = NULL;
-    mbuf_state = NULL;
-    mbuf_idiff = NULL;
-    mbuf_inter_log = NULL;
-    mbuf_field_data = NULL;
-    mbuf_gx = NULL;
-    mbuf_gy = NULL;
-    mbuf_conn1 = NULL;
-    mbuf_conn2 = NULL;
-    mbuf_conn3 = NULL;
     context = NULL;
+    device_ids = NULL;
+    domains = NULL;
+    n_domains = 0;
+    copies = NULL;
+    n_copies = 0;
+    copy_wait = NULL;
+    mbuf_log_host[0] = mbuf_log_host[1] = NULL;
     pacing = NULL;
     rvec_state = NULL;
-    rvec_idiff = NULL;
-    rvec_inter_log = NULL;
     rvec_field_data = NULL;
     rvec_gx = NULL;
     rvec_gy = NULL;
-    rvec_conn1 = NULL;
-    rvec_conn2 = NULL;
-    rvec_conn3 = NULL;
+    rvec_log[0] = rvec_log[1] = NULL;
+    rvec_log_index = NULL;
+    rvec_log_local = NULL;
+    rvec_apd_cell = NULL;
+    rvec_apd_time = NULL;
+    log_events = NULL;
+    log_pending[0] = log_pending[1] = 0;
+    log_reading[0] = log_reading[1] = 0;
     logs = NULL;
     vars = NULL;
     list_update_str = NULL;
 
     // Check input arguments
     // https://docs.python.org/3.8/c-api/arg.html#c.PyArg_ParseTuple
-    if(!PyArg_ParseTuple(args, "OOskkbddOOOdddOOOOdOO",
+    if(!PyArg_ParseTuple(args, "OOskkbddOOOdddOOOOdOOOOOiOO",
             &platform_name,     // Must be bytes
             &device_name,       // Must be bytes
             &kernel_source,
@@ -395,7 +1294,13 @@ sim_init(PyObject* self, PyObject* args)
             &log_dict,
             &log_interval,
             &inter_log,
-            &field_data
+            &field_data,
+            &apd_threshold,
+            &apd_data,
+            &program_cache,
+            &fission,
+            &domain_list,
+            &copy_list
             )) {
         PyErr_SetString(PyExc_Exception, "Wrong number of arguments.");
         // Nothing allocated yet, no pyobjects _created_, return directly
@@ -407,6 +1312,7 @@ sim_init(PyObject* self, PyObject* args)
     arg_gx = (Real)gx;
     arg_gy = (Real)gy;
     halt_sim = 0;
+    apd_enabled = (apd_threshold != Py_None);
 
     #ifdef MYOKIT_DEBUG_MESSAGES
     printf("Retrieved function arguments.\n");
@@ -464,6 +1370,25 @@ sim_init(PyObject* self, PyObject* args)
     }
     n_field_data = PyList_Size(field_data);
 
+    //
+    // Check APD detection arguments
+    //
+    if(apd_enabled) {
+        #ifndef i_vm
+        PyErr_SetString(PyExc_Exception, "APD detection requires a membrane potential variable.");
+        return sim_clean();
+        #endif
+        if(!PyFloat_Check(apd_threshold)) {
+            PyErr_SetString(PyExc_Exception, "'apd_threshold' must be None or a float.");
+            return sim_clean();
+        }
+        if(!PyList_Check(apd_data)) {
+            PyErr_SetString(PyExc_Exception, "'apd_data' must be a list.");
+            return sim_clean();
+        }
+        arg_apd_threshold = (Real)PyFloat_AsDouble(apd_threshold);
+    }
+
     //
     // Conductance mode
     //
@@ -472,6 +1397,39 @@ sim_init(PyObject* self, PyObject* args)
         return sim_clean();
     }
 
+    //
+    // Check domains
+    //
+    if(!PyList_Check(domain_list) || PyList_Size(domain_list) < 1) {
+        PyErr_SetString(PyExc_Exception, "'domains' must be a non-empty list.");
+        return sim_clean();
+    }
+    n_domains = PyList_Size(domain_list);
+    domains = (Domain*)calloc(n_domains, sizeof(Domain));
+    device_ids = (cl_device_id*)calloc(n_domains, sizeof(cl_device_id));
+    log_events = (cl_event*)malloc(2 * n_domains * sizeof(cl_event));
+    k = 0;
+    for(i=0; i<n_domains; i++) {
+        dom = domains + i;
+        if(!PyArg_ParseTuple(PyList_GetItem(domain_list, i), "kkkkOOO", &dom->lo, &dom->hi, &dom->offset, &dom->n_local, &halo, &export, &conns)) {
+            PyErr_SetString(PyExc_Exception, "Each domain must be a tuple (lo, hi, offset, n_local, halo, export, connections).");
+            return sim_clean();
+        }
+        if(dom->lo != k || dom->hi <= dom->lo || dom->offset > dom->lo || dom->hi - dom->offset > dom->n_local || (ny > 1 && (dom->lo % nx || dom->hi % nx || dom->offset % nx || dom->n_local % nx))) {
+            PyErr_SetString(PyExc_Exception, "Invalid domain: domains must contain consecutive cells (or rows, in 2d).");
+            return sim_clean();
+        }
+        if(!PyList_Check(halo) || !PyList_Check(export)) {
+            PyErr_SetString(PyExc_Exception, "The halo and export cells in each domain must be given as lists.");
+            return sim_clean();
+        }
+        k = dom->hi;
+    }
+    if(k != nx * ny) {
+        PyErr_SetString(PyExc_Exception, "Invalid domains: all cells must be simulated.");
+        return sim_clean();
+    }
+
     //
     // Set up pacing system
     //
@@ -513,32 +1471,13 @@ sim_init(PyObject* self, PyObject* args)
         rvec_state[i] = (Real)PyFloat_AsDouble(flt);
     }
 
-    // Create diffusion current vector
-    if (diffusion) {
-        dsize_idiff = nx * ny * sizeof(Real);
-        rvec_idiff = (Real*)malloc(dsize_idiff);
-        for(i=0; i<nx * ny; i++) rvec_idiff[i] = 0.0;
-    } else {
-        dsize_idiff = sizeof(Real);
-        rvec_idiff = (Real*)malloc(dsize_idiff);
-        rvec_idiff[0] = 0.0;
-    }
-
-    // Create vector of intermediary variables to log
-    if(n_inter) {
-        dsize_inter_log = nx * ny * n_inter * sizeof(Real);
-        rvec_inter_log = (Real*)malloc(dsize_inter_log);
-        for(i=0; i<nx * ny * n_inter; i++) rvec_inter_log[i] = 0.0;
-    } else {
-        dsize_inter_log = sizeof(Real);
-        rvec_inter_log = (Real*)malloc(dsize_inter_log);
-        rvec_inter_log[0] = 0.0;
-    }
-
     // Create vector of field data
     if(n_field_data) {
-        dsize_field_data = n_field_data * sizeof(Real);
-        rvec_field_data = (Real*)malloc(dsize_field_data);
+        if(n_field_data % (nx * ny)) {
+            PyErr_SetString(PyExc_Exception, "'field_data' must contain the same number of values for every cell.");
+            return sim_clean();
+        }
+        rvec_field_data = (Real*)malloc(n_field_data * sizeof(Real));
         for(i=0; i<n_field_data; i++) {
             flt = PyList_GetItem(field_data, i);    // No need to decref
             if(!PyFloat_Check(flt)) {
@@ -549,10 +1488,18 @@ sim_init(PyObject* self, PyObject* args)
             }
             rvec_field_data[i] = (Real)PyFloat_AsDouble(flt);
         }
-    } else {
-        dsize_field_data = sizeof(Real);
-        rvec_field_data = (Real*)malloc(dsize_field_data);
-        rvec_field_data[0] = 0.0;
+    }
+
+    // Create vectors for downloading detected APs
+    if(apd_enabled) {
+        apd_capacity = 0;
+        for(i=0; i<n_domains; i++) {
+            if(4 * (domains[i].hi - domains[i].lo) > apd_capacity) {
+                apd_capacity = (cl_uint)(4 * (domains[i].hi - domains[i].lo));
+            }
+        }
+        rvec_apd_cell = (cl_uint*)malloc(apd_capacity * sizeof(cl_uint));
+        rvec_apd_time = (Real*)malloc(2 * apd_capacity * sizeof(Real));
     }
 
     // Conductance options
@@ -572,11 +1519,8 @@ sim_init(PyObject* self, PyObject* args)
             return sim_clean();
         }
 
-        // Create vector
-        dsize_gx = (nx - 1) * ny * sizeof(Real);
-        rvec_gx = (Real*)malloc(dsize_gx);
-
-        // Populate gx field vector
+        // Create and populate gx field vector
+        rvec_gx = (Real*)malloc(((nx - 1) * ny + 1) * sizeof(Real));
         for(i=0; i<(nx - 1)*ny; i++) {
             flt = PyList_GetItem(gx_field, i);   // Borrowed reference
             if(!PyFloat_Check(flt)) {
@@ -597,11 +1541,8 @@ sim_init(PyObject* self, PyObject* args)
                 return sim_clean();
             }
 
-            // Create vector
-            dsize_gy = (ny - 1) * nx * sizeof(Real);
-            rvec_gy = (Real*)malloc(dsize_gy);
-
-            // Populate gy field vector
+            // Create and populate gy field vector
+            rvec_gy = (Real*)malloc((ny - 1) * nx * sizeof(Real));
             for(i=0; i<(ny - 1)*nx; i++) {
                 flt = PyList_GetItem(gy_field, i);   // Borrowed reference
                 if(!PyFloat_Check(flt)) {
@@ -610,74 +1551,6 @@ sim_init(PyObject* self, PyObject* args)
                 }
                 rvec_gy[i] = (Real)PyFloat_AsDouble(flt);
             }
-        } else {
-            dsize_gy = sizeof(Real);
-            rvec_gy = (Real*)malloc(dsize_gy);
-            rvec_gy[0] = 0.0;
-        }
-
-    } else if(connections != Py_None) {
-        // Set up arbitrary-geometry diffusion
-        #ifdef MYOKIT_DEBUG_MESSAGES
-        printf("Setting up connections.\n");
-        #endif
-
-        // Check connections list
-        if(!PyList_Check(connections)) {
-            PyErr_SetString(PyExc_Exception, "Connections should be None or a list");
-            return sim_clean();
-        }
-        n_connections = PyList_Size(connections);
-
-        dsize_conn1 = n_connections * sizeof(unsigned long);  // Same type as nx, ny, etc.
-        dsize_conn2 = n_connections * sizeof(unsigned long);
-        dsize_conn3 = n_connections * sizeof(Real);
-
-        rvec_conn1 = (unsigned long*)malloc(dsize_conn1);
-        rvec_conn2 = (unsigned long*)malloc(dsize_conn2);
-        rvec_conn3 = (Real*)malloc(dsize_conn3);
-
-        for(i=0; i<n_connections; i++) {
-            flt = PyList_GetItem(connections, i);   // Borrowed reference
-            if(!PyTuple_Check(flt)) {
-                PyErr_SetString(PyExc_Exception, "Connections list must contain all tuples");
-                return sim_clean();
-            }
-            if(PyTuple_Size(flt) != 3) {
-                PyErr_SetString(PyExc_Exception, "Connections list must contain only 3-tuples");
-                return sim_clean();
-            }
-
-            ret = PyTuple_GetItem(flt, 0);  // Borrowed reference
-            if(PyLong_Check(ret)) {
-                rvec_conn1[i] = (unsigned long)PyLong_AsLong(ret);
-            #if PY_MAJOR_VERSION < 3
-            } else if (PyInt_Check(ret)) {
-                rvec_conn1[i] = (unsigned long)PyInt_AsLong(ret);
-            #endif
-            } else {
-                PyErr_SetString(PyExc_Exception, "First item in each connection tuple must be int");
-                return sim_clean();
-            }
-
-            ret = PyTuple_GetItem(flt, 1);  // Borrowed reference
-            if(PyLong_Check(ret)) {
-                rvec_conn2[i] = (unsigned long)PyLong_AsLong(ret);
-            #if PY_MAJOR_VERSION < 3
-            } else if(PyInt_Check(ret)) {
-                rvec_conn2[i] = (unsigned long)PyInt_AsLong(ret);
-            #endif
-            } else {
-                PyErr_SetString(PyExc_Exception, "Second item in each connection tuple must be int");
-                return sim_clean();
-            }
-
-            ret = PyTuple_GetItem(flt, 2);  // Borrowed reference
-            if(!PyFloat_Check(ret)) {
-                PyErr_SetString(PyExc_Exception, "Third item in each connection tuple must be float");
-                return sim_clean();
-            }
-            rvec_conn3[i] = (Real)PyFloat_AsDouble(ret);
         }
     }
 
@@ -685,26 +1558,13 @@ sim_init(PyObject* self, PyObject* args)
     printf("Created vectors.\n");
     #endif
 
-    #ifdef MYOKIT_DEBUG_MESSAGES
-    printf("Setting work group sizes.\n");
-    #endif
-    // Work group size and total number of items
-    global_work_size[0] = nx;
-    global_work_size[1] = ny;
-    if (connections != Py_None) {
-        global_work_size_conn[0] = n_connections;
-    }
-    #ifdef MYOKIT_DEBUG_MESSAGES
-    printf("Work group sizes determined.\n");
-    #endif
-
-    // Get platform and device id
-    if (mcl_select_device(platform_name, device_name, &platform_id, &device_id)) {
-        // Error message set by mcl_select_device
+    // Get platform and device ids
+    if (mcl_select_devices(platform_name, device_name, (cl_uint)n_domains, fission, &platform_id, device_ids)) {
+        // Error message set by mcl_select_devices
         return sim_clean();
     }
     #ifdef MYOKIT_DEBUG_MESSAGES
-    printf("Selected platform and device id.\n");
+    printf("Selected platform and device ids.\n");
     #endif
 
     // Query capabilities
@@ -717,108 +1577,26 @@ sim_init(PyObject* self, PyObject* args)
     }
     #endif
 
-    // Create a context and command queue
+    // Create a context
     #ifdef MYOKIT_DEBUG_MESSAGES
     printf("Attempting to create OpenCL context...\n");
     #endif
     cl_context_properties context_properties[] = { CL_CONTEXT_PLATFORM, (cl_context_properties)platform_id, 0};
-    context = clCreateContext(context_properties, 1, &device_id, NULL, NULL, &flag);
+    context = clCreateContext(context_properties, (cl_uint)n_domains, device_ids, NULL, NULL, &flag);
     if(mcl_flag2("context", flag)) return sim_clean();
     #ifdef MYOKIT_DEBUG_MESSAGES
     printf("Created context.\n");
     #endif
 
-    // Create command queue
-    command_queue = clCreateCommandQueue(context, device_id, 0, &flag);
-    if(mcl_flag2("queue", flag)) return sim_clean();
-    #ifdef MYOKIT_DEBUG_MESSAGES
-    printf("Created command queue.\n");
-    #endif
-
-    // Create memory buffers on the device
-    mbuf_state = clCreateBuffer(context, CL_MEM_READ_WRITE, dsize_state, NULL, &flag);
-    if(mcl_flag2("dsize_state", flag)) return sim_clean();
-    mbuf_idiff = clCreateBuffer(context, CL_MEM_READ_WRITE, dsize_idiff, NULL, &flag);
-    if(mcl_flag2("dsize_diff", flag)) return sim_clean();
-    mbuf_inter_log = clCreateBuffer(context, CL_MEM_READ_WRITE, dsize_inter_log, NULL, &flag);
-    if(mcl_flag2("dsize_inter_log", flag)) return sim_clean();
-    mbuf_field_data = clCreateBuffer(context, CL_MEM_READ_ONLY, dsize_field_data, NULL, &flag);
-    if(mcl_flag2("dsize_field_data", flag)) return sim_clean();
-    if(gx_field != Py_None) {
-        mbuf_gx = clCreateBuffer(context, CL_MEM_READ_ONLY, dsize_gx, NULL, &flag);
-        if(mcl_flag(flag)) return sim_clean();
-        mbuf_gy = clCreateBuffer(context, CL_MEM_READ_ONLY, dsize_gy, NULL, &flag);
-        if(mcl_flag(flag)) return sim_clean();
-    } else if(connections != Py_None) {
-        mbuf_conn1 = clCreateBuffer(context, CL_MEM_READ_ONLY, dsize_conn1, NULL, &flag);
-        if(mcl_flag(flag)) return sim_clean();
-        mbuf_conn2 = clCreateBuffer(context, CL_MEM_READ_ONLY, dsize_conn2, NULL, &flag);
-        if(mcl_flag(flag)) return sim_clean();
-        mbuf_conn3 = clCreateBuffer(context, CL_MEM_READ_ONLY, dsize_conn3, NULL, &flag);
-        if(mcl_flag(flag)) return sim_clean();
-    }
-
-    #ifdef MYOKIT_DEBUG_MESSAGES
-    printf("Created buffers.\n");
-    printf("State buffer size: %d.\n", (int)dsize_state);
-    printf("Idiff buffer size: %d.\n", (int)dsize_idiff);
-    printf("Inter-log buffer size: %d.\n", (int)dsize_inter_log);
-    printf("Field-data buffer size: %d.\n", (int)dsize_field_data);
-    printf("Gx field buffer size: %d.\n", (int)dsize_gx);
-    printf("Gy field buffer size: %d.\n", (int)dsize_gy);
-    printf("Connections-1 buffer size: %d.\n", (int)dsize_conn1);
-    printf("Connections-2 buffer size: %d.\n", (int)dsize_conn2);
-    printf("Connections-3 buffer size: %d.\n", (int)dsize_conn3);
-    #endif
-
-    /* Copy data into buffers */
-    /* Note: using non-blocking writes here, and then waiting for it below (manual queue flush/finish) */
-    flag = clEnqueueWriteBuffer(command_queue, mbuf_state, CL_FALSE, 0, dsize_state, rvec_state, 0, NULL, NULL);
-    if(mcl_flag(flag)) return sim_clean();
-    flag = clEnqueueWriteBuffer(command_queue, mbuf_idiff, CL_FALSE, 0, dsize_idiff, rvec_idiff, 0, NULL, NULL);
-    if(mcl_flag(flag)) return sim_clean();
-    flag = clEnqueueWriteBuffer(command_queue, mbuf_inter_log, CL_FALSE, 0, dsize_inter_log, rvec_inter_log, 0, NULL, NULL);
-    if(mcl_flag(flag)) return sim_clean();
-    flag = clEnqueueWriteBuffer(command_queue, mbuf_field_data, CL_FALSE, 0, dsize_field_data, rvec_field_data, 0, NULL, NULL);
-    if(mcl_flag(flag)) return sim_clean();
-    if (gx_field != Py_None) {
-        flag = clEnqueueWriteBuffer(command_queue, mbuf_gx, CL_FALSE, 0, dsize_gx, rvec_gx, 0, NULL, NULL);
-        if(mcl_flag(flag)) return sim_clean();
-        flag = clEnqueueWriteBuffer(command_queue, mbuf_gy, CL_FALSE, 0, dsize_gy, rvec_gy, 0, NULL, NULL);
-        if(mcl_flag(flag)) return sim_clean();
-    } else if(connections != Py_None) {
-        flag = clEnqueueWriteBuffer(command_queue, mbuf_conn1, CL_FALSE, 0, dsize_conn1, rvec_conn1, 0, NULL, NULL);
-        if(mcl_flag(flag)) return sim_clean();
-        flag = clEnqueueWriteBuffer(command_queue, mbuf_conn2, CL_FALSE, 0, dsize_conn2, rvec_conn2, 0, NULL, NULL);
-        if(mcl_flag(flag)) return sim_clean();
-        flag = clEnqueueWriteBuffer(command_queue, mbuf_conn3, CL_FALSE, 0, dsize_conn3, rvec_conn3, 0, NULL, NULL);
-        if(mcl_flag(flag)) return sim_clean();
-    }
-    #ifdef MYOKIT_DEBUG_MESSAGES
-    printf("Enqueued copying of data into buffers.\n");
-    #endif
-
-    // Wait for copying to be finished
-    clFlush(command_queue);
-    clFinish(command_queue);
-    #ifdef MYOKIT_DEBUG_MESSAGES
-    printf("Command queue flushed.\n");
-    #endif
-
-    // Load and compile the program
-    program = clCreateProgramWithSource(context, 1, (const char**)&kernel_source, NULL, &flag);
-    if(mcl_flag(flag)) return sim_clean();
-    #ifdef MYOKIT_DEBUG_MESSAGES
-    printf("Program created.\n");
-    #endif
+    // Load and compile the program, or load cached binaries
     sprintf(options, "");
     //sprintf(options, "-w"); // Suppress warnings
-    flag = clBuildProgram(program, 1, &device_id, options, NULL, NULL);
+    flag = mcl_build_program(context, (cl_uint)n_domains, device_ids, kernel_source, options, program_cache, &program);
     if(flag == CL_BUILD_PROGRAM_FAILURE) {
         // Build failed, extract log
-        clGetProgramBuildInfo(program, device_id, CL_PROGRAM_BUILD_LOG, 0, NULL, &blog_size);
+        clGetProgramBuildInfo(program, device_ids[0], CL_PROGRAM_BUILD_LOG, 0, NULL, &blog_size);
         blog = (char*)malloc(blog_size);
-        clGetProgramBuildInfo(program, device_id, CL_PROGRAM_BUILD_LOG, blog_size, blog, NULL);
+        clGetProgramBuildInfo(program, device_ids[0], CL_PROGRAM_BUILD_LOG, blog_size, blog, NULL);
         fprintf(stderr, "OpenCL Error: Kernel failed to compile.\n");
         fprintf(stderr, "----------------------------------------");
         fprintf(stderr, "---------------------------------------\n");
@@ -832,76 +1610,38 @@ sim_init(PyObject* self, PyObject* args)
     printf("Program built.\n");
     #endif
 
-    // Create the kernels
-    kernel_cell = clCreateKernel(program, "cell_step", &flag);
-    if(mcl_flag(flag)) return sim_clean();
-    if(connections != Py_None) {
-        // Arbitrary geometry
-        kernel_arb_reset = clCreateKernel(program, "diff_arb_reset", &flag);
-        if(mcl_flag(flag)) return sim_clean();
-        kernel_arb_step = clCreateKernel(program, "diff_arb_step", &flag);
-        if(mcl_flag(flag)) return sim_clean();
-    } else if (gx_field != Py_None) {
-        // Rectangular grid, heterogeneous conduction
-        kernel_cond = clCreateKernel(program, "diff_hetero", &flag);
-        if(mcl_flag(flag)) return sim_clean();
-    } else if (diffusion) {
-        // Rectangular grid, homogeneous conduction
-        kernel_diff = clCreateKernel(program, "diff_step", &flag);
-        if(mcl_flag(flag)) return sim_clean();
+    // Create command queues, buffers, and kernels for each domain
+    for(i=0; i<n_domains; i++) {
+        PyArg_ParseTuple(PyList_GetItem(domain_list, i), "kkkkOOO", &j, &j, &j, &j, &halo, &export, &conns);
+        if(domain_init(domains + i, device_ids[i], halo, export, conns)) return sim_clean();
     }
     #ifdef MYOKIT_DEBUG_MESSAGES
-    printf("Kernels created.\n");
+    printf("Created buffers and kernels for %u domain(s).\n", (unsigned int)n_domains);
     #endif
 
-    // Pass arguments into kernels
-    i = 0;
-    if(mcl_flag(clSetKernelArg(kernel_cell, i++, sizeof(nx), &nx))) return sim_clean();
-    if(mcl_flag(clSetKernelArg(kernel_cell, i++, sizeof(ny), &ny))) return sim_clean();
-    if(mcl_flag(clSetKernelArg(kernel_cell, i++, sizeof(arg_time), &arg_time))) return sim_clean();
-    if(mcl_flag(clSetKernelArg(kernel_cell, i++, sizeof(arg_dt), &arg_dt))) return sim_clean();
-    if(mcl_flag(clSetKernelArg(kernel_cell, i++, sizeof(arg_pace), &arg_pace))) return sim_clean();
-    if(mcl_flag(clSetKernelArg(kernel_cell, i++, sizeof(mbuf_state), &mbuf_state))) return sim_clean();
-    if(mcl_flag(clSetKernelArg(kernel_cell, i++, sizeof(mbuf_idiff), &mbuf_idiff))) return sim_clean();
-    if(mcl_flag(clSetKernelArg(kernel_cell, i++, sizeof(mbuf_inter_log), &mbuf_inter_log))) return sim_clean();
-    if(mcl_flag(clSetKernelArg(kernel_cell, i++, sizeof(mbuf_field_data), &mbuf_field_data))) return sim_clean();
-
-    // Calculate initial diffusion current
-    if(connections != Py_None) {
-        // Arbitrary geometry
-        i = 0;
-        if(mcl_flag(clSetKernelArg(kernel_arb_reset, i++, sizeof(nx), &nx))) return sim_clean();
-        if(mcl_flag(clSetKernelArg(kernel_arb_reset, i++, sizeof(mbuf_idiff), &mbuf_idiff))) return sim_clean();
-        i = 0;
-        if(mcl_flag(clSetKernelArg(kernel_arb_step, i++, sizeof(n_connections), &n_connections))) return sim_clean();
-        if(mcl_flag(clSetKernelArg(kernel_arb_step, i++, sizeof(mbuf_conn1), &mbuf_conn1))) return sim_clean();
-        if(mcl_flag(clSetKernelArg(kernel_arb_step, i++, sizeof(mbuf_conn2), &mbuf_conn2))) return sim_clean();
-        if(mcl_flag(clSetKernelArg(kernel_arb_step, i++, sizeof(mbuf_conn3), &mbuf_conn3))) return sim_clean();
-        if(mcl_flag(clSetKernelArg(kernel_arb_step, i++, sizeof(mbuf_state), &mbuf_state))) return sim_clean();
-        if(mcl_flag(clSetKernelArg(kernel_arb_step, i++, sizeof(mbuf_idiff), &mbuf_idiff))) return sim_clean();
-    } else if (gx_field != Py_None) {
-        // Heteogeneous, rectangular diffusion
-        i = 0;
-        if(mcl_flag(clSetKernelArg(kernel_cond, i++, sizeof(nx), &nx))) return sim_clean();
-        if(mcl_flag(clSetKernelArg(kernel_cond, i++, sizeof(ny), &ny))) return sim_clean();
-        if(mcl_flag(clSetKernelArg(kernel_cond, i++, sizeof(mbuf_gx), &mbuf_gx))) return sim_clean();
-        if(mcl_flag(clSetKernelArg(kernel_cond, i++, sizeof(mbuf_gy), &mbuf_gy))) return sim_clean();
-        if(mcl_flag(clSetKernelArg(kernel_cond, i++, sizeof(mbuf_state), &mbuf_state))) return sim_clean();
-        if(mcl_flag(clSetKernelArg(kernel_cond, i++, sizeof(mbuf_idiff), &mbuf_idiff))) return sim_clean();
-    } else if (diffusion) {
-        // Homogeneous, rectangular diffusion
-        i = 0;
-        if(mcl_flag(clSetKernelArg(kernel_diff, i++, sizeof(nx), &nx))) return sim_clean();
-        if(mcl_flag(clSetKernelArg(kernel_diff, i++, sizeof(ny), &ny))) return sim_clean();
-        if(mcl_flag(clSetKernelArg(kernel_diff, i++, sizeof(arg_gx), &arg_gx))) return sim_clean();
-        if(mcl_flag(clSetKernelArg(kernel_diff, i++, sizeof(arg_gy), &arg_gy))) return sim_clean();
-        if(mcl_flag(clSetKernelArg(kernel_diff, i++, sizeof(mbuf_state), &mbuf_state))) return sim_clean();
-        if(mcl_flag(clSetKernelArg(kernel_diff, i++, sizeof(mbuf_idiff), &mbuf_idiff))) return sim_clean();
+    //
+    // Set up halo exchange
+    //
+    if(!PyList_Check(copy_list)) {
+        PyErr_SetString(PyExc_Exception, "'copies' must be a list.");
+        return sim_clean();
+    }
+    n_copies = PyList_Size(copy_list);
+    copies = (HaloCopy*)calloc(n_copies + 1, sizeof(HaloCopy));
+    copy_wait = (cl_event*)malloc((n_copies + 1) * sizeof(cl_event));
+    for(i=0; i<n_copies; i++) {
+        HaloCopy* copy = copies + i;
+        if(!PyArg_ParseTuple(PyList_GetItem(copy_list, i), "kkkkk", &copy->src, &copy->dst, &copy->src_offset, &copy->dst_offset, &copy->count)) {
+            PyErr_SetString(PyExc_Exception, "Each copy must be a tuple (src, dst, src_offset, dst_offset, count).");
+            return sim_clean();
+        }
+        if(copy->src >= n_domains || copy->dst >= n_domains || copy->count == 0
+                || copy->src_offset + copy->count > domains[copy->src].n_export
+                || copy->dst_offset + copy->count > domains[copy->dst].n_halo) {
+            PyErr_SetString(PyExc_Exception, "Invalid copy between domains.");
+            return sim_clean();
+        }
     }
-
-    #ifdef MYOKIT_DEBUG_MESSAGES
-    printf("Arguments passed into kernels.\n");
-    #endif
 
     //
     // Set up logging system
@@ -919,59 +1659,79 @@ sim_init(PyObject* self, PyObject* args)
     #ifdef MYOKIT_DEBUG_MESSAGES
     printf("Allocated log pointers:.\n");
     #endif
-    vars = (Real**)malloc(sizeof(Real*)*n_vars); // Pointers to variables to log
+    vars = (Real**)malloc(sizeof(Real*)*n_vars*2); // Pointers to variables to log, for both slots
     #ifdef MYOKIT_DEBUG_MESSAGES
     printf("Allocated var pointers.\n");
     #endif
 
+    // Create pinned host memory for asynchronous logging, and map it into
+    // host address space for the duration of the simulation. Each slot can
+    // hold every logged value, plus the first state used to check for NaNs.
+    dsize_log = (n_vars + 1) * sizeof(Real);
+    for (i=0; i<2; i++) {
+        mbuf_log_host[i] = clCreateBuffer(context, CL_MEM_READ_WRITE | CL_MEM_ALLOC_HOST_PTR, dsize_log, NULL, &flag);
+        if(mcl_flag2("log_host", flag)) return sim_clean();
+        rvec_log[i] = (Real*)clEnqueueMapBuffer(domains[0].queue, mbuf_log_host[i], CL_TRUE, CL_MAP_READ | CL_MAP_WRITE, 0, dsize_log, 0, NULL, NULL, &flag);
+        if(mcl_flag2("map_log_host", flag)) return sim_clean();
+    }
+    rvec_log_index = (unsigned long*)malloc(sizeof(unsigned long)*(n_vars + 1));
+    rvec_log_local = (unsigned long*)calloc(n_vars + 1, sizeof(unsigned long));
+
     // Number of variables in log
     k_vars = 0;
 
     // Time and pace are set globally
 <?
 var = model.binding('time')
-print(tab + 'k_vars += log_add(log_dict, logs, vars, k_vars, "' + var.qname() + '", &arg_time);')
+print(tab + 'k_vars += log_add(log_dict, logs, vars, k_vars, "' + var.qname() + '", &log_time[0]);')
 var = model.binding('pace')
 if var is not None:
-    print(tab + 'k_vars += log_add(log_dict, logs, vars, k_vars, "' + var.qname() + '", &arg_pace);')
+    print(tab + 'k_vars += log_add(log_dict, logs, vars, k_vars, "' + var.qname() + '", &log_pace[0]);')
 ?>
 
-    // Diffusion current
-    logging_diffusion = 0;
+    // States. The first entry is reserved for the NaN check.
+    logging_states = 0;
+    rvec_log_index[0] = 0;
+    k_log = 1;
     for(i=0; i<ny; i++) {
         for(j=0; j<nx; j++) {
 <?
-var = model.binding('diffusion_current')
-if var is not None:
+for var in model.states():
     if dims == 1:
         print(3*tab + 'sprintf(log_var_name, "%u.' + var.qname() + '", (unsigned int)j);')
     else:
-        print(3*tab + 'sprintf(log_var_name, "%u.%u.' + var.qname() + '", (unsigned int)j, (unsigned int)i);')
-    print(3*tab + 'if(log_add(log_dict, logs, vars, k_vars, log_var_name, &rvec_idiff[i*nx+j])) {')
-    print(4*tab + 'logging_diffusion = 1;')
+        print(3*tab + 'sprintf(log_var_name, "%u.%u.' + var.qname() + '", (unsigned int)j, (unsigned int)i);' )
+    print(3*tab + 'if(log_add(log_dict, logs, vars, k_vars, log_var_name, &rvec_log[0][k_log])) {')
+    print(4*tab + 'rvec_log_index[k_log++] = (i*nx+j)*n_state+' + str(var.indice()) + ';')
+    print(4*tab + 'logging_states = 1;')
     print(4*tab + 'k_vars++;')
     print(3*tab + '}')
 ?>
         }
     }
+    if(!logging_states) k_log = 0;
+    n_log_state = k_log;
 
-    // States
-    logging_states = 0;
+    // Diffusion current
+    logging_diffusion = 0;
     for(i=0; i<ny; i++) {
         for(j=0; j<nx; j++) {
 <?
-for var in model.states():
+var = model.binding('diffusion_current')
+if var is not None:
     if dims == 1:
         print(3*tab + 'sprintf(log_var_name, "%u.' + var.qname() + '", (unsigned int)j);')
     else:
-        print(3*tab + 'sprintf(log_var_name, "%u.%u.' + var.qname() + '", (unsigned int)j, (unsigned int)i);' )
-    print(3*tab + 'if(log_add(log_dict, logs, vars, k_vars, log_var_name, &rvec_state[(i*nx+j)*n_state+' + str(var.indice()) + '])) {')
-    print(4*tab + 'logging_states = 1;')
+        print(3*tab + 'sprintf(log_var_name, "%u.%u.' + var.qname() + '", (unsigned int)j, (unsigned int)i);')
+    print(3*tab + 'if(log_add(log_dict, logs, vars, k_vars, log_var_name, &rvec_log[0][k_log])) {')
+    print(4*tab + 'rvec_log_index[k_log++] = i*nx+j;')
+    print(4*tab + 'logging_diffusion = 1;')
     print(4*tab + 'k_vars++;')
     print(3*tab + '}')
 ?>
         }
     }
+    n_log_idiff = k_log - n_log_state;
 
     // Intermediary variables
     logging_inters = 0;
@@ -985,7 +1745,8 @@ if dims == 1:
 else:
     print(4*tab + 'sprintf(log_var_name, "%u.%u.%s", (unsigned int)j, (unsigned int)i, PyBytes_AsString(ret));')
 
-print(4*tab + 'if(log_add(log_dict, logs, vars, k_vars, log_var_name, &rvec_inter_log[(i*nx+j)*n_inter+k])) {')
+print(4*tab + 'if(log_add(log_dict, logs, vars, k_vars, log_var_name, &rvec_log[0][k_log])) {')
+print(5*tab + 'rvec_log_index[k_log++] = (i*nx+j)*n_inter+k;')
 print(5*tab + 'logging_inters = 1;')
 print(5*tab + 'k_vars++;')
 print(4*tab + '}')
@@ -993,6 +1754,7 @@ print(4*tab + '}')
             }
         }
     }
+    n_log_inter = k_log - n_log_state - n_log_idiff;
     ret = NULL;
 
     /* Check if log contained extra variables */
@@ -1001,10 +1763,37 @@ print(4*tab + '}')
         return sim_clean();
     }
 
+    /* Store the values gathered on each device contiguously */
+    log_divide();
+
+    /* Set pointers to logged variables in the second logging slot */
+    for(i=0; i<n_vars; i++) {
+        vars[n_vars + i] = log_slot_pointer(vars[i], 1);
+    }
+
+    /* Create buffers for gathering the logged values on the devices */
+    for(i=0; i<n_domains; i++) {
+        dom = domains + i;
+        dom->mbuf_log = clCreateBuffer(context, CL_MEM_READ_WRITE, dsize_log, NULL, &flag);
+        if(mcl_flag2("log", flag)) return sim_clean();
+        dom->mbuf_log_index = clCreateBuffer(context, CL_MEM_READ_ONLY | CL_MEM_COPY_HOST_PTR, sizeof(unsigned long)*(n_vars + 1), rvec_log_local, &flag);
+        if(mcl_flag2("log_index", flag)) return sim_clean();
+        if(mcl_flag(clSetKernelArg(dom->kernel_log, 2, sizeof(dom->mbuf_log_index), &dom->mbuf_log_index))) return sim_clean();
+        if(mcl_flag(clSetKernelArg(dom->kernel_log, 4, sizeof(dom->mbuf_log), &dom->mbuf_log))) return sim_clean();
+    }
+
+    /* Both logging slots are empty */
+    log_slot = 0;
+    log_pending[0] = log_pending[1] = 0;
+    log_reading[0] = log_reading[1] = 0;
+
     #ifdef MYOKIT_DEBUG_MESSAGES
     printf("Created log for %u variables.\n", (unsigned int)n_vars);
     #endif
 
+    /* Wait for all buffers to be ready */
+    finish_all();
+
     /* Log update method: */
     list_update_str = PyUnicode_FromString("append");
 
@@ -1033,9 +1822,10 @@ sim_step(PyObject *self, PyObject *args)
     ESys_Flag flag_pacing;
     long steps_left_in_run;
     cl_int flag;
-    unsigned long i;
+    unsigned long i, n;
     double d;
     int logging_condition;
+    Domain* dom;
 
     steps_left_in_run = 500 + 200000 / (nx * ny);
     if(steps_left_in_run < 1000) steps_left_in_run = 1000;
@@ -1056,74 +1846,97 @@ sim_step(PyObject *self, PyObject *args)
         if (!intermediary_step) istep++;
         arg_dt = (Real)dt;
 
-        /* Update diffusion current, calculating it for time t */
-        if(connections != Py_None) {
-            /* Arbitrary geometry */
-            if(mcl_flag2("kernel_arb_reset", clEnqueueNDRangeKernel(command_queue, kernel_arb_reset, 2, NULL, global_work_size, NULL, 0, NULL, NULL))) return sim_clean();
-            if(mcl_flag2("kernel_arb_step", clEnqueueNDRangeKernel(command_queue, kernel_arb_step, 1, NULL, global_work_size_conn, NULL, 0, NULL, NULL))) return sim_clean();
-        } else if (gx_field != Py_None) {
-            /* Heterogeneous rectangular diffusion */
-            if(mcl_flag2("kernel_cond", clEnqueueNDRangeKernel(command_queue, kernel_cond, 2, NULL, global_work_size, NULL, 0, NULL, NULL))) return sim_clean();
-        } else if (diffusion) {
-            /* Homogeneous rectangular diffusion */
-            if(mcl_flag2("kernel_diff", clEnqueueNDRangeKernel(command_queue, kernel_diff, 2, NULL, global_work_size, NULL, 0, NULL, NULL))) return sim_clean();
+        /* Copy membrane potentials at time t into the halos of other devices */
+        if(n_copies) {
+            if(mcl_flag2("halo_exchange", halo_exchange())) return sim_clean();
         }
 
-        /* Logging at time t? Then download the state from the device */
-        if(logging_condition && logging_states) {
-            /* Note the 3d argument CL_TRUE ensures this is a "blocking_read" */
-            /* i.e. the call doesn't return until the copying has completed, */
-            /* we don't need to manually flush/finish the command queue */
-            flag = clEnqueueReadBuffer(command_queue, mbuf_state, CL_TRUE, 0, dsize_state, rvec_state, 0, NULL, NULL);
-            if(mcl_flag(flag)) return sim_clean();
-
-            /* Check for NaNs in the state */
-            if(isnan(rvec_state[0])) {
-                halt_sim = 1;
-            }
-        }
+        for(i=0; i<n_domains; i++) {
+            dom = domains + i;
 
-        /* Calculate intermediary variables at t, update device states to t+dt */
-        if(mcl_flag(clSetKernelArg(kernel_cell, 2, sizeof(Real), &arg_time))) return sim_clean();
-        if(mcl_flag(clSetKernelArg(kernel_cell, 3, sizeof(Real), &arg_dt))) return sim_clean();
-        if(mcl_flag(clSetKernelArg(kernel_cell, 4, sizeof(Real), &arg_pace))) return sim_clean();
-        if(mcl_flag(clEnqueueNDRangeKernel(command_queue, kernel_cell, 2, NULL, global_work_size, NULL, 0, NULL, NULL))) return sim_clean();
-
-        /* At this point, we have
-         *  - engine_time  : the time t
-         *  - engine_pace  : the pacing signal at t
-         *  - rvec_state   : The state at t
-         *  - device state : The state at t+dt
-         *  - device inter : The intermediary variables at t
-         *  - device diff  : The diffusion currents at t
-         */
+            /* Update diffusion current, calculating it for time t */
+            if(connections != Py_None) {
+                /* Arbitrary geometry */
+                if(mcl_flag2("kernel_arb_reset", clEnqueueNDRangeKernel(dom->queue, dom->kernel_arb_reset, 1, NULL, dom->work_size_local, NULL, 0, NULL, NULL))) return sim_clean();
+                if(dom->n_connections) {
+                    if(mcl_flag2("kernel_arb_step", clEnqueueNDRangeKernel(dom->queue, dom->kernel_arb_step, 1, NULL, dom->work_size_conn, NULL, 0, NULL, NULL))) return sim_clean();
+                }
+            } else if (gx_field != Py_None) {
+                /* Heterogeneous rectangular diffusion */
+                if(mcl_flag2("kernel_cond", clEnqueueNDRangeKernel(dom->queue, dom->kernel_cond, 2, (n_domains > 1) ? dom->work_offset : NULL, dom->work_size, NULL, 0, NULL, NULL))) return sim_clean();
+            } else if (diffusion) {
+                /* Homogeneous rectangular diffusion */
+                if(mcl_flag2("kernel_diff", clEnqueueNDRangeKernel(dom->queue, dom->kernel_diff, 2, (n_domains > 1) ? dom->work_offset : NULL, dom->work_size, NULL, 0, NULL, NULL))) return sim_clean();
+            }
 
-        /* Log situation at time t */
-        if(logging_condition) {
-            /* Download diffusion at time t from device */
-            if(logging_diffusion) {
-                flag = clEnqueueReadBuffer(command_queue, mbuf_idiff, CL_TRUE, 0, dsize_idiff, rvec_idiff, 0, NULL, NULL);
-                if(mcl_flag(flag)) return sim_clean();
+            /* Logging at time t? Then gather the logged states on the device */
+            /* Because the queue is in-order, this will complete before the next */
+            /* kernel changes the state. */
+            if(logging_condition && dom->n_log_state) {
+                if(mcl_flag2("kernel_log", log_gather(dom, dom->n_log_state, dom->log_start, &dom->mbuf_state))) return sim_clean();
             }
 
-            /* Download intermediary variables at time t from device */
-            if(logging_inters) {
-                flag = clEnqueueReadBuffer(command_queue, mbuf_inter_log, CL_TRUE, 0, dsize_inter_log, rvec_inter_log, 0, NULL, NULL);
-                if(mcl_flag(flag)) return sim_clean();
+            /* Calculate intermediary variables at t, update device states to t+dt */
+            if(mcl_flag(clSetKernelArg(dom->kernel_cell, 2, sizeof(Real), &arg_time))) return sim_clean();
+            if(mcl_flag(clSetKernelArg(dom->kernel_cell, 3, sizeof(Real), &arg_dt))) return sim_clean();
+            if(mcl_flag(clSetKernelArg(dom->kernel_cell, 4, sizeof(Real), &arg_pace))) return sim_clean();
+            if(mcl_flag(clEnqueueNDRangeKernel(dom->queue, dom->kernel_cell, 2, (n_domains > 1) ? dom->work_offset : NULL, dom->work_size, NULL, 0, NULL, NULL))) return sim_clean();
+
+            /* Check for threshold crossings between t and t+dt */
+            if(apd_enabled) {
+                if(mcl_flag(clSetKernelArg(dom->kernel_apd, 2, sizeof(Real), &arg_time))) return sim_clean();
+                if(mcl_flag(clSetKernelArg(dom->kernel_apd, 3, sizeof(Real), &arg_dt))) return sim_clean();
+                if(mcl_flag2("kernel_apd", clEnqueueNDRangeKernel(dom->queue, dom->kernel_apd, 2, (n_domains > 1) ? dom->work_offset : NULL, dom->work_size, NULL, 0, NULL, NULL))) return sim_clean();
             }
 
-            /* Write everything to the log */
-            for(i=0; i<n_vars; i++) {
-                flt = PyFloat_FromDouble(*vars[i]);
-                ret = PyObject_CallMethodObjArgs(logs[i], list_update_str, flt, NULL);
-                Py_CLEAR(flt);
-                Py_XDECREF(ret);
-                if(ret == NULL) {
-                    PyErr_SetString(PyExc_Exception, "Call to append() failed on logging list.");
-                    return sim_clean();
+            /* At this point, we have
+             *  - engine_time  : the time t
+             *  - engine_pace  : the pacing signal at t
+             *  - rvec_state   : The state at t
+             *  - device state : The state at t+dt
+             *  - device inter : The intermediary variables at t
+             *  - device diff  : The diffusion currents at t
+             */
+
+            /* Gather and download the logged values at time t */
+            if(logging_condition) {
+                /* Gather diffusion currents and intermediary variables at t */
+                if(dom->n_log_idiff) {
+                    if(mcl_flag2("kernel_log", log_gather(dom, dom->n_log_idiff, dom->log_start + dom->n_log_state, &dom->mbuf_idiff))) return sim_clean();
+                }
+                if(dom->n_log_inter) {
+                    if(mcl_flag2("kernel_log", log_gather(dom, dom->n_log_inter, dom->log_start + dom->n_log_state + dom->n_log_idiff, &dom->mbuf_inter_log))) return sim_clean();
+                }
+
+                /* Start downloading the gathered values from the device */
+                /* Note the 3d argument CL_FALSE makes this a non-blocking read */
+                /* into the current logging slot. */
+                n = dom->n_log_state + dom->n_log_idiff + dom->n_log_inter;
+                if(n) {
+                    flag = clEnqueueReadBuffer(dom->queue, dom->mbuf_log, CL_FALSE, dom->log_start * sizeof(Real), n * sizeof(Real), rvec_log[log_slot] + dom->log_start, 0, NULL, &log_events[log_slot * n_domains + log_reading[log_slot]]);
+                    if(mcl_flag(flag)) return sim_clean();
+                    log_reading[log_slot]++;
                 }
             }
-            ret = NULL;
+        }
+
+        /* Log situation at time t */
+        if(logging_condition) {
+            /* Store time and pace, and submit the reads to the devices */
+            log_time[log_slot] = arg_time;
+            log_pace[log_slot] = arg_pace;
+            log_pending[log_slot] = 1;
+            flush_all();
+
+            /* While the devices are busy, write the previous logging point to
+               the log. If it contained a NaN, the current point is not
+               logged. */
+            if(log_write_slot(1 - log_slot)) return sim_clean();
+            if(halt_sim) {
+                log_wait_slot(log_slot);
+                log_pending[log_slot] = 0;
+            }
+            log_slot = 1 - log_slot;
 
             /* Set next logging point */
             inext_log++;
@@ -1135,6 +1948,9 @@ sim_step(PyObject *self, PyObject *args)
                 PyErr_SetString(PyExc_Exception, "Overflow in logged step count: Simulation too long!");
                 return sim_clean();
             }
+        } else if (n_domains > 1) {
+            /* Let all devices work at the same time */
+            flush_all();
         }
 
         /* Update time, advancing it to t+dt */
@@ -1165,8 +1981,8 @@ sim_step(PyObject *self, PyObject *args)
         /* Report back to python */
         if(--steps_left_in_run == 0) {
             /* For some reason, this clears memory */
-            clFlush(command_queue);
-            clFinish(command_queue);
+            finish_all();
+            if(apd_drain()) return sim_clean();
             return PyFloat_FromDouble(engine_time);
         }
     }
@@ -1175,9 +1991,18 @@ sim_step(PyObject *self, PyObject *args)
     printf("Simulation finished.\n");
     #endif
 
-    /* Set final state (at engine_time) --> blocking read */
-    flag = clEnqueueReadBuffer(command_queue, mbuf_state, CL_TRUE, 0, dsize_state, rvec_state, 0, NULL, NULL);
-    if(mcl_flag(flag)) return sim_clean();
+    /* Write the final logging point to the log */
+    if(log_write_slot(1 - log_slot)) return sim_clean();
+
+    /* Download any remaining APs */
+    if(apd_drain()) return sim_clean();
+
+    /* Set final state (at engine_time) --> blocking reads */
+    for(i=0; i<n_domains; i++) {
+        dom = domains + i;
+        flag = clEnqueueReadBuffer(dom->queue, dom->mbuf_state, CL_TRUE, (dom->lo - dom->offset) * n_state * sizeof(Real), (dom->hi - dom->lo) * n_state * sizeof(Real), rvec_state + dom->lo * n_state, 0, NULL, NULL);
+        if(mcl_flag(flag)) return sim_clean();
+    }
     for(i=0; i<n_state*nx*ny; i++) {
         PyList_SetItem(state_out, i, PyFloat_FromDouble(rvec_state[i]));
         /* PyList_SetItem steals a reference: no need to decref the double! */
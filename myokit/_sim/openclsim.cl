@@ -19,6 +19,9 @@
 # rl_states         A map {state: (inf, tau)} of states for which to use Rush-
 #                   Larsen updates instead of forward Euler
 # fiber_tissue      True if the fiber-tissue kernel should be built
+# apd               True if the APD detection kernel should be built
+# multi_rate        None, or a tuple (levels, abs_tol, rel_tol) to divide each
+#                   step into up to 2**levels substeps per cell
 # ----------------------------------------------------------------------------
 #
 # This file is part of Myokit.
@@ -151,10 +154,17 @@ if precision == myokit.DOUBLE_PRECISION:
 #define n_field <?=str(len(fields))?>
 
 <?
-if diffusion:
+if diffusion or apd:
     print('/* Indice of membrane potential in state vector */')
     print('#define i_vm ' + str(model.label('membrane_potential').indice()))
 
+if multi_rate:
+    print('/* Multi-rate stepping: maximum level, and error tolerances */')
+    print('#define MR_MAX_LEVEL ' + str(multi_rate[0]))
+    print('#define MR_ABS_TOL ' + w.ex(myokit.Number(multi_rate[1])))
+    print('#define MR_REL_TOL ' + w.ex(myokit.Number(multi_rate[2])))
+    print('')
+
 if precision == myokit.SINGLE_PRECISION:
     print('/* Using single precision floats */')
     print('typedef float Real;')
@@ -282,29 +292,33 @@ if diffusion and paced_cells:
 
 /*
  * Cell kernel.
- * Computes a single Euler-step for a single cell.
+ * Computes a single Euler-step for a single cell. With multi-rate stepping,
+ * the step is divided into 2^level substeps, where the level is chosen for
+ * each cell based on an estimate of the local error.
  *
  * Arguments
  *  nx         : The number of cells in the x-direction
  *  ny         : The number of cells in the y-direction
- *  time       : The current simulation time
+ *  time_in    : The current simulation time
  *  dt         : The time step to take
  *  pace_in    : The current pacing value
  *  state      : The state vector
  *  idiff_in   : The diffusion vector
  *  inter_log  : A vector containing all logged intermediary variables
  *  field_data : A vector containing all field data
+ *  offset     : The global index of the first cell stored in the vectors
  */
 __kernel void cell_step(
     const unsigned long nx,
     const unsigned long ny,
-    const Real time,
+    const Real time_in,
     const Real dt,
     const Real pace_in,
     __global Real* state,
     const __global Real* idiff_in,
     __global Real* inter_log,
-    const __global Real* field_data
+    const __global Real* field_data,
+    const unsigned long offset
     )
 {
     const unsigned long ix = get_global_id(0);
@@ -312,11 +326,14 @@ __kernel void cell_step(
     if(ix >= nx) return;
     if(iy >= ny) return;
 
-    // Offset of this cell's state in the state vector
+    // Global cell index, and index in the local vectors
     const unsigned long cid = ix + iy * nx;
-    const unsigned long of1 = cid * n_state;
-    const unsigned long of2 = cid * n_inter;
-    const unsigned long of3 = cid * n_field;
+    const unsigned long lid = cid - offset;
+
+    // Offset of this cell's state in the state vector
+    const unsigned long of1 = lid * n_state;
+    const unsigned long of2 = lid * n_inter;
+    const unsigned long of3 = lid * n_field;
 
     // Pacing
 <?
@@ -330,42 +347,250 @@ else:
 
 if diffusion:
     print(tab + '// Diffusion')
-    print(tab + 'Real idiff = idiff_in[cid];')
+    print(tab + 'Real idiff = idiff_in[lid];')
     print('')
 
-print(tab + '// Evaluate derivatives')
+# Calls to the component functions, with the output variables they set
+calls = []
 for comp in comp_order:
-    ilist = comp_in[comp]
-    olist = comp_out[comp]
-
     # Skip uselesss components
     if comp in components_to_skip:
         continue
-
-    # Declare any output variables
-    for var in comp_out[comp]:
-        print(tab + 'Real ' + v(var) + ' = 0;')
-
-    # Function header
+    ilist = comp_in[comp]
+    olist = comp_out[comp]
     args = ['of1', 'of2', 'of3', 'state', 'inter_log', 'field_data']
     args.extend([v(lhs) for lhs in ilist])
     args.extend(['&' + v(lhs) for lhs in olist])
-    print(tab + 'calc_' + comp.name() + '(' + ', '.join(args) + ');')
+    calls.append((
+        [v(var) for var in olist],
+        'calc_' + comp.name() + '(' + ', '.join(args) + ');'))
 
-?>
-    /* Perform update */
-<?
-for var in model.states():
-    if var in rl_states:
+if not multi_rate:
+    print(tab + 'Real time = time_in;')
+    print('')
+    print(tab + '// Evaluate derivatives')
+    for outputs, call in calls:
+        for var in outputs:
+            print(tab + 'Real ' + var + ' = 0;')
+        print(tab + call)
+    print('')
+
+    print(tab + '/* Perform update */')
+    for var in model.states():
+        if var in rl_states:
+            inf, tau = rl_states[var]
+            inf, tau, var = v(inf), v(tau), v(var)
+            print(tab + var + ' = ' + inf + ' - (' + inf + ' - ' + var + ') * exp(-dt / ' + tau + ');')
+        else:
+            print(tab + v(var) + ' += dt * ' + v(var.lhs()) + ';')
+
+else:
+    fe_states = [x for x in model.states() if x not in rl_states]
+    rl_list = [x for x in model.states() if x in rl_states]
+
+    print(tab + '// Multi-rate update: the step is divided into substeps of size')
+    print(tab + '// dt / 2^level. Each substep is a forward Euler (or Rush-Larsen) step,')
+    print(tab + '// and is accepted if the difference with a Heun step is within the')
+    print(tab + '// tolerances. Otherwise, the substep is retried with half the size.')
+    print(tab + 'unsigned int pos = 0;     // Time passed, in units of the smallest substep')
+    print(tab + 'unsigned int level = 0;   // The current substep has size dt / 2^level')
+    print(tab + 'unsigned int i;')
+    print(tab + 'int first = 1;')
+    print(tab + 'int accept;')
+    print(tab + 'Real h, err, e;')
+    print(tab + 'Real time = time_in;')
+    print(tab + 'Real x0[n_state];         // The state at the start of the substep')
+    print(tab + 'Real f0[n_state];         // The derivatives at the start of the substep')
+    if rl_list:
+        print(tab + 'Real r0[' + str(2 * len(rl_list)) + '];'
+              + '             // Rush-Larsen inf and tau at the start of the substep')
+    if inter_log:
+        print(tab + 'Real i0[n_inter];         // Logged intermediary variables at time_in')
+    for outputs, call in calls:
+        for var in outputs:
+            print(tab + 'Real ' + var + ' = 0;')
+    print('')
+    print(tab + 'while(1) {')
+    print(2 * tab + '// Evaluate derivatives')
+    for outputs, call in calls:
+        print(2 * tab + call)
+    print('')
+    print(2 * tab + 'accept = 1;')
+    print(2 * tab + 'if (first) {')
+    if inter_log:
+        print(3 * tab + '// Store logged intermediary variables at the start of the step')
+        print(3 * tab + 'for (i=0; i<n_inter; i++) i0[i] = inter_log[of2 + i];')
+    print(3 * tab + 'first = 0;')
+    print(2 * tab + '} else {')
+    print(3 * tab + '// Estimate local error of the last substep')
+    print(3 * tab + 'err = 0;')
+    for k, var in enumerate(fe_states):
+        print(3 * tab + 'e = fabs(' + v(var.lhs()) + ' - f0[' + str(var.indice())
+              + ']) / (MR_ABS_TOL + MR_REL_TOL * fabs(' + v(var) + '));')
+        print(3 * tab + 'if (e > err) err = e;')
+    print(3 * tab + 'err *= 0.5f * h;')
+    print(3 * tab + 'if (err > 1 && level < MR_MAX_LEVEL) {')
+    print(4 * tab + '// Reject, and retry with half the step size')
+    print(4 * tab + 'accept = 0;')
+    print(4 * tab + 'level++;')
+    print(3 * tab + '} else {')
+    print(4 * tab + '// Accept, and stop at the end of the step')
+    print(4 * tab + 'pos += 1u << (MR_MAX_LEVEL - level);')
+    print(4 * tab + 'if (pos == (1u << MR_MAX_LEVEL)) break;')
+    print(4 * tab + '// Double the step size if the error is small, and the new')
+    print(4 * tab + '// substep stays aligned with the end of the step')
+    print(4 * tab + 'if (err < 0.25f && level > 0 && pos % (2u << (MR_MAX_LEVEL - level)) == 0) level--;')
+    print(3 * tab + '}')
+    print(2 * tab + '}')
+    print('')
+    print(2 * tab + '// Store state and derivatives at the start of the next substep')
+    print(2 * tab + 'if (accept) {')
+    print(3 * tab + 'for (i=0; i<n_state; i++) x0[i] = state[of1 + i];')
+    for var in fe_states:
+        print(3 * tab + 'f0[' + str(var.indice()) + '] = ' + v(var.lhs()) + ';')
+    for k, var in enumerate(rl_list):
         inf, tau = rl_states[var]
-        inf, tau, var = v(inf), v(tau), v(var)
-        print(tab + var + ' = ' + inf + ' - (' + inf + ' - ' + var + ') * exp(-dt / ' + tau + ');')
-    else:
-        print(tab + v(var) + ' += dt * ' + v(var.lhs()) + ';')
+        print(3 * tab + 'r0[' + str(2 * k) + '] = ' + v(inf) + ';')
+        print(3 * tab + 'r0[' + str(2 * k + 1) + '] = ' + v(tau) + ';')
+    print(2 * tab + '}')
+    print('')
+    print(2 * tab + '// Take a substep')
+    print(2 * tab + 'h = dt / (Real)(1u << level);')
+    print(2 * tab + 'time = time_in + dt * (Real)(pos + (1u << (MR_MAX_LEVEL - level))) / (Real)(1u << MR_MAX_LEVEL);')
+    for var in fe_states:
+        i = str(var.indice())
+        print(2 * tab + v(var) + ' = x0[' + i + '] + h * f0[' + i + '];')
+    for k, var in enumerate(rl_list):
+        i = str(var.indice())
+        inf, tau = 'r0[' + str(2 * k) + ']', 'r0[' + str(2 * k + 1) + ']'
+        print(2 * tab + v(var) + ' = ' + inf + ' - (' + inf + ' - x0[' + i + ']) * exp(-h / ' + tau + ');')
+    print(tab + '}')
+    if inter_log:
+        print('')
+        print(tab + '// Restore logged intermediary variables at the start of the step')
+        print(tab + 'for (i=0; i<n_inter; i++) inter_log[of2 + i] = i0[i];')
 
 ?>
 }
 
+/*
+ * Log gathering kernel.
+ * Copies logged values from a state, diffusion current, or intermediary
+ * variable vector into a compact vector, so that only the logged values need
+ * to be sent to the host.
+ *
+ * Arguments
+ *  count  : The number of values to copy
+ *  offset : The position of the first value in the index and output vectors
+ *  index  : The position of each logged value in its source vector
+ *  source : The vector to copy from
+ *  output : The vector to copy to
+ */
+__kernel void log_gather(
+    const unsigned long count,
+    const unsigned long offset,
+    const __global unsigned long* index,
+    const __global Real* source,
+    __global Real* output)
+{
+    const unsigned long i = get_global_id(0);
+    if(i >= count) return;
+    output[offset + i] = source[index[offset + i]];
+}
+
+/*
+ * Halo scattering kernel.
+ * Copies values received from another device into the state vector, so that
+ * the membrane potentials of neighbouring cells simulated on other devices
+ * are available to the diffusion kernels.
+ *
+ * Arguments
+ *  count  : The number of values to copy
+ *  index  : The position of each value in the output vector
+ *  source : The vector to copy from
+ *  output : The vector to copy to
+ */
+__kernel void halo_scatter(
+    const unsigned long count,
+    const __global unsigned long* index,
+    const __global Real* source,
+    __global Real* output)
+{
+    const unsigned long i = get_global_id(0);
+    if(i >= count) return;
+    output[index[i]] = source[i];
+}
+
+<?
+if apd:
+    print("""
+/*
+ * APD detection kernel.
+ * Checks if the membrane potential crossed a fixed threshold during the last
+ * step, and stores the start and duration of every completed action
+ * potential.
+ *
+ * Arguments
+ *  nx        : The number of cells in the x-direction
+ *  ny        : The number of cells in the y-direction
+ *  time      : The time at the start of the last step
+ *  dt        : The size of the last step
+ *  threshold : The threshold defining an action potential
+ *  capacity  : The maximum number of action potentials to store
+ *  state     : The state vector, after the last step
+ *  vm_last   : The membrane potential before the last step
+ *  active    : Flags set to 1 for cells in an action potential
+ *  start     : The start time of the current action potential in each cell
+ *  count     : The number of detected action potentials
+ *  cell      : The cell index of every detected action potential
+ *  apd       : The start and duration of every detected action potential
+ *  offset    : The global index of the first cell stored in the vectors
+ */
+__kernel void apd_step(
+    const unsigned long nx,
+    const unsigned long ny,
+    const Real time,
+    const Real dt,
+    const Real threshold,
+    const unsigned int capacity,
+    const __global Real* state,
+    __global Real* vm_last,
+    __global unsigned int* active,
+    __global Real* start,
+    volatile __global unsigned int* count,
+    __global unsigned int* cell,
+    __global Real* apd,
+    const unsigned long offset)
+{
+    const unsigned long ix = get_global_id(0);
+    const unsigned long iy = get_global_id(1);
+    if(ix >= nx) return;
+    if(iy >= ny) return;
+
+    const unsigned long cid = ix + iy * nx;
+    const unsigned long lid = cid - offset;
+    const Real v0 = vm_last[lid];
+    const Real v1 = state[lid * n_state + i_vm];
+    vm_last[lid] = v1;
+
+    if (v0 < threshold && v1 >= threshold) {
+        // Upward crossing: start of an action potential
+        start[lid] = time + dt * (threshold - v0) / (v1 - v0);
+        active[lid] = 1;
+    } else if (v0 >= threshold && v1 < threshold && active[lid]) {
+        // Downward crossing: end of an action potential
+        const unsigned int k = atomic_inc(count);
+        if (k < capacity) {
+            cell[k] = (unsigned int)cid;
+            apd[2 * k] = start[lid];
+            apd[2 * k + 1] = time + dt * (threshold - v0) / (v1 - v0) - start[lid];
+        }
+        active[lid] = 0;
+    }
+}
+    """)
+?>
+
 <?
 if diffusion and (not connections) and (not heterogeneous):
     print("""
@@ -380,6 +605,7 @@ if diffusion and (not connections) and (not heterogeneous):
  *  gy    : The cell-to-cell conductance in the y direction
  *  state : The state vector
  *  idiff : The diffusion current vector
+ *  offset : The global index of the first cell stored in the vectors
  */
 __kernel void diff_step(
     const unsigned long nx,
@@ -387,7 +613,8 @@ __kernel void diff_step(
     const Real gx,
     const Real gy,
     const __global Real *state,
-    __global Real *idiff)
+    __global Real *idiff,
+    const unsigned long offset)
 {
     const unsigned long ix = get_global_id(0);
     const unsigned long iy = get_global_id(1);
@@ -395,7 +622,7 @@ __kernel void diff_step(
     if(iy >= ny) return;
 
     // Offset of this cell's Vm in the state vector
-    const unsigned long cid = ix + iy * nx;
+    const unsigned long cid = ix + iy * nx - offset;
     const unsigned long of1 = cid * n_state + i_vm;
 
     // Diffusion, x-direction
@@ -448,6 +675,10 @@ if heterogeneous:
  *  gy_field : The cell-to-cell conductances in the y direction
  *  state : The state vector
  *  idiff : The diffusion current vector
+ *  offset : The global index of the first cell stored in the vectors
+ *
+ * The conductance fields start at the first connection of the first stored
+ * row of cells (or, in 1d, of the first stored cell).
  */
 __kernel void diff_hetero(
     const unsigned long nx,
@@ -455,16 +686,19 @@ __kernel void diff_hetero(
     const __global Real* gx,
     const __global Real* gy,
     const __global Real *state,
-    __global Real *idiff)
+    __global Real *idiff,
+    const unsigned long offset)
 {
     const unsigned long ix = get_global_id(0);
     const unsigned long iy = get_global_id(1);
     if(ix >= nx) return;
     if(iy >= ny) return;
 
-    // Offset of this cell's Vm in the state vector
-    const unsigned long cid = ix + iy * nx;
+    // Offset of this cell's Vm in the state vector, and of the connections
+    // to the cell's left and bottom neighbours in the conductance fields.
+    const unsigned long cid = ix + iy * nx - offset;
     const unsigned long off = cid * n_state + i_vm;
+    const unsigned long ofx = cid - iy + offset / nx;
 
     // Current & voltage
     Real i = 0.0;
@@ -472,8 +706,8 @@ __kernel void diff_hetero(
 
     // Diffusion, x-direction
     if(nx > 1) {
-        if(ix > 0) { i += gx[cid - iy - 1] * (v - state[off - n_state]); }
-        if(ix < nx - 1) { i += gx[cid - iy] * (v - state[off + n_state]); }
+        if(ix > 0) { i += gx[ofx - 1] * (v - state[off - n_state]); }
+        if(ix < nx - 1) { i += gx[ofx] * (v - state[off + n_state]); }
     }
 
     // Diffusion, y-direction
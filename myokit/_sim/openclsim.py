@@ -8,12 +8,15 @@
 from __future__ import absolute_import, division
 from __future__ import print_function, unicode_literals
 
+import bisect
 import os
 import myokit
 import numpy as np
 import platform
 from collections import OrderedDict
 
+from myokit._sim.opencl import ProgramCache
+
 
 # Location of C and OpenCL sources
 SOURCE_FILE = 'openclsim.c'
@@ -262,8 +265,12 @@ class SimulationOpenCL(myokit.CModule):
         # Scalar fields
         self._fields = OrderedDict()
 
-        # Set default time step
+        # Simulate on a single device
+        self.set_devices()
+
+        # Set default time step, without multi-rate stepping
         self.set_step_size()
+        self.set_multi_rate()
 
         # Set initial time
         self._time = 0
@@ -905,7 +912,8 @@ class SimulationOpenCL(myokit.CModule):
         passed in as ``progress``. An optional description of the current
         simulation to use in the ProgressReporter can be passed in as `msg`.
         """
-        self._run(duration, myokit.LOG_NONE, 1, report_nan, progress, msg)
+        self._run(
+            duration, myokit.LOG_NONE, 1, report_nan, progress, msg, None)
         self._default_state = list(self._state)
 
     def remove_field(self, var):
@@ -930,7 +938,8 @@ class SimulationOpenCL(myokit.CModule):
         self._state = list(self._default_state)
 
     def run(self, duration, log=None, log_interval=1.0, report_nan=True,
-            progress=None, msg='Running SimulationOpenCL'):
+            progress=None, msg='Running SimulationOpenCL',
+            apd_threshold=None):
         """
         Runs a simulation and returns the logged results. Running a simulation
         has the following effects:
@@ -979,6 +988,15 @@ class SimulationOpenCL(myokit.CModule):
         For 2d simulations, the naming scheme ``x.y.name`` is used, for
         example ``0.0.membrane.V``.
 
+        Only the logged values are sent from the device to the host, so that
+        logging a subset of the cells can greatly reduce the time and memory
+        used for logging. For example, to log the membrane potential in every
+        10th cell of a rectangular region, use::
+
+            d = s.run(1000, log=['engine.time'] + [
+                str(x) + '.' + str(y) + '.membrane.V'
+                for x in range(100, 200, 10) for y in range(0, 50, 10)])
+
         A log entry will be made every time *at least* ``log_interval`` time
         units have passed. No guarantee is given about the exact time log
         entries will be made, but the value of any logged time variable is
@@ -995,18 +1013,137 @@ class SimulationOpenCL(myokit.CModule):
         the :class:`myokit.ProgressReporter` interface can be passed in.
         passed in as ``progress``. An optional description of the current
         simulation to use in the ProgressReporter can be passed in as `msg`.
+
+        To obtain activation times and action potential durations (APDs)
+        without logging the membrane potential, the argument
+        ``apd_threshold`` can be set to a fixed threshold level. Threshold
+        crossings of the membrane potential (which must be labelled as
+        ``membrane_potential``) are then detected on the device, and only the
+        completed action potentials are sent to the host. In this case, the
+        method returns a tuple ``(log, apds)``, where ``apds`` is a
+        :class:`myokit.DataLog` with entries ``x`` (and ``y`` for 2d
+        simulations), ``start``, and ``duration``, listing the cell index,
+        start time, and duration of each action potential, ordered by start
+        time. As in :meth:`myokit.Simulation.run()`, the start and end of each
+        action potential are defined by a fixed threshold, and are obtained
+        with linear interpolation between the steps.
          """
-        r = self._run(duration, log, log_interval, report_nan, progress, msg)
+        r = self._run(
+            duration, log, log_interval, report_nan, progress, msg,
+            apd_threshold)
         self._time += duration
         return r
 
-    def _run(self, duration, log, log_interval, report_nan, progress, msg):
+    def _domains(self):
+        """
+        Divides the cells over the devices set with :meth:`set_devices`, and
+        returns a tuple ``(domains, copies)`` describing the division.
+
+        Each domain is a tuple ``(lo, hi, offset, n_local, halo, export,
+        connections)``. Cells ``lo <= i < hi`` are simulated on the domain's
+        device, which stores ``n_local`` cells. For rectangular grids, cell
+        ``i`` is stored at local index ``i - offset``. For arbitrary
+        geometries, ``offset = lo`` and the halo cells are stored after the
+        simulated cells. The list ``halo`` contains the local indices of the
+        cells simulated on other devices, ``export`` contains the local
+        indices of cells needed by other devices, and ``connections`` is a
+        list of connections using local indices (or ``None``).
+
+        Each copy is a tuple ``(src, dst, src_offset, dst_offset, count)``,
+        indicating that ``count`` values starting at ``src_offset`` in the
+        export list of domain ``src`` are copied to the halo of domain
+        ``dst``, starting at ``dst_offset``.
+        """
+        n = self._devices
+        if n == 1:
+            return [(0, self._ntotal, 0, self._ntotal, [], [],
+                     self._connections)], []
+
+        # Divide the cells (or rows, in 2d) into blocks
+        w = self._nx if len(self._dims) == 2 else 1
+        m = self._ntotal // w
+        bounds = [w * ((m * k) // n) for k in range(n + 1)]
+
+        # Find the halo cells of each domain (as global indices), and their
+        # positions in local storage
+        offsets, sizes, halos, positions, conns = [], [], [], [], []
+        for k in range(n):
+            lo, hi = bounds[k], bounds[k + 1]
+            if not self._diffusion_enabled:
+                offset, top, halo, local = lo, hi, [], None
+            elif self._connections is None:
+                offset = max(lo - w, 0)
+                top = min(hi + w, self._ntotal)
+                halo = list(range(offset, lo)) + list(range(hi, top))
+                local = None
+            else:
+                halo = set()
+                for i, j, c in self._connections:
+                    if lo <= i < hi and not lo <= j < hi:
+                        halo.add(j)
+                    elif lo <= j < hi and not lo <= i < hi:
+                        halo.add(i)
+                halo = sorted(halo)
+                offset, top = lo, hi + len(halo)
+                local = dict((g, hi + q) for q, g in enumerate(halo))
+
+            offsets.append(offset)
+            sizes.append(top - offset)
+            halos.append(halo)
+            if local is None:
+                positions.append([g - offset for g in halo])
+                conns.append(self._connections)
+            else:
+                positions.append([local[g] - offset for g in halo])
+                cs = []
+                for i, j, c in self._connections:
+                    if lo <= i < hi or lo <= j < hi:
+                        i = i - lo if lo <= i < hi else local[i] - lo
+                        j = j - lo if lo <= j < hi else local[j] - lo
+                        cs.append((i, j, c))
+                conns.append(cs)
+
+        # Set up copies from the domains that simulate each halo cell. The
+        # halo lists are sorted, so that cells with the same owner are
+        # consecutive.
+        exports = [[] for k in range(n)]
+        copies = []
+        for k, halo in enumerate(halos):
+            q = 0
+            while q < len(halo):
+                e = bisect.bisect_right(bounds, halo[q]) - 1
+                r = q
+                while r < len(halo) and halo[r] < bounds[e + 1]:
+                    r += 1
+                copies.append((e, k, len(exports[e]), q, r - q))
+                exports[e].extend([g - offsets[e] for g in halo[q:r]])
+                q = r
+
+        domains = []
+        for k in range(n):
+            domains.append((
+                bounds[k], bounds[k + 1], offsets[k], sizes[k], positions[k],
+                exports[k], conns[k]))
+        return domains, copies
+
+    def _run(self, duration, log, log_interval, report_nan, progress, msg,
+             apd_threshold):
         # Simulation times
         if duration < 0:
             raise ValueError('Simulation time can\'t be negative.')
         tmin = self._time
         tmax = tmin + duration
 
+        # APD detection
+        apd_data = None
+        if apd_threshold is not None:
+            if self._vm is None:
+                raise ValueError(
+                    'APD detection requires the membrane potential variable'
+                    ' to be labelled as "membrane_potential".')
+            apd_threshold = float(apd_threshold)
+            apd_data = []
+
         # Gather global variables in model
         g = []
         for label in self._global:
@@ -1055,6 +1192,8 @@ class SimulationOpenCL(myokit.CModule):
             'connections': self._connections is not None,
             'heterogeneous': self._gx_field is not None,
             'fiber_tissue': False,
+            'apd': apd_threshold is not None,
+            'multi_rate': self._multi_rate,
         }
         kernel = self._export(kernel_file, args)
 
@@ -1082,6 +1221,9 @@ class SimulationOpenCL(myokit.CModule):
                     'The argument "progress" must be either a subclass of'
                     ' myokit.ProgressReporter or None.')
 
+        # Divide cells over devices
+        domains, copies = self._domains()
+
         # Run simulation
         arithmetic_error = False
         if duration > 0:
@@ -1110,6 +1252,12 @@ class SimulationOpenCL(myokit.CModule):
                 log_interval,
                 [x.qname().encode('ascii') for x in inter_log],
                 field_data,
+                apd_threshold,
+                apd_data,
+                ProgramCache.create(),
+                self._fission,
+                domains,
+                copies,
             )
             t = tmin
             try:
@@ -1265,8 +1413,20 @@ class SimulationOpenCL(myokit.CModule):
                 txt.append(str(e))
             raise myokit.SimulationError('\n'.join(txt))
 
-        # Return log
-        return log
+        # Return log, or log and APDs
+        if apd_threshold is None:
+            return log
+        apds = myokit.DataLog()
+        apd_data.sort(key=lambda x: x[1])
+        cells = [x[0] for x in apd_data]
+        if len(self._dims) == 1:
+            apds['x'] = cells
+        else:
+            apds['x'] = [i % self._nx for i in cells]
+            apds['y'] = [i // self._nx for i in cells]
+        apds['start'] = [x[1] for x in apd_data]
+        apds['duration'] = [x[2] for x in apd_data]
+        return log, apds
 
     def set_conductance(self, gx=10, gy=5):
         """
@@ -1477,6 +1637,46 @@ class SimulationOpenCL(myokit.CModule):
         """
         self._default_state = self._set_state(state, x, y, self._default_state)
 
+    def set_devices(self, count=1, fission=False):
+        """
+        Divides the simulation over ``count`` OpenCL devices.
+
+        By default, all cells are simulated on a single device. If ``count``
+        is greater than one, the cells are divided into ``count`` blocks of
+        roughly equal size, each of which is simulated on a different device.
+        In 1d, each block is a run of consecutive cells, while in 2d each
+        block consists of whole rows. For geometries set with
+        :meth:`set_connections`, blocks are runs of consecutive cell indices,
+        so that less data needs to be exchanged if connected cells have
+        nearby indices.
+
+        Each device stores the cells in its block, plus a "halo" of
+        neighbouring cells simulated on other devices. Before every diffusion
+        step, the membrane potentials of the halo cells are copied from the
+        devices that simulate them. Logging, APD detection, and all other
+        features work as they do on a single device.
+
+        The first device is the one selected with :class:`myokit.OpenCL`, and
+        the remaining devices are taken from the same platform. Alternatively,
+        set ``fission=True`` to divide the selected device into ``count``
+        equally sized sub-devices (this requires a device that supports
+        OpenCL device fission).
+        """
+        count = int(count)
+        if count < 1:
+            raise ValueError('The number of devices must be at least 1.')
+        if len(self._dims) == 2:
+            if count > self._ny:
+                raise ValueError(
+                    'The number of devices cannot exceed the number of rows'
+                    ' (' + str(self._ny) + ').')
+        elif count > self._nx:
+            raise ValueError(
+                'The number of devices cannot exceed the number of cells'
+                ' (' + str(self._nx) + ').')
+        self._devices = count
+        self._fission = bool(fission)
+
     def set_field(self, var, values):
         """
         Can be used to replace a model constant with a scalar field.
@@ -1516,6 +1716,47 @@ class SimulationOpenCL(myokit.CModule):
         # Add field
         self._fields[var] = list(values.reshape(self._nx * self._ny))
 
+    def set_multi_rate(self, levels=0, abs_tol=1e-3, rel_tol=1e-3):
+        """
+        Enables or disables multi-rate time stepping.
+
+        By default, every cell is updated with a single forward Euler (or
+        Rush-Larsen) step of the size set with :meth:`set_step_size`. If
+        ``levels`` is greater than zero, each cell can divide every step into
+        up to ``2**levels`` substeps instead. This allows the step size to be
+        increased, while cells with fast dynamics (e.g. during an upstroke)
+        are still updated with small steps. Diffusion currents are calculated
+        once per step, and held constant during the substeps.
+
+        The substeps are chosen separately for each cell, starting from a
+        single substep spanning the whole step. A substep of size ``h`` from
+        ``x0`` to ``x1`` is accepted if the estimated local error
+        ``h / 2 * |f(x1) - f(x0)|`` is less than ``abs_tol + rel_tol * |x1|``
+        for every state (excluding states updated with Rush-Larsen), or if
+        it has the smallest allowed size ``step_size / 2**levels``. Otherwise,
+        the substep is retried with half the size. After an accepted substep
+        with a small error, the substep size is doubled again.
+
+        Because each substep requires an extra model evaluation to estimate
+        the error, multi-rate stepping is most useful for long simulations in
+        which most cells are at rest most of the time. Note that the step
+        size set with :meth:`set_step_size` must still be small enough for
+        the (explicit) diffusion step to be stable.
+
+        To disable multi-rate stepping, call ``set_multi_rate()`` without
+        arguments.
+        """
+        levels = int(levels)
+        if levels < 0 or levels > 16:
+            raise ValueError('The number of levels must be in the range 0-16.')
+        abs_tol = float(abs_tol)
+        rel_tol = float(rel_tol)
+        if abs_tol <= 0:
+            raise ValueError('The absolute tolerance must be positive.')
+        if rel_tol < 0:
+            raise ValueError('The relative tolerance cannot be negative.')
+        self._multi_rate = (levels, abs_tol, rel_tol) if levels else None
+
     def set_paced_cells(self, nx=5, ny=5, x=0, y=0):
         """
         Sets the number of cells that will receive a stimulus from the pacing
@@ -308,6 +308,7 @@ ESys_Reset(ESys sys)
         next->period = next->operiod;
         next->multiplier = next->omultiplier;
         next->next = 0;
+        next++;
     }
 
     // Set up the event queue
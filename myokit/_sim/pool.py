@@ -0,0 +1,461 @@
+#
+# Process pool for running many single cell simulations in parallel.
+#
+# This file is part of Myokit.
+# See http://myokit.org for copyright, sharing, and licensing details.
+#
+from __future__ import absolute_import, division
+from __future__ import print_function, unicode_literals
+
+import os
+
+from collections import OrderedDict
+
+import numpy as np
+
+import myokit
+
+# Process pools and shared memory in Python 3
+try:
+    import concurrent.futures as futures
+except ImportError:     # pragma: no python 3 cover
+    futures = None
+try:
+    from multiprocessing import shared_memory
+except ImportError:     # pragma: no cover
+    shared_memory = None
+
+
+# Per-process simulation, created once by _init_worker
+_worker = None
+
+# Constants changed by the last job in this worker process
+_worker_changed = set()
+
+
+class SimulationPool(object):
+    """
+    Runs :class:`myokit.Simulation` objects in a pool of worker processes.
+
+    Each worker process creates a single simulation when it starts, and then
+    reuses it for every job it receives, so that simulations are compiled at
+    most once per worker (and usually not at all, if a compiled module is
+    available from the on-disk cache in ``myokit.DIR_CACHE``). Jobs are
+    distributed using a :class:`concurrent.futures.ProcessPoolExecutor`, and
+    logged results are passed back to the main process via shared memory,
+    instead of as pickled lists.
+
+    Example::
+
+        with myokit.SimulationPool(model, protocol) as pool:
+            jobs = [pool.submit(1000, {'ikr.gKr': x}) for x in values]
+            logs = [job.result() for job in jobs]
+
+    Each job starts from the model's initial state at time 0, with the
+    constants and protocol from the model and protocol passed in to the pool
+    (unless explicitly changed for that job). Changes made by one job do not
+    affect any other jobs.
+
+    Arguments:
+
+    ``model``
+        The model to simulate.
+    ``protocol``
+        An optional :class:`myokit.Protocol` to use as the default protocol
+        for all jobs.
+    ``processes``
+        The number of worker processes to use. If not set, one process will be
+        started for every CPU core.
+
+    Pools should be shut down after use, either by calling :meth:`shutdown`,
+    or by using the pool as a context manager.
+
+    Pools are only available on Python 3. Results are returned without
+    shared memory on versions older than 3.8.
+    """
+    def __init__(self, model, protocol=None, processes=None):
+        if futures is None:     # pragma: no python 3 cover
+            raise RuntimeError(
+                'Simulation pools require the concurrent.futures module.')
+
+        # Check model and protocol
+        if not model.is_valid():
+            model.validate()
+        self._model = model.clone()
+        self._protocol = None if protocol is None else protocol.clone()
+
+        # Check processes
+        if processes is None:
+            processes = os.cpu_count() or 1
+        else:
+            processes = int(processes)
+            if processes < 1:
+                raise ValueError('Number of processes must be at least 1.')
+        self._processes = processes
+
+        # Start pool
+        self._pool = futures.ProcessPoolExecutor(
+            max_workers=processes,
+            initializer=_init_worker,
+            initargs=(self._model, self._protocol),
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+        return False
+
+    def map(self, duration, constants, chunksize=1, log=None,
+            log_interval=None, log_times=None, pre=None, protocol=None):
+        """
+        Runs a simulation for every entry in ``constants``, and returns an
+        iterator over the logged results.
+
+        The argument ``constants`` must be an iterable over dicts mapping
+        constants (variables or fully qualified names) to values. Jobs are
+        sent to the worker processes in chunks of ``chunksize``, which can
+        reduce communication overhead for short simulations.
+
+        All other arguments are passed to :meth:`submit`. Results are returned
+        in the same order as ``constants``. If any simulation fails, the
+        exception is raised when its result is retrieved from the iterator.
+        """
+        chunksize = int(chunksize)
+        if chunksize < 1:
+            raise ValueError('The chunk size must be at least 1.')
+        constants = [_check_constants(x) for x in constants]
+        log = _check_log(log)
+        jobs = []
+        for i in range(0, len(constants), chunksize):
+            jobs.append(self._pool.submit(
+                _run_chunk_worker, duration, constants[i:i + chunksize], log,
+                log_interval, log_times, pre, protocol))
+        return _iterate_logs(jobs)
+
+    def processes(self):
+        """ Returns the number of worker processes used by this pool. """
+        return self._processes
+
+    def run_batch(self, parameters, duration, constants, chunksize=None,
+                  log=None, log_interval=None, log_times=None):
+        """
+        Runs a simulation for every row in an ``(N, P)`` array of
+        ``parameters``, and returns the results as an ``OrderedDict`` of
+        ``(N, T)`` NumPy arrays.
+
+        This works like :meth:`myokit.Simulation.run_batch`, but divides the
+        rows over the worker processes, in chunks of ``chunksize`` rows. If
+        no ``chunksize`` is set, the rows are divided into four chunks per
+        process.
+
+        All simulations start from the model's initial state at time 0, and
+        rows for which a :class:`myokit.SimulationError` occurred are filled
+        with ``NaN``.
+        """
+        parameters = np.array(parameters, dtype=float, ndmin=2)
+        if parameters.ndim != 2:
+            raise ValueError('The argument `parameters` must be a 2d array.')
+        if parameters.shape[1] != len(constants):
+            raise ValueError(
+                'The number of columns in `parameters` must equal the number'
+                ' of constants.')
+        n = len(parameters)
+        if n == 0:
+            raise ValueError('The argument `parameters` cannot be empty.')
+        if chunksize is None:
+            chunksize = max(1, -(-n // (4 * self._processes)))
+        else:
+            chunksize = int(chunksize)
+            if chunksize < 1:
+                raise ValueError('The chunk size must be at least 1.')
+        constants = [
+            x.qname() if isinstance(x, myokit.Variable) else str(x)
+            for x in constants]
+        log = _check_log(log)
+
+        # Submit all chunks, then gather the results
+        jobs = []
+        for i in range(0, n, chunksize):
+            jobs.append(self._pool.submit(
+                _run_batch_worker, parameters[i:i + chunksize], duration,
+                constants, log, log_interval, log_times))
+        parts = []
+        try:
+            for job in jobs:
+                parts.append(_unpack(job.result()))
+        except BaseException:
+            _free_jobs(jobs[len(parts) + 1:], _unpack)
+            raise
+
+        # Stack results, making sure chunks that failed entirely fit in
+        t = max([x.shape[1] for p in parts for x in p.values()] or [0])
+        for p in parts:
+            for k, x in p.items():
+                if x.shape[1] != t:
+                    p[k] = np.full((len(x), t), np.nan)
+        return OrderedDict([
+            (k, np.concatenate([p[k] for p in parts])) for k in parts[0]])
+
+    def shutdown(self, wait=True):
+        """
+        Stops all worker processes. If ``wait`` is ``True``, this method
+        blocks until all pending jobs are completed.
+        """
+        self._pool.shutdown(wait=wait)
+
+    def submit(self, duration, constants=None, log=None, log_interval=None,
+               log_times=None, pre=None, protocol=None):
+        """
+        Schedules a single simulation, and returns a
+        :class:`concurrent.futures.Future` that will contain the logged
+        results as a :class:`myokit.DataLog`.
+
+        Arguments:
+
+        ``duration``
+            The time to simulate.
+        ``constants``
+            An optional dict mapping literal constants (variables or fully
+            qualified names) to the values to use in this simulation.
+        ``log``
+            The variables to log, see :meth:`myokit.Simulation.run`. Existing
+            :class:`myokit.DataLog` objects cannot be used.
+        ``log_interval``
+            An optional fixed size log interval, see
+            :meth:`myokit.Simulation.run`.
+        ``log_times``
+            An optional set of pre-determined logging times, see
+            :meth:`myokit.Simulation.run`.
+        ``pre``
+            An optional duration to pre-pace for (without logging) before
+            running the simulation.
+        ``protocol``
+            An optional :class:`myokit.Protocol` to use instead of the pool's
+            default protocol.
+
+        """
+        constants = _check_constants(constants)
+        log = _check_log(log)
+        job = self._pool.submit(
+            _run_worker, duration, constants, log, log_interval, log_times,
+            pre, protocol)
+
+        # Unpack the shared memory as soon as the result is in
+        future = futures.Future()
+
+        def job_done(job):
+            if job.cancelled():
+                future.cancel()
+                return
+            try:
+                result = _unpack_log(job.result())
+            except Exception as e:
+                if not future.cancelled():
+                    future.set_exception(e)
+            else:
+                if not future.cancelled():
+                    future.set_result(result)
+
+        def future_done(future):
+            if future.cancelled():
+                job.cancel()
+
+        job.add_done_callback(job_done)
+        future.add_done_callback(future_done)
+        return future
+
+
+def _check_constants(constants):
+    """ Checks a dict of constants, converting variables to qnames. """
+    if constants is None:
+        return {}
+    return dict([
+        (k.qname() if isinstance(k, myokit.Variable) else str(k), float(v))
+        for k, v in constants.items()])
+
+
+def _check_log(log):
+    """ Checks a log argument can be sent to a worker. """
+    if isinstance(log, myokit.DataLog):
+        raise ValueError(
+            'Existing DataLog objects cannot be used in simulation pools.')
+    if log is None or isinstance(log, int):
+        return log
+    return [x.qname() if isinstance(x, myokit.Variable) else str(x)
+            for x in log]
+
+
+def _free_jobs(jobs, unpack):
+    """
+    Cancels the given jobs or, if already running, waits for them to finish
+    and frees their shared memory using the given unpacking method.
+    """
+    for job in jobs:
+        if not job.cancel():
+            try:
+                unpack(job.result())
+            except Exception:
+                pass
+
+
+def _free_results(results):
+    """ Frees the memory used by a list of chunk results. """
+    for exception, packed in results:
+        if packed is not None:
+            _unpack_log(packed)
+
+
+def _init_worker(model, protocol):
+    """ Creates the simulation used by a worker process. """
+    global _worker
+    sim = myokit.Simulation(model, protocol)
+    _worker = (sim, model, protocol)
+
+
+def _iterate_logs(jobs):
+    """
+    Yields the logs from a list of jobs running :meth:`_run_chunk_worker`, and
+    frees the memory for any remaining results if iteration is stopped early.
+    """
+    results = []
+    try:
+        while jobs or results:
+            if not results:
+                results = list(jobs.pop(0).result())
+            exception, packed = results.pop(0)
+            if exception is not None:
+                raise exception
+            yield _unpack_log(packed)
+    finally:
+        _free_results(results)
+        _free_jobs(jobs, _free_results)
+
+
+def _pack(arrays):
+    """
+    Packs an ordered dict of arrays into a block of shared memory, and returns
+    a picklable description of the packed data.
+    """
+    layout = [(k, v.shape) for k, v in arrays.items()]
+    if shared_memory is None:   # pragma: no cover
+        return None, layout, [np.asarray(v) for v in arrays.values()]
+
+    size = sum([v.size for v in arrays.values()]) * 8
+    shm = shared_memory.SharedMemory(create=True, size=max(8, size))
+    try:
+        offset = 0
+        for v in arrays.values():
+            np.frombuffer(shm.buf, float, v.size, offset)[:] = v.ravel()
+            offset += v.size * 8
+        name = shm.name
+    finally:
+        shm.close()
+
+    # Ownership passes to the main process, which is responsible for freeing
+    # the memory: stop the resource tracker from freeing it when this process
+    # exits.
+    try:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    except Exception:   # pragma: no cover
+        pass
+
+    return name, layout, None
+
+
+def _unpack(packed):
+    """
+    Unpacks arrays packed by :meth:`_pack`, and frees the shared memory used.
+    """
+    name, layout, arrays = packed
+    if name is None:    # pragma: no cover
+        return OrderedDict([(k, a) for (k, s), a in zip(layout, arrays)])
+
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        out = OrderedDict()
+        offset = 0
+        for key, shape in layout:
+            n = int(np.prod(shape))
+            out[key] = np.frombuffer(
+                shm.buf, float, n, offset).reshape(shape).copy()
+            offset += n * 8
+    finally:
+        shm.close()
+        shm.unlink()
+    return out
+
+
+def _unpack_log(packed):
+    """ Unpacks a log packed by :meth:`_run_worker`. """
+    time_key, packed = packed
+    log = myokit.DataLog(time=time_key)
+    for k, v in _unpack(packed).items():
+        log[k] = v
+    return log
+
+
+def _reset_worker(constants, protocol):
+    """
+    Resets the worker simulation to the model's initial state, constants, and
+    protocol, then sets the given constants and protocol.
+    """
+    global _worker_changed
+    sim, model, default_protocol = _worker
+    sim.set_default_state(model.state())
+    sim.reset()
+    sim.set_protocol(default_protocol if protocol is None else protocol)
+
+    # Restore constants changed by the previous job, then set new ones
+    for name in _worker_changed:
+        sim.set_constant(name, model.get(name).eval())
+    _worker_changed = set()
+    for name, value in constants.items():
+        _worker_changed.add(name)
+        sim.set_constant(name, value)
+    return sim
+
+
+def _run_chunk_worker(duration, constants, log, log_interval, log_times, pre,
+                      protocol):
+    """
+    Runs a simulation for every dict in ``constants``, and returns a list of
+    tuples ``(exception, result)``.
+    """
+    results = []
+    try:
+        for x in constants:
+            try:
+                results.append((None, _run_worker(
+                    duration, x, log, log_interval, log_times, pre,
+                    protocol)))
+            except myokit.MyokitError as e:
+                results.append((e, None))
+    except BaseException:
+        _free_results(results)
+        raise
+    return results
+
+
+def _run_worker(duration, constants, log, log_interval, log_times, pre,
+                protocol):
+    """ Runs a single simulation in a worker process. """
+    sim = _reset_worker(constants, protocol)
+    if pre:
+        sim.pre(pre)
+    d = sim.run(duration, log=log, log_interval=log_interval,
+                log_times=log_times, log_numpy=True, progress=False)
+    if isinstance(d, tuple):
+        d = d[0]
+    return d.time_key(), _pack(d)
+
+
+def _run_batch_worker(parameters, duration, constants, log, log_interval,
+                      log_times):
+    """ Runs a batch of simulations in a worker process. """
+    sim = _reset_worker({}, None)
+    return _pack(sim.run_batch(
+        parameters, duration, constants, log=log, log_interval=log_interval,
+        log_times=log_times, progress=False))
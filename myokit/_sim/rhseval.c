@@ -0,0 +1,156 @@
+<?
+# rhseval.c
+#
+# A pype template for a module that evaluates a model's right-hand side (state
+# derivatives and intermediary variables) for one or more states.
+#
+# Note: For compatibility with older Python versions on windows, we need to
+# stick to a slightly outdated C standard (i.e. C90).
+#
+# Required variables
+# -----------------------------------------------------------------------------
+# module_name     A module name
+# model_code      Code for a CModel
+# -----------------------------------------------------------------------------
+#
+# This file is part of Myokit.
+# See http://myokit.org for copyright, sharing, and licensing details.
+#
+?>
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include <stdio.h>
+
+/* The CModel uses the sundials type for real numbers */
+typedef double realtype;
+
+<?= model_code ?>
+
+/* Number of inputs per point: time, pace, realtime, evaluations */
+#define N_INPUTS 4
+
+/* Model, created when first needed */
+static Model model = NULL;
+
+/*
+ * Evaluates the derivatives, and optionally the intermediary variables, for a
+ * batch of K points.
+ *
+ * Arguments: states (K x n_states), inputs (K x N_INPUTS), derivatives
+ * (K x n_states, output), intermediary variables (K x n_intermediary, or empty
+ * to skip, output), and K.
+ */
+static PyObject*
+evaluate(PyObject* self, PyObject* args)
+{
+    int i;
+    Py_ssize_t k, nk;
+    Py_buffer b_state, b_input, b_deriv, b_inter;
+    realtype *x, *u, *f, *a;
+    Model_Flag flag;
+
+    /* Check input arguments */
+    if (!PyArg_ParseTuple(args, "y*y*w*w*n",
+            &b_state,
+            &b_input,
+            &b_deriv,
+            &b_inter,
+            &nk
+            )) {
+        /* Any buffers obtained are released by PyArg_ParseTuple */
+        return 0;
+    }
+
+    /* Create model */
+    if (model == NULL) {
+        model = Model_Create(&flag);
+        if (flag != Model_OK) {
+            PyBuffer_Release(&b_state);
+            PyBuffer_Release(&b_input);
+            PyBuffer_Release(&b_deriv);
+            PyBuffer_Release(&b_inter);
+            Model_SetPyErr(flag);
+            return 0;
+        }
+    }
+
+    /* Check buffer sizes */
+    if (nk < 0
+            || b_state.len != (Py_ssize_t)(nk * model->n_states * sizeof(realtype))
+            || b_input.len != (Py_ssize_t)(nk * N_INPUTS * sizeof(realtype))
+            || b_deriv.len != (Py_ssize_t)(nk * model->n_states * sizeof(realtype))
+            || (b_inter.len != 0 && b_inter.len != (Py_ssize_t)(nk * model->n_intermediary * sizeof(realtype)))) {
+        PyBuffer_Release(&b_state);
+        PyBuffer_Release(&b_input);
+        PyBuffer_Release(&b_deriv);
+        PyBuffer_Release(&b_inter);
+        PyErr_SetString(PyExc_ValueError, "Incorrect buffer sizes.");
+        return 0;
+    }
+    x = (realtype*)b_state.buf;
+    u = (realtype*)b_input.buf;
+    f = (realtype*)b_deriv.buf;
+    a = (realtype*)b_inter.buf;
+
+    /* Run! */
+    for (k=0; k<nk; k++) {
+        Model_SetBoundVariables(model,
+            u[k * N_INPUTS], u[k * N_INPUTS + 1],
+            u[k * N_INPUTS + 2], u[k * N_INPUTS + 3]);
+        Model_SetStates(model, x + k * model->n_states);
+        Model_EvaluateDerivatives(model);
+        for (i=0; i<model->n_states; i++) {
+            f[k * model->n_states + i] = model->derivatives[i];
+        }
+        if (b_inter.len != 0) {
+            for (i=0; i<model->n_intermediary; i++) {
+                a[k * model->n_intermediary + i] = model->intermediary[i];
+            }
+        }
+    }
+
+    /* Finished succesfully, clean up and return */
+    PyBuffer_Release(&b_state);
+    PyBuffer_Release(&b_input);
+    PyBuffer_Release(&b_deriv);
+    PyBuffer_Release(&b_inter);
+    Py_RETURN_NONE;
+}
+
+/*
+ * Methods in this module
+ */
+static PyMethodDef SimMethods[] = {
+    {"evaluate", evaluate, METH_VARARGS, "Evaluates the right-hand side for a batch of points."},
+    {NULL},
+};
+
+/*
+ * Module definition
+ */
+#if PY_MAJOR_VERSION >= 3
+
+    static struct PyModuleDef moduledef = {
+        PyModuleDef_HEAD_INIT,
+        "<?= module_name ?>",       /* m_name */
+        "Generated RHS evaluation module",   /* m_doc */
+        -1,                         /* m_size */
+        SimMethods,                 /* m_methods */
+        NULL,                       /* m_reload */
+        NULL,                       /* m_traverse */
+        NULL,                       /* m_clear */
+        NULL,                       /* m_free */
+    };
+
+    PyMODINIT_FUNC PyInit_<?=module_name?>(void) {
+        return PyModule_Create(&moduledef);
+    }
+
+#else
+
+    PyMODINIT_FUNC
+    init<?=module_name?>(void) {
+        (void) Py_InitModule("<?= module_name ?>", SimMethods);
+    }
+
+#endif
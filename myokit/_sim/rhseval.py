@@ -0,0 +1,195 @@
+#
+# Compiled right-hand-side evaluation, sharing the CModel code.
+#
+# This file is part of Myokit.
+# See http://myokit.org for copyright, sharing, and licensing details.
+#
+from __future__ import absolute_import, division
+from __future__ import print_function, unicode_literals
+
+import os
+import platform
+
+import numpy as np
+import myokit
+
+# Location of C source file
+SOURCE_FILE = 'rhseval.c'
+
+# Inputs provided to the model, in the order used by the back-end
+_INPUTS = ('time', 'pace', 'realtime', 'evaluations')
+
+
+class RhsEvaluator(myokit.CModule):
+    """
+    Evaluates a model's right-hand side (the state derivatives and, optionally,
+    the intermediary variables) using compiled C code.
+
+    An ``RhsEvaluator`` provides the same results as
+    :meth:`myokit.Model.evaluate_derivatives()`, but is much faster, and can
+    evaluate a whole batch of states in a single call. This makes it suitable
+    for use inside optimisers and root finders.
+
+    The evaluator is most easily obtained by calling
+    :meth:`myokit.Model.compile_rhs()`, which caches the compiled evaluator
+    until the model is changed. Instances can be called directly, as
+    ``f = evaluator(state)``, or via :meth:`evaluate()`.
+
+    The given model is cloned before use, so that the values of all constants
+    are fixed at the time of creation.
+
+    Variables bound to the external inputs ``time``, ``pace``, ``realtime``,
+    and ``evaluations`` can be set when evaluating. If no value is given, the
+    right-hand side of the bound variable is used (as in
+    :meth:`Model.evaluate_derivatives()`). Any other bindings are ignored.
+    """
+    _index = 0  # Unique id
+
+    def __init__(self, model):
+        super(RhsEvaluator, self).__init__()
+
+        # Require a valid model
+        if not model.is_valid():
+            model.validate()
+
+        # Clone model
+        self._model = model.clone()
+
+        # Default values for external inputs, taken from the bound variables'
+        # right-hand sides (these are replaced by the CModel)
+        self._inputs = np.zeros(len(_INPUTS))
+        for i, label in enumerate(_INPUTS):
+            var = self._model.binding(label)
+            if var is not None:
+                self._inputs[i] = var.rhs().eval()
+
+        # Generate C Model code
+        cmodel = myokit.CModel(self._model, None)
+
+        # Names of intermediary variables, in the order used by the CModel
+        self._intermediary = [
+            v.qname() for v in self._model.variables(inter=True, deep=True)]
+
+        # Extension module id
+        RhsEvaluator._index += 1
+        module_name = 'myokit_rhs_' + str(RhsEvaluator._index)
+        module_name += '_' + str(myokit.pid_hash())
+
+        # Template arguments
+        args = {
+            'module_name': module_name,
+            'model_code': cmodel.code,
+        }
+        fname = os.path.join(myokit.DIR_CFUNC, SOURCE_FILE)
+        del(cmodel)
+
+        # Define libraries
+        libs = []
+        if platform.system() != 'Windows':  # pragma: no windows cover
+            libs.append('m')
+
+        # Compile extension
+        libd = []
+        incd = [myokit.DIR_CFUNC]
+        self._ext = self._compile(module_name, fname, args, libs, libd, incd)
+
+    def __call__(self, state, inputs=None, out=None):
+        """
+        Evaluates and returns the state derivatives at ``state``.
+
+        See :meth:`evaluate()` for details.
+        """
+        return self.evaluate(state, inputs, out)[0]
+
+    def evaluate(
+            self, state, inputs=None, derivatives=None, intermediary=False):
+        """
+        Evaluates the right-hand side at the given ``state``, and returns a
+        tuple ``(derivatives, intermediary)``.
+
+        The order of the state variables must be that specified by the model
+        (i.e. the one obtained from calling :meth:`Model.states()`). To
+        evaluate many points at once, ``state`` can be given as a 2d array of
+        shape ``(K, n)``, where ``n`` is the number of states.
+
+        The returned ``derivatives`` have the same shape as ``state``. To
+        avoid allocating a new array on every call, a preallocated
+        C-contiguous array of floats of the correct shape can be passed in as
+        ``derivatives``, which will then be filled and returned.
+
+        By default, the intermediary variables are not returned, and the
+        second entry in the returned tuple is ``None``. To obtain them, set
+        ``intermediary=True``, or pass in a preallocated array of shape
+        ``(m, )`` or ``(K, m)``, where ``m`` is the number of intermediary
+        variables. The order of the intermediary variables is given by
+        :meth:`intermediary()`.
+
+        Values for external inputs can be set with ``inputs``, a dictionary
+        mapping binding labels (e.g. ``time`` or ``pace``) to either a single
+        value or, for batches, an array of ``K`` values.
+        """
+        # Check state vector
+        n = self._model.count_states()
+        try:
+            state = np.array(state, dtype=float, order='C', ndmin=1)
+        except (TypeError, ValueError):
+            raise ValueError('State vector must contain floats.')
+        if state.ndim > 2 or state.shape[-1] != n:
+            raise ValueError('State vector must have length ' + str(n) + '.')
+        shape = state.shape
+        k = 1 if state.ndim == 1 else shape[0]
+
+        # Create input array
+        u = np.empty((k, len(_INPUTS)))
+        u[:] = self._inputs
+        if inputs is not None:
+            for label, value in inputs.items():
+                if label in _INPUTS and self._model.binding(label) is not None:
+                    try:
+                        u[:, _INPUTS.index(label)] = value
+                    except (TypeError, ValueError):
+                        raise ValueError(
+                            'The value for input `' + str(label) + '` must be'
+                            ' a float or an array of ' + str(k) + ' floats.')
+
+        # Create or check output arrays
+        derivatives = self._output(derivatives, shape, 'derivatives')
+        if intermediary is False or intermediary is None:
+            intermediary = None
+        else:
+            m = len(self._intermediary)
+            intermediary = self._output(
+                None if intermediary is True else intermediary,
+                shape[:-1] + (m, ), 'intermediary')
+
+        # Evaluate
+        self._ext.evaluate(
+            state, u, derivatives,
+            np.empty(0) if intermediary is None else intermediary, k)
+        return derivatives, intermediary
+
+    def intermediary(self):
+        """
+        Returns a list containing the qualified names of the intermediary
+        variables, in the order used by :meth:`evaluate()`.
+        """
+        return list(self._intermediary)
+
+    def _output(self, array, shape, name):
+        """
+        Creates an output array of the given ``shape``, or checks that a
+        user-supplied ``array`` can be used.
+        """
+        if array is None:
+            return np.empty(shape)
+        if not (isinstance(array, np.ndarray) and array.dtype == float
+                and array.flags['C_CONTIGUOUS']
+                and array.flags['WRITEABLE']):
+            raise ValueError(
+                'The argument `' + name + '` must be a writable C-contiguous'
+                ' NumPy array of floats.')
+        if array.shape != shape:
+            raise ValueError(
+                'The argument `' + name + '` must have shape ' + str(shape)
+                + '.')
+        return array
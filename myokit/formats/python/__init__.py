@@ -9,6 +9,7 @@ from __future__ import print_function, unicode_literals
 
 from ._exporter import PythonExporter
 from ._ewriter import PythonExpressionWriter, NumPyExpressionWriter
+from ._ewriter import NumPyArrayExpressionWriter  # noqa
 
 # Importers
 # Exporters
@@ -250,3 +250,37 @@ class NumPyExpressionWriter(PythonExpressionWriter):
         s.append(')')
         return ''.join(s)
 
+
+class NumPyArrayExpressionWriter(NumPyExpressionWriter):
+    """
+    This :class:`ExpressionWriter <myokit.formats.ExpressionWriter>` translates
+    Myokit :class:`expressions <myokit.Expression>` to Python expressions that
+    are evaluated element-wise when used with NumPy arrays.
+
+    Unlike the :class:`NumPyExpressionWriter`, logical operators are written as
+    ``numpy.logical_not``, ``numpy.logical_and`` and ``numpy.logical_or``, and
+    conditional statements are written using ``numpy.where``, so that they can
+    be evaluated for arrays as well as for scalars.
+    """
+    def _ex_not(self, e):
+        return self._ex_function(e, 'logical_not')
+
+    def _ex_and(self, e):
+        return self._ex_function(e, 'logical_and')
+
+    def _ex_or(self, e):
+        return self._ex_function(e, 'logical_or')
+
+    def _ex_if(self, e):
+        return self._function_prefix + 'where(' + self.ex(e._i) + ', ' \
+            + self.ex(e._t) + ', ' + self.ex(e._e) + ')'
+
+    def _ex_piecewise(self, e):
+        n = len(e._i)
+        s = []
+        for i in range(n):
+            s.append(self._function_prefix + 'where(')
+            s.append(self.ex(e._i[i]) + ', ' + self.ex(e._e[i]) + ', ')
+        s.append(self.ex(e._e[n]))
+        s.append(')' * n)
+        return ''.join(s)
@@ -0,0 +1,86 @@
+#
+# Shared code for the analytical simulations in myokit.lib.hh and
+# myokit.lib.markov.
+#
+# This file is part of Myokit.
+# See http://myokit.org for copyright, sharing, and licensing details.
+#
+from __future__ import absolute_import, division
+from __future__ import print_function, unicode_literals
+
+import numpy as np
+import myokit
+
+
+def run_batch(sim, parameters, duration, log_interval, log_times, step):
+    """
+    Shared implementation of ``run_batch()`` for the analytical simulations in
+    :mod:`myokit.lib.markov` and :mod:`myokit.lib.hh`.
+
+    Checks the arguments, and then runs through the protocol (or fixed
+    membrane potential) of simulation ``sim``, calling
+    ``step(parameters, x, times, v)`` for each interval of constant voltage
+    ``v``. Here ``x`` is an array of shape ``(N, n)`` containing the state for
+    all parameter sets at the start of the interval, and ``times`` are the
+    times to evaluate at, relative to the interval start, with the interval
+    end as final entry. The method must return a tuple ``(current, x)``, with
+    the current at every time except the last, and the state at the last.
+
+    Returns an array of shape ``(N, T)`` containing the logged currents.
+    """
+    if not sim._has_current:
+        raise Exception(
+            'The used model did not specify a current variable.')
+
+    # Check arguments
+    parameters = np.asarray(parameters, dtype=float)
+    if parameters.ndim != 2 or (
+            parameters.shape[1] != len(sim._parameters)):
+        raise ValueError(
+            'Parameters must be given as an (N, P) array, where P is the'
+            ' number of parameters (' + str(len(sim._parameters)) + ').')
+    duration = float(duration)
+    if duration < 0:
+        raise ValueError('Duration must be non-negative.')
+    log_interval = float(log_interval)
+    if log_interval <= 0:
+        raise ValueError('Log interval must be greater than zero.')
+    if log_times is None:
+        log_times = sim._time + np.arange(0, duration, log_interval)
+    else:
+        log_times = np.asarray(log_times, dtype=float)
+
+    # Current and state for all parameter sets
+    current = np.zeros((len(parameters), len(log_times)))
+    x = np.tile(np.asarray(sim._state, dtype=float), (len(parameters), 1))
+
+    # Create pacing system
+    time = sim._time
+    tfinal = time + duration
+    if sim._protocol is None:
+        pacing = None
+        v = sim._membrane_potential
+    else:
+        pacing = myokit.PacingSystem(sim._protocol)
+        v = pacing.advance(time)
+
+    while True:
+        # Get times to evaluate at, including next time
+        if pacing is None:
+            tnext = tfinal
+            select = np.ones(log_times.shape, dtype=bool)
+        else:
+            tnext = min(tfinal, pacing.next_time())
+            select = np.logical_and(log_times >= time, log_times < tnext)
+        times = np.append(log_times[select], tnext) - time
+
+        # Evaluate for all parameter sets
+        current[:, select], x = step(parameters, x, times, v)
+
+        # Update pacing
+        time = tnext
+        if pacing is None or time >= tfinal:
+            break
+        v = pacing.advance(time)
+
+    return current
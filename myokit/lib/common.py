@@ -10,6 +10,8 @@
 from __future__ import absolute_import, division
 from __future__ import print_function, unicode_literals
 
+import copy
+
 import numpy as np
 import myokit
 
@@ -19,6 +21,12 @@ try:
 except NameError:   # pragma: no python 2 cover
     basestring = str
 
+# Thread pools in Python 3
+try:
+    import concurrent.futures as futures
+except ImportError:     # pragma: no python 3 cover
+    futures = None
+
 
 #
 # Deprecated since 2018-04-16
@@ -70,6 +78,8 @@ class StepProtocol(object):
         self._max_step_size = None
         # No simulation data yet
         self._logs = None
+        # Number of threads to use
+        self._threads = None
         # Holding potential & step potentials
         self.set_holding_potential()
         self.set_step_potential()
@@ -249,6 +259,20 @@ class StepProtocol(object):
         self._steps = np.arange(self._vmin, self._vmax + self._dv, self._dv)
         self._logs = None
 
+    def set_threads(self, threads=None):
+        """
+        Sets the number of threads used to simulate the voltage steps. Each
+        thread uses its own copy of the simulation.
+
+        By default (``threads=None``) a single simulation is used, and
+        experiments in which each step continues from the state reached in
+        the previous step (see :class:`Inactivation`) keep doing so. If a
+        number of threads is set, every step starts from the same state, so
+        that the steps are independent and can be simulated in parallel.
+        """
+        self._threads = None if threads is None else int(threads)
+        self._logs = None
+
     def steps(self):
         """
         Returns the list of steps this protocol will use.
@@ -339,6 +363,10 @@ class Activation(StepProtocol):
     The experiment is not performed until a call to one of the post-processing
     methods is made. After this, the raw data will be cached. Any change to the
     protocol variables after this point will delete the cached data.
+
+    The state reached at the holding potential is calculated only once, and
+    shared by all voltage steps. The steps can be simulated in parallel by
+    setting a number of threads with :meth:`set_threads()`.
     """
     def __init__(self, model, var, vvar=None):
         super(Activation, self).__init__(model, var, vvar)
@@ -348,17 +376,23 @@ class Activation(StepProtocol):
         Runs the experiment, logs during the voltage steps.
         """
         log = self._vars + [self._tvar]
-        s = myokit.Simulation(self._model)
-        d = []
-        for v in self._steps:
-            s.reset()
-            s.set_constant(self._vvar, self._vhold)
-            s.set_max_step_size(None)
-            s.pre(self._thold)
+        sims = _simulations(self._model, self._threads, len(self._steps))
+
+        # Get the state at the holding potential, shared by all steps
+        s = sims[0]
+        s.set_constant(self._vvar, self._vhold)
+        s.set_max_step_size(None)
+        s.pre(self._thold)
+        state = s.state()
+
+        def step(s, v):
+            s.set_state(state)
+            s.set_time(0)
             s.set_constant(self._vvar, v)
             s.set_max_step_size(self._max_step_size)
-            d.append(s.run(self._tstep, log=log))
-        self._logs = d
+            return s.run(self._tstep, log=log)
+
+        self._logs = _map(step, self._steps, sims)
 
 
 class Inactivation(StepProtocol):
@@ -397,6 +431,11 @@ class Inactivation(StepProtocol):
     The experiment is not performed until a call to one of the post-processing
     methods is made. After this, the raw data will be cached. Any change to the
     protocol variables after this point will delete the cached data.
+
+    By default, each step starts from the state reached at the end of the
+    previous step's pre-pacing. If a number of threads is set with
+    :meth:`set_threads()`, each step instead starts from the model's initial
+    state, so that the steps can be simulated in parallel.
     """
     def __init__(self, model, var, vvar=None):
         super(Inactivation, self).__init__(model, var, vvar)
@@ -406,15 +445,21 @@ class Inactivation(StepProtocol):
         Runs the simulation, saves the current traces.
         """
         log = self._vars + [self._tvar]
-        d = []
-        s = myokit.Simulation(self._model)
-        for v in self._steps:
-            s.reset()
+        sims = _simulations(self._model, self._threads, len(self._steps))
+        state = self._model.state()
+
+        def step(s, v):
+            if self._threads is None:
+                s.reset()
+            else:
+                s.set_state(state)
+                s.set_time(0)
             s.set_constant(self._vvar, v)
             s.pre(self._tstep)
             s.set_constant(self._vvar, self._vhold)
-            d.append(s.run(self._thold, log=log))
-        self._logs = d
+            return s.run(self._thold, log=log)
+
+        self._logs = _map(step, self._steps, sims)
 
     def set_holding_potential(self, vhold=-20, thold=50):
         """
@@ -478,6 +523,12 @@ class Recovery(object):
     ``I = Gmax * g * (V - E)``. Using conductance in this test rather than
     current avoids the numerical problems incurred by dividing ``I`` through
     ``(V-E)``.
+
+    By default, the experiments for all values of ``twait`` are run one after
+    the other, each continuing from the state reached in the previous one. If
+    a number of threads is set with :meth:`set_threads()`, the holding period
+    and first step are simulated only once, after which the remainder of the
+    experiment is simulated in parallel for each ``twait``.
     """
     def __init__(self, model, var, vvar=None):
         if not model.is_valid():
@@ -527,6 +578,9 @@ class Recovery(object):
         self.set_step_potential()
         self.set_pause_duration()
 
+        # Number of threads to use
+        self._threads = None
+
     def ratio(self):
         """
         Returns the ratios of the peak conductances (p1 / p2) for step 1 and
@@ -542,23 +596,44 @@ class Recovery(object):
         # Variables to log
         log_vars = [x.qname() for x in self._vars]
 
-        # Run simulations
+        # Create simulations
         self._vvar.set_rhs(self._vhold)     # Make V a constant
-        s = myokit.Simulation(self._model)
+        sims = _simulations(self._model, self._threads, len(twaits))
         log = myokit.DataLog()
         gvars = [x.qname() for x in self._vars]
         for g in gvars:
             log[g] = []
         log[self._tvar.qname()] = list(twaits)
-        for twait in twaits:
+
+        # Run holding period and first step
+        def first(s):
             s.set_constant(self._vvar, self._vhold)
             s.run(self._thold, log=myokit.LOG_NONE)
             s.set_constant(self._vvar, self._vstep)
-            d1 = s.run(self._tstep1, log=log_vars)
+            return s.run(self._tstep1, log=log_vars)
+
+        # Run pause and second step
+        def second(s, twait):
             s.set_constant(self._vvar, self._vhold)
             s.run(twait, log=myokit.LOG_NONE)
             s.set_constant(self._vvar, self._vstep)
-            d2 = s.run(self._tstep2, log=log_vars)
+            return s.run(self._tstep2, log=log_vars)
+
+        if self._threads is None:
+            # Run full experiment for every wait time, continuing from the
+            # state reached in the previous one
+            def step(s, twait):
+                return first(s), second(s, twait)
+        else:
+            # Share holding period and first step between wait times
+            d1 = first(sims[0])
+            state = sims[0].state()
+
+            def step(s, twait):
+                s.set_state(state)
+                return d1, second(s, twait)
+
+        for d1, d2 in _map(step, twaits, sims):
             for g in gvars:
                 ratio = np.max(d1[g])
                 ratio = np.nan if ratio == 0 else np.max(d2[g]) / ratio
@@ -606,6 +681,18 @@ class Recovery(object):
         self._tmax = tmax
         self._nt = nt
 
+    def set_threads(self, threads=None):
+        """
+        Sets the number of threads used to simulate the different pause
+        durations. Each thread uses its own copy of the simulation.
+
+        By default (``threads=None``) a single simulation is used, and each
+        experiment continues from the state reached in the previous one. If a
+        number of threads is set, the holding period and first step are
+        simulated once and shared by all pause durations.
+        """
+        self._threads = None if threads is None else int(threads)
+
     def set_step_potential(self, vstep=-20, tstep1=500, tstep2=25):
         """
         Sets the step potential and the step durations.
@@ -644,6 +731,11 @@ class Restitution(object):
         given, the method will look for the label ``membrane_potential``, if
         that's not found an exception is raised.
 
+    By default, each cycle length is tested starting from the state reached
+    during pre-pacing at the previous cycle length. If a number of threads is
+    set with :meth:`set_threads()`, each cycle length is instead tested
+    starting from the model's initial state, so that the cycle lengths can be
+    simulated in parallel.
     """
     def __init__(self, model, vvar=None):
         # Check model
@@ -671,6 +763,7 @@ class Restitution(object):
         self.set_beats()
         self.set_stimulus()
         self.set_threshold()
+        self.set_threads()
 
         # No data yet!
         self._data = None
@@ -688,28 +781,32 @@ class Restitution(object):
             'multiplier': 0,
         }
 
-        # Create simulation
-        s = myokit.Simulation(self._model)
-        s.set_max_step_size(self._max_step_size)
-
-        # Start testing
+        # Get cycle lengths to test
         i = 0
-        pcls = []
-        apds = []
+        cls = []
         c = self._clmax
         while c >= self._clmin:
-            # Update cycle length
             c = self._clmax - i * self._dcl
             i += 1
+            cls.append(c)
 
+        # Create simulations
+        sims = _simulations(self._model, self._threads, len(cls))
+        state = self._model.state()
+
+        def cycle(s, c):
             # Create and set new protocol
             p = myokit.Protocol()
-            e['period'] = c
-            p.schedule(**e)
+            p.schedule(**dict(e, period=c))
             s.set_protocol(p)
 
             # Run simulation
-            s.reset()
+            if self._threads is None:
+                s.reset()
+            else:
+                s.set_state(state)
+                s.set_time(0)
+            s.set_max_step_size(self._max_step_size)
             s.pre(c * self._pre_beats)
             d, a = s.run(
                 c * self._beats,
@@ -717,9 +814,13 @@ class Restitution(object):
                 apd_variable=self._vvar,
                 apd_threshold=self._apd_threshold
             )
+            return a['duration']
 
-            # Save apds
-            for apd in a['duration']:
+        # Start testing, save apds
+        pcls = []
+        apds = []
+        for c, durations in zip(cls, _map(cycle, cls, sims)):
+            for apd in durations:
                 pcls.append(c)
                 apds.append(apd)
 
@@ -810,6 +911,19 @@ class Restitution(object):
         self._apd_threshold = float(threshold)
         self._data = None
 
+    def set_threads(self, threads=None):
+        """
+        Sets the number of threads used to simulate the different cycle
+        lengths. Each thread uses its own copy of the simulation.
+
+        By default (``threads=None``) a single simulation is used, and each
+        cycle length is tested starting from the state reached during
+        pre-pacing at the previous one. If a number of threads is set, every
+        cycle length starts from the model's initial state.
+        """
+        self._threads = None if threads is None else int(threads)
+        self._data = None
+
     def set_times(self, clmin=300, clmax=1200, dcl=20):
         """
         Sets the pacing cycle lengths tested in this experiment.
@@ -855,6 +969,8 @@ class StrengthDuration(object):
         given as ``None``), the method will search for a variable labeled as
         ``membrane_potential``.
 
+    The stimulus durations can be tested in parallel by setting a number of
+    threads with :meth:`set_threads()`.
     """
     def __init__(self, model, ivar, vvar=None):
         # Clone model
@@ -922,6 +1038,7 @@ class StrengthDuration(object):
         self.set_precision()
         self.set_threshold()
         self.set_times()
+        self.set_threads()
 
         # No data yet!
         self._data = None
@@ -941,84 +1058,87 @@ class StrengthDuration(object):
         """
         Inner version of run()
         """
+        # Create simulations
+        durations = np.array(self._durations, copy=True)
+        sims = _simulations(self._model, self._threads, len(durations))
+
+        # Test every duration
+        amplitudes = _map(
+            lambda s, duration: self._test(s, duration, debug),
+            durations, sims)
+
+        # Set output data
+        self._data = myokit.DataLog()
+        self._data['duration'] = durations
+        self._data['strength'] = np.array(amplitudes)
+
+    def _test(self, s, duration, debug=False):
+        """
+        Finds the minimum amplitude required for a depolarisation at the given
+        stimulus ``duration``, using simulation ``s``.
+        """
         if debug:
             import traceback
-
-        # Create simulation
-        s = myokit.Simulation(self._model)
+            print('Testing duration: ' + str(duration))
 
         # Variables to log
         vvar = self._vvar.qname()
 
-        # Output data
-        durations = np.array(self._durations, copy=True)
-        amplitudes = np.zeros(durations.shape)
-
-        # Test every duration
-        for k, duration in enumerate(durations):
+        s.set_protocol(myokit.pacing.blocktrain(self._time + 1, duration))
+        a1 = self._amin
+        a2 = self._amax
+
+        # Test minimum amplitude
+        s.reset()
+        s.set_constant(self._avar, a1)
+        try:
+            d = s.run(self._time, log=[vvar]).npview()
+            t1 = (np.max(d[vvar]) > self._threshold)
+        except Exception:
             if debug:
-                print('Testing duration: ' + str(duration))
-            s.set_protocol(myokit.pacing.blocktrain(self._time + 1, duration))
-            a1 = self._amin
-            a2 = self._amax
-
-            # Test minimum amplitude
-            s.reset()
-            s.set_constant(self._avar, a1)
-            try:
-                d = s.run(self._time, log=[vvar]).npview()
-                t1 = (np.max(d[vvar]) > self._threshold)
-            except Exception:
-                if debug:
-                    traceback.print_exc()
-                t1 = False
+                traceback.print_exc()
+            t1 = False
+        if debug:
+            print(t1)
+
+        # Test maximum amplitude
+        s.reset()
+        s.set_constant(self._avar, a2)
+        try:
+            d = s.run(self._time, log=[vvar]).npview()
+            t2 = (np.max(d[vvar]) > self._threshold)
+        except Exception:
+            if debug:
+                traceback.print_exc()
+            t2 = False
+        if debug:
+            print(t2)
+        if t1 == t2:
+            # No zero crossing found
             if debug:
-                print(t1)
+                print('> no zero crossing')
+            return np.nan
 
-            # Test maximum amplitude
+        # Zero must lie in between. Start bisection search
+        a = 0.5 * a1 + 0.5 * a2
+        for j in range(0, self._precision):
             s.reset()
-            s.set_constant(self._avar, a2)
+            s.set_constant(self._avar, a)
             try:
                 d = s.run(self._time, log=[vvar]).npview()
-                t2 = (np.max(d[vvar]) > self._threshold)
             except Exception:
                 if debug:
                     traceback.print_exc()
-                t2 = False
-            if debug:
-                print(t2)
-            if t1 == t2:
-                # No zero crossing found
-                amplitudes[k] = np.nan
-                if debug:
-                    print('> no zero crossing')
-                continue
-
-            # Zero must lie in between. Start bisection search
+                break
+            t = (np.max(d[vvar]) > self._threshold)
+            if t1 == t:
+                a1 = a
+            else:
+                a2 = a
             a = 0.5 * a1 + 0.5 * a2
-            for j in range(0, self._precision):
-                s.reset()
-                s.set_constant(self._avar, a)
-                try:
-                    d = s.run(self._time, log=[vvar]).npview()
-                except Exception:
-                    if debug:
-                        traceback.print_exc()
-                    break
-                t = (np.max(d[vvar]) > self._threshold)
-                if t1 == t:
-                    a1 = a
-                else:
-                    a2 = a
-                a = 0.5 * a1 + 0.5 * a2
-            amplitudes[k] = a
-            if debug:
-                print('> ' + str(a))
-
-        # Set output data
-        self._data = myokit.DataLog()
-        self._data['duration'] = durations
-        self._data['strength'] = amplitudes
+        if debug:
+            print('> ' + str(a))
+        return a
 
     def set_currents(self, imin=-250, imax=0):
         """
@@ -1059,6 +1179,15 @@ class StrengthDuration(object):
         self._threshold = float(threshold)
         self._data = None
 
+    def set_threads(self, threads=None):
+        """
+        Sets the number of threads used to test the different stimulus
+        durations. Each thread uses its own copy of the simulation. If
+        ``threads`` is ``None``, a single thread is used.
+        """
+        self._threads = None if threads is None else int(threads)
+        self._data = None
+
     def set_times(self, tmin=0.2, tmax=2.0, dt=0.1, twait=50):
         """
         Sets the tested stimulus durations.
@@ -1092,3 +1221,39 @@ class StrengthDuration(object):
         self._durations = np.arange(tmin, tmax, dt)
         self._time = twait
         self._data = None
+
+
+def _map(function, items, sims):
+    """
+    Calls ``function(sim, item)`` for every item in ``items``, and returns a
+    list of the results.
+
+    The items are divided over one thread per simulation in ``sims``, each of
+    which uses its own simulation. Because simulations release the GIL while
+    integrating, this allows independent simulations to run on multiple cores.
+    """
+    if len(sims) == 1:
+        return [function(sims[0], x) for x in items]
+
+    items = list(items)
+    n = len(sims)
+    with futures.ThreadPoolExecutor(max_workers=n) as pool:
+        parts = list(pool.map(
+            lambda k: [function(sims[k], x) for x in items[k::n]], range(n)))
+    results = [None] * len(items)
+    for k, part in enumerate(parts):
+        results[k::n] = part
+    return results
+
+
+def _simulations(model, threads, n):
+    """
+    Creates and returns a list of simulations for ``model``, one for every
+    thread to be used to run ``n`` independent jobs. If ``threads`` is
+    ``None``, a single thread is used.
+    """
+    threads = 1 if threads is None else max(1, min(threads, n))
+    if futures is None:     # pragma: no python 3 cover
+        threads = 1
+    s = myokit.Simulation(model)
+    return [s] + [copy.copy(s) for i in range(threads - 1)]
@@ -8,10 +8,19 @@ from __future__ import absolute_import, division
 from __future__ import print_function, unicode_literals
 
 import collections
+import multiprocessing
 import numpy as np
 
 import myokit
 
+from myokit._sim.gillespie import Gillespie
+from myokit.lib._analytical import run_batch as _run_batch
+
+try:
+    import concurrent.futures as futures
+except ImportError:     # pragma: no python 3 cover
+    futures = None
+
 
 class LinearModel(object):
     """
@@ -389,6 +398,33 @@ class LinearModel(object):
         myokit._exec(code, globl, local)
         self._matrix_function = local['matrix_function']
 
+        #
+        # Create function to create stacks of matrices, for inputs that are
+        # arrays of a given (broadcast) shape
+        #
+        self._model.reserve_unique_names('A', 'B', 'n', 'numpy', 'shape')
+        head = 'def matrix_batch_function(shape,'
+        head += ','.join([w(p.lhs()) for p in self._inputs])
+        head += '):'
+        body = []
+        body.append('A = numpy.zeros(shape + (n, n))')
+        for i, row in enumerate(A):
+            for j, e in enumerate(row):
+                if e != zero:
+                    body.append(
+                        'A[..., ' + str(i) + ',' + str(j) + '] = ' + w(e))
+        body.append('B = numpy.zeros(shape + (n, ))')
+        for j, e in enumerate(B):
+            if e != zero:
+                body.append('B[..., ' + str(j) + '] = ' + w(e))
+        body.append('return A, B')
+        code = head + '\n' + '\n'.join(['    ' + line for line in body])
+        globl = {'numpy': np, 'n': n}
+        local = {}
+
+        myokit._exec(code, globl, local)
+        self._matrix_batch_function = local['matrix_batch_function']
+
         #
         # Create function to return list of transition rates
         #
@@ -530,13 +566,25 @@ class LinearModel(object):
 
         ``membrane_potential``
             The value to use for the membrane potential, or ``None`` to use the
-            value from the original :class:`myokit.Model`.
+            value from the original :class:`myokit.Model`. To evaluate the
+            matrices for several voltages at once, a sequence of values can be
+            passed in. In this case, ``A`` and ``B`` will have shapes ``(m, n,
+            n)`` and ``(m, n)`` respectively, where ``m`` is the number of
+            voltages.
         ``parameters``
             The values to use for the parameters, given in the order they were
             originally specified in (if the model was created using
-            :meth:`from_component()`, this will be alphabetical order).
+            :meth:`from_component()`, this will be alphabetical order). To
+            evaluate the matrices for ``N`` parameter sets at once, an ``(N,
+            P)`` array can be passed in, resulting in matrices with shapes
+            ``(N, n, n)`` and ``(N, n)``. Sequences of voltages and parameter
+            sets can be combined if they have the same length ``N``.
 
         """
+        if (membrane_potential is not None and np.ndim(membrane_potential)) \
+                or (parameters is not None and np.ndim(parameters) > 1):
+            return self._matrices_batch(membrane_potential, parameters)
+
         inputs = list(self._default_inputs)
         if membrane_potential is not None:
             inputs[-1] = float(membrane_potential)
@@ -549,6 +597,37 @@ class LinearModel(object):
             inputs[:-1] = [float(x) for x in parameters]
         return self._matrix_function(*inputs)
 
+    def _matrices_batch(self, membrane_potential, parameters):
+        """
+        Calculates stacks of matrices ``A`` and ``B`` for a sequence of
+        membrane potentials and/or parameter sets, see :meth:`matrices`.
+        """
+        inputs = list(self._default_inputs)
+        if membrane_potential is not None:
+            inputs[-1] = np.asarray(membrane_potential, dtype=float)
+        shape = np.shape(inputs[-1])
+        if parameters is not None:
+            parameters = np.asarray(parameters, dtype=float)
+            if np.shape(parameters)[-1:] != (len(self._parameters), ):
+                raise ValueError(
+                    'Illegal parameter vector size: '
+                    + str(len(self._parameters)) + ' required, '
+                    + str(np.shape(parameters)[-1:]) + ' provided.')
+            inputs[:-1] = list(np.moveaxis(parameters, -1, 0))
+            shape = np.broadcast(
+                np.empty(shape), np.empty(parameters.shape[:-1])).shape
+        try:
+            return self._matrix_batch_function(shape, *inputs)
+        except (TypeError, ValueError):
+            # Expressions using e.g. ``and`` or ``or`` cannot be evaluated for
+            # arrays: fall back to evaluating each entry separately
+            inputs = [np.broadcast_to(x, shape) for x in inputs]
+            A = np.zeros(shape + (len(self._states), len(self._states)))
+            B = np.zeros(shape + (len(self._states), ))
+            for i in np.ndindex(*shape):
+                A[i], B[i] = self._matrix_function(*[x[i] for x in inputs])
+            return A, B
+
     def membrane_potential(self):
         """
         Returns the name of the membrane potential variable used by this model.
@@ -684,8 +763,15 @@ class AnalyticalSimulation(object):
         plt.plot(d.time(), d[m.current()])
         plt.show()
 
+    To avoid repeated calculations, the matrices and eigenvalue decomposition
+    are cached for the most recently used membrane potentials. The maximum
+    number of cached potentials can be set with ``cache_size``.
+
+    For protocols with ramps or recorded voltage traces, where the membrane
+    potential is rarely the same twice, a lookup table can be used instead,
+    see :meth:`set_lookup_table`.
     """
-    def __init__(self, model, protocol=None):
+    def __init__(self, model, protocol=None, cache_size=1000):
         super(AnalyticalSimulation, self).__init__()
         # Check model
         if not isinstance(model, LinearModel):
@@ -728,8 +814,15 @@ class AnalyticalSimulation(object):
         # Cached matrices and partial solution (eigenvalue decomposition etc.)
         # Both stored per voltage, but will become invalidated if parameters
         # change
-        self._cached_matrices = {}
-        self._cached_solution = {}
+        cache_size = int(cache_size)
+        if cache_size < 1:
+            raise ValueError('The cache size must be at least 1.')
+        self._cached_matrices = _BoundedCache(cache_size)
+        self._cached_solution = _BoundedCache(cache_size)
+
+        # Lookup table settings (vmin, step, number of points), and table
+        self._table_range = None
+        self._table = None
 
         # If protocol was given, create pacing system, update vm
         self._pacing = None
@@ -920,6 +1013,64 @@ class AnalyticalSimulation(object):
         # Return
         return log
 
+    def run_batch(self, parameters, duration, log_interval=0.01,
+                  log_times=None):
+        """
+        Runs simulations for ``N`` parameter sets at once, and returns the
+        current for each.
+
+        All simulations start from this simulation's current time and state,
+        and use its protocol or membrane potential. Unlike :meth:`run`, this
+        method does not update the simulation time or state.
+
+        For each voltage in the protocol, the model matrices and their
+        eigenvalue decompositions are calculated for all parameter sets in a
+        single vectorised operation, making this much faster than running
+        each parameter set separately.
+
+        Arguments:
+
+        ``parameters``
+            An array of shape ``(N, P)``, where each row contains values for
+            all ``P`` model parameters (in the order returned by
+            :meth:`LinearModel.parameters`).
+        ``duration``
+            The number of time units to simulate.
+        ``log_interval``
+            The time between logged points.
+        ``log_times``
+            A pre-defined sequence of times to log at. If set, ``log_interval``
+            will be ignored.
+
+        Returns an array of shape ``(N, T)``, containing the current at each of
+        the ``T`` logged times for each parameter set. For parameter sets that
+        lead to invalid (e.g. non-finite) matrices the current will be NaN.
+        """
+        # Partial solutions for the most recently used voltages
+        solutions = _BoundedCache(10)
+
+        def step(parameters, x, times, v):
+            # Get partial solution for all parameter sets
+            try:
+                E, P, PI, B = solutions[v]
+            except KeyError:
+                A, B = self._model.matrices(v, parameters)
+                E, P, PI = _eig_batch(A)
+                solutions[v] = (E, P, PI, B)
+
+            # Calculate currents, without calculating the intermediate
+            # states: I(t) = B * P * exp(E * t) * P^-1 * x0
+            y0 = np.einsum('kij,kj->ki', PI, x)
+            c = np.einsum('ki,kij->kj', B, P) * y0
+            ex = np.exp(E.reshape(E.shape + (1, )) * times)
+            current = np.einsum('kj,kjt->kt', c, ex[:, :, :-1]).real
+
+            # Calculate state at final time
+            return current, np.einsum('kij,kj->ki', P, y0 * ex[:, :, -1]).real
+
+        return _run_batch(
+            self, parameters, duration, log_interval, log_times, step)
+
     def _run(self, log, times, tnext, offset):
         """
         Runs a simulation with the current membrane potential.
@@ -973,6 +1124,7 @@ class AnalyticalSimulation(object):
         Updates a single parameter to a new value.
         """
         self._parameters[self._parameter_map[variable]] = float(value)
+        self._invalidate_cache()
 
     def set_default_state(self, state):
         """
@@ -999,6 +1151,74 @@ class AnalyticalSimulation(object):
                 'Membrane potential cannot be set if a protocol is used.')
         self._membrane_potential = float(v)
 
+    def _invalidate_cache(self):
+        """ Clears all cached matrices and solutions. """
+        self._cached_matrices.clear()
+        self._cached_solution.clear()
+        self._table = None
+
+    def _lookup(self, v):
+        """
+        Returns a list of tuples ``(w, (E, P, PI, B))`` with weights ``w``
+        and partial solutions from the lookup table, or ``None`` if no table
+        is used or ``v`` is outside its range.
+        """
+        if self._table_range is None:
+            return None
+        vmin, step, m = self._table_range
+        k = (v - vmin) / step
+        if not (0 <= k <= m - 1):
+            return None
+
+        # Create table
+        if self._table is None:
+            n = len(self._state)
+            A, B = self._model.matrices(
+                vmin + step * np.arange(m), self._parameters)
+            E, P = np.linalg.eig(A)
+            PI = np.linalg.inv(P)
+            self._table = (E.reshape((m, n, 1)), P, PI, B)
+
+        # Get entries at and above v
+        E, P, PI, B = self._table
+        i = min(int(k), m - 1)
+        w = k - i
+        parts = [(1 - w, (E[i], P[i], PI[i], B[i]))]
+        if w > 1e-9:
+            i += 1
+            parts.append((w, (E[i], P[i], PI[i], B[i])))
+        return parts
+
+    def set_lookup_table(self, vmin=None, vmax=None, step=0.1):
+        """
+        Enables or disables the use of a lookup table.
+
+        If enabled, the eigenvalue decomposition used to solve the model is
+        calculated for a grid of evenly spaced membrane potentials from
+        ``vmin`` to ``vmax``, in a single vectorised operation. Solutions for
+        potentials between two grid points are then approximated by linearly
+        interpolating between the solutions at those points, so that no new
+        decomposition is needed for each new potential. Potentials outside the
+        table's range are handled without the table.
+
+        The table is recalculated automatically when the parameters change.
+
+        To disable the lookup table, call this method without arguments.
+        """
+        self._table = None
+        if vmin is None and vmax is None:
+            self._table_range = None
+            return
+        if vmin is None or vmax is None:
+            raise ValueError('Both vmin and vmax must be set.')
+        vmin, vmax, step = float(vmin), float(vmax), float(step)
+        if step <= 0:
+            raise ValueError('The step size must be greater than zero.')
+        if vmax <= vmin:
+            raise ValueError('The maximum voltage must exceed the minimum.')
+        m = 1 + int(np.ceil((vmax - vmin) / step - 1e-9))
+        self._table_range = (vmin, step, m)
+
     def set_parameters(self, parameters):
         """
         Changes the parameter values used in this simulation.
@@ -1010,8 +1230,7 @@ class AnalyticalSimulation(object):
         self._parameters = np.array(parameters, copy=True, dtype=float)
 
         # Invalidate cache
-        self._cached_matrices = {}
-        self._cached_solution = {}
+        self._invalidate_cache()
 
     def set_state(self, state):
         """
@@ -1053,33 +1272,44 @@ class AnalyticalSimulation(object):
         """
         n = len(self._state)
 
-        # Solve system, or get cached solution
-        try:
-            E, P, PI, B = self._cached_solution[self._membrane_potential]
-        except KeyError:
-            # Get matrices
-            A, B = self._matrices()
-
-            # Get eigenvalues, matrix of eigenvectors
-            E, P = np.linalg.eig(A)
-            E = E.reshape((n, 1))
-            PI = np.linalg.inv(P)
+        # Get partial solutions from lookup table, or solve system, or get
+        # cached solution
+        parts = self._lookup(self._membrane_potential)
+        if parts is None:
+            try:
+                solution = self._cached_solution[self._membrane_potential]
+            except KeyError:
+                # Get matrices
+                A, B = self._matrices()
 
-            # Cache results
-            self._cached_solution[self._membrane_potential] = (E, P, PI, B)
+                # Get eigenvalues, matrix of eigenvectors
+                E, P = np.linalg.eig(A)
+                E = E.reshape((n, 1))
+                PI = np.linalg.inv(P)
 
-        # Calculate transform of initial state
-        y0 = PI.dot(self._state.reshape((n, 1)))
+                # Cache results
+                solution = (E, P, PI, B)
+                self._cached_solution[self._membrane_potential] = solution
+            parts = [(1, solution)]
 
         # Reshape times array
-        times = np.array(times, copy=False).reshape((len(times),))
+        times = np.asarray(times).reshape((len(times),))
+
+        # Calculate (weighted sum of) states and currents
+        x = i = 0
+        for w, (E, P, PI, B) in parts:
+            # Calculate transform of initial state
+            y0 = PI.dot(self._state.reshape((n, 1)))
 
-        # Calculate state
-        x = P.dot(y0 * np.exp(times * E))
+            # Calculate state
+            xw = P.dot(y0 * np.exp(times * E))
+            x = x + w * xw
+            if self._has_current:
+                i = i + w * B.dot(xw)
 
-        # Calculate current and/or return
+        # Return
         if self._has_current:
-            return x, B.dot(x)
+            return x, i
         else:
             return x
 
@@ -1090,12 +1320,87 @@ class AnalyticalSimulation(object):
         return list(self._state)
 
 
+def _eig_batch(A):
+    """
+    Calculates the eigenvalues ``E``, eigenvectors ``P`` and inverse
+    ``P^-1`` for a stack of matrices ``A`` with shape ``(N, n, n)``.
+
+    For matrices that contain non-finite values or whose eigenvector matrix
+    can not be inverted, the returned arrays contain NaNs.
+    """
+    N, n = A.shape[:2]
+    E = np.empty((N, n), dtype=complex)
+    P = np.empty((N, n, n), dtype=complex)
+    PI = np.empty((N, n, n), dtype=complex)
+    E[:] = P[:] = PI[:] = np.nan
+    ok = np.all(np.isfinite(A), axis=(1, 2))
+    if np.any(ok):
+        E[ok], P[ok] = np.linalg.eig(A[ok])
+        try:
+            PI[ok] = np.linalg.inv(P[ok])
+        except np.linalg.LinAlgError:
+            for k in np.nonzero(ok)[0]:
+                try:
+                    PI[k] = np.linalg.inv(P[k])
+                except np.linalg.LinAlgError:
+                    pass
+
+        # Use real arrays if possible
+        if not (np.any(E[ok].imag) or np.any(P[ok].imag)):
+            E, P, PI = E.real, P.real, PI.real
+    return E, P, PI
+
+
+class _BoundedCache(object):
+    """
+    A dict-like object that holds at most ``size`` items, and discards the
+    least recently used items when new ones are added.
+    """
+    def __init__(self, size):
+        self._size = size
+        self._items = collections.OrderedDict()
+
+    def clear(self):
+        self._items.clear()
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __getitem__(self, key):
+        # Move item to end
+        value = self._items.pop(key)
+        self._items[key] = value
+        return value
+
+    def __len__(self):
+        return len(self._items)
+
+    def __setitem__(self, key, value):
+        self._items.pop(key, None)
+        self._items[key] = value
+        while len(self._items) > self._size:
+            self._items.popitem(last=False)
+
+
 class DiscreteSimulation(object):
     """
     Performs stochastic simulations of a :class:`LinearModel`'s behavior for a
     finite number of channels.
 
-    Simulations are run using the "Direct method" proposed by Gillespie [1].
+    By default, simulations are run in Python using the "Direct method"
+    proposed by Gillespie [1]. For larger numbers of channels, a compiled
+    implementation of the same method can be selected with
+    ``method='direct'``, or an approximate but much faster "tau-leaping"
+    method [2] can be used with ``method='tau-leaping'``. With tau-leaping, the
+    number of transitions of each type in every interval of size
+    ``leap_interval`` is sampled from a Poisson distribution, and the state is
+    logged once per interval.
+
+    The compiled methods use their own random number generator, which is
+    seeded from NumPy's global random number generator when first used (so
+    that ``numpy.random.seed()`` can be used to obtain reproducible results).
+    Independent replicate simulations can be run in parallel with
+    :meth:`run_replicates()`.
 
     Each simulation object maintains an internal state consisting of
 
@@ -1140,16 +1445,30 @@ class DiscreteSimulation(object):
         stochastic time evolution of coupled chemical reactions
         The Journal of Computational Physics, 22, 403-434.
 
+    [2] Gillespie (2001) Approximate accelerated stochastic simulation of
+        chemically reacting systems
+        The Journal of Chemical Physics, 115, 1716-1733.
+
     Arguments:
 
     ``model``
         A :class:`LinearModel`.
+    ``protocol``
+        An optional :class:`myokit.Protocol` to set the membrane potential.
     ``nchannels``
         The number of channels to simulate.
+    ``method``
+        The simulation method to use, either ``'python'`` (default),
+        ``'direct'`` (compiled direct method), or ``'tau-leaping'`` (compiled
+        tau-leaping).
+    ``leap_interval``
+        The time step used in tau-leaping. Ignored for other methods.
 
     """
+    _methods = ('python', 'direct', 'tau-leaping')
 
-    def __init__(self, model, protocol=None, nchannels=100):
+    def __init__(self, model, protocol=None, nchannels=100, method='python',
+                 leap_interval=0.01):
         # Check model
         if not isinstance(model, LinearModel):
             raise ValueError('First parameter must be a `LinearModel`.')
@@ -1169,6 +1488,24 @@ class DiscreteSimulation(object):
             raise ValueError('The number of channels must be at least 1.')
         self._nchannels = nchannels
 
+        # Check method
+        if method not in self._methods:
+            raise ValueError(
+                'Unknown method "' + str(method) + '", expecting one of '
+                + ', '.join(self._methods) + '.')
+        self._method = method
+        self._leap_interval = 0
+        if method == 'tau-leaping':
+            self._leap_interval = float(leap_interval)
+            if self._leap_interval <= 0:
+                raise ValueError('Leap interval must be greater than zero.')
+
+        # Compile back-end, random number generator state is created when
+        # first needed
+        if method != 'python':
+            Gillespie._get_instance()
+        self._rng = None
+
         # Set state
         self._state = self.discretize_state(self._model.default_state())
 
@@ -1218,7 +1555,7 @@ class DiscreteSimulation(object):
 
         Returns a discretized state ``y`` where ``sum(y) = nchannels``.
         """
-        x = np.array(x, copy=False, dtype=float)
+        x = np.asarray(x, dtype=float)
         if (np.abs(1 - np.sum(x))) > 1e-6:
             raise ValueError(
                 'The sum of fractions in the state to be discretized must'
@@ -1231,12 +1568,25 @@ class DiscreteSimulation(object):
         y[i] = self._nchannels - np.sum(y)
         return list(y)
 
+    def _invalidate_cache(self):
+        """
+        Clears the cached transition rates and current matrix.
+        """
+        self._cached_rates = None
+        self._cached_matrix = None
+
     def membrane_potential(self):
         """
         Returns the current membrane potential.
         """
         return self._membrane_potential
 
+    def method(self):
+        """
+        Returns the simulation method used, as a string.
+        """
+        return self._method
+
     def number_of_channels(self):
         """
         Returns the number of channels used in this simulation.
@@ -1340,23 +1690,14 @@ class DiscreteSimulation(object):
             raise ValueError('Duration must be non-negative.')
 
         # Set up logging
-        time_key = self._model._model.time().qname()
-        log_vars = [time_key, self._model._membrane_potential]
-        log_vars.extend(self._model.states())
-        cur_key = self._model.current()
-        if cur_key is not None:
-            log_vars.append(cur_key)
-
         if log is None:
             # Create new log
-            log = myokit.DataLog()
-            log.set_time_key(time_key)
-            for var in log_vars:
-                log[var] = []
+            log = self._create_log()
 
         else:
 
             # Check existing log
+            log_vars = self._log_keys()
             if len(log.keys()) > len(log_vars):
                 raise ValueError('Invalid log: contains extra keys.')
             try:
@@ -1380,31 +1721,149 @@ class DiscreteSimulation(object):
                 self._run(tnext - self._time, log)
                 # Update pacing
                 self._membrane_potential = self._pacing.advance(tnext)
-                self._cached_rates = None
-                self._cached_matrix = None
+                self._invalidate_cache()
 
         # Return
         return log
 
+    def run_replicates(self, duration, replicates, threads=None):
+        """
+        Runs ``replicates`` independent simulations for ``duration`` time
+        units, and returns a list of :class:`myokit.DataLog` objects.
+
+        All replicates start from this simulation's current time and state,
+        and use its protocol or membrane potential. Unlike :meth:`run`, this
+        method does not update the simulation time or state.
+
+        With the compiled methods, each replicate uses an independent stream
+        of random numbers, and replicates are simulated in parallel using
+        ``threads`` threads (defaulting to the number of available CPUs). With
+        the ``'python'`` method, replicates are simulated one after the other.
+        """
+        # Check arguments
+        duration = float(duration)
+        if duration < 0:
+            raise ValueError('Duration must be non-negative.')
+        replicates = int(replicates)
+        if replicates < 1:
+            raise ValueError('The number of replicates must be at least 1.')
+
+        # Create logs, states, and random number generator states
+        logs = [self._create_log() for i in range(replicates)]
+        states = [self._state] * replicates
+        rngs = [None] * replicates
+        pool = None
+        if self._method != 'python':
+            rngs = self._streams(replicates)
+            if threads is None:
+                threads = multiprocessing.cpu_count()
+            threads = min(int(threads), replicates)
+            if threads > 1 and futures is not None:
+                pool = futures.ThreadPoolExecutor(max_workers=threads)
+
+        # Create pacing system
+        time = self._time
+        tfinal = time + duration
+        if self._protocol is None:
+            pacing = None
+            v = self._membrane_potential
+        else:
+            pacing = myokit.PacingSystem(self._protocol)
+            v = pacing.advance(time)
+
+        try:
+            while True:
+                # Get next time, rates, and current matrix
+                tnext = tfinal
+                if pacing is not None:
+                    tnext = min(tfinal, pacing.next_time())
+                rates = self._model.rates(v, self._parameters)
+                B = None
+                if self._model.current() is not None:
+                    B = self._model.matrices(v, self._parameters)[1]
+
+                # Simulate all replicates
+                args = (rates, time, tnext - time)
+                results = (pool.map if pool else map)(
+                    lambda k: self._simulate(states[k], rngs[k], *args),
+                    range(replicates))
+                for k, (state, times, x) in enumerate(results):
+                    self._append(logs[k], times, x, v, B)
+                    states[k] = state
+
+                # Update pacing
+                time = tnext
+                if pacing is None or time >= tfinal:
+                    break
+                v = pacing.advance(time)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        return logs
+
     def _run(self, duration, log):
         """
         Runs a simulation with the current membrane potential.
         """
+        if self._method != 'python' and self._rng is None:
+            self._rng = self._streams(1)[0]
+        state, times, states = self._simulate(
+            self._state, self._rng, self._rates(), self._time, duration)
+
+        # Update log, current state and time
+        B = None
+        if self._model.current() is not None:
+            B = self._current_matrix()
+        self._append(log, times, states, self._membrane_potential, B)
+        self._state = list(state)
+        self._time += duration
+
+    def _simulate(self, state, rng, rates, time, duration):
+        """
+        Simulates for ``duration`` time units, starting from the given
+        ``time`` and ``state``, with a fixed list of transition ``rates``.
+
+        Returns a tuple ``(state, times, states)`` containing the final state,
+        a list of logged times, and a list containing a list of logged values
+        for each state.
+        """
+        if self._method == 'python':
+            return self._simulate_python(state, rates, time, duration)
+
+        # Run compiled simulation
+        x = bytearray(np.array(state, dtype=np.int64).tobytes())
+        log_time = bytearray()
+        log_state = bytearray()
+        n = Gillespie._get_instance().simulate(
+            [r for i, j, r in rates],
+            [i for i, j, r in rates],
+            [j for i, j, r in rates],
+            x, rng, time, duration, self._leap_interval, log_time, log_state)
+        times = np.frombuffer(log_time, dtype=float)
+        states = np.frombuffer(log_state, dtype=np.int64)
+        states = states.reshape((n, len(state))).T
+        return list(np.frombuffer(x, dtype=np.int64)), times.tolist(), \
+            states.tolist()
+
+    def _simulate_python(self, state, rates, time, duration):
+        """
+        Performs a simulation using the direct method, implemented in Python.
+        See :meth:`_simulate()`.
+        """
         # Get logging lists
-        log_time = log.time()
-        log_states = []
-        for key in self._model.states():
-            log_states.append(log[key])
+        log_time = []
+        log_states = [[] for x in state]
 
         # Get current, time and state
-        t = self._time
-        state = np.array(self._state, copy=True, dtype=int)
+        t = time
+        state = np.array(state, copy=True, dtype=int)
 
         # Get list of transitions
         R = []      # Transition rates
         SI = []     # From state
         SJ = []     # To state
-        for i, j, rij in self._rates():
+        for i, j, rij in rates:
             SI.append(i)
             SJ.append(j)
             R.append(rij)
@@ -1413,8 +1872,7 @@ class DiscreteSimulation(object):
         SJ = np.array(SJ)
 
         # Run
-        n_steps = 0
-        t_stop = self._time + duration
+        t_stop = time + duration
 
         # Request for a short time can result in duration=0 at this point,
         # Must set variables otherwise set in loop below here
@@ -1426,7 +1884,6 @@ class DiscreteSimulation(object):
             log_time.append(t)
             for i, x in enumerate(state):
                 log_states[i].append(x)
-            n_steps += 1
 
             # Get lambdas
             lambdas = R * state[SI]
@@ -1456,11 +1913,11 @@ class DiscreteSimulation(object):
             t += tau
 
         # Perform final step using the "brute-force" approach, ensuring we
-        # reach self._time + duration exactly.
+        # reach time + duration exactly.
         # Note that for large tau, the estimates of the probability that
         # something changes may become inaccurate (and > 1)
         # I didn't see this in testing...
-        tau = (self._time + duration) - t
+        tau = (time + duration) - t
         lambdas *= tau
         for i, r in enumerate(lambdas):
             if np.random.uniform(0, 1) < r:
@@ -1468,29 +1925,66 @@ class DiscreteSimulation(object):
                 state[SI[i]] -= 1
                 state[SJ[i]] += 1
 
-        # Add vm to log
-        vm_key = self._model._membrane_potential
-        log[vm_key].extend([self._membrane_potential] * n_steps)
+        return list(state), log_time, log_states
 
-        # Add current to log
-        c = self._model.current()
-        if c is not None:
-            B = self._current_matrix()
-            x = np.vstack([
-                np.array(log_states[i][-n_steps:], dtype=float)
-                for i in range(len(state))])
+    def _append(self, log, times, states, v, B):
+        """
+        Appends logged ``times`` and ``states`` (a list of lists, as returned
+        by :meth:`_simulate`) to a log, along with the membrane potential
+        ``v`` and the current calculated using the matrix ``B`` (or ``None``
+        if the model has no current).
+        """
+        log.time().extend(times)
+        for key, x in zip(self._model.states(), states):
+            log[key].extend(x)
+        log[self._model._membrane_potential].extend([v] * len(times))
+        if B is not None:
+            x = np.array(states, dtype=float).reshape((len(states), -1))
             x /= self._nchannels
-            log[c].extend(B.dot(x))
+            log[self._model.current()].extend(B.dot(x))
 
-        # Update current state and time
-        self._state = list(state)
-        self._time += duration
+    def _create_log(self):
+        """
+        Creates and returns an empty log for this simulation.
+        """
+        log = myokit.DataLog()
+        log.set_time_key(self._model._model.time().qname())
+        for var in self._log_keys():
+            log[var] = []
+        return log
+
+    def _log_keys(self):
+        """
+        Returns a list of the variables logged by this simulation.
+        """
+        log_vars = [
+            self._model._model.time().qname(),
+            self._model._membrane_potential]
+        log_vars.extend(self._model.states())
+        cur_key = self._model.current()
+        if cur_key is not None:
+            log_vars.append(cur_key)
+        return log_vars
+
+    def _streams(self, n):
+        """
+        Creates ``n`` independent random number generator states for the
+        compiled back-end, seeded from NumPy's global random number generator.
+        """
+        rng = bytearray(np.random.randint(0, 256, size=32).astype(
+            np.uint8).tobytes())
+        streams = []
+        for i in range(n):
+            streams.append(bytearray(rng))
+            Gillespie._get_instance().jump(rng)
+        return streams
 
     def set_constant(self, variable, value):
         """
         Updates a single parameter to a new value.
         """
         self._parameters[self._parameter_map[variable]] = float(value)
+        self._invalidate_cache()
 
     def set_default_state(self, state):
         """
@@ -1519,8 +2013,7 @@ class DiscreteSimulation(object):
             raise Exception(
                 'Membrane potential cannot be set if a protocol is used.')
         self._membrane_potential = float(v)
-        self._cached_rates = None
-        self._cached_matrix = None
+        self._invalidate_cache()
 
     def set_parameters(self, parameters):
         """
@@ -1531,8 +2024,7 @@ class DiscreteSimulation(object):
                 'Wrong size parameter vector, expecting ('
                 + str(len(self._parameters)) + ') values.')
         self._parameters = np.array(parameters, copy=True, dtype=float)
-        self._cached_rates = None
-        self._cached_matrix = None
+        self._invalidate_cache()
 
     def set_state(self, state):
         """
@@ -0,0 +1,263 @@
+#
+# Methods to find (and cache) steady states and limit cycles.
+#
+# This file is part of Myokit.
+# See http://myokit.org for copyright, sharing, and licensing details.
+#
+from __future__ import absolute_import, division
+from __future__ import print_function, unicode_literals
+
+import json
+import os
+
+import numpy as np
+import myokit
+
+# Maximum size of the default steady state cache, in bytes
+CACHE_SIZE = 16 * 1024 * 1024
+
+# Number of beats used to estimate the beat map in accelerated searches
+_HISTORY = 5
+
+
+def cache():
+    """
+    Returns the :class:`myokit.tools.DiskCache` used by default to store
+    steady states and limit cycles.
+
+    The cache is stored in a subdirectory of ``myokit.DIR_CACHE``, so that it
+    is shared between all simulations and processes.
+    """
+    return myokit.tools.DiskCache(
+        os.path.join(myokit.DIR_CACHE, 'steady-states'), CACHE_SIZE)
+
+
+def _get_cache(cache_arg):
+    """ Returns a ``DiskCache`` for a ``cache`` argument, or ``None``. """
+    if cache_arg is True:
+        return cache()
+    if cache_arg is False or cache_arg is None:
+        return None
+    if not isinstance(cache_arg, myokit.tools.DiskCache):
+        raise ValueError(
+            'The argument `cache` must be True, False, None, or a'
+            ' myokit.tools.DiskCache.')
+    return cache_arg
+
+
+def _load(cache, key):
+    """ Returns the data cached for ``key``, or ``None``. """
+    if cache is None:
+        return None
+    path = cache.get(key)
+    if path is None:
+        return None
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):  # pragma: no cover
+        # Removed by another process, or corrupt
+        return None
+
+
+def _store(cache, key, data):
+    """ Stores ``data`` in the cache under ``key`` (if a cache is set). """
+    if cache is not None:
+        cache.put(key, json.dumps(data).encode('utf-8'))
+
+
+def _simulation_key(simulation):
+    """
+    Returns a list of objects that together determine the outcome of running
+    ``simulation``: its model (including any changed constants), protocol,
+    state, time, and solver settings.
+    """
+    cls, args, state = simulation.__reduce__()
+    parts = [cls.__module__ + '.' + cls.__name__]
+    for arg in args:
+        parts.append(arg.code() if hasattr(arg, 'code') else arg)
+    parts.append(state)
+    return parts
+
+
+def limit_cycle(simulation, period, max_beats=1000, abs_tol=1e-9,
+                rel_tol=1e-6, accelerate=True, cache=True):
+    """
+    Pre-paces a :class:`myokit.Simulation` until it reaches a limit cycle, and
+    returns a tuple ``(state, beats, converged)``.
+
+    The simulation is run for one ``period`` at a time, using
+    :meth:`Simulation.pre()`, until the state at the start of a beat and the
+    state at its end satisfy::
+
+        abs(x_end - x_start) <= abs_tol + rel_tol * abs(x_end)
+
+    for every state variable, or until ``max_beats`` beats have been
+    simulated. The returned ``state`` is the final state, ``beats`` is the
+    number of beats that were simulated to find it, and ``converged`` is
+    ``True`` if the criterion above was met. As with :meth:`Simulation.pre()`,
+    the simulation's state and default state are set to the final state, while
+    its time is unchanged.
+
+    If ``accelerate`` is set to ``True``, the states found in the last few
+    beats are used to estimate the (linearised) beat map, and a Newton step on
+    this map (Anderson acceleration) is used to jump towards its fixed point.
+    Steps that do not reduce the beat-to-beat change are rejected, after which
+    normal pre-pacing resumes. For slowly converging models this can reduce
+    the number of beats required by an order of magnitude.
+
+    Converged results are stored in an on-disk cache, keyed by the
+    simulation's model (including any constants changed with
+    :meth:`Simulation.set_constant`), protocol, state, time, and solver
+    settings, along with the ``period`` and tolerances. When the same limit
+    cycle is requested again, e.g. from a different process, the result is
+    returned without simulating (in which case ``beats`` is the number of
+    beats that were originally needed). By default, the cache returned by
+    :meth:`cache()` is used. To use a different cache, pass in a
+    :class:`myokit.tools.DiskCache` as ``cache``, and to disable caching set
+    ``cache=False``.
+    """
+    period = float(period)
+    if period <= 0:
+        raise ValueError('Period must be greater than zero.')
+    max_beats = int(max_beats)
+    if max_beats < 1:
+        raise ValueError('Maximum number of beats must be at least 1.')
+    abs_tol = float(abs_tol)
+    rel_tol = float(rel_tol)
+    if abs_tol < 0 or rel_tol < 0:
+        raise ValueError('Tolerances cannot be negative.')
+    if abs_tol == 0 and rel_tol == 0:
+        raise ValueError('At least one tolerance must be greater than zero.')
+    cache = _get_cache(cache)
+
+    # Check cache
+    key = None
+    if cache is not None:
+        key = cache.key(
+            'limit_cycle', _simulation_key(simulation), period, abs_tol,
+            rel_tol)
+        data = _load(cache, key)
+        if data is not None:
+            simulation.set_state(data['state'])
+            simulation.set_default_state(data['state'])
+            return list(data['state']), data['beats'], True
+
+    def beat(x):
+        simulation.set_state(x)
+        simulation.pre(period)
+        return np.array(simulation.state())
+
+    def error(x, y):
+        return np.max(np.abs(y - x) / (abs_tol + rel_tol * np.abs(y)))
+
+    # Recent iterates x and residuals y - x, used for acceleration
+    xs = []
+    fs = []
+
+    # Best plain (non-accelerated) beat so far: error, x, y
+    best = None
+
+    beats = 0
+    converged = False
+    accelerated = False
+    x = np.array(simulation.state())
+    while beats < max_beats:
+        # Simulate a beat
+        try:
+            y = beat(x)
+        except myokit.SimulationError:
+            if not accelerated:
+                raise
+            y = None
+        beats += 1
+
+        # Check convergence
+        e = np.inf if y is None else error(x, y)
+        if e <= 1:
+            converged = True
+            break
+
+        # Reject accelerated steps that didn't improve on the best beat
+        if accelerated and not e < best[0]:
+            del xs[:], fs[:]
+            x, y, e = best[2], None, best[0]
+            accelerated = False
+            continue
+        if best is None or e < best[0]:
+            best = (e, x, y)
+
+        # Plain step
+        accelerated = False
+        xs.append(x)
+        fs.append(y - x)
+        x = y
+        if not accelerate or len(xs) <= _HISTORY:
+            continue
+
+        # Accelerated step: Find the combination of recent iterates that
+        # minimises the (scaled) residual, and take a step from there.
+        w = 1 / (abs_tol + rel_tol * np.abs(y))
+        dx = np.diff(xs, axis=0).T
+        df = np.diff(fs, axis=0).T
+        try:
+            g = np.linalg.lstsq(df * w[:, None], fs[-1] * w, rcond=None)[0]
+        except np.linalg.LinAlgError:   # pragma: no cover
+            g = None
+        if g is not None:
+            z = xs[-1] + fs[-1] - np.dot(dx + df, g)
+            if np.all(np.isfinite(z)):
+                x = z
+                accelerated = True
+        del xs[0], fs[0]
+
+    # Update simulation
+    state = [float(v) for v in (x if y is None else y)]
+    simulation.set_state(state)
+    simulation.set_default_state(state)
+
+    # Store and return
+    if converged and cache is not None:
+        _store(cache, key, {'state': state, 'beats': beats})
+    return state, beats, converged
+
+
+def steady_state(model, accuracy=1e-9, max_iter=50, cache=True):
+    """
+    Searches for a steady state of an (unpaced) ``model``, using
+    :meth:`myokit.JacobianCalculator.newton_root`, starting from the model's
+    initial state, and returns a tuple ``(state, error)``, where ``error`` is
+    the maximum absolute derivative at ``state``.
+
+    Any variables bound to external inputs (e.g. ``pace``) are unbound for the
+    search, so that their right-hand side is used.
+
+    As with :meth:`limit_cycle()`, results are stored in an on-disk cache,
+    keyed by the model code, ``accuracy`` and ``max_iter``. To use a
+    different cache, pass in a :class:`myokit.tools.DiskCache` as ``cache``,
+    and to disable caching set ``cache=False``.
+    """
+    accuracy = float(accuracy)
+    if accuracy < 0:
+        raise ValueError('Accuracy cannot be negative.')
+    max_iter = int(max_iter)
+    cache = _get_cache(cache)
+
+    # Check cache
+    key = None
+    if cache is not None:
+        key = cache.key('steady_state', model.code(), accuracy, max_iter)
+        data = _load(cache, key)
+        if data is not None:
+            return list(data['state']), data['error']
+
+    # Search
+    calculator = myokit.JacobianCalculator(model)
+    x, f, j, e = calculator.newton_root(
+        accuracy=accuracy, max_iter=max_iter)
+    state = [float(v) for v in x]
+    e = float(e)
+
+    # Store and return
+    _store(cache, key, {'state': state, 'error': e})
+    return state, e
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+#
+# Tests the CModule class and the on-disk cache of compiled modules.
+#
+# This file is part of Myokit.
+# See http://myokit.org for copyright, sharing, and licensing details.
+#
+from __future__ import absolute_import, division
+from __future__ import print_function, unicode_literals
+
+import os
+import unittest
+
+import myokit
+
+from myokit.tests import TemporaryDirectory
+
+
+class CachedModule(myokit.CModule):
+    """ Compiles the compiler-detection template. """
+    _index = 0
+
+    def __init__(self):
+        super(CachedModule, self).__init__()
+        CachedModule._index += 1
+        name = 'myokit_test_module_' + str(CachedModule._index)
+        name += '_' + str(myokit.pid_hash())
+        fname = os.path.join(myokit.DIR_CFUNC, 'compiler.c')
+        self.module = self._compile(name, fname, {'module_name': name}, [])
+
+
+class CModuleCacheTest(unittest.TestCase):
+    """
+    Tests caching of compiled modules.
+    """
+
+    def setUp(self):
+        self._dir = myokit.DIR_CACHE
+        self._enabled = myokit.CACHE_COMPILED
+        self._size = myokit.CACHE_COMPILED_SIZE
+
+    def tearDown(self):
+        myokit.DIR_CACHE = self._dir
+        myokit.CACHE_COMPILED = self._enabled
+        myokit.CACHE_COMPILED_SIZE = self._size
+
+    def test_cache(self):
+        # Test modules are cached and reused
+
+        with TemporaryDirectory() as d:
+            myokit.DIR_CACHE = d.path()
+            myokit.CACHE_COMPILED = True
+            cache = myokit.tools.DiskCache(d.path('modules'))
+
+            # First compilation stores the module
+            m1 = CachedModule().module
+            self.assertEqual(len(os.listdir(cache.path())), 1)
+            self.assertTrue(m1.__name__.startswith('myokit_cached_'))
+
+            # Second is loaded from cache, as a separate module
+            m2 = CachedModule().module
+            self.assertEqual(len(os.listdir(cache.path())), 1)
+            self.assertEqual(m1.__name__, m2.__name__)
+            self.assertIsNot(m1, m2)
+            self.assertEqual(m1.compiler(), m2.compiler())
+
+            # Corrupt cache entries are replaced
+            key = os.listdir(cache.path())[0]
+            cache.put(key, b'Not a module')
+            m3 = CachedModule().module
+            self.assertEqual(m1.compiler(), m3.compiler())
+            self.assertGreater(cache.size(), 12)
+
+            # Cache can be disabled
+            cache.clear()
+            myokit.CACHE_COMPILED = False
+            m4 = CachedModule().module
+            self.assertFalse(m4.__name__.startswith('myokit_cached_'))
+            self.assertEqual(cache.size(), 0)
+
+    def test_cache_size(self):
+        # Test the maximum size is respected
+
+        with TemporaryDirectory() as d:
+            myokit.DIR_CACHE = d.path()
+            myokit.CACHE_COMPILED = True
+            myokit.CACHE_COMPILED_SIZE = 0
+            CachedModule()
+            cache = myokit.tools.DiskCache(d.path('modules'))
+            self.assertEqual(cache.size(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -34,6 +34,10 @@ inc = three;four
 [opencl]
 lib = five;six
 inc = three;eight
+[cache]
+compiled = false
+compiled_size = 12
+path = nine
 """
 
 # Config with empty paths and spaces
@@ -128,6 +132,9 @@ class TestConfig(unittest.TestCase):
         sundials_inc = myokit.SUNDIALS_INC
         opencl_lib = myokit.OPENCL_LIB
         opencl_inc = myokit.OPENCL_INC
+        cache_compiled = myokit.CACHE_COMPILED
+        cache_compiled_size = myokit.CACHE_COMPILED_SIZE
+        dir_cache = myokit.DIR_CACHE
 
         # Change myokit config dir temporarily
         path = myokit.DIR_USER
@@ -160,6 +167,9 @@ class TestConfig(unittest.TestCase):
                 self.assertEqual(myokit.SUNDIALS_INC, ['three', 'four'])
                 self.assertEqual(myokit.OPENCL_LIB, ['five', 'six'])
                 self.assertEqual(myokit.OPENCL_INC, ['three', 'eight'])
+                self.assertFalse(myokit.CACHE_COMPILED)
+                self.assertEqual(myokit.CACHE_COMPILED_SIZE, 12 * 1024**2)
+                self.assertEqual(myokit.DIR_CACHE, 'nine')
 
                 # Lists of paths should be filtered for empty values and
                 # trimmed
@@ -253,6 +263,9 @@ class TestConfig(unittest.TestCase):
             myokit.SUNDIALS_INC = sundials_inc
             myokit.OPENCL_LIB = opencl_lib
             myokit.OPENCL_INC = opencl_inc
+            myokit.CACHE_COMPILED = cache_compiled
+            myokit.CACHE_COMPILED_SIZE = cache_compiled_size
+            myokit.DIR_CACHE = dir_cache
 
             # Reload local settings
             config._load()
@@ -1193,6 +1193,51 @@ class DataBlock2dTest(unittest.TestCase):
         self.assertAlmostEqual(e[1], -0.5 + np.sqrt(3) / 2j)
         self.assertAlmostEqual(e[2], 1)
 
+    def test_eigenvalues_chunked(self):
+        # Test eigenvalue methods with chunks, threads, and output arrays.
+
+        # Random matrices, some with real and some with complex eigenvalues
+        r = np.random.RandomState(1)
+        x = r.normal(size=(50, 4, 4))
+        x[:20] += np.transpose(x[:20], (0, 2, 1))
+        b = myokit.DataBlock2d(4, 4, np.arange(50))
+        b.set2d('x', x)
+        e = np.array([np.linalg.eigvals(y) for y in x])
+
+        for chunk_size in (None, 1, 7, 20, 100):
+            for threads in (1, 3):
+                f = b.eigenvalues('x', chunk_size, threads)
+                self.assertTrue(np.all(f == e))
+                f = b.dominant_eigenvalues('x', chunk_size, threads)
+                self.assertTrue(np.all(
+                    f == [y[np.argmax(np.absolute(y))] for y in e]))
+                f = b.largest_eigenvalues('x', chunk_size, threads)
+                self.assertTrue(np.all(
+                    f == [y[np.argmax(np.real(y))] for y in e]))
+
+        # Output arrays
+        out = np.zeros((50, 4), dtype=complex)
+        f = b.eigenvalues('x', chunk_size=8, threads=2, out=out)
+        self.assertIs(f, out)
+        self.assertTrue(np.all(out == e))
+        out = np.zeros(50, dtype=complex)
+        f = b.dominant_eigenvalues('x', out=out)
+        self.assertIs(f, out)
+        self.assertRaisesRegex(
+            ValueError, 'shape', b.eigenvalues, 'x', out=np.zeros(50))
+        self.assertRaises(
+            TypeError, b.eigenvalues, 'x', out=np.zeros((50, 4)))
+
+        # Invalid chunk size
+        self.assertRaisesRegex(
+            ValueError, 'Chunk size', b.eigenvalues, 'x', chunk_size=0)
+
+        # Empty block
+        b = myokit.DataBlock2d(3, 3, [])
+        b.set2d('x', np.zeros((0, 3, 3)))
+        self.assertEqual(b.eigenvalues('x').shape, (0, 3))
+        self.assertEqual(b.dominant_eigenvalues('x').shape, (0, ))
+
     def test_largest_eigenvalues(self):
         # Test the largest_eigenvalues method.
 
@@ -1241,6 +1241,110 @@ class DataLogTest(unittest.TestCase):
             self.assertTrue(np.all(e.time() == d.time()))
             self.assertTrue(np.all(e.time() == d['c.d']))
 
+    def test_save_stored_and_mmap(self):
+        # Test saving without compression, and loading with mmap.
+
+        d = myokit.DataLog(time='a.b')
+        d['a.b'] = np.arange(0, 100, dtype=float)
+        d['c.d'] = np.sqrt(np.arange(0, 100) * 1.2)
+        with TemporaryDirectory() as td:
+            fname = td.path('test.bin')
+            d.save(fname, compression='stored')
+
+            # Normal loading
+            e = myokit.DataLog.load(fname)
+            self.assertEqual(list(e.keys()), ['a.b', 'c.d'])
+            self.assertEqual(list(d['c.d']), list(e['c.d']))
+
+            # Memory-mapped loading
+            e = myokit.DataLog.load(fname, mmap=True)
+            self.assertEqual(list(e.keys()), ['a.b', 'c.d'])
+            self.assertEqual(e.time_key(), 'a.b')
+            self.assertIsInstance(e['c.d'], np.ndarray)
+            self.assertTrue(e['c.d'].flags.aligned)
+            self.assertFalse(e['c.d'].flags.writeable)
+            self.assertTrue(np.all(d['a.b'] == e['a.b']))
+            self.assertTrue(np.all(d['c.d'] == e['c.d']))
+            del(e)
+
+            # Single precision
+            d.save(fname, precision=myokit.SINGLE_PRECISION,
+                   compression='stored')
+            e = myokit.DataLog.load(fname, mmap=True)
+            self.assertEqual(e['c.d'].dtype, np.float32)
+            self.assertTrue(np.all(
+                d['c.d'].astype(np.float32) == e['c.d']))
+            del(e)
+
+            # Empty log
+            d['a.b'] = d['c.d'] = []
+            d.save(fname, compression='stored')
+            e = myokit.DataLog.load(fname, mmap=True)
+            self.assertEqual(len(e['c.d']), 0)
+
+            # Compressed files can't be mapped
+            d.save(fname)
+            self.assertRaisesRegex(
+                myokit.DataLogReadError, 'without compression',
+                myokit.DataLog.load, fname, mmap=True)
+
+            # Chunked files can't be mapped
+            with myokit.DataLogWriter(fname, ['a.b']):
+                pass
+            self.assertRaisesRegex(
+                myokit.DataLogReadError, 'Chunked', myokit.DataLog.load,
+                fname, mmap=True)
+
+            # Unknown compression
+            self.assertRaisesRegex(
+                ValueError, 'Unknown compression', d.save, fname,
+                compression='magic')
+
+    def test_save_compression(self):
+        # Test saving with different compression methods and shuffling.
+
+        d = myokit.DataLog(time='t')
+        d['t'] = np.linspace(0, 100, 1001)
+        d['v'] = np.sin(d['t'])
+        d['w'] = np.cos(d['t'])
+        methods = ('stored', 'deflate', 'deflate-fast', 'lzma')
+        with TemporaryDirectory() as td:
+            path = td.path('test.zip')
+            for compression in methods:
+                for shuffle in (False, True):
+                    for chunk_size in (None, 300):
+                        for threads in (None, 1):
+                            d.save(path, compression=compression,
+                                   shuffle=shuffle, chunk_size=chunk_size,
+                                   threads=threads)
+                            e = myokit.DataLog.load(path)
+                            self.assertEqual(list(e.keys()), list(d.keys()))
+                            for k, v in d.items():
+                                self.assertTrue(np.all(np.array(e[k]) == v))
+
+            # Single precision
+            d.save(path, precision=myokit.SINGLE_PRECISION, shuffle=True)
+            e = myokit.DataLog.load(path)
+            self.assertEqual(e['v'].typecode, 'f')
+            self.assertTrue(np.all(np.array(e['v']) == d['v'].astype('f')))
+
+            # Shuffling makes float data more compressible
+            d.save(path)
+            size = os.path.getsize(path)
+            d.save(path, shuffle=True)
+            self.assertLess(os.path.getsize(path), size)
+
+            # Shuffled files can't be memory-mapped
+            d.save(path, compression='stored', shuffle=True)
+            self.assertRaisesRegex(
+                myokit.DataLogReadError, 'shuffling', myokit.DataLog.load,
+                path, mmap=True)
+
+            # Bad compression
+            self.assertRaisesRegex(
+                ValueError, 'Unknown compression', d.save, path,
+                compression='bzip2')
+
     def test_load_errors(self):
         # Test if the correct load errors are raised.
 
@@ -2085,6 +2189,14 @@ class DataLogTest(unittest.TestCase):
         self.assertEqual(apds['start'][0], 5)
         self.assertEqual(apds['duration'][0], 4)
 
+        # NumPy arrays are returned for NumPy logs, lists for lists
+        self.assertIsInstance(apds['start'], np.ndarray)
+        self.assertIsInstance(apds['duration'], np.ndarray)
+        d['v'] = list(d['v'])
+        apds = d.apd(v='v', threshold=-85)
+        self.assertEqual(apds['start'], [5])
+        self.assertEqual(apds['duration'], [4])
+
         # Check against example model
         m, p, x = myokit.load(os.path.join(DIR_DATA, 'lr-1991.mmt'))
         s = myokit.Simulation(m, p)
@@ -2201,6 +2313,49 @@ class DataLogTest(unittest.TestCase):
         for i, y in enumerate(x):
             self.assertTrue(np.abs(np.exp(y) - e['values'][i]) < 0.02)
 
+        # test extrapolation
+        d = myokit.DataLog(time='time')
+        d['time'] = [1, 2, 4, 5]
+        d['values'] = [3, 5, 4, 0]
+        e = d.regularize(dt=1, tmin=0, tmax=6)
+        self.assertTrue(np.all(e['time'] == np.arange(7)))
+        self.assertTrue(np.all(e['values'] == [1, 3, 5, 4.5, 4, 0, -4]))
+
+    def test_views(self):
+        # Test trimming and splitting NumPy logs without copying.
+
+        d = myokit.DataLog(time='t')
+        d['t'] = np.arange(100, dtype=float)
+        d['v'] = np.arange(100, dtype=float) * 2
+
+        # Copies by default
+        e = d.trim(10, 20)
+        self.assertFalse(np.shares_memory(e['v'], d['v']))
+        e = d.trim(10, 20, copy=False)
+        self.assertTrue(np.shares_memory(e['v'], d['v']))
+        self.assertTrue(np.all(e['v'] == d['v'][10:20]))
+        e = d.trim_left(90, copy=False)
+        self.assertTrue(np.shares_memory(e['t'], d['t']))
+        e = d.trim_right(10, copy=False)
+        self.assertTrue(np.shares_memory(e['t'], d['t']))
+
+        # Adjusted time is never a view
+        e = d.trim(10, 20, adjust=True, copy=False)
+        self.assertFalse(np.shares_memory(e['t'], d['t']))
+        self.assertTrue(np.all(e['t'] == np.arange(10)))
+        self.assertEqual(d['t'][10], 10)
+
+        # Splitting
+        logs = d.split_periodic(30, adjust=True, copy=False)
+        self.assertEqual(len(logs), 4)
+        for i, e in enumerate(logs):
+            self.assertTrue(np.shares_memory(e['v'], d['v']))
+            self.assertFalse(np.shares_memory(e['t'], d['t']))
+            self.assertEqual(e['v'][0], 60 * i)
+            self.assertEqual(e['t'][0], 0)
+        self.assertEqual(len(logs[0]['t']), 31)
+        self.assertTrue(np.all(d['t'] == np.arange(100)))
+
     def test_time(self):
         # Test the time() method.
 
@@ -2295,6 +2450,233 @@ class DataLogTest(unittest.TestCase):
         self.assertEqual(w.name(), 'w')
 
 
+class DataLogWriterTest(unittest.TestCase):
+    """
+    Tests the DataLogWriter class.
+    """
+
+    def test_write_and_load(self):
+        # Test writing in chunks and loading.
+
+        t = np.arange(25, dtype=float)
+        v = np.sin(t)
+        with TemporaryDirectory() as td:
+            path = td.path('test.bin')
+            with myokit.DataLogWriter(path, ['t', 'v'], time='t',
+                                      chunk_size=10) as w:
+                self.assertEqual(w.filename(), path)
+                for i in range(12):
+                    w['t'].append(t[i])
+                    w['v'].append(v[i])
+
+                # One chunk written, two points buffered
+                self.assertEqual(w.length(), 12)
+                self.assertEqual(len(w['v']), 12)
+                self.assertEqual(len(w['v']._b), 2)
+                w.validate()
+
+                # Extend, as used by simulations logging to NumPy arrays
+                w['t'].extend(t[12:])
+                w['v'].extend(v[12:])
+                self.assertEqual(w.length(), 25)
+                self.assertEqual(len(w['v']._b), 5)
+            self.assertTrue(w.closed())
+            w.close()
+
+            d = myokit.DataLog.load(path)
+            self.assertEqual(list(d.keys()), ['t', 'v'])
+            self.assertEqual(d.time_key(), 't')
+            self.assertEqual(d['v'].typecode, 'd')
+            self.assertTrue(np.all(np.array(d['t']) == t))
+            self.assertTrue(np.all(np.array(d['v']) == v))
+
+            # Files without an index can be read, incomplete chunks are
+            # ignored
+            with open(path, 'rb') as f:
+                data = f.read()
+            with open(path, 'wb') as f:
+                f.write(data[:-10])
+            d = myokit.DataLog.load(path)
+            self.assertTrue(np.all(np.array(d['v']) == v))
+            with open(path, 'wb') as f:
+                f.write(data[:data.index(b'INDX') - 10])
+            d = myokit.DataLog.load(path)
+            self.assertTrue(np.all(np.array(d['v']) == v[:20]))
+
+            # Single precision, empty log
+            with myokit.DataLogWriter(
+                    path, ['t'], precision=myokit.SINGLE_PRECISION) as w:
+                pass
+            d = myokit.DataLog.load(path)
+            self.assertIsNone(d.time_key())
+            self.assertEqual(d['t'].typecode, 'f')
+            self.assertEqual(len(d['t']), 0)
+
+    def test_load_selection(self):
+        # Test loading selected keys and time windows.
+
+        t = np.arange(100, dtype=float) * 0.5
+        d = myokit.DataLog(time='t')
+        d['t'] = t
+        d['0.v'] = np.sin(t)
+        d['1.v'] = np.cos(t)
+        with TemporaryDirectory() as td:
+            for compression in ('deflate', 'stored'):
+                for chunk_size in (None, 7, 1000):
+                    path = td.path('test.bin')
+                    d.save(path, compression=compression,
+                           chunk_size=chunk_size)
+
+                    # Full log
+                    e = myokit.DataLog.load(path)
+                    self.assertEqual(list(e.keys()), list(d.keys()))
+                    for k, v in d.items():
+                        self.assertTrue(np.all(np.array(e[k]) == v))
+
+                    # Selected keys, in the order given, after the time key
+                    e = myokit.DataLog.load(path, keys=[('v', 1), '0.v'])
+                    self.assertEqual(list(e.keys()), ['t', '1.v', '0.v'])
+                    e.validate()
+                    self.assertTrue(np.all(np.array(e.time()) == t))
+                    self.assertTrue(np.all(np.array(e['0.v']) == d['0.v']))
+                    e = myokit.DataLog.load(path, keys=['0.v', 't'])
+                    self.assertEqual(list(e.keys()), ['0.v', 't'])
+
+                    # Time windows
+                    for a, b in ((None, 10), (3.2, None), (3, 10.5),
+                                 (-5, 5), (6, 6), (60, None)):
+                        e = myokit.DataLog.load(
+                            path, keys=['1.v'], tmin=a, tmax=b)
+                        self.assertEqual(list(e.keys()), ['t', '1.v'])
+                        e.validate()
+                        f = d.trim(-1 if a is None else a,
+                                   100 if b is None else b)
+                        self.assertTrue(
+                            np.all(np.array(e['1.v']) == f['1.v']))
+
+                    # Memory-mapped selection
+                    if compression == 'stored' and chunk_size is None:
+                        e = myokit.DataLog.load(
+                            path, mmap=True, keys=['t'], tmin=10)
+                        self.assertTrue(np.all(e['t'] == t[20:]))
+
+                    # Errors
+                    self.assertRaisesRegex(
+                        KeyError, 'not found', myokit.DataLog.load, path,
+                        keys=['w'])
+                    d.set_time_key(None)
+                    d.save(path, compression=compression,
+                           chunk_size=chunk_size)
+                    d.set_time_key('t')
+                    self.assertRaisesRegex(
+                        ValueError, 'time variable', myokit.DataLog.load,
+                        path, tmin=1)
+
+            self.assertRaisesRegex(
+                ValueError, 'Unknown compression', d.save, path,
+                compression='zip', chunk_size=10)
+
+    def test_with_prepare_log(self):
+        # Test writers can be used as simulation logs.
+
+        m = myokit.load_model(os.path.join(DIR_DATA, 'lr-1991.mmt'))
+        with TemporaryDirectory() as td:
+            w = myokit.DataLogWriter(
+                td.path('test.bin'), ['engine.time', 'membrane.V'])
+            self.assertIs(myokit.prepare_log(w, m), w)
+            self.assertEqual(w.time_key(), 'engine.time')
+            w.close()
+
+            # Time key can't be changed after writing
+            self.assertRaisesRegex(
+                RuntimeError, 'time key', w.set_time_key, 'membrane.V')
+
+    def test_writer_large_extend(self):
+        # Test buffers stay bounded after extending by more than a chunk.
+
+        with TemporaryDirectory() as td:
+            path = td.path('test.bin')
+            w = myokit.DataLogWriter(path, ['a', 'b'], chunk_size=10)
+            w['a'].extend(range(35))
+            self.assertEqual(len(w['a']._b), 35)
+            w['b'].extend(range(35))
+            self.assertEqual(len(w['a']._b), 5)
+            self.assertEqual(len(w['b']._b), 5)
+            for i in range(35, 135):
+                w['a'].append(i)
+                w['b'].append(-i)
+                self.assertLess(len(w['a']._b), 11)
+                self.assertLess(len(w['b']._b), 11)
+            self.assertEqual(len(w['a']), 135)
+            w.close()
+            d = myokit.DataLog.load(path)
+            self.assertEqual(list(d['a']), list(range(135)))
+            self.assertEqual(
+                list(d['b']), list(range(35)) + [-i for i in range(35, 135)])
+
+    def test_writer_errors(self):
+        # Test error handling in the DataLogWriter.
+
+        with TemporaryDirectory() as td:
+            path = td.path('test.bin')
+            self.assertRaisesRegex(
+                ValueError, 'chunk size', myokit.DataLogWriter, path, ['a'],
+                chunk_size=0)
+            self.assertRaisesRegex(
+                ValueError, 'At least one', myokit.DataLogWriter, path, [])
+
+            w = myokit.DataLogWriter(path, ['a', 'b'])
+            self.assertRaisesRegex(
+                TypeError, 'replaced', w.__setitem__, 'a', [])
+            self.assertRaises(NotImplementedError, w.clone)
+            w.set_time_key('c')
+            self.assertRaisesRegex(
+                myokit.InvalidDataLogError, 'not found', w.validate)
+            w.set_time_key(None)
+
+            # Unequal lengths
+            w['a'].append(1)
+            w['a'].append(2)
+            w['b'].append(1)
+            self.assertRaisesRegex(
+                myokit.InvalidDataLogError, 'same length', w.validate)
+            self.assertRaisesRegex(
+                myokit.InvalidDataLogError, 'same length', w.close)
+            self.assertTrue(w.closed())
+            d = myokit.DataLog.load(path)
+            self.assertEqual(list(d['a']), [1])
+
+            # Bad headers
+            with open(path, 'rb') as f:
+                data = f.read()
+            with open(path, 'wb') as f:
+                f.write(data.replace(b'\n2\n', b'\n3\n', 1))
+            self.assertRaisesRegex(
+                myokit.DataLogReadError, 'number of fields',
+                myokit.DataLog.load, path)
+            with open(path, 'wb') as f:
+                f.write(data.replace(b'\nd\n', b'\nx\n', 1))
+            self.assertRaisesRegex(
+                myokit.DataLogReadError, 'data type', myokit.DataLog.load,
+                path)
+            with open(path, 'wb') as f:
+                f.write(data.replace(b'\ndeflate\n', b'\nzip\n', 1))
+            self.assertRaisesRegex(
+                myokit.DataLogReadError, 'compression', myokit.DataLog.load,
+                path)
+            with open(path, 'wb') as f:
+                f.write(data.replace(b'1\n2', b'2\n2', 1))
+            self.assertRaisesRegex(
+                myokit.DataLogReadError, 'version', myokit.DataLog.load,
+                path)
+            with open(path, 'wb') as f:
+                data = data[:data.index(b'INDX')]
+                f.write(data.replace(b'CHNK', b'XXXX', 1))
+            self.assertRaisesRegex(
+                myokit.DataLogReadError, 'chunk header', myokit.DataLog.load,
+                path)
+
+
 if __name__ == '__main__':
     print('Add -v for more debug output')
     import sys
@@ -992,6 +992,47 @@ class NumPyExpressionWriterTest(unittest.TestCase):
             ValueError, 'Unknown expression type', w.ex, 7)
 
 
+class NumPyArrayExpressionWriterTest(unittest.TestCase):
+    """ Test the NumPy array ewriter class. """
+
+    def test_conditions(self):
+        w = myokit.formats.python.NumPyArrayExpressionWriter()
+
+        model = myokit.Model()
+        component = model.add_component('c')
+        avar = component.add_variable('a')
+        a = myokit.Name(avar)
+        b = myokit.Number('12', 'pF')
+        c = myokit.Number(1)
+        cond1 = myokit.parse_expression('5 > 3')
+        cond2 = myokit.parse_expression('2 < 1')
+
+        # Inherited
+        self.assertEqual(w.ex(myokit.Exp(a)), 'numpy.exp(c.a)')
+
+        # Not
+        x = myokit.Not(cond1)
+        self.assertEqual(w.ex(x), 'numpy.logical_not((5.0 > 3.0))')
+        # And
+        x = myokit.And(cond1, cond2)
+        self.assertEqual(
+            w.ex(x), 'numpy.logical_and((5.0 > 3.0), (2.0 < 1.0))')
+        # Or
+        x = myokit.Or(cond1, cond2)
+        self.assertEqual(
+            w.ex(x), 'numpy.logical_or((5.0 > 3.0), (2.0 < 1.0))')
+
+        # If
+        x = myokit.If(cond1, a, b)
+        self.assertEqual(w.ex(x), 'numpy.where((5.0 > 3.0), c.a, 12.0)')
+        # Piecewise
+        x = myokit.Piecewise(cond1, a, cond2, b, c)
+        self.assertEqual(
+            w.ex(x),
+            'numpy.where((5.0 > 3.0), c.a, '
+            'numpy.where((2.0 < 1.0), 12.0, 1.0))')
+
+
 class PythonExpressionWriterTest(unittest.TestCase):
     """ Test the Python ewriter class. """
 
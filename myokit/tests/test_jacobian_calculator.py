@@ -68,6 +68,50 @@ class JacobianCalculatorTest(unittest.TestCase):
         self.assertRaisesRegex(
             ValueError, 'floats', c.calculate, x)
 
+    def test_batch(self):
+        # Test calculating derivatives and Jacobians for a batch of states
+
+        m = myokit.load_model(os.path.join(DIR_DATA, 'noble-1962.mmt'))
+        c = myokit.JacobianCalculator(m)
+        n = m.count_states()
+        x = np.array(m.state()) * np.linspace(0.9, 1.1, 5).reshape((5, 1))
+
+        f, j = c.calculate(x)
+        self.assertEqual(f.shape, (5, n))
+        self.assertEqual(j.shape, (5, n, n))
+        for i, xi in enumerate(x):
+            fi, ji = c.calculate(xi)
+            self.assertTrue(np.all(f[i] == fi))
+            self.assertTrue(np.all(j[i] == ji))
+
+        # Preallocated output arrays
+        f2 = np.zeros((5, n))
+        j2 = np.zeros((5, n, n))
+        f3, j3 = c.calculate(x, f2, j2)
+        self.assertIs(f2, f3)
+        self.assertIs(j2, j3)
+        self.assertTrue(np.all(f2 == f))
+        self.assertTrue(np.all(j2 == j))
+
+        # Empty batch
+        f, j = c.calculate(np.zeros((0, n)))
+        self.assertEqual(j.shape, (0, n, n))
+
+        # Invalid arrays
+        self.assertRaisesRegex(
+            ValueError, 'shape', c.calculate, x, np.zeros((4, n)))
+        self.assertRaisesRegex(
+            ValueError, 'shape', c.calculate, x, None, np.zeros((5, n)))
+        self.assertRaisesRegex(
+            ValueError, 'floats', c.calculate, x, np.zeros((5, n), dtype=int))
+        self.assertRaisesRegex(
+            ValueError, 'C-contiguous', c.calculate, x, None,
+            np.zeros((5, n, n)).T)
+        self.assertRaisesRegex(
+            ValueError, 'length', c.calculate, np.zeros((2, 3, n)))
+        self.assertRaisesRegex(
+            ValueError, 'length', c.calculate, np.zeros((5, n + 1)))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -16,6 +16,12 @@ import myokit
 
 from myokit.tests import DIR_DATA, WarningCollector
 
+# Unit testing in Python 2 and 3
+try:
+    unittest.TestCase.assertRaisesRegex
+except AttributeError:
+    unittest.TestCase.assertRaisesRegex = unittest.TestCase.assertRaisesRegexp
+
 
 class CommonTest(unittest.TestCase):
     """Tests lib.common"""
@@ -47,6 +53,16 @@ class CommonTest(unittest.TestCase):
         a.peaks(normalize=False)
         a.fit_boltzmann()
 
+        # Parallel and serial results are the same
+        a.disable_conversion()
+        a.set_step_potential(-80, 0, 20, 10)
+        a.set_threads(1)
+        p1 = a.peaks()
+        a.set_threads(3)
+        a.set_step_potential(-80, 0, 20, 10)
+        p2 = a.peaks()
+        self.assertTrue(np.all(p1['ina.g'] == p2['ina.g']))
+
     def test_inactivation(self):
         # Test the inactivation experiment class.
         with WarningCollector():
@@ -68,6 +84,15 @@ class CommonTest(unittest.TestCase):
         a.peaks(normalize=False)
         a.fit_boltzmann()
 
+        # Independent steps give the same results with any number of threads
+        a.disable_conversion()
+        a.set_step_potential(-80, 0, 20, 10)
+        a.set_threads(1)
+        p1 = a.peaks()
+        a.set_threads(3)
+        p2 = a.peaks()
+        self.assertTrue(np.all(p1['ina.g'] == p2['ina.g']))
+
     def test_recovery(self):
         # Test the recovery experiment class.
         with WarningCollector():
@@ -96,6 +121,13 @@ class CommonTest(unittest.TestCase):
         x = d['ina.g']  # This is a monotonically increasing function
         self.assertTrue(np.all(x[1:] > x[:-1]))
 
+        # Independent pauses give the same results with any number of threads
+        r.set_threads(1)
+        d1 = r.ratio()
+        r.set_threads(3)
+        d2 = r.ratio()
+        self.assertTrue(np.all(np.array(d1['ina.g']) == d2['ina.g']))
+
     def test_restitution(self):
         # Test the restitution experiment class.
         with WarningCollector():
@@ -125,6 +157,29 @@ class CommonTest(unittest.TestCase):
         s.set_times(0.5, 1.0, 0.2)
         s.run()
 
+    def test_map(self):
+        # Test dividing jobs over threads.
+        with WarningCollector():
+            import myokit.lib.common as common
+
+        def f(s, x):
+            return s, x
+
+        # Results are returned in order, each job uses a single simulation
+        for sims in (['a'], ['a', 'b'], ['a', 'b', 'c']):
+            r = common._map(f, range(7), sims)
+            self.assertEqual([x for s, x in r], list(range(7)))
+            self.assertEqual(
+                [s for s, x in r], [sims[i % len(sims)] for i in range(7)])
+
+        # Errors are passed on
+        def g(s, x):
+            raise ValueError('oops')
+
+        self.assertRaisesRegex(ValueError, 'oops', common._map, g, [1], ['a'])
+        self.assertRaisesRegex(
+            ValueError, 'oops', common._map, g, [1, 2], ['a', 'b'])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -835,6 +835,51 @@ class AnalyticalSimulationTest(unittest.TestCase):
         self.assertRaisesRegex(
             ValueError, 'must be in the range', s.set_default_state, dstate)
 
+    def test_run_batch(self):
+        # Test running simulations for several parameter sets at once.
+
+        fname = os.path.join(DIR_DATA, 'lr-1991-fitting.mmt')
+        model = myokit.load_model(fname)
+        m = hh.HHModel.from_component(model.get('ina'))
+        p = myokit.pacing.steptrain([-30, -10], -120, 3, 2)
+        s = hh.AnalyticalSimulation(m, p)
+        s.pre(10)
+
+        # Compare with running each set separately
+        p0 = np.array(s.parameters())
+        ps = np.array([p0, 1.1 * p0, 0.9 * p0])
+        x0 = s.state()
+        i = s.run_batch(ps, 8, log_interval=0.05)
+        self.assertEqual(i.shape, (3, 160))
+        self.assertEqual(s.state(), x0)
+        for k in range(3):
+            s.reset()
+            s.set_parameters(ps[k])
+            d = s.run(8, log_interval=0.05)
+            self.assertTrue(np.allclose(i[k], d[m.current()]))
+
+        # Fixed membrane potential, log times
+        s = hh.AnalyticalSimulation(m)
+        s.set_membrane_potential(-20)
+        times = np.linspace(0, 5, 11)
+        i = s.run_batch(ps[:1], 5, log_times=times)
+        self.assertTrue(np.allclose(i[0], s.solve(times)[1]))
+
+        # Invalid input
+        self.assertRaisesRegex(
+            ValueError, 'array', s.run_batch, ps[:, :3], 5)
+        self.assertRaisesRegex(
+            ValueError, 'array', s.run_batch, p0, 5)
+        self.assertRaisesRegex(
+            ValueError, 'negative', s.run_batch, ps, -1)
+        self.assertRaisesRegex(
+            ValueError, 'greater than zero', s.run_batch, ps, 5, 0)
+        model.get('ina').remove_variable(model.get('ina.INa'))
+        m = hh.HHModel.from_component(model.get('ina'))
+        s = hh.AnalyticalSimulation(m)
+        self.assertRaisesRegex(
+            Exception, 'did not specify a current', s.run_batch, ps, 5)
+
     def test_against_cvode(self):
         # Validate against a cvode sim.
 
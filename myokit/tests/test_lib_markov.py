@@ -266,6 +266,33 @@ class LinearModelTest(unittest.TestCase):
         # Requires 21 parameters
         self.assertRaises(ValueError, m.matrices, -20, range(3))
 
+        # Multiple voltages at once
+        vs = np.linspace(-100, 40, 8)
+        A, B = m.matrices(vs)
+        self.assertEqual(A.shape, (8, 6, 6))
+        self.assertEqual(B.shape, (8, 6))
+        for k, v in enumerate(vs):
+            Ak, Bk = m.matrices(v)
+            self.assertTrue(np.allclose(A[k], Ak, rtol=1e-12, atol=0))
+            self.assertTrue(np.allclose(B[k], Bk, rtol=1e-12, atol=0))
+        self.assertRaises(ValueError, m.matrices, vs, range(3))
+
+        # Multiple parameter sets at once, with or without voltages
+        p = np.array(m.default_parameters())
+        ps = np.array([p, 1.1 * p, 0.9 * p])
+        A, B = m.matrices(-20, ps)
+        self.assertEqual(A.shape, (3, 6, 6))
+        self.assertEqual(B.shape, (3, 6))
+        A2, B2 = m.matrices(vs[:3], ps)
+        for k, q in enumerate(ps):
+            Ak, Bk = m.matrices(-20, q)
+            self.assertTrue(np.allclose(A[k], Ak, rtol=1e-12, atol=0))
+            self.assertTrue(np.allclose(B[k], Bk, rtol=1e-12, atol=0))
+            Ak, Bk = m.matrices(vs[k], q)
+            self.assertTrue(np.allclose(A2[k], Ak, rtol=1e-12, atol=0))
+            self.assertTrue(np.allclose(B2[k], Bk, rtol=1e-12, atol=0))
+        self.assertRaises(ValueError, m.matrices, -20, ps[:, :3])
+
     def test_linear_model_steady_state_1(self):
         # Test finding the steady-state of the Clancy model
 
@@ -507,6 +534,116 @@ class AnalyticalSimulationTest(unittest.TestCase):
         self.assertRaisesRegex(
             ValueError, 'negative', s.set_default_state, dstate)
 
+    def test_cache_and_lookup_table(self):
+        # Test the bounded cache and the lookup table.
+
+        fname = os.path.join(DIR_DATA, 'clancy-1999-fitting.mmt')
+        model = myokit.load_model(fname)
+        m = markov.LinearModel.from_component(model.get('ina'))
+        times = np.linspace(0, 5, 6)
+
+        # Cache is bounded
+        s = markov.AnalyticalSimulation(m, cache_size=3)
+        x = []
+        for v in [-80, -60, -40, -20, -80]:
+            s.set_membrane_potential(v)
+            x.append(s.solve(times)[0])
+        self.assertEqual(len(s._cached_solution), 3)
+        self.assertTrue(np.all(x[0] == x[-1]))
+        self.assertRaisesRegex(
+            ValueError, 'cache size', markov.AnalyticalSimulation, m,
+            cache_size=0)
+
+        # Changing constants invalidates the cache
+        s.set_constant(m.parameters()[0], 1.5 * s.parameters()[0])
+        self.assertEqual(len(s._cached_solution), 0)
+
+        # Lookup table: exact at grid points, close in between
+        s1 = markov.AnalyticalSimulation(m)
+        s2 = markov.AnalyticalSimulation(m)
+        s2.set_lookup_table(-120, 60, 0.5)
+        for v in [-120, -80.5, -42.1, -10.25, 60, 70]:
+            s1.set_membrane_potential(v)
+            s2.set_membrane_potential(v)
+            x1, i1 = s1.solve(times)
+            x2, i2 = s2.solve(times)
+            self.assertTrue(np.allclose(x1, x2, atol=1e-3, rtol=0))
+            self.assertTrue(np.allclose(
+                i1, i2, atol=1e-3 * np.max(np.abs(i1)), rtol=0))
+        self.assertEqual(len(s2._cached_solution), 1)
+
+        # Table is updated when parameters change
+        p = s1.parameters()
+        p[0] *= 1.5
+        s1.set_parameters(p)
+        s2.set_parameters(p)
+        i1, i2 = s1.solve(times)[1], s2.solve(times)[1]
+        self.assertTrue(np.allclose(
+            i1, i2, atol=1e-3 * np.max(np.abs(i1)), rtol=0))
+
+        # Disable table
+        s2.set_lookup_table()
+        s2.set_membrane_potential(-42.1)
+        s2.solve(times)
+        self.assertIn(-42.1, s2._cached_solution)
+
+        # Invalid tables
+        self.assertRaisesRegex(
+            ValueError, 'Both', s2.set_lookup_table, vmin=-100)
+        self.assertRaisesRegex(
+            ValueError, 'step size', s2.set_lookup_table, -100, 50, 0)
+        self.assertRaisesRegex(
+            ValueError, 'maximum', s2.set_lookup_table, 50, -100)
+
+    def test_run_batch(self):
+        # Test running simulations for several parameter sets at once.
+
+        fname = os.path.join(DIR_DATA, 'clancy-1999-fitting.mmt')
+        model = myokit.load_model(fname)
+        m = markov.LinearModel.from_component(model.get('ina'))
+        p = myokit.pacing.steptrain([-30, -10], -120, 3, 2)
+        s = markov.AnalyticalSimulation(m, p)
+        s.pre(10)
+
+        # Compare with running each set separately
+        p0 = np.array(s.parameters())
+        ps = np.array([p0, 1.1 * p0, 0.9 * p0, p0])
+        ps[3, 0] = float('nan')
+        x0 = s.state()
+        i = s.run_batch(ps, 8, log_interval=0.05)
+        self.assertEqual(i.shape, (4, 160))
+        self.assertEqual(s.state(), x0)
+        for k in range(3):
+            s.reset()
+            s.set_parameters(ps[k])
+            d = s.run(8, log_interval=0.05)
+            e = d[m.current()]
+            self.assertTrue(np.allclose(
+                i[k], e, atol=1e-6 * np.max(np.abs(e)), rtol=0))
+        self.assertTrue(np.all(np.isnan(i[3])))
+
+        # Fixed membrane potential, log times
+        s = markov.AnalyticalSimulation(m)
+        s.set_membrane_potential(-20)
+        times = np.linspace(0, 5, 11)
+        i = s.run_batch(ps[:1], 5, log_times=times)
+        self.assertTrue(np.allclose(i[0], s.solve(times)[1]))
+
+        # Invalid input
+        self.assertRaisesRegex(
+            ValueError, 'array', s.run_batch, ps[:, :3], 5)
+        self.assertRaisesRegex(
+            ValueError, 'array', s.run_batch, p0, 5)
+        self.assertRaisesRegex(
+            ValueError, 'negative', s.run_batch, ps, -1)
+        self.assertRaisesRegex(
+            ValueError, 'greater than zero', s.run_batch, ps, 5, 0)
+        model.get('ina').remove_variable(model.get('ina.i'))
+        m = markov.LinearModel.from_component(model.get('ina'))
+        s = markov.AnalyticalSimulation(m)
+        self.assertRaisesRegex(
+            Exception, 'did not specify a current', s.run_batch, ps, 5)
+
     def test_against_cvode(self):
         # Validate against a cvode sim.
 
@@ -668,6 +805,91 @@ class DiscreteSimulationTest(unittest.TestCase):
         d2['hello'] = [1, 2, 3]
         self.assertRaisesRegex(ValueError, 'extra', s.run, 1, log=d2)
 
+    def test_compiled_methods(self):
+        # Test the compiled direct and tau-leaping methods.
+
+        fname = os.path.join(DIR_DATA, 'clancy-1999-fitting.mmt')
+        model = myokit.load_model(fname)
+        m = markov.LinearModel.from_component(model.get('ina'))
+        p = myokit.pacing.steptrain([-20], -120, 5, 5)
+        n = 10000
+
+        # Reference: fraction of open channels during step
+        a = markov.AnalyticalSimulation(m, p)
+        times = np.array([5.5, 6, 7])
+        ref = a.run(10, log_times=times)['ina.O']
+
+        for method in ('direct', 'tau-leaping'):
+            np.random.seed(1)
+            s = markov.DiscreteSimulation(
+                m, p, nchannels=n, method=method, leap_interval=0.001)
+            self.assertEqual(s.method(), method)
+            d = s.run(10)
+            self.assertEqual(len(d.time()), len(d['ina.O']))
+            self.assertEqual(len(d.time()), len(d['ina.i']))
+            self.assertEqual(len(d.time()), len(d['membrane.V']))
+            self.assertEqual(sum(s.state()), n)
+            self.assertTrue(np.all(np.diff(d.time()) >= 0))
+            x = np.array([d[k] for k in m.states()])
+            self.assertTrue(np.all(np.sum(x, axis=0) == n))
+            i = np.searchsorted(d.time(), times, side='right') - 1
+            o = np.array(d['ina.O'])[i] / n
+            self.assertTrue(np.allclose(o, ref, atol=0.02, rtol=0))
+
+            # Seeding numpy gives reproducible results
+            np.random.seed(1)
+            s = markov.DiscreteSimulation(
+                m, p, nchannels=n, method=method, leap_interval=0.001)
+            e = s.run(10)
+            self.assertEqual(d.time(), e.time())
+            self.assertEqual(d['ina.O'], e['ina.O'])
+
+        # Tau-leaping logs once per leap
+        s = markov.DiscreteSimulation(
+            m, nchannels=n, method='tau-leaping', leap_interval=0.5)
+        d = s.run(10)
+        self.assertTrue(np.allclose(d.time(), np.arange(0, 10, 0.5)))
+        self.assertEqual(s._time, 10)
+
+        # Invalid methods
+        self.assertRaisesRegex(
+            ValueError, 'Unknown method', markov.DiscreteSimulation, m,
+            method='next-reaction')
+        self.assertRaisesRegex(
+            ValueError, 'greater than zero', markov.DiscreteSimulation, m,
+            method='tau-leaping', leap_interval=0)
+
+    def test_run_replicates(self):
+        # Test running independent replicates.
+
+        fname = os.path.join(DIR_DATA, 'clancy-1999-fitting.mmt')
+        model = myokit.load_model(fname)
+        m = markov.LinearModel.from_component(model.get('ina'))
+        p = myokit.pacing.steptrain([-20], -120, 2, 2)
+
+        for method in ('python', 'direct', 'tau-leaping'):
+            s = markov.DiscreteSimulation(m, p, nchannels=1000, method=method)
+            s.run(1)
+            state = s.state()
+            logs = s.run_replicates(3, 3, threads=2)
+            self.assertEqual(len(logs), 3)
+            self.assertEqual(s.state(), state)
+            self.assertEqual(s._time, 1)
+            for d in logs:
+                self.assertIsInstance(d, myokit.DataLog)
+                self.assertEqual(d.time()[0], 1)
+                self.assertEqual(len(d.time()), len(d['ina.i']))
+                self.assertEqual(set(d['membrane.V']), set([-120, -20]))
+                self.assertEqual(
+                    [d[k][0] for k in m.states()], [float(x) for x in state])
+            self.assertNotEqual(logs[0]['ina.O'], logs[1]['ina.O'])
+
+        # Invalid arguments
+        self.assertRaisesRegex(
+            ValueError, 'negative', s.run_replicates, -1, 2)
+        self.assertRaisesRegex(
+            ValueError, 'at least 1', s.run_replicates, 1, 0)
+
     def test_discrete_simulation_properties(self):
         # Test basic get/set methods of discrete simulation.
 
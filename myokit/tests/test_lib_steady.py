@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+#
+# Tests the lib.steady module.
+#
+# This file is part of Myokit.
+# See http://myokit.org for copyright, sharing, and licensing details.
+#
+from __future__ import absolute_import, division
+from __future__ import print_function, unicode_literals
+
+import os
+import unittest
+import numpy as np
+
+import myokit
+import myokit.lib.steady as steady
+
+from myokit.tests import DIR_DATA, TemporaryDirectory
+
+# Unit testing in Python 2 and 3
+try:
+    unittest.TestCase.assertRaisesRegex
+except AttributeError:
+    unittest.TestCase.assertRaisesRegex = unittest.TestCase.assertRaisesRegexp
+
+
+MODEL = """
+[[model]]
+c.x = 1
+c.y = 0
+
+[engine]
+time = 0 bind time
+pace = 0 bind pace
+
+[c]
+dot(x) = a - b * x * y
+dot(y) = x - y
+a = 2
+b = 0.5
+"""
+
+
+class LimitCycleTest(unittest.TestCase):
+    """
+    Tests :meth:`myokit.lib.steady.limit_cycle()`.
+    """
+
+    def test_limit_cycle(self):
+        # Test finding a limit cycle, with and without caching
+
+        m = myokit.load_model(os.path.join(DIR_DATA, 'beeler-1977-model.mmt'))
+        p = myokit.load_protocol(
+            os.path.join(DIR_DATA, 'beeler-1977-protocol.mmt'))
+        s = myokit.Simulation(m, p)
+        s.set_tolerance(1e-8, 1e-8)
+
+        with TemporaryDirectory() as d:
+            cache = myokit.tools.DiskCache(d.path())
+
+            # Plain pre-pacing
+            x1, b1, c1 = steady.limit_cycle(
+                s, 1000, rel_tol=1e-4, accelerate=False, cache=cache)
+            self.assertTrue(c1)
+            self.assertGreater(b1, 1)
+            self.assertEqual(s.state(), x1)
+            self.assertEqual(s.default_state(), x1)
+            self.assertEqual(s.time(), 0)
+            self.assertEqual(len(cache._entries()), 1)
+
+            # Result is a limit cycle
+            s.pre(1000)
+            x = np.array(x1)
+            y = np.array(s.state())
+            self.assertTrue(np.all(np.abs(y - x) <= 1e-9 + 1e-4 * np.abs(y)))
+
+            # Repeated call returns cached result
+            s.reset()
+            s.set_state(m.state())
+            x2, b2, c2 = steady.limit_cycle(
+                s, 1000, rel_tol=1e-4, accelerate=False, cache=cache)
+            self.assertEqual(x1, x2)
+            self.assertEqual(b1, b2)
+            self.assertTrue(c2)
+
+            # Changing a constant changes the key
+            s.set_state(m.state())
+            s.set_constant('isi.gsBar', 0.1)
+            x3, b3, c3 = steady.limit_cycle(
+                s, 1000, rel_tol=1e-4, accelerate=False, cache=cache)
+            self.assertNotEqual(x1, x3)
+            self.assertEqual(len(cache._entries()), 2)
+
+            # Accelerated search needs fewer beats
+            s.set_constant('isi.gsBar', 0.09)
+            s.set_state(m.state())
+            x4, b4, c4 = steady.limit_cycle(
+                s, 1000, rel_tol=1e-6, accelerate=True, cache=False)
+            s.set_state(m.state())
+            x5, b5, c5 = steady.limit_cycle(
+                s, 1000, rel_tol=1e-6, accelerate=False, cache=False)
+            self.assertTrue(c4)
+            self.assertTrue(c5)
+            self.assertLessEqual(b4, b5)
+            self.assertTrue(np.allclose(x4, x5, rtol=1e-3, atol=1e-6))
+            self.assertEqual(len(cache._entries()), 2)
+
+            # Not converged
+            s.set_state(m.state())
+            x6, b6, c6 = steady.limit_cycle(
+                s, 1000, max_beats=2, cache=cache)
+            self.assertFalse(c6)
+            self.assertEqual(b6, 2)
+            self.assertEqual(len(cache._entries()), 2)
+
+    def test_limit_cycle_errors(self):
+        # Test argument checking
+
+        m = myokit.parse_model(MODEL)
+        s = myokit.Simulation(m)
+        self.assertRaisesRegex(
+            ValueError, 'Period', steady.limit_cycle, s, 0)
+        self.assertRaisesRegex(
+            ValueError, 'beats', steady.limit_cycle, s, 1, max_beats=0)
+        self.assertRaisesRegex(
+            ValueError, 'negative', steady.limit_cycle, s, 1, abs_tol=-1)
+        self.assertRaisesRegex(
+            ValueError, 'negative', steady.limit_cycle, s, 1, rel_tol=-1)
+        self.assertRaisesRegex(
+            ValueError, 'At least one', steady.limit_cycle, s, 1, abs_tol=0,
+            rel_tol=0)
+        self.assertRaisesRegex(
+            ValueError, 'cache', steady.limit_cycle, s, 1, cache='yes')
+
+
+class SteadyStateTest(unittest.TestCase):
+    """
+    Tests :meth:`myokit.lib.steady.steady_state()`.
+    """
+
+    def test_steady_state(self):
+        # Test finding and caching a steady state
+
+        m = myokit.parse_model(MODEL)
+        with TemporaryDirectory() as d:
+            cache = myokit.tools.DiskCache(d.path())
+
+            x, e = steady.steady_state(m, cache=cache)
+            self.assertLess(e, 1e-9)
+            self.assertAlmostEqual(x[0], 2)
+            self.assertAlmostEqual(x[1], 2)
+            self.assertEqual(len(cache._entries()), 1)
+
+            # Cached
+            x2, e2 = steady.steady_state(m, cache=cache)
+            self.assertEqual(x, x2)
+            self.assertEqual(e, e2)
+            self.assertEqual(len(cache._entries()), 1)
+
+            # Different model
+            m.get('c.a').set_rhs(4.5)
+            x3, e3 = steady.steady_state(m, cache=cache)
+            self.assertAlmostEqual(x3[0], 3)
+            self.assertEqual(len(cache._entries()), 2)
+
+            # No caching
+            x4, e4 = steady.steady_state(m, cache=False)
+            self.assertEqual(x3, x4)
+            self.assertEqual(len(cache._entries()), 2)
+
+        # Invalid arguments
+        self.assertRaisesRegex(
+            ValueError, 'negative', steady.steady_state, m, accuracy=-1)
+        self.assertRaisesRegex(
+            ValueError, 'cache', steady.steady_state, m, cache=1)
+
+    def test_default_cache(self):
+        # Test the default cache location
+
+        c = steady.cache()
+        self.assertTrue(c.path().startswith(
+            os.path.abspath(os.path.expanduser(myokit.DIR_CACHE))))
+        self.assertEqual(c.max_size(), steady.CACHE_SIZE)
+
+
+if __name__ == '__main__':
+    unittest.main()
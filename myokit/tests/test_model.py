@@ -433,6 +433,73 @@ class ModelTest(unittest.TestCase):
         nan = model.evaluate_derivatives(ignore_errors=True)[2]
         self.assertNotEqual(nan, nan)   # x != x is a nan test...
 
+    def test_pyfunc(self):
+        # Test Model.pyfunc()
+        import numpy as np
+
+        m = myokit.parse_model("""
+            [[model]]
+            c.x = 1
+            c.y = 2
+
+            [engine]
+            time = 0 bind time
+            pace = 0 bind pace
+
+            [c]
+            dot(x) = if(x > 1 and not y < 0, -x, a * exp(y)) + engine.pace
+            dot(y) = piecewise(x < 0, 1, x < 1 or b > 2, y, b * z)
+            z = sqrt(abs(x - y))
+            a = 2
+            b = a * 3
+            """)
+        f = m.pyfunc()
+
+        # Single state
+        x = m.state()
+        self.assertEqual(list(f(x)), m.evaluate_derivatives(x))
+
+        # Array of states, with and without inputs
+        xs = np.array([[1, 2], [2, 1], [-1, 3], [0.5, -3], [3, 4]])
+        ps = np.array([0, 1, 0, 1, 0])
+        fs = f(xs)
+        self.assertEqual(fs.shape, xs.shape)
+        for x, y in zip(xs, fs):
+            self.assertEqual(list(y), m.evaluate_derivatives(x))
+        fs = f(xs, {'pace': ps, 'time': 1, 'unknown': 2})
+        for x, p, y in zip(xs, ps, fs):
+            self.assertEqual(
+                list(y), m.evaluate_derivatives(x, inputs={'pace': p}))
+
+        # Output array
+        out = np.zeros(xs.shape)
+        self.assertIs(f(xs, None, out), out)
+        self.assertTrue(np.all(out == f(xs)))
+
+        # Changes to the model don't affect the function
+        m.get('c.a').set_rhs(3)
+        self.assertNotEqual(list(f(xs[0])), m.evaluate_derivatives(xs[0]))
+        self.assertEqual(
+            list(m.pyfunc()(xs[0])), m.evaluate_derivatives(xs[0]))
+
+        # Invalid state
+        self.assertRaisesRegex(ValueError, 'length 2', f, [1, 2, 3])
+        self.assertRaisesRegex(ValueError, 'length 2', f, 1)
+
+        # Variables named like python keywords or numpy
+        m = myokit.Model()
+        c = m.add_component('c')
+        t = c.add_variable('time')
+        t.set_rhs(0)
+        t.set_binding('time')
+        x = c.add_variable('numpy')
+        x.promote(1)
+        x.set_rhs('-numpy')
+        y = c.add_variable('x')
+        y.promote(1)
+        y.set_rhs('numpy')
+        self.assertEqual(list(m.pyfunc()([2, 3])), [-2, 2])
+
     def test_format_state(self):
         # Test Model.format_state()
 
@@ -112,5 +112,48 @@ class OpenCLTest(unittest.TestCase):
         self.assertEqual(o.clockspeed(1200), '1.2 GHz')
 
 
+class ProgramCacheTest(unittest.TestCase):
+    """
+    Tests the cache of OpenCL program binaries (without using OpenCL).
+    """
+
+    def setUp(self):
+        self._dir = myokit.DIR_CACHE
+        self._enabled = myokit.CACHE_COMPILED
+
+    def tearDown(self):
+        myokit.DIR_CACHE = self._dir
+        myokit.CACHE_COMPILED = self._enabled
+
+    def test_program_cache(self):
+        # Test storing and loading binaries
+        from myokit._sim.opencl import ProgramCache
+
+        with TemporaryDirectory() as d:
+            myokit.DIR_CACHE = d.path()
+            myokit.CACHE_COMPILED = True
+            c = ProgramCache.create()
+            self.assertIsInstance(c, ProgramCache)
+
+            device = ('Platform', '1.2', 'Device', '1.2', '3.4')
+            self.assertIsNone(c.load('source', device, ''))
+            c.store('source', device, '', b'binary')
+            self.assertEqual(c.load('source', device, ''), b'binary')
+
+            # Shared between instances
+            self.assertEqual(
+                ProgramCache().load('source', device, ''), b'binary')
+
+            # Keyed on source, device, driver, and options
+            other = ('Platform', '1.2', 'Device', '1.2', '3.5')
+            self.assertIsNone(c.load('source2', device, ''))
+            self.assertIsNone(c.load('source', other, ''))
+            self.assertIsNone(c.load('source', device, '-w'))
+
+            # Caching can be disabled
+            myokit.CACHE_COMPILED = False
+            self.assertIsNone(ProgramCache.create())
+
+
 if __name__ == '__main__':
     unittest.main()
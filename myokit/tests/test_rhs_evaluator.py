@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+#
+# Tests the RhsEvaluator and Model.compile_rhs()
+#
+# This file is part of Myokit.
+# See http://myokit.org for copyright, sharing, and licensing details.
+#
+from __future__ import absolute_import, division
+from __future__ import print_function, unicode_literals
+
+import os
+import unittest
+import numpy as np
+
+import myokit
+
+from myokit.tests import DIR_DATA
+
+# Unit testing in Python 2 and 3
+try:
+    unittest.TestCase.assertRaisesRegex
+except AttributeError:
+    unittest.TestCase.assertRaisesRegex = unittest.TestCase.assertRaisesRegexp
+
+
+class RhsEvaluatorTest(unittest.TestCase):
+    """
+    Tests :class:`myokit.RhsEvaluator`.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.model = myokit.load_model(
+            os.path.join(DIR_DATA, 'beeler-1977-model.mmt'))
+        cls.rhs = myokit.RhsEvaluator(cls.model)
+
+    def test_single(self):
+        # Test evaluating a single state
+
+        m = self.model
+        x = m.state()
+        f = self.rhs(x)
+        self.assertIsInstance(f, np.ndarray)
+        self.assertEqual(f.shape, (len(x), ))
+        self.assertTrue(np.allclose(f, m.evaluate_derivatives(x)))
+
+        x[0] = -20
+        f = self.rhs(x)
+        self.assertTrue(np.allclose(f, m.evaluate_derivatives(x)))
+
+        # Inputs
+        f = self.rhs(x, inputs={'pace': 1, 'unknown': 3})
+        self.assertTrue(np.allclose(
+            f, m.evaluate_derivatives(x, inputs={'pace': 1})))
+
+        # Intermediary variables
+        f, a = self.rhs.evaluate(x, intermediary=True)
+        names = self.rhs.intermediary()
+        self.assertEqual(a.shape, (len(names), ))
+        self.assertIn('ina.INa', names)
+        m2 = m.clone()
+        m2.set_state(x)
+        i = names.index('ina.INa')
+        self.assertAlmostEqual(a[i], m2.get('ina.INa').eval())
+        self.assertIsNone(self.rhs.evaluate(x)[1])
+
+    def test_batch(self):
+        # Test evaluating a batch of states
+
+        m = self.model
+        x = np.array(m.state())
+        xs = x * np.linspace(0.9, 1.1, 7)[:, None]
+        ps = np.array([0, 1, 0, 1, 0, 1, 0])
+        f, a = self.rhs.evaluate(xs, inputs={'pace': ps}, intermediary=True)
+        self.assertEqual(f.shape, xs.shape)
+        self.assertEqual(a.shape, (7, len(self.rhs.intermediary())))
+        for k in range(len(xs)):
+            g = m.evaluate_derivatives(xs[k], inputs={'pace': ps[k]})
+            self.assertTrue(np.allclose(f[k], g))
+            b = self.rhs.evaluate(
+                xs[k], inputs={'pace': ps[k]}, intermediary=True)[1]
+            self.assertTrue(np.all(a[k] == b))
+
+        # Preallocated output
+        out = np.zeros(xs.shape)
+        inter = np.zeros(a.shape)
+        f2, a2 = self.rhs.evaluate(
+            xs, inputs={'pace': ps}, derivatives=out, intermediary=inter)
+        self.assertIs(f2, out)
+        self.assertIs(a2, inter)
+        self.assertTrue(np.all(f2 == f))
+        self.assertTrue(np.all(a2 == a))
+        self.assertIs(self.rhs(xs, None, out), out)
+
+        # Empty batch
+        f = self.rhs(np.zeros((0, len(x))))
+        self.assertEqual(f.shape, (0, len(x)))
+
+    def test_errors(self):
+        # Test argument checking
+
+        n = self.model.count_states()
+        self.assertRaisesRegex(ValueError, 'length', self.rhs, [1, 2])
+        self.assertRaisesRegex(
+            ValueError, 'length', self.rhs, np.zeros((2, 2, n)))
+        self.assertRaisesRegex(ValueError, 'floats', self.rhs, ['a'] * n)
+        self.assertRaisesRegex(
+            ValueError, 'input `pace`', self.rhs, np.zeros((3, n)),
+            inputs={'pace': [1, 2]})
+        self.assertRaisesRegex(
+            ValueError, 'shape', self.rhs, np.zeros(n), out=np.zeros(n + 1))
+        self.assertRaisesRegex(
+            ValueError, 'C-contiguous', self.rhs, np.zeros(n),
+            out=np.zeros(n, dtype=int))
+        self.assertRaisesRegex(
+            ValueError, 'intermediary', self.rhs.evaluate, np.zeros(n),
+            intermediary=np.zeros(3))
+
+    def test_compile_rhs(self):
+        # Test Model.compile_rhs() and its caching
+
+        m = myokit.Model('m')
+        c = m.add_component('c')
+        t = c.add_variable('time')
+        t.set_binding('time')
+        t.set_rhs(1)
+        a = c.add_variable('a')
+        b = c.add_variable('b')
+        a.promote(1)
+        a.set_rhs('time')
+        b.promote(2)
+        b.set_rhs('2 * b + a')
+        m.validate()
+
+        f = m.compile_rhs()
+        self.assertIsInstance(f, myokit.RhsEvaluator)
+        self.assertIs(f, m.compile_rhs())
+        self.assertEqual(list(f([1, 2])), m.evaluate_derivatives([1, 2]))
+        self.assertEqual(list(f([1, 2], {'time': 3})), [3, 5])
+
+        # Changing the model results in a new evaluator
+        b.set_rhs('3 * b + a')
+        g = m.compile_rhs()
+        self.assertIsNot(f, g)
+        self.assertEqual(list(f([1, 2])), [1, 5])
+        self.assertEqual(list(g([1, 2])), [1, 7])
+        self.assertIs(g, m.compile_rhs())
+
+        # Changing the state order results in a new evaluator
+        m.reorder_state([b, a])
+        h = m.compile_rhs()
+        self.assertIsNot(g, h)
+        self.assertEqual(list(h([2, 1])), [7, 1])
+
+        # Changing state values does not
+        a.set_state_value(3)
+        self.assertIs(h, m.compile_rhs())
+
+
+if __name__ == '__main__':
+    unittest.main()
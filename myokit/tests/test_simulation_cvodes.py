@@ -22,7 +22,9 @@ import myokit
 from myokit.tests import (
     CancellingReporter,
     DIR_DATA,
+    TemporaryDirectory,
     test_case_pk_model,
+    TestReporter,
     WarningCollector,
 )
 
@@ -154,6 +156,200 @@ class SimulationTest(unittest.TestCase):
         self.assertNotEqual(e['engine.time'][n - 1], e['engine.time'][n])
         self.assertGreater(e['engine.time'][n], e['engine.time'][n - 1])
 
+    def test_log_numpy(self):
+        # Test logging to NumPy arrays.
+
+        # Dynamic logging
+        self.sim.reset()
+        d1 = self.sim.run(100)
+        self.sim.reset()
+        d2 = self.sim.run(100, log_numpy=True)
+        self.assertIsInstance(d2['engine.time'], np.ndarray)
+        self.assertEqual(set(d1.keys()), set(d2.keys()))
+        for k, v in d1.items():
+            self.assertTrue(np.all(np.array(v) == d2[k]))
+
+        # Continuing a log
+        self.sim.reset()
+        e1 = self.sim.run(50, log=self.sim.run(50))
+        self.sim.reset()
+        e2 = self.sim.run(50, log=self.sim.run(50), log_numpy=True)
+        self.assertIsInstance(e2['engine.time'], np.ndarray)
+        for k, v in e1.items():
+            self.assertTrue(np.all(np.array(v) == e2[k]))
+
+        # Periodic logging
+        self.sim.reset()
+        d1 = self.sim.run(100, log_interval=0.1)
+        self.sim.reset()
+        d2 = self.sim.run(100, log_interval=0.1, log_numpy=True)
+        self.assertEqual(len(d2.time()), 1000)
+        for k, v in d1.items():
+            self.assertTrue(np.all(np.array(v) == d2[k]))
+
+        # Point-list logging
+        times = np.linspace(0, 100, 77)
+        self.sim.reset()
+        d1 = self.sim.run(101, log_times=times)
+        self.sim.reset()
+        d2 = self.sim.run(101, log_times=times, log_numpy=True)
+        self.assertEqual(len(d2.time()), 77)
+        for k, v in d1.items():
+            self.assertTrue(np.all(np.array(v) == d2[k]))
+
+        # Zero-duration run returns empty arrays
+        d2 = self.sim.run(0, log_numpy=True)
+        self.assertIsInstance(d2['engine.time'], np.ndarray)
+        self.assertEqual(len(d2['engine.time']), 0)
+
+        # Progress and message can still be passed positionally
+        self.sim.reset()
+        d2 = self.sim.run(
+            10, None, None, None, None, None, None, None, 'Running')
+        self.assertIsInstance(d2['engine.time'], list)
+
+    def test_log_writer(self):
+        # Test logging to a DataLogWriter.
+
+        self.sim.reset()
+        e = self.sim.run(100, log_interval=0.1)
+        with TemporaryDirectory() as td:
+            for log_numpy in (False, True):
+                self.sim.reset()
+                path = td.path('log.bin')
+                with myokit.DataLogWriter(path, e.keys(), chunk_size=64) as w:
+                    d = self.sim.run(
+                        100, log=w, log_interval=0.1, log_numpy=log_numpy)
+                    self.assertIs(d, w)
+                    self.assertEqual(w.length(), 1000)
+                d = myokit.DataLog.load(path)
+                self.assertEqual(d.time_key(), 'engine.time')
+                for k, v in e.items():
+                    self.assertTrue(np.all(np.array(d[k]) == v))
+
+    def test_run_batch(self):
+        # Test running a batch of simulations.
+
+        s = myokit.Simulation(self.model, self.protocol)
+        s.pre(100)
+        s.set_time(10)
+        state = s.state()
+        constants = ['ica.gCa', 'ib.gb']
+        parameters = np.array([[0.09, 0.03921], [0.05, 0.03921], [0.09, 0.1]])
+        times = np.linspace(10, 109, 100)
+        b = s.run_batch(parameters, 100, constants, log=['membrane.V'],
+                        log_times=times)
+        self.assertEqual(list(b.keys()), ['membrane.V'])
+        self.assertEqual(b['membrane.V'].shape, (3, 100))
+
+        # Time, state, and constants are unchanged
+        self.assertEqual(s.time(), 10)
+        self.assertEqual(s.state(), state)
+        self.assertEqual(
+            s._model.get('ica.gCa').eval(),
+            self.model.get('ica.gCa').eval())
+        d = s.run(100, log=['membrane.V'], log_times=times)
+        self.assertTrue(np.all(b['membrane.V'][0] == d['membrane.V']))
+
+        # Compare with sequential runs
+        for row, v in zip(parameters, b['membrane.V']):
+            s.set_time(10)
+            s.set_state(state)
+            for var, value in zip(constants, row):
+                s.set_constant(var, value)
+            d = s.run(100, log=['membrane.V'], log_times=times)
+            self.assertTrue(np.all(v == d['membrane.V']))
+
+        # Periodic logging
+        b = s.run_batch(parameters, 10, constants, log_interval=1)
+        self.assertIn('engine.time', b)
+        self.assertEqual(b['engine.time'].shape, (3, 10))
+
+        # Failing simulations return NaN
+        b = s.run_batch(
+            [[0.09], [float('nan')]], 10, ['ica.gCa'], log_interval=1)
+        self.assertFalse(np.any(np.isnan(b['membrane.V'][0])))
+        self.assertTrue(np.all(np.isnan(b['membrane.V'][1])))
+
+        # Results are the same when run in chunks, with progress reporting
+        r = TestReporter()
+        c = s.run_batch(parameters, 10, constants, log_interval=1, progress=r)
+        self.assertTrue(r.entered and r.updated and r.exited)
+        self.assertTrue(np.all(c['membrane.V'] == b['membrane.V']))
+        self.assertRaises(
+            myokit.SimulationCancelledError, s.run_batch, parameters, 10,
+            constants, log_interval=1, progress=CancellingReporter(0))
+
+        # Log times outside the simulated interval are ignored
+        s.set_time(10)
+        b = s.run_batch(parameters, 10, constants, log_times=[0, 10, 15, 20])
+        self.assertEqual(b['engine.time'].shape, (3, 2))
+        self.assertTrue(np.all(b['engine.time'] == [10, 15]))
+        b = s.run_batch(parameters, 10, constants, log_times=[30, 40])
+        self.assertEqual(b['engine.time'].shape, (3, 0))
+        b = s.run_batch(parameters, 0, constants, log_interval=1)
+        self.assertEqual(b['engine.time'].shape, (3, 0))
+
+        # Invalid arguments
+        self.assertRaisesRegex(
+            ValueError, 'columns', s.run_batch, parameters, 10, ['ica.gCa'],
+            log_interval=1)
+        self.assertRaisesRegex(
+            ValueError, 'not a literal', s.run_batch, [[1]], 10,
+            ['membrane.V'], log_interval=1)
+        self.assertRaisesRegex(
+            ValueError, 'must be set', s.run_batch, parameters, 10, constants)
+        self.assertRaisesRegex(
+            ValueError, 'DataLog', s.run_batch, parameters, 10, constants,
+            log=myokit.DataLog(), log_interval=1)
+        self.assertRaisesRegex(
+            ValueError, 'simultaneously', s.run_batch, parameters, 10,
+            constants, log_interval=1, log_times=[10, 11])
+        self.assertRaisesRegex(
+            ValueError, 'non-decreasing', s.run_batch, parameters, 10,
+            constants, log_times=[12, 11])
+        self.assertRaisesRegex(
+            ValueError, 'greater than 0', s.run_batch, parameters, 10,
+            constants, log_interval=0)
+        self.assertRaisesRegex(
+            ValueError, 'negative', s.run_batch, parameters, -1, constants,
+            log_interval=1)
+
+    def test_run_jacobians(self):
+        # Test logging Jacobians during a simulation.
+
+        s = myokit.Simulation(self.model, self.protocol)
+        s.set_tolerance(1e-8, 1e-8)
+        b = s.run_jacobians(600, log_interval=5)
+        self.assertIsInstance(b, myokit.DataBlock2d)
+        self.assertEqual(s.time(), 600)
+        n = self.model.count_states()
+        self.assertEqual(b.shape(), (120, n, n))
+        self.assertIn('membrane.V', list(b.keys0d()))
+        self.assertIn('engine.pace', list(b.keys0d()))
+        self.assertEqual(b.time()[1], 5)
+
+        # Compare with Jacobian tracer
+        log = myokit.DataLog(time='engine.time')
+        log['engine.time'] = b.time()
+        for k, v in b.items0d():
+            log[k] = v
+        t = myokit.JacobianTracer(self.model)
+        j = t.jacobians(log).get2d('jacobians')
+        self.assertTrue(np.allclose(
+            b.get2d('jacobians'), j, rtol=1e-4, atol=1e-6))
+
+        # Dynamic logging, with selected variables
+        s.reset()
+        b = s.run_jacobians(10, log=['membrane.V'])
+        self.assertEqual(list(b.keys0d()), ['membrane.V'])
+        self.assertEqual(b.get2d('jacobians').shape, (len(b.time()), n, n))
+        self.assertGreater(len(b.time()), 1)
+
+        # Existing logs can't be used
+        self.assertRaisesRegex(
+            ValueError, 'DataLog', s.run_jacobians, 10, log=myokit.DataLog())
+
     def test_pacing_values_at_event_transitions(self):
         # Tests the value of the pacing signal at event transitions
 
@@ -837,6 +1033,31 @@ class SimulationTest(unittest.TestCase):
         self.assertEqual(list(d1.time()), [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10])
         self.assertEqual(list(d1['c.w']), [0, 0, 2, 2, 4, 4, 4, 4, 6, 6, 0])
 
+    def test_threads(self):
+        # Test running simulations in parallel threads.
+        import threading
+
+        sims = [myokit.Simulation(self.model, self.protocol) for i in range(3)]
+        for i, s in enumerate(sims):
+            s.set_constant('ica.gCa', 0.05 + 0.02 * i)
+        expected = [s.run(500, log_interval=1) for s in sims]
+        for s in sims:
+            s.reset()
+
+        results = [None] * len(sims)
+
+        def run(i):
+            results[i] = sims[i].run(500, log_interval=1)
+
+        threads = [threading.Thread(target=run, args=(i, )) for i in range(3)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        for d, e in zip(results, expected):
+            self.assertTrue(
+                np.all(np.array(d['membrane.V']) == e['membrane.V']))
+
     def test_pickling(self):
         # Test pickling a simulation
 
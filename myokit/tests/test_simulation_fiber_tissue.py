@@ -730,6 +730,30 @@ class FiberTissueSimulationTest(unittest.TestCase):
         finally:
             self.s1.set_step_size(0.0012)
 
+    def test_multi_rate(self):
+        # Tests running with multi-rate stepping
+        try:
+            logf, logt = self.s1.run(
+                0.1, logf=['engine.time', '0.0.membrane.V'],
+                logt=['0.0.membrane.V'], log_interval=0.01)
+            self.s1.reset()
+            self.s1.set_multi_rate(3)
+            logf2, logt2 = self.s1.run(
+                0.1, logf=['engine.time', '0.0.membrane.V'],
+                logt=['0.0.membrane.V'], log_interval=0.01)
+            self.assertTrue(np.allclose(
+                logf['0.0.membrane.V'], logf2['0.0.membrane.V'], atol=0.1))
+            self.assertTrue(np.allclose(
+                logt['0.0.membrane.V'], logt2['0.0.membrane.V'], atol=0.1))
+
+            self.assertRaisesRegex(
+                ValueError, 'range', self.s1.set_multi_rate, -1)
+            self.assertRaisesRegex(
+                ValueError, 'absolute', self.s1.set_multi_rate, 1, 0)
+        finally:
+            self.s1.set_multi_rate()
+            self.s1.reset()
+
 
 @unittest.skipIf(not OpenCL_FOUND, 'OpenCL not found on this system.')
 class FiberTissueSimulationFindNanTest(unittest.TestCase):
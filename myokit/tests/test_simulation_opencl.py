@@ -666,6 +666,42 @@ class SimulationOpenCLTest(unittest.TestCase):
         self.assertTrue(np.all(d['membrane.V', 0] == d['membrane.V', 1]))
         self.assertTrue(np.all(d['membrane.V', 0] == d['membrane.V', 2]))
 
+    def test_multi_rate(self):
+        # Test multi-rate stepping against small fixed steps
+
+        log = ['engine.time', 'membrane.V', 'ina.INa']
+        try:
+            self.s1.reset()
+            self.s1.set_step_size(0.005)
+            d1 = self.s1.run(40, log=log, log_interval=0.4).npview()
+            self.s1.reset()
+            self.s1.set_step_size(0.02)
+            self.s1.set_multi_rate(2, 1e-3, 1e-3)
+            d2 = self.s1.run(40, log=log, log_interval=0.4).npview()
+        finally:
+            self.s1.set_step_size()
+            self.s1.set_multi_rate()
+            self.s1.reset()
+
+        self.assertTrue(np.all(d1.time() == d2.time()))
+        for i in (0, 9):
+            e = np.abs(d1['membrane.V', i] - d2['membrane.V', i])
+            self.assertLess(np.max(e), 2)
+            self.assertLess(np.mean(e), 0.2)
+
+        # Intermediary variables are logged at the start of each step
+        self.assertEqual(d1['ina.INa', 0][0], d2['ina.INa', 0][0])
+
+        # Invalid arguments
+        self.assertRaisesRegex(
+            ValueError, 'range', self.s1.set_multi_rate, -1)
+        self.assertRaisesRegex(
+            ValueError, 'range', self.s1.set_multi_rate, 17)
+        self.assertRaisesRegex(
+            ValueError, 'absolute', self.s1.set_multi_rate, 1, 0)
+        self.assertRaisesRegex(
+            ValueError, 'relative', self.s1.set_multi_rate, 1, 1, -1)
+
     def test_neighbours_0d(self):
         # Test listing neighbours in a 0d simulation
 
@@ -879,6 +915,56 @@ class SimulationOpenCLTest(unittest.TestCase):
             myokit.SimulationCancelledError,
             self.s0.run, 20, progress=CancellingReporter(0))
 
+    def test_run_apd(self):
+        # Test running with on-device APD detection
+
+        # 1d simulation
+        self.s1.reset()
+        d, apds = self.s1.run(
+            500, log=['engine.time', '0.membrane.V', '9.membrane.V'],
+            log_interval=0.1, apd_threshold=-70)
+        self.assertEqual(set(apds.keys()), set(['x', 'start', 'duration']))
+        self.assertEqual(sorted(apds['x']), list(range(10)))
+        self.assertEqual(apds['start'], sorted(apds['start']))
+        self.assertEqual(self.s1.time(), 500)
+        for x in (0, 9):
+            e = d.apd(str(x) + '.membrane.V', -70)
+            i = apds['x'].index(x)
+            self.assertAlmostEqual(apds['start'][i], e['start'][0], delta=0.2)
+            self.assertAlmostEqual(
+                apds['duration'][i], e['duration'][0], delta=0.4)
+
+        # 2d simulation
+        self.s2.reset()
+        d, apds = self.s2.run(500, log=myokit.LOG_NONE, apd_threshold=-70)
+        self.assertEqual(len(d), 0)
+        self.assertEqual(
+            set(apds.keys()), set(['x', 'y', 'start', 'duration']))
+        self.assertEqual(len(apds['x']), 12)
+        self.assertEqual(
+            set(zip(apds['x'], apds['y'])),
+            set((x, y) for x in range(4) for y in range(3)))
+
+        # No membrane potential
+        m = self.m.clone()
+        m.label('membrane_potential').set_label(None)
+        s = myokit.SimulationOpenCL(m, self.p, ncells=2, diffusion=False)
+        self.assertRaisesRegex(
+            ValueError, 'membrane_potential', s.run, 1, apd_threshold=-70)
+
+    def test_run_log_subset(self):
+        # Test logging only some of the cells
+
+        self.s2.reset()
+        d1 = self.s2.run(5, log=myokit.LOG_ALL)
+        self.s2.reset()
+        keys = ['engine.time', '1.2.membrane.V', '3.0.membrane.V',
+                '2.1.ina.INa', '0.0.membrane.i_diff']
+        d2 = self.s2.run(5, log=keys)
+        self.assertEqual(set(d2.keys()), set(keys))
+        for key in keys:
+            self.assertEqual(d1[key], d2[key])
+
     def test_set_constant(self):
         # Test set_constant (interface only, rest is in cvode comparison)
 
@@ -903,6 +989,79 @@ class SimulationOpenCLTest(unittest.TestCase):
         self.assertRaisesRegex(
             ValueError, 'not a literal', s.set_constant, v, 2)
 
+    def test_set_devices(self):
+        # Test dividing cells over multiple devices
+
+        def exchange(s):
+            # Simulate a halo exchange, return global and local potentials
+            domains, copies = s._domains()
+            v = np.random.uniform(-90, 40, s._ntotal)
+            local = []
+            for lo, hi, offset, n_local, halo, export, conns in domains:
+                x = np.zeros(n_local)
+                x[lo - offset:hi - offset] = v[lo:hi]
+                local.append(x)
+            exported = [x[d[5]] for x, d in zip(local, domains)]
+            for src, dst, src_offset, dst_offset, count in copies:
+                halo = domains[dst][4][dst_offset:dst_offset + count]
+                local[dst][halo] = exported[src][
+                    src_offset:src_offset + count]
+            return v, domains, local
+
+        # Single device
+        self.s1.set_devices()
+        domains, copies = self.s1._domains()
+        self.assertEqual(domains, [(0, 10, 0, 10, [], [], None)])
+        self.assertEqual(copies, [])
+
+        # Rectangular grids: all stored cells are up to date after exchange
+        try:
+            for s, n in ((self.s1, 3), (self.s1, 10), (self.s2, 2)):
+                s.set_devices(n)
+                v, domains, local = exchange(s)
+                self.assertEqual(len(domains), n)
+                self.assertEqual(domains[0][0], 0)
+                self.assertEqual(domains[-1][1], s._ntotal)
+                for d, x in zip(domains, local):
+                    offset, n_local = d[2], d[3]
+                    self.assertTrue(np.all(x == v[offset:offset + n_local]))
+                    if len(s._dims) == 2:
+                        self.assertEqual(d[0] % s._nx, 0)
+        finally:
+            self.s1.set_devices()
+            self.s2.set_devices()
+
+        # Connections: diffusion currents are the same as on a single device
+        try:
+            conns = [(0, 5, 1.), (1, 2, 2.), (2, 9, 3.), (3, 4, 4.),
+                     (4, 8, 5.), (6, 7, 6.), (0, 9, 7.), (5, 6, 8.)]
+            self.s1.set_connections(conns)
+            self.s1.set_devices(3)
+            v, domains, local = exchange(self.s1)
+            i_global = np.zeros(10)
+            for i, j, g in conns:
+                i_global[i] += g * (v[i] - v[j])
+                i_global[j] += g * (v[j] - v[i])
+            for lo, hi, offset, n_local, halo, export, cs in domains:
+                x = local.pop(0)
+                i_local = np.zeros(n_local)
+                for i, j, g in cs:
+                    i_local[i] += g * (x[i] - x[j])
+                    i_local[j] += g * (x[j] - x[i])
+                self.assertTrue(
+                    np.allclose(i_local[:hi - lo], i_global[lo:hi]))
+        finally:
+            self.s1.set_conductance()
+            self.s1.set_devices()
+
+        # Invalid arguments
+        self.assertRaisesRegex(
+            ValueError, 'at least 1', self.s1.set_devices, 0)
+        self.assertRaisesRegex(
+            ValueError, 'number of cells', self.s1.set_devices, 11)
+        self.assertRaisesRegex(
+            ValueError, 'number of rows', self.s2.set_devices, 4)
+
     def test_set_field(self):
         # Test set_field (interface only, rest is in cvode comparison)
 
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+#
+# Tests the SimulationPool class.
+#
+# This file is part of Myokit.
+# See http://myokit.org for copyright, sharing, and licensing details.
+#
+from __future__ import absolute_import, division
+from __future__ import print_function, unicode_literals
+
+import os
+import unittest
+
+from collections import OrderedDict
+
+import numpy as np
+
+import myokit
+
+from myokit._sim.pool import _pack, _unpack
+
+from myokit.tests import DIR_DATA
+
+# Unit testing in Python 2 and 3
+try:
+    unittest.TestCase.assertRaisesRegex
+except AttributeError:
+    unittest.TestCase.assertRaisesRegex = unittest.TestCase.assertRaisesRegexp
+
+
+class SimulationPoolTest(unittest.TestCase):
+    """
+    Tests the SimulationPool class.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        m, p, _ = myokit.load(os.path.join(DIR_DATA, 'lr-1991.mmt'))
+        cls.model = m
+        cls.protocol = p
+        cls.pool = myokit.SimulationPool(m, p, processes=2)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.shutdown()
+
+    def test_submit(self):
+        # Test running single simulations.
+
+        self.assertEqual(self.pool.processes(), 2)
+        s = myokit.Simulation(self.model, self.protocol)
+        s.set_constant('ica.gCa', 0.05)
+        e = s.run(100, log=['engine.time', 'membrane.V'], log_interval=1)
+
+        f = self.pool.submit(100, {'ica.gCa': 0.05}, log=['membrane.V'],
+                             log_interval=1)
+        d = f.result()
+        self.assertIsInstance(d, myokit.DataLog)
+        self.assertEqual(list(d.keys()), ['membrane.V'])
+        self.assertTrue(np.all(d['membrane.V'] == e['membrane.V']))
+
+        # Constants are not retained between jobs
+        s.set_constant('ica.gCa', 0.09)
+        s.reset()
+        e = s.run(100, log_interval=1)
+        for k in range(4):
+            d = self.pool.submit(100, log_interval=1).result()
+            self.assertEqual(d.time_key(), 'engine.time')
+            self.assertTrue(np.all(d['membrane.V'] == e['membrane.V']))
+
+        # Pre-pacing
+        s.reset()
+        s.pre(100)
+        e = s.run(100, log_interval=1)
+        d = self.pool.submit(100, pre=100, log_interval=1).result()
+        self.assertTrue(np.all(d['membrane.V'] == e['membrane.V']))
+
+        # Errors are passed on
+        f = self.pool.submit(10, {'ica.gCa': float('nan')})
+        self.assertRaises(myokit.SimulationError, f.result)
+
+        # Existing logs can't be used
+        self.assertRaisesRegex(
+            ValueError, 'DataLog', self.pool.submit, 10, log=myokit.DataLog())
+
+    def test_map(self):
+        # Test running simulations with map.
+
+        values = [0.05, 0.06, 0.07, 0.08, 0.09]
+        s = myokit.Simulation(self.model, self.protocol)
+        logs = self.pool.map(
+            50, [{'ica.gCa': x} for x in values], chunksize=2,
+            log=['membrane.V'], log_interval=1)
+        for x, d in zip(values, logs):
+            s.reset()
+            s.set_constant('ica.gCa', x)
+            e = s.run(50, log=['membrane.V'], log_interval=1)
+            self.assertTrue(np.all(d['membrane.V'] == e['membrane.V']))
+
+        # Stopping early is OK
+        logs = self.pool.map(
+            50, [{'ica.gCa': x} for x in values], log_interval=1)
+        next(logs)
+        logs.close()
+
+        self.assertRaisesRegex(
+            ValueError, 'chunk size', self.pool.map, 10, [{}], chunksize=0)
+
+    def test_run_batch(self):
+        # Test running batches in the pool.
+
+        s = myokit.Simulation(self.model, self.protocol)
+        p = np.array([[0.05], [0.06], [float('nan')], [0.08], [0.09]])
+        e = s.run_batch(p, 50, ['ica.gCa'], log_interval=1)
+        d = self.pool.run_batch(p, 50, ['ica.gCa'], chunksize=1,
+                                log_interval=1)
+        self.assertEqual(list(d.keys()), list(e.keys()))
+        for k, v in e.items():
+            self.assertEqual(d[k].shape, (5, 50))
+            self.assertTrue(np.all(np.isnan(d[k][2])))
+            self.assertTrue(np.all(d[k][[0, 1, 3, 4]] == v[[0, 1, 3, 4]]))
+
+        self.assertRaisesRegex(
+            ValueError, 'columns', self.pool.run_batch, p, 50, [])
+
+
+class SharedMemoryTest(unittest.TestCase):
+    """
+    Tests passing arrays between processes via shared memory.
+    """
+
+    def test_pack_unpack(self):
+        # Test packing arrays in a worker, and unpacking in the main process.
+        try:
+            import concurrent.futures as futures
+        except ImportError:     # pragma: no python 3 cover
+            raise unittest.SkipTest('No concurrent.futures module.')
+
+        arrays = OrderedDict([
+            ('a', np.arange(5.0)),
+            ('b', np.zeros((2, 0))),
+            ('c', np.random.random((3, 4))),
+        ])
+        with futures.ProcessPoolExecutor(max_workers=1) as pool:
+            packed = pool.submit(_pack, arrays).result()
+        unpacked = _unpack(packed)
+        self.assertEqual(list(unpacked.keys()), list(arrays.keys()))
+        for k, v in arrays.items():
+            self.assertEqual(unpacked[k].shape, v.shape)
+            self.assertTrue(np.all(unpacked[k] == v))
+
+        # Arrays are writable copies
+        unpacked['a'][0] = 10
+        self.assertEqual(unpacked['a'][0], 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -23,6 +23,8 @@ except NameError:   # pragma: no cover
 
 import myokit
 
+from myokit.tests import TemporaryDirectory
+
 
 class BenchmarkerTest(unittest.TestCase):
     """Tests the ``Benchmarker``."""
@@ -236,6 +238,101 @@ class CaptureTest(unittest.TestCase):
         self.assertEqual(captured[2], '2a 2b 2e')
 
 
+class DiskCacheTest(unittest.TestCase):
+    """Tests the ``DiskCache``."""
+
+    def test_get_and_put(self):
+        # Test storing and retrieving entries
+
+        with TemporaryDirectory() as d:
+            c = myokit.tools.DiskCache(d.path('cache'))
+            self.assertEqual(c.path(), d.path('cache'))
+            self.assertIsNone(c.max_size())
+
+            # Empty cache, directory doesn't exist yet
+            k1 = c.key('hello', 1, [2, 3])
+            self.assertEqual(k1, c.key('hello', 1, [2, 3]))
+            self.assertNotEqual(k1, c.key('hello', 1, [2, 4]))
+            self.assertIsNone(c.get(k1))
+            self.assertEqual(c.size(), 0)
+
+            # Store bytes
+            path = c.put(k1, b'12345')
+            self.assertEqual(c.get(k1), path)
+            with open(c.get(k1), 'rb') as f:
+                self.assertEqual(f.read(), b'12345')
+            self.assertEqual(c.size(), 5)
+
+            # Overwrite
+            c.put(k1, b'123')
+            with open(c.get(k1), 'rb') as f:
+                self.assertEqual(f.read(), b'123')
+            self.assertEqual(c.size(), 3)
+
+            # Store file
+            with open(d.path('file'), 'wb') as f:
+                f.write(b'abcd')
+            k2 = c.key('file')
+            c.put_file(k2, d.path('file'))
+            with open(c.get(k2), 'rb') as f:
+                self.assertEqual(f.read(), b'abcd')
+            self.assertEqual(c.size(), 7)
+
+            # Temporary files are ignored
+            with open(os.path.join(c.path(), '.tmp-123'), 'wb') as f:
+                f.write(b'123')
+            self.assertEqual(c.size(), 7)
+
+            # Clear
+            c.clear()
+            self.assertEqual(c.size(), 0)
+            self.assertIsNone(c.get(k1))
+            self.assertIsNone(c.get(k2))
+
+            # Invalid keys
+            self.assertRaises(ValueError, c.get, '../hello')
+            self.assertRaises(ValueError, c.put, '.tmp-1', b'123')
+            self.assertRaises(ValueError, c.put, '', b'123')
+
+            # Invalid size
+            self.assertRaises(ValueError, myokit.tools.DiskCache, 'x', -1)
+
+    def test_eviction(self):
+        # Test least-recently used entries are removed first
+
+        with TemporaryDirectory() as d:
+            c = myokit.tools.DiskCache(d.path(), max_size=10)
+            self.assertEqual(c.max_size(), 10)
+
+            # Set modification times explicitly, to avoid relying on the
+            # resolution of the file system clock
+            c.put('a', b'1234')
+            os.utime(c.get('a'), (100, 100))
+            c.put('b', b'1234')
+            os.utime(c.get('b'), (200, 200))
+            self.assertEqual(c.size(), 8)
+
+            # Adding c removes a
+            c.put('c', b'1234')
+            self.assertEqual(c.size(), 8)
+            self.assertIsNone(c.get('a'))
+            self.assertIsNotNone(c.get('b'))
+            self.assertIsNotNone(c.get('c'))
+
+            # Using b makes c the least-recently used entry
+            os.utime(c.get('c'), (300, 300))
+            c.get('b')
+            c.put('d', b'1234')
+            self.assertIsNotNone(c.get('b'))
+            self.assertIsNone(c.get('c'))
+            self.assertIsNotNone(c.get('d'))
+
+            # Entries larger than the cache are removed immediately
+            c.put('e', b'12345678901')
+            self.assertIsNone(c.get('e'))
+            self.assertLessEqual(c.size(), 10)
+
+
 class ToolsTest(unittest.TestCase):
     """Tests various tools in myokit.tools"""
 
@@ -9,6 +9,7 @@
 from __future__ import absolute_import, division
 from __future__ import print_function, unicode_literals
 
+import hashlib
 import os
 import re
 import shutil
@@ -16,6 +17,7 @@ import stat
 import sys
 import tempfile
 import threading
+import time
 import timeit
 
 # StringIO in Python 2 and 3
@@ -420,6 +422,217 @@ class capture(object):
         return self.out() + self.err()
 
 
+class DiskCache(object):
+    """
+    Stores files in a directory on disk, indexed by string keys, and removes
+    the least-recently used entries when the total size exceeds a maximum.
+
+    Example::
+
+        cache = myokit.tools.DiskCache('~/cache', max_size=2**20)
+        key = cache.key('some', 'inputs', 123)
+        path = cache.get(key)
+        if path is None:
+            path = cache.put(key, expensive_calculation())
+
+    A cache can be shared by several processes. New entries are written to a
+    temporary file which is then moved into place with an atomic rename, so
+    that other processes never see partially written files. If an entry is
+    removed by one process (e.g. to make space) while another process tries to
+    read it, the second process will simply see a cache miss.
+
+    Arguments:
+
+    ``path``
+        The directory to store files in. Will be created if it doesn't exist.
+    ``max_size``
+        The maximum total size of all cached files, in bytes, or ``None`` to
+        let the cache grow indefinitely.
+
+    """
+    # Prefix for temporary files, should not be a valid key
+    _TEMP = '.tmp-'
+
+    # Age (in seconds) after which temporary files are assumed to be orphaned
+    _TEMP_AGE = 3600
+
+    # Valid keys
+    _KEY = re.compile(r'^[a-zA-Z0-9_\-][a-zA-Z0-9_\-.]*$')
+
+    def __init__(self, path, max_size=None):
+        self._path = os.path.abspath(os.path.expanduser(path))
+        if max_size is not None:
+            max_size = int(max_size)
+            if max_size < 0:
+                raise ValueError('Maximum cache size cannot be negative.')
+        self._max_size = max_size
+
+    def _check_key(self, key):
+        """ Raises a ``ValueError`` if ``key`` can't be used as a file name."""
+        if self._KEY.match(key) is None:
+            raise ValueError('Invalid cache key: ' + str(key))
+
+    def _entries(self):
+        """
+        Returns a list of tuples ``(last_used, size, path)`` for all entries in
+        the cache, and removes any orphaned temporary files.
+        """
+        entries = []
+        try:
+            names = os.listdir(self._path)
+        except OSError:
+            return entries
+        now = time.time()
+        for name in names:
+            path = os.path.join(self._path, name)
+            try:
+                st = os.stat(path)
+            except OSError:     # pragma: no cover
+                # Removed by another process
+                continue
+            if name.startswith(self._TEMP):
+                if now - st.st_mtime > self._TEMP_AGE:
+                    self._remove(path)
+            else:
+                entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def _remove(self, path):
+        """ Removes a file, ignoring errors from concurrent removal. """
+        try:
+            os.remove(path)
+        except OSError:     # pragma: no cover
+            pass
+
+    def clear(self):
+        """ Removes all entries from this cache. """
+        for entry in self._entries():
+            self._remove(entry[2])
+
+    def get(self, key):
+        """
+        Returns the path to the file cached for ``key``, or ``None`` if no
+        such file exists.
+
+        Retrieving an entry marks it as recently used. Note that the returned
+        file may be removed at any time by other processes using the same
+        cache, so callers should copy or read it immediately and be ready to
+        handle an ``IOError``.
+        """
+        self._check_key(key)
+        path = os.path.join(self._path, key)
+        try:
+            os.utime(path, None)
+        except OSError:
+            return None
+        return path
+
+    @staticmethod
+    def key(*parts):
+        """
+        Creates a cache key by hashing the string representation of all the
+        given ``parts``.
+        """
+        h = hashlib.sha256()
+        for part in parts:
+            h.update(repr(part).encode('utf-8'))
+            h.update(b'\0')
+        return h.hexdigest()
+
+    def max_size(self):
+        """ Returns the maximum cache size, in bytes (or ``None``). """
+        return self._max_size
+
+    def path(self):
+        """ Returns the path to the directory used by this cache. """
+        return self._path
+
+    def put(self, key, data):
+        """
+        Stores the given ``bytes`` in this cache, under the given ``key``, and
+        returns the path of the newly created file.
+
+        If the cache exceeds its maximum size after adding the new entry, the
+        least-recently used entries will be removed (this may include the new
+        entry, if its size exceeds the maximum cache size).
+        """
+        self._check_key(key)
+        temp = self._temp_file()
+        try:
+            with open(temp, 'wb') as f:
+                f.write(data)
+        except Exception:
+            self._remove(temp)
+            raise
+        return self._store(key, temp)
+
+    def put_file(self, key, filename):
+        """
+        Stores a copy of the file ``filename`` in this cache, under the given
+        ``key``, and returns the path of the newly created file.
+
+        See :meth:`put()` for details.
+        """
+        self._check_key(key)
+        temp = self._temp_file()
+        try:
+            shutil.copyfile(filename, temp)
+        except Exception:
+            self._remove(temp)
+            raise
+        return self._store(key, temp)
+
+    def size(self):
+        """ Returns the total size of all entries in this cache, in bytes. """
+        return sum([x[1] for x in self._entries()])
+
+    def _store(self, key, temp):
+        """ Moves a temporary file into place, and trims the cache. """
+        path = os.path.join(self._path, key)
+        try:
+            # Atomic on posix and windows (if on the same file system)
+            os.replace(temp, path)
+        except AttributeError:  # pragma: no python 3 cover
+            if os.path.exists(path):
+                os.remove(path)
+            os.rename(temp, path)
+        except Exception:       # pragma: no cover
+            self._remove(temp)
+            raise
+        self.trim()
+        return path
+
+    def _temp_file(self):
+        """ Creates and returns the path to a new temporary file. """
+        if not os.path.isdir(self._path):
+            try:
+                os.makedirs(self._path)
+            except OSError:     # pragma: no cover
+                # Created by another process
+                if not os.path.isdir(self._path):
+                    raise
+        fd, path = tempfile.mkstemp(prefix=self._TEMP, dir=self._path)
+        os.close(fd)
+        return path
+
+    def trim(self):
+        """
+        Removes least-recently used entries until the total cache size is
+        below the maximum.
+        """
+        if self._max_size is None:
+            return
+        entries = self._entries()
+        size = sum([x[1] for x in entries])
+        if size > self._max_size:
+            entries.sort()
+            for last_used, file_size, path in entries:
+                self._remove(path)
+                size -= file_size
+                if size <= self._max_size:
+                    break
+
+
 def format_path(path, root='.'):
     """
     Formats a path for use in user messages. If the given path is a